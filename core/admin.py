@@ -6,7 +6,7 @@ from django.contrib.auth.models import Group
 
 from core.admin_base import NurLesenMixin, NurLesenModelAdmin
 
-from .models import AktivitaetsLog
+from .models import AktivitaetsLog, Postausgang
 
 
 @admin.register(AktivitaetsLog)
@@ -24,6 +24,19 @@ class AktivitaetsLogAdmin(NurLesenModelAdmin):
     ordering = ('-zeitpunkt',)
 
 
+@admin.register(Postausgang)
+class PostausgangAdmin(NurLesenModelAdmin):
+    """Ausgehende Mails — nur lesend. Zum Nachsehen, was verschoben oder
+    aufgegeben wurde und warum (`letzter_fehler`); zugestellt wird über
+    `postausgang_senden`, nicht von Hand."""
+    list_display = ('erstellt_am', 'an', 'betreff', 'status', 'versuche', 'faellig_ab', 'gesendet_am')
+    list_filter = ('status',)
+    search_fields = ('an', 'betreff', 'schluessel')
+    date_hierarchy = 'erstellt_am'
+    ordering = ('-erstellt_am',)
+    exclude = ('html',)
+
+
 # ---------------------------------------------------------------------------
 # Djangos eigene Benutzer- und Gruppen-Admins kommen aus `django.contrib.auth`
 # und wüssten von E2 nichts. Sie werden deshalb ab- und schreibgeschützt
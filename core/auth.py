@@ -23,6 +23,9 @@ Verwendung klassische Views:
     def send_mahnung_email_view(request, ...):
 """
 import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from django.contrib.auth.decorators import user_passes_test
 from ninja.security import SessionAuth
 
@@ -84,8 +87,49 @@ def hat_rolle(user, rollen):
     organisation = aktuelle_organisation()
     if organisation is None:
         return False
-    return Mitgliedschaft.objects.filter(
-        benutzer=user, organisation=organisation, rolle__in=rollen).exists()
+    gemerkt = _ROLLEN.get()
+    if gemerkt is None:
+        return Mitgliedschaft.objects.filter(
+            benutzer=user, organisation=organisation, rolle__in=rollen).exists()
+    schluessel = (user.pk, getattr(organisation, 'pk', organisation))
+    if schluessel not in gemerkt:
+        gemerkt[schluessel] = (Mitgliedschaft.objects.filter(
+            benutzer=user, organisation=organisation).values_list('rolle', flat=True).first())
+    return gemerkt[schluessel] in rollen
+
+
+# ROLLEN JE ANFRAGE. Eine Seite fragt dieselbe Rolle oft ein Dutzend Mal —
+# Dekorator, `fw_badges`, Navigation, `darf_oeffnen` je Aktion im Template —,
+# und jede Frage war eine Abfrage. Innerhalb von `rollen_je_anfrage()` merkt
+# sich `hat_rolle` die Rolle je (Benutzer, Organisation); die Middleware
+# belegt den Speicher mit den Mitgliedschaften vor, die sie für den Kontext
+# ohnehin gelesen hat, sodass eine Anfrage dafür gar nicht mehr fragt.
+#
+# Je Anfrage und nicht länger: Eine entzogene Rolle soll mit dem nächsten
+# Klick gelten, nicht erst nach Ablauf eines Caches. Ändert sich eine
+# Mitgliedschaft mitten in der Anfrage (Benutzerverwaltung), vergisst das
+# Signal in `core.signals` den Eintrag. Ausserhalb (Befehle, Hintergrund-
+# aufträge, Shell) ist nichts gesetzt, und `hat_rolle` fragt wie bisher.
+_ROLLEN = ContextVar('rollen_je_anfrage', default=None)
+
+
+@contextmanager
+def rollen_je_anfrage(vorbelegt=None):
+    """Rollen für die Dauer eines Blocks merken. `vorbelegt`: dict
+    (Benutzer-ID, Organisations-ID) → Rolle oder None (keine Mitgliedschaft)."""
+    token = _ROLLEN.set(dict(vorbelegt or {}))
+    try:
+        yield
+    finally:
+        _ROLLEN.reset(token)
+
+
+def rollen_vergessen(benutzer_id):
+    """Die gemerkten Rollen eines Benutzers verwerfen (Mitgliedschaft geändert)."""
+    gemerkt = _ROLLEN.get()
+    if gemerkt:
+        for schluessel in [s for s in gemerkt if s[0] == benutzer_id]:
+            del gemerkt[schluessel]
 
 
 def ist_eigentuemer(user):
@@ -0,0 +1,197 @@
+"""Blättern über einen Schlüssel statt über OFFSET (Keyset-Pagination).
+
+Die Listen blätterten mit `LIMIT 50 OFFSET n`: Für Seite 400 muss die
+Datenbank 20'000 Zeilen sortieren und verwerfen, bevor sie die 50 gesuchten
+liefert — jede Seite kostet mehr als die davor. Dazu zählte jeder Aufruf die
+ganze Liste (`count()`), nur damit im Fuss «Seite 3/812» stehen kann.
+
+Hier merkt sich der Link «Weiter» die Sortierwerte der letzten Zeile
+(`?nach=…`), «Zurück» die der ersten (`?vor=…`). Die nächste Seite ist dann
+`WHERE (faellig, id) > (…) ORDER BY faellig, id LIMIT 51` — über den Index
+gleich schnell, ob Seite 1 oder 400. Eine Liste darf aus mehreren Abschnitten
+bestehen, jeder mit eigener Sortierung (Debitoren: offene aufsteigend, danach
+erledigte absteigend); der Schlüssel trägt den Abschnitt mit.
+
+Gezählt wird genau, wenn eine Liste frisch geöffnet wird (ohne Schlüssel).
+Beim Weiterblättern kommt die Zahl aus dem Cache (je Verwaltung und Filter,
+`ZAEHLER_GUELTIGKEIT` Sekunden) — sie ist dann ungefähr: Was seither dazukam,
+zählt erst beim nächsten frischen Aufruf. Ob es eine nächste Seite gibt,
+entscheidet nie die Zahl, sondern die 51. Zeile.
+
+`?seite=n` ohne Schlüssel (Lesezeichen, alte Links) geht weiter über OFFSET.
+
+Die Sortierfelder müssen Felder des Modells oder Annotationen sein und dürfen
+nicht NULL werden (sonst `Coalesce` annotieren); das letzte muss eindeutig
+sein, in der Regel `id`.
+"""
+import base64
+import hashlib
+import json
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+
+#: Zeilen je Seite, wenn die Ansicht nichts anderes sagt.
+GROESSE = 50
+
+#: So lange gilt eine gemerkte Zeilenzahl beim Weiterblättern.
+ZAEHLER_GUELTIGKEIT = 10 * 60
+
+
+class Blatt(Page):
+    """Eine Seite — ein `Page` wie von `Paginator`, damit Vorlagen und Tests
+    (`page.number`, `page.paginator.num_pages`, `page.object_list`) bleiben,
+    dazu `weiter` und `zurueck`: die Schlüssel für die Nachbarseiten oder
+    None. `object_list` darf die Ansicht durch aufbereitete Zeilen ersetzen.
+    """
+
+    def __init__(self, object_list, number, paginator, weiter, zurueck, query=''):
+        super().__init__(object_list, number, paginator)
+        self.weiter = weiter
+        self.zurueck = zurueck
+        #: Die übrigen Parameter der Anfrage (Filter, Suche) für die Links.
+        self.query = query
+
+    def has_next(self):
+        return self.weiter is not None
+
+    def has_previous(self):
+        return self.number > 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def _felder(felder):
+    return [(f.lstrip('-'), f.startswith('-')) for f in felder]
+
+
+def _feld(qs, name):
+    annotation = qs.query.annotations.get(name)
+    return annotation.output_field if annotation is not None else qs.model._meta.get_field(name)
+
+
+def _schluessel(abschnitt, obj, felder):
+    werte = [str(getattr(obj, name)) for name, _ in _felder(felder)]
+    roh = json.dumps([abschnitt, werte], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(roh).decode().rstrip('=')
+
+
+def _lesen(schluessel, abschnitte):
+    """(abschnitt, werte) aus einem Schlüssel — None, wenn er nicht passt.
+
+    Ein verstümmelter oder von Hand geänderter Link führt auf Seite 1 statt
+    zu einem Fehler."""
+    try:
+        roh = base64.urlsafe_b64decode(schluessel + '=' * (-len(schluessel) % 4))
+        abschnitt, werte = json.loads(roh)
+        qs, felder = abschnitte[abschnitt]
+        felder = _felder(felder)
+        if len(werte) != len(felder):
+            return None
+        return abschnitt, [_feld(qs, name).to_python(w) for (name, _), w in zip(felder, werte)]
+    except Exception:
+        return None
+
+
+def _jenseits(felder, werte, rueckwaerts):
+    """`Q` für «nach diesen Werten» in Sortierrichtung (rückwärts: davor)."""
+    bedingung = Q()
+    for i, (name, absteigend) in enumerate(felder):
+        groesser = absteigend == rueckwaerts
+        teil = Q(**{f'{name}__{"gt" if groesser else "lt"}': werte[i]})
+        for vorher, wert in zip(felder[:i], werte[:i]):
+            teil &= Q(**{vorher[0]: wert})
+        bedingung |= teil
+    return bedingung
+
+
+def _sortiert(qs, felder, rueckwaerts=False):
+    return qs.order_by(*[('-' if absteigend != rueckwaerts else '') + name
+                         for name, absteigend in _felder(felder)])
+
+
+def _zaehlen(abschnitte, gemerkt_nehmen):
+    """Zeilen je Abschnitt — genau, oder beim Weiterblättern gemerkt."""
+    from django.core.cache import cache
+    from core.tenancy import cache_key
+
+    fingerabdruck = hashlib.md5('|'.join(str(qs.query) for qs, _ in abschnitte).encode()).hexdigest()
+    schluessel = cache_key('blaettern', fingerabdruck)
+    if gemerkt_nehmen:
+        anzahlen = cache.get(schluessel)
+        if anzahlen is not None:
+            return anzahlen
+    anzahlen = [qs.order_by().count() for qs, _ in abschnitte]
+    cache.set(schluessel, anzahlen, ZAEHLER_GUELTIGKEIT)
+    return anzahlen
+
+
+def _ab_offset(abschnitte, anzahlen, start, n):
+    zeilen = []
+    for i, (qs, felder) in enumerate(abschnitte):
+        if len(zeilen) >= n:
+            break
+        if start >= anzahlen[i]:
+            start -= anzahlen[i]
+            continue
+        zeilen += [(i, obj) for obj in _sortiert(qs, felder)[start:start + n - len(zeilen)]]
+        start = 0
+    return zeilen
+
+
+def blaettern(params, abschnitte, *, groesse=GROESSE):
+    """Eine Seite aus `abschnitte` — [(queryset, sortierfelder), …].
+
+    `params` ist `request.GET` oder ein dict mit `seite`, `nach`, `vor`.
+    """
+    try:
+        nummer = max(1, int(params.get('seite') or 1))
+    except (TypeError, ValueError):
+        nummer = 1
+    nach = _lesen(params.get('nach') or '', abschnitte) if params.get('nach') else None
+    vor = _lesen(params.get('vor') or '', abschnitte) if params.get('vor') else None
+    anzahlen = _zaehlen(abschnitte, gemerkt_nehmen=bool(nach or vor))
+    paginator = Paginator(range(sum(anzahlen)), groesse)
+
+    if vor is not None:
+        # Rückwärts lesen und umdrehen: erst der Rest des eigenen Abschnitts,
+        # dann die davor, jeweils vom Ende her.
+        zeilen = []
+        for i in range(vor[0], -1, -1):
+            qs, felder = abschnitte[i]
+            if i == vor[0]:
+                qs = qs.filter(_jenseits(_felder(felder), vor[1], rueckwaerts=True))
+            zeilen += [(i, obj) for obj in _sortiert(qs, felder, rueckwaerts=True)[:groesse + 1 - len(zeilen)]]
+            if len(zeilen) > groesse:
+                break
+        if len(zeilen) <= groesse:
+            nummer = 1          # Anfang erreicht, egal was der Link sagte
+        zeilen = list(reversed(zeilen[:groesse]))
+        mehr = True
+    else:
+        if nach is not None:
+            zeilen = []
+            for i in range(nach[0], len(abschnitte)):
+                qs, felder = abschnitte[i]
+                if i == nach[0]:
+                    qs = qs.filter(_jenseits(_felder(felder), nach[1], rueckwaerts=False))
+                zeilen += [(i, obj) for obj in _sortiert(qs, felder)[:groesse + 1 - len(zeilen)]]
+                if len(zeilen) > groesse:
+                    break
+        else:
+            nummer = min(nummer, paginator.num_pages)
+            zeilen = _ab_offset(abschnitte, anzahlen, (nummer - 1) * groesse, groesse + 1)
+        mehr = len(zeilen) > groesse
+        zeilen = zeilen[:groesse]
+
+    weiter = _schluessel(*zeilen[-1], abschnitte[zeilen[-1][0]][1]) if mehr and zeilen else None
+    zurueck = _schluessel(*zeilen[0], abschnitte[zeilen[0][0]][1]) if nummer > 1 and zeilen else None
+    from urllib.parse import urlencode
+    uebrige = [(k, v) for k in params if k not in ('seite', 'nach', 'vor')
+               for v in (params.getlist(k) if hasattr(params, 'getlist') else [params[k]])]
+    return Blatt([obj for _, obj in zeilen], nummer, paginator, weiter, zurueck,
+                 urlencode(uebrige))
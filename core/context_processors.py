@@ -1,6 +1,3 @@
-from crm.models import Eigentuemer
-
-
 def fw_badges(request):
     """Stellt Zähler für die Sidebar-Badges bereit (nur für eingeloggte
     Team-Mitglieder in der /neu/-Oberfläche). Zählt ungelesene Schadenmeldungen."""
@@ -19,14 +16,18 @@ def fw_badges(request):
 
 
 def admin_baum_navigation(request):
-    if request.path.startswith('/admin/'):
-        baum_daten = Eigentuemer.objects.prefetch_related(
-            'liegenschaften',
-            'liegenschaften__einheiten',
-            'liegenschaften__einheiten__geraete',
-            'liegenschaften__einheiten__vertraege',
-            'liegenschaften__einheiten__vertraege__mieter',
-            'liegenschaften__einheiten__leerstaende'
-        ).all()
-        return {'custom_admin_nav': baum_daten}
-    return {}
\ No newline at end of file
+    """Wurzeln der Admin-Seitenleiste — nur die Eigentümer, die Kinder lädt
+    der Browser beim Aufklappen (`core.services.admin_baum`).
+
+    Übergeben wird die Funktion, nicht ihr Ergebnis: Das Template ruft sie
+    erst auf, wenn es die Seitenleiste wirklich zeichnet. Eine Admin-Seite,
+    die sie nicht zeigt (Popup, JSON, Weiterleitung), fragt nichts ab.
+    """
+    user = getattr(request, 'user', None)
+    if not request.path.startswith('/admin/') or not user or not user.is_staff:
+        return {}
+    from core.tenancy import aktuelle_organisation
+    if aktuelle_organisation() is None:
+        return {}
+    from core.services.admin_baum import wurzeln
+    return {'custom_admin_nav': wurzeln}
@@ -0,0 +1,88 @@
+"""Einen Bank-Kontoauszug (camt.053/054 oder Bank-CSV) ohne Browser importieren.
+
+    python manage.py bank_import auszug.xml --organisation 3
+    python manage.py bank_import auszug.xml --organisation 3 --konto 1021
+    python manage.py bank_import auszug.csv --organisation 3 --probelauf
+
+Dieselben Schritte wie der Import im Bankabgleich (`core.services.bankimport`):
+Duplikate überspringen, Zahlungen per Referenz, Name+Betrag oder gelerntem
+Absender zuordnen, den Rest auf 1190 bzw. 2030 parken, Belastungen in den
+Bank-Eingang legen. Gedacht für Auszüge, die die Bank per SFTP/EBICS ablegt,
+und für grosse Jahresauszüge, die im Browser an die Zeitgrenze stossen.
+
+`--organisation` ist Pflicht: Ein Kontoauszug gehört genau einer Verwaltung.
+Über alle zu laufen hiesse, dieselben Zahlungen in jede Verwaltung zu buchen.
+`--probelauf` zeigt die Zuordnung, ohne etwas zu schreiben.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Importiert einen Bank-Kontoauszug (camt.053/054 oder CSV) für eine Verwaltung.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('datei', help='Pfad zur Auszugsdatei (XML oder CSV).')
+        parser.add_argument('--organisation', type=int, required=True,
+                            help='Verwaltung (ID), der der Auszug gehört.')
+        parser.add_argument('--konto', default='1020',
+                            help='Buchungskonto der Bank (Standard 1020).')
+        parser.add_argument('--probelauf', action='store_true',
+                            help='Nur zuordnen und anzeigen — nichts schreiben.')
+
+    def handle(self, *args, **opts):
+        from core.tenancy import je_organisation
+
+        try:
+            with open(opts['datei'], 'rb') as datei:
+                ergebnisse, fehler = je_organisation(
+                    lambda organisation: self._importieren(organisation, datei, opts),
+                    auswahl=opts['organisation'], ausgabe=self.stderr)
+        except OSError as exc:
+            raise CommandError(f"Datei nicht lesbar: {exc}")
+        if fehler:
+            raise CommandError(f"Bank-Import abgebrochen — {fehler[0][1]}")
+        if ergebnisse and ergebnisse[0].get('gesperrt'):
+            raise CommandError(f"{ergebnisse[0]['gesperrt']} Zahlung(en) in gesperrter Periode "
+                               "nicht verbucht — Periode öffnen und erneut importieren.")
+
+    def _importieren(self, organisation, datei, opts):
+        import os
+        from core.models import AktivitaetsLog
+        from core.services import bankimport
+
+        quelle = bankimport.erkenne_format(datei)
+        eintraege, kopf = bankimport.lese_datei(datei, quelle)
+        plan = bankimport.planen(eintraege)
+        if opts['probelauf']:
+            arten = {}
+            for s in plan['schritte']:
+                arten[s['art']] = arten.get(s['art'], 0) + 1
+                if s['rechnung'] is not None:
+                    self.stdout.write(f"  {s['eintrag']['datum']} CHF {s['eintrag']['betrag']} "
+                                      f"→ {s['art']}: {s['rechnung'].titel}")
+            self.stdout.write(f"{organisation}: Probelauf {quelle} — {len(eintraege)} Bewegung(en), "
+                              + ", ".join(f"{n} {a}" for a, n in sorted(arten.items()))
+                              + ". Nichts geschrieben.")
+            return {}
+
+        dateiname = os.path.basename(opts['datei'])
+        erg = bankimport.ausfuehren(plan, kopf, bank_nr=opts['konto'], quelle=quelle,
+                                    dateiname=dateiname)
+        msg = (f"{erg['verbucht']} zugeordnet (CHF {erg['zugeordnet_summe']}, "
+               f"davon {erg['fuzzy']} Name/Betrag, {erg['gelernt']} gelernter Absender), "
+               f"{erg['guthaben']} Guthaben auf 2030, {erg['geklaert']} auf 1190, "
+               f"{erg['belastungen']} Belastung(en), {erg['duplikate']} Duplikat(e), "
+               f"{erg['gesperrt']} Periodensperre")
+        AktivitaetsLog.objects.create(aktion=f"{quelle}-Import (Befehl)", objekt=dateiname[:200],
+                                      details=msg)
+        self.stdout.write(self.style.SUCCESS(f"{organisation}: {quelle} — {msg}."))
+        abgleich = bankimport.saldoabgleich(erg['auszug'])
+        if abgleich is not None:
+            buch_saldo, diff = abgleich
+            if diff == 0:
+                self.stdout.write(f"  Saldoabgleich {erg['bank_nr']}: stimmt (CHF {buch_saldo}).")
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f"  Saldoabgleich {erg['bank_nr']}: Auszug CHF {erg['auszug'].schlusssaldo}, "
+                    f"Buchhaltung CHF {buch_saldo} — Differenz CHF {diff}."))
+        return erg
@@ -3,6 +3,7 @@ Für PythonAnywhere Scheduled Task (jährlich, z.B. 2. Januar):
 
     python manage.py jahresabschluss_lauf --jahr 2026
     python manage.py jahresabschluss_lauf --jahr 2026 --organisation 3
+    python manage.py jahresabschluss_lauf --parallel 4   # vier Verwaltungen gleichzeitig
 
 Ohne --jahr wird das Vorjahr abgeschlossen.
 
@@ -25,13 +26,16 @@ class Command(BaseCommand):
         parser.add_argument('--jahr', type=int, default=timezone.localdate().year - 1)
         parser.add_argument('--organisation', type=int, default=None,
                             help='Nur diese Verwaltung (ID). Ohne Angabe: alle.')
+        parser.add_argument('--parallel', type=int, default=1,
+                            help='So viele Verwaltungen gleichzeitig, je in einem eigenen Prozess.')
 
     def handle(self, *args, **opts):
         from core.tenancy import je_organisation
 
         jahr = opts['jahr']
         _, fehler = je_organisation(lambda organisation: self._abschliessen(organisation, jahr),
-                                    auswahl=opts.get('organisation'), ausgabe=self.stderr)
+                                    auswahl=opts.get('organisation'), ausgabe=self.stderr,
+                                    protokoll=self.stdout, parallel=opts.get('parallel') or 1)
         if fehler:
             raise CommandError(f"Jahresabschluss {jahr}: {len(fehler)} Verwaltung(en) "
                                f"abgebrochen — {', '.join(str(o) for o, _ in fehler)}.")
@@ -2,7 +2,9 @@
 Task (z.B. wöchentlich):
 
     python manage.py mahnlauf [--zins] [--kein-versand]
+    python manage.py mahnlauf --probelauf        # nur anzeigen, nichts schreiben
     python manage.py mahnlauf --organisation 3
+    python manage.py mahnlauf --parallel 4       # vier Verwaltungen gleichzeitig
 
 JE VERWALTUNG EIN LAUF. Der Lauf verschickt Mahnungen mit Namen und Betrag an
 Mieter; ein Lauf über den gesamten Bestand wäre also nicht bloss falsch
@@ -21,23 +23,39 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--zins', action='store_true', help="Verzugszins (5%) berechnen")
         parser.add_argument('--kein-versand', action='store_true', help="Keine E-Mails versenden")
+        parser.add_argument('--probelauf', action='store_true',
+                            help="Nur planen und anzeigen — keine Mahnung, Gebühr oder E-Mail.")
         parser.add_argument('--organisation', type=int, default=None,
                             help='Nur diese Verwaltung (ID). Ohne Angabe: alle.')
+        parser.add_argument('--parallel', type=int, default=1,
+                            help='So viele Verwaltungen gleichzeitig, je in einem eigenen Prozess.')
 
     def handle(self, *args, **opts):
         from core.tenancy import je_organisation
 
         _, fehler = je_organisation(lambda organisation: self._mahnen(organisation, opts),
-                                    auswahl=opts.get('organisation'), ausgabe=self.stderr)
+                                    auswahl=opts.get('organisation'), ausgabe=self.stderr,
+                                    protokoll=self.stdout, parallel=opts.get('parallel') or 1)
         if fehler:
             raise CommandError(f"Mahnlauf: {len(fehler)} Verwaltung(en) abgebrochen — "
                                f"{', '.join(str(o) for o, _ in fehler)}.")
 
     def _mahnen(self, organisation, opts):
         res = run_mahnlauf(aktive_lg=None, send_email=not opts['kein_versand'],
-                           mit_zins=opts['zins'], user=None)
+                           mit_zins=opts['zins'], user=None, probelauf=opts['probelauf'])
+        if opts['probelauf']:
+            for s in res['plan']:
+                r = s['rechnung']
+                self.stdout.write(
+                    f"  {organisation}: {s['stufe']}. Mahnung · {r.titel} · offen CHF {s['offen']} "
+                    f"· {s['tage']} Tage · Gebühr CHF {s['gebuehr']} · Zins CHF {s['zins']}"
+                    f"{' · E-Mail' if s['per_email'] else ''}")
+            self.stdout.write(f"{organisation}: Probelauf — {res['gemahnt']} Mahnung(en) geplant, "
+                              f"Gebühren CHF {res['gebuehren']}, Zins CHF {res['zins']}. Nichts geschrieben.")
+            return res
         msg = (f"Mahnlauf: {res['gemahnt']} gemahnt, {res['emails']} E-Mails, "
-               f"Gebühren CHF {res['gebuehren']}, Zins CHF {res['zins']}.")
+               f"Gebühren CHF {res['gebuehren']}, Zins CHF {res['zins']}"
+               f"{f', {n} schon gemahnt' if (n := res['uebersprungen']) else ''}.")
         AktivitaetsLog.objects.create(aktion="Mahnlauf (Scheduler)", objekt="Sammellauf",
                                       details=msg)
         self.stdout.write(self.style.SUCCESS(f"{organisation}: {msg}"))
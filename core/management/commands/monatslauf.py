@@ -3,6 +3,7 @@
 
     python manage.py monatslauf                    # alle Verwaltungen
     python manage.py monatslauf --organisation 3   # nur diese eine nachholen
+    python manage.py monatslauf --parallel 4       # vier Verwaltungen gleichzeitig
 
 Ohne --jahr/--monat wird der aktuelle Monat gestellt.
 
@@ -15,7 +16,11 @@ Rechnung im falschen Bestand ist ein Beleg mit fremder Nummer im Journal
 
 Bricht eine Verwaltung ab, laufen die übrigen weiter (siehe `je_organisation`)
 — sonst bliebe der halbe Bestand ungestellt, weil bei einer Verwaltung ein
-Konto fehlt. Der Befehl endet trotzdem mit Fehler, damit es auffällt."""
+Konto fehlt. Der Befehl endet trotzdem mit Fehler, damit es auffällt.
+
+Der Scheduler stellt über den Stapelweg (`run_sollstellung(..., bulk=True)`):
+dasselbe Journal wie der Einzelweg, aber mit einer Handvoll Abfragen statt
+einigen je Vertrag. Mit `--einzeln` läuft der Einzelweg, etwa zum Vergleich."""
 from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 
@@ -32,22 +37,28 @@ class Command(BaseCommand):
         parser.add_argument('--monat', type=int, default=heute.month)
         parser.add_argument('--organisation', type=int, default=None,
                             help='Nur diese Verwaltung (ID). Ohne Angabe: alle.')
+        parser.add_argument('--parallel', type=int, default=1,
+                            help='So viele Verwaltungen gleichzeitig, je in einem eigenen Prozess.')
+        parser.add_argument('--einzeln', action='store_true',
+                            help='Vertrag für Vertrag stellen statt im Stapel.')
 
     def handle(self, *args, **opts):
         from core.tenancy import je_organisation
 
         jahr, monat = opts['jahr'], opts['monat']
+        bulk = not opts.get('einzeln')
         _, fehler = je_organisation(
-            lambda organisation: self._stellen(organisation, jahr, monat),
-            auswahl=opts.get('organisation'), ausgabe=self.stderr)
+            lambda organisation: self._stellen(organisation, jahr, monat, bulk),
+            auswahl=opts.get('organisation'), ausgabe=self.stderr,
+            protokoll=self.stdout, parallel=opts.get('parallel') or 1)
         if fehler:
             raise CommandError(
                 f"Sollstellung {monat:02d}/{jahr}: {len(fehler)} Verwaltung(en) "
                 f"abgebrochen — {', '.join(str(o) for o, _ in fehler)}.")
 
-    def _stellen(self, organisation, jahr, monat):
+    def _stellen(self, organisation, jahr, monat, bulk=True):
         try:
-            n = run_sollstellung(jahr, monat, user=None)
+            n = run_sollstellung(jahr, monat, user=None, bulk=bulk)
         except RuntimeError as e:
             # Fachlicher Abbruch (z.B. gesperrte Periode) — kein Programmfehler,
             # aber auch kein Erfolg: als Fehler weiterreichen, damit der Lauf
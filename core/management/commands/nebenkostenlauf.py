@@ -0,0 +1,57 @@
+"""Nebenkostenlauf: alle NK-Abrechnungen eines Jahres, je Verwaltung.
+Für PythonAnywhere Scheduled Task (jährlich, im September) oder von Hand:
+
+    python manage.py nebenkostenlauf                   # Vorjahr, alle Verwaltungen
+    python manage.py nebenkostenlauf --jahr 2025 --organisation 3
+    python manage.py nebenkostenlauf --prozesse 4      # PDFs auf vier Prozessen
+    python manage.py nebenkostenlauf --neu             # Manifest verwerfen
+
+Rechnet jede Abrechnungsperiode, die im Jahr endet, zeichnet je Mieter das
+PDF, legt es in seine Akte (→ Mieterportal) und schreibt ein Manifest (siehe
+`core.services.nebenkostenlauf`). Bricht der Lauf ab, macht der nächste
+Aufruf beim ersten fehlenden Stapel weiter.
+
+`--prozesse` verteilt das Zeichnen innerhalb einer Verwaltung; die
+Verwaltungen selbst laufen nacheinander — zwei Pools gleichzeitig hätten
+dieselben Prozessoren nur geteilt.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import AktivitaetsLog
+
+
+class Command(BaseCommand):
+    help = "Erzeugt und legt alle NK-Abrechnungen eines Jahres ab — je Verwaltung, wiederaufsetzbar."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jahr', type=int, default=timezone.localdate().year - 1)
+        parser.add_argument('--organisation', type=int, default=None,
+                            help='Nur diese Verwaltung (ID). Ohne Angabe: alle.')
+        parser.add_argument('--prozesse', type=int, default=1,
+                            help='So viele Prozesse zeichnen die PDFs.')
+        parser.add_argument('--neu', action='store_true',
+                            help='Manifest verwerfen und alles neu erzeugen.')
+
+    def handle(self, *args, **opts):
+        from core.tenancy import je_organisation
+
+        jahr = opts['jahr']
+        _, fehler = je_organisation(lambda organisation: self._abrechnen(organisation, jahr, opts),
+                                    auswahl=opts.get('organisation'), ausgabe=self.stderr)
+        if fehler:
+            raise CommandError(f"Nebenkostenlauf {jahr}: {len(fehler)} Verwaltung(en) "
+                               f"abgebrochen — {', '.join(str(o) for o, _ in fehler)}.")
+
+    def _abrechnen(self, organisation, jahr, opts):
+        from core.services.nebenkostenlauf import nebenkostenlauf
+
+        res = nebenkostenlauf(jahr, prozesse=opts['prozesse'], neu=opts['neu'])
+        msg = (f"Nebenkostenlauf {jahr}: {res['abgelegt']} Abrechnung(en) abgelegt, "
+               f"{res['uebersprungen']} schon vorhanden, {res['fehler']} Periode(n) mit Fehler — "
+               f"{res['sekunden']} s, {res['je_sekunde']}/s.")
+        if res['abgelegt'] or res['fehler']:
+            AktivitaetsLog.objects.create(aktion="Nebenkostenlauf (Scheduler)",
+                                          objekt=str(jahr), details=msg)
+        self.stdout.write(self.style.SUCCESS(f"{organisation}: {msg}"))
+        return res
@@ -0,0 +1,44 @@
+"""Stellt fällige Mails aus dem Postausgang (`core.Postausgang`) zu.
+
+    python manage.py postausgang_senden
+    python manage.py postausgang_senden --organisation 3
+    python manage.py postausgang_senden --dauerhaft        # Always-on Task
+
+Ohne `--dauerhaft` wird abgearbeitet, bis nichts Fälliges mehr zugestellt
+werden kann, und beendet — für einen Scheduled Task alle paar Minuten. Mit
+`--dauerhaft` schaut der Befehl alle `--pause` Sekunden erneut nach; so
+werden verschobene Nachrichten pünktlich wiederholt statt erst beim
+täglichen Lauf.
+
+Der Befehl läuft über alle Verwaltungen in einem Durchgang, nicht je
+Verwaltung: Jede Nachricht trägt Empfänger und Inhalt fertig in sich, und
+eine Verbindung für alle ist gerade der Zweck. Mehrere gleichzeitige Läufe
+sind unschädlich — jede Nachricht wird vor dem Senden beansprucht.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Stellt fällige Mails aus dem Postausgang zu (eine Verbindung je Stapel)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organisation', type=int, default=None,
+                            help='Nur diese Verwaltung (ID). Ohne Angabe: alle.')
+        parser.add_argument('--dauerhaft', action='store_true',
+                            help='Nicht beenden, sondern immer wieder nachschauen.')
+        parser.add_argument('--pause', type=int, default=30,
+                            help='Sekunden zwischen zwei Durchgängen mit --dauerhaft.')
+
+    def handle(self, *args, **opts):
+        from core.services.postausgang import alles_abarbeiten
+
+        while True:
+            ergebnis = alles_abarbeiten(organisation=opts['organisation'])
+            if any(ergebnis.values()) or not opts['dauerhaft']:
+                self.stdout.write(f"{ergebnis['gesendet']} gesendet, {ergebnis['verschoben']} verschoben, "
+                                  f"{ergebnis['aufgegeben']} aufgegeben.")
+            if not opts['dauerhaft']:
+                return
+            time.sleep(opts['pause'])
@@ -0,0 +1,62 @@
+"""Saldenbuch aus dem Journal neu aufbauen oder gegen das Journal prüfen.
+
+    python manage.py saldenbuch --pruefen                  # nur vergleichen
+    python manage.py saldenbuch                            # neu aufbauen
+    python manage.py saldenbuch --organisation 3           # nur diese Verwaltung
+
+Das Saldenbuch (`finance.models.Saldenbuch`) wird beim Buchen nachgeführt und
+stimmt, solange jede Buchung über `save()` oder `buche_stapel()` ins Journal
+kommt. Nach `loaddata`, einem Roh-SQL-Eingriff oder einem
+`QuerySet.update()` auf Buchungen stimmt es nicht mehr — und niemand merkt
+es, weil Erfolgsrechnung und Jahresabschluss dann schlicht andere Zahlen
+zeigen als das Journal.
+
+`--pruefen` ändert nichts und endet mit Code 1, wenn eine Verwaltung
+abweicht; so lässt es sich nach dem Deploy oder nächtlich laufen lassen.
+Der Neuaufbau ersetzt das Saldenbuch je Verwaltung in einer Transaktion.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Baut das Saldenbuch aus dem Journal neu auf oder prüft es (--pruefen).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pruefen', action='store_true',
+                            help='Nur vergleichen und Abweichungen melden, nichts schreiben.')
+        parser.add_argument('--organisation', type=int, default=None,
+                            help='Nur diese Verwaltung (ID). Ohne Angabe: alle.')
+
+    def handle(self, *args, **opts):
+        from core.tenancy import je_organisation
+
+        arbeit = self._pruefen if opts['pruefen'] else self._aufbauen
+        ergebnisse, fehler = je_organisation(arbeit, auswahl=opts['organisation'],
+                                             ausgabe=self.stderr)
+        if fehler:
+            raise CommandError(f"Saldenbuch: {len(fehler)} Verwaltung(en) abgebrochen — "
+                               f"{', '.join(str(o) for o, _ in fehler)}.")
+        if opts['pruefen'] and any(ergebnisse):
+            raise CommandError(f"Saldenbuch weicht in {sum(1 for n in ergebnisse if n)} "
+                               "Verwaltung(en) vom Journal ab — `manage.py saldenbuch` baut es neu auf.")
+
+    def _aufbauen(self, organisation):
+        from finance.models import Saldenbuch
+        n = Saldenbuch.neu_aufbauen(organisation.pk)
+        self.stdout.write(self.style.SUCCESS(f'✓ {organisation}: {n} Saldenzeile(n) aus dem Journal.'))
+        return n
+
+    def _pruefen(self, organisation):
+        from finance.models import Saldenbuch
+        abweichungen = Saldenbuch.abweichungen(organisation.pk)
+        for (_, konto_id, lg_id, jahr, monat, _, _), ist, soll in abweichungen[:20]:
+            self.stdout.write(
+                f'  {organisation}: Konto {konto_id}, Liegenschaft {lg_id or "–"}, '
+                f'{monat:02d}/{jahr}: Saldenbuch S {ist[0]} / H {ist[1]}, '
+                f'Journal S {soll[0]} / H {soll[1]}')
+        if abweichungen:
+            self.stdout.write(self.style.WARNING(
+                f'✗ {organisation}: {len(abweichungen)} Abweichung(en).'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ {organisation}: Saldenbuch stimmt.'))
+        return len(abweichungen)
@@ -14,6 +14,11 @@ JE VERWALTUNG EIN LAUF. Der Report nennt Liegenschaften, Mieterträge und
 Leerstände — ein Lauf über den gesamten Bestand schickte einem Eigentümer die
 Zahlen fremder Portfolios. Seit Etappe 6.2 wirft `Eigentuemer.objects` ohne
 Kontext, statt die falschen Empfänger zu bedienen.
+
+Die Reports gehen über den Postausgang: erst alle eingereiht, dann je
+Verwaltung über eine Verbindung zugestellt. Ein zweiter Lauf am selben Tag
+(Scheduler doppelt, Neustart nach Abbruch) reiht nichts nochmals ein; was
+der Server abwies, holt `postausgang_senden` nach.
 """
 import datetime
 
@@ -29,21 +34,25 @@ class Command(BaseCommand):
         parser.add_argument('--dry-run', action='store_true')
         parser.add_argument('--organisation', type=int, default=None,
                             help='Nur diese Verwaltung (ID). Ohne Angabe: alle.')
+        parser.add_argument('--parallel', type=int, default=1,
+                            help='So viele Verwaltungen gleichzeitig, je in einem eigenen Prozess.')
 
     def handle(self, *args, **opts):
         from core.tenancy import je_organisation
 
         jahr = opts['jahr'] or (datetime.date.today().year - 1)
         _, fehler = je_organisation(lambda organisation: self._senden(organisation, jahr, opts),
-                                    auswahl=opts.get('organisation'), ausgabe=self.stderr)
+                                    auswahl=opts.get('organisation'), ausgabe=self.stderr,
+                                    protokoll=self.stdout, parallel=opts.get('parallel') or 1)
         if fehler:
             raise CommandError(f"{len(fehler)} Verwaltung(en) abgebrochen — "
                                f"{', '.join(str(o) for o, _ in fehler)}.")
 
     def _senden(self, organisation, jahr, opts):
         from crm.models import Eigentuemer
-        from core.views.portal import _portfolio_daten
+        from core.services.eigentuemer_portfolio import portfolio_daten
         from core.services.portfolio_report import generate_portfolio_report
+        from core.services.postausgang import alles_abarbeiten
         from core.services.steuerauszug import generate_steuerauszug_pdf
         from core.utils.email_service import send_report_mail
 
@@ -51,12 +60,13 @@ class Command(BaseCommand):
         if opts['nur_mit_portal']:
             qs = qs.filter(benutzer__isnull=False)
 
-        gesendet = 0
+        heute = datetime.date.today()
+        gesendet = schon = 0
         for md in qs:
             if not md.email:
                 continue
             try:
-                report = generate_portfolio_report(md, _portfolio_daten(md))
+                report = generate_portfolio_report(md, portfolio_daten(md))
                 steuer = generate_steuerauszug_pdf(md, jahr)
             except Exception as e:
                 self.stderr.write(f"  ✗ {md.firma_oder_name}: Report-Fehler {e}")
@@ -74,10 +84,24 @@ class Command(BaseCommand):
             if opts['dry_run']:
                 self.stdout.write(f"  (dry-run) → {md.firma_oder_name} <{md.email}>")
                 continue
-            if send_report_mail(md.email, f"Ihr Liegenschafts-Report {jahr}", html, anhaenge):
+            eingereiht = send_report_mail(
+                md.email, f"Ihr Liegenschafts-Report {jahr}", html, anhaenge,
+                schluessel=f"eigentuemer-report:{md.pk}:{jahr}:{heute:%Y-%m-%d}")
+            if eingereiht is None:
+                # Heute schon eingereiht (zweiter Lauf): nicht nochmals zählen.
+                schon += 1
+                self.stdout.write(f"  · {md.firma_oder_name} <{md.email}>: heute schon eingereiht")
+            elif eingereiht:
                 gesendet += 1
                 self.stdout.write(self.style.SUCCESS(f"  ✓ {md.firma_oder_name} <{md.email}>"))
 
+        # Auch ohne neue Mail abarbeiten: Was ein abgebrochener erster Lauf
+        # eingereiht hat, geht sonst erst mit dem nächsten Postausgang-Lauf.
+        zugestellt = alles_abarbeiten(organisation=organisation) if gesendet or schon else {}
         self.stdout.write(self.style.SUCCESS(
-            f"{organisation}: {gesendet} Report-Mail(s) versendet (Jahr {jahr})."))
+            f"{organisation}: {gesendet} Report-Mail(s) versendet (Jahr {jahr})"
+            f"{f', {schon} schon eingereiht' if schon else ''}."))
+        if zugestellt.get('verschoben') or zugestellt.get('aufgegeben'):
+            self.stderr.write(f"  {zugestellt.get('verschoben', 0)} verschoben, "
+                              f"{zugestellt.get('aufgegeben', 0)} aufgegeben — siehe Postausgang.")
         return gesendet
@@ -15,8 +15,16 @@ führt sie über Djangos eigene Verbindung aus — ohne externes Programm.
     python manage.py sequenzen_richten              # setzen
     python manage.py sequenzen_richten --nur-zeigen # nur ausgeben
 
-Auf SQLite ist der Befehl ein Leerlauf: Dort gibt es keine Sequenzen, und
-`sequence_reset_sql` liefert eine leere Liste.
+Auf SQLite ist der Teil mit den ID-Zählern ein Leerlauf: Dort gibt es keine
+Sequenzen, und `sequence_reset_sql` liefert eine leere Liste.
+
+DIE BELEGNUMMERN GEHÖREN DAZU. Seit es den `Belegnummernkreis` gibt, zählt
+jede Verwaltung ihre Belegnummern in einer eigenen Zeile statt über
+`Max(beleg_nr)`. Nach `loaddata` kann dieser Zähler hinter dem Journal stehen
+— dieselbe Falle wie bei den IDs, nur dass hier keine Datenbanksequenz,
+sondern OR 957a/958f betroffen ist. Der Befehl gleicht die Zähler deshalb an
+(auf jeder Datenbank) und meldet jede Verwaltung, deren Belegnummern nicht
+lückenlos bei 1 beginnen.
 """
 from django.apps import apps
 from django.core.management.base import BaseCommand
@@ -33,6 +41,8 @@ class Command(BaseCommand):
             help='Anweisungen ausgeben, ohne sie auszuführen.')
 
     def handle(self, *args, **optionen):
+        self._belegnummern(optionen['nur_zeigen'])
+
         modelle = [m for konfig in apps.get_app_configs()
                    if konfig.models_module is not None
                    for m in konfig.get_models(include_auto_created=True)]
@@ -58,3 +68,26 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS(
             f'✓ {len(anweisungen)} Sequenz(en) auf den tatsächlichen Bestand gesetzt.'))
+
+    def _belegnummern(self, nur_zeigen):
+        """Belegnummernzähler auf das Journal angleichen und Lücken melden."""
+        from django.db.models import Count, Max
+
+        from finance.models import Belegnummernkreis, Buchung
+
+        # `alle_organisationen`: Ein Umzug betrifft den ganzen Bestand, und die
+        # Auswertung gruppiert ausdrücklich je Organisation.
+        je_org = (Buchung.alle_organisationen.values('organisation_id')
+                  .annotate(hoechste=Max('beleg_nr'), anzahl=Count('beleg_nr'))
+                  .order_by('organisation_id'))
+        for zeile in je_org:
+            if (zeile['hoechste'] or 0) != zeile['anzahl']:
+                self.stdout.write(self.style.WARNING(
+                    f"! Verwaltung {zeile['organisation_id']}: {zeile['anzahl']} Belegnummern, "
+                    f"höchste {zeile['hoechste']} — die Folge ist nicht lückenlos."))
+        if nur_zeigen:
+            return
+        korrigiert = Belegnummernkreis.angleichen()
+        if korrigiert:
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ {korrigiert} Belegnummernzähler auf das Journal gesetzt.'))
@@ -4,21 +4,24 @@
     python manage.py taeglicher_lauf --organisation 3
 
 Generiert Auto-Pendenzen (Fristen), aktualisiert Marktdaten (Referenzzins/LIK)
-und verschickt am gewählten Wochentag das Fristen-Wochenmail — so genügt ein
-einziger täglicher Scheduled Task.
+verschickt am gewählten Wochentag das Fristen-Wochenmail, holt nach, was
+im Postausgang liegen blieb, räumt dort Erledigtes weg, führt die Senkungsansprüche nach und rechnet
+den Stand der Startseite vor — so genügt ein einziger täglicher Scheduled
+Task.
 
 ZWEI ARTEN VON TEILLÄUFEN, und sie dürfen nicht vermischt werden:
 
 **Teile mit eigener Schleife** — `generate_auto_pendenzen`,
-`update_verwaltung_rates` und `fristen_digest` gehen selbst über alle
+`update_verwaltung_rates`, `fristen_digest` und der Postausgang gehen selbst über alle
 Verwaltungen (Etappe 6.1/6.2). Sie werden hier GENAU EINMAL aufgerufen. Steckte
 man sie zusätzlich in die Schleife unten, liefe jeder von ihnen n-mal über n
 Verwaltungen: das Fristen-Mail käme n-fach an, und die Marktdaten würden n-mal
 abgeholt.
 
-**Teile ohne eigene Schleife** — `run_adress_umzuege` und die
-Bewerbungs-Bereinigung greifen über `Mieter.objects` bzw.
-`Mietbewerbung.objects` zu und brauchen darum je Verwaltung einen Kontext.
+**Teile ohne eigene Schleife** — `run_adress_umzuege`, die
+Bewerbungs-Bereinigung, die Senkungsansprüche und der Stand der Startseite
+(`faelle.startseite`) greifen über die gefilterten Manager zu oder rechnen
+ausdrücklich für eine Verwaltung und laufen darum je Verwaltung.
 
 Der Aktivitätslog wird je Verwaltung geschrieben; er ist selbst Mandantendaten.
 """
@@ -39,6 +42,8 @@ class Command(BaseCommand):
                             help="Wochentag fürs Fristen-Mail (0=Montag … 6=Sonntag, -1=nie)")
         parser.add_argument('--organisation', type=int, default=None,
                             help='Nur diese Verwaltung (ID). Ohne Angabe: alle.')
+        parser.add_argument('--parallel', type=int, default=1,
+                            help='So viele Verwaltungen gleichzeitig, je in einem eigenen Prozess.')
 
     def handle(self, *args, **opts):
         from core.tenancy import je_organisation
@@ -82,10 +87,23 @@ class Command(BaseCommand):
             except Exception as e:
                 gemeinsam.append(f"Fristen-Mail übersprungen ({e})")
 
+        # Postausgang: verschobene und liegengebliebene Mails zustellen. Für
+        # den Fall, dass kein `postausgang_senden --dauerhaft` mitläuft.
+        try:
+            from core.services.postausgang import alles_abarbeiten, aufraeumen
+            zugestellt = alles_abarbeiten(organisation=nur_eine)
+            if zugestellt['gesendet']:
+                gemeinsam.append(f"{zugestellt['gesendet']} Mail(s) aus dem Postausgang zugestellt")
+            if geloescht := aufraeumen(organisation=nur_eine):
+                gemeinsam.append(f"{geloescht} erledigte Mail(s) aus dem Postausgang gelöscht")
+        except Exception as e:
+            gemeinsam.append(f"Postausgang übersprungen ({e})")
+
         # ── Teile ohne eigene Schleife: je Verwaltung ─────────────────────
         _, fehler = je_organisation(
             lambda organisation: self._je_verwaltung(organisation, gemeinsam),
-            auswahl=opts.get('organisation'), ausgabe=self.stderr)
+            auswahl=opts.get('organisation'), ausgabe=self.stderr,
+            protokoll=self.stdout, parallel=opts.get('parallel') or 1)
         if fehler:
             raise CommandError(f"Täglicher Lauf: {len(fehler)} Verwaltung(en) abgebrochen — "
                                f"{', '.join(str(o) for o, _ in fehler)}.")
@@ -113,6 +131,26 @@ class Command(BaseCommand):
         except Exception as e:
             details.append(f"Bewerbungs-Bereinigung übersprungen ({e})")
 
+        # Senkungsansprüche nachführen. Die Signale decken Zinsänderungen und
+        # gespeicherte Verträge ab; hier kommt dazu, was ohne Speichern gilt —
+        # eine Anpassung, deren `wirksam_ab` heute erreicht ist.
+        try:
+            from core.services.senkungsanspruch import aktualisieren
+            n_senkung = aktualisieren(organisation, timezone.localdate())
+            if n_senkung:
+                details.append(f"{n_senkung} Senkungsanspruch/-ansprüche nachgeführt")
+        except Exception as e:
+            details.append(f"Senkungsansprüche übersprungen ({e})")
+
+        # Zuletzt, damit der Stand die Änderungen dieses Laufs schon enthält:
+        # neue Pendenzen, aktivierte Adressen, frische Marktdaten.
+        try:
+            from faelle.startseite import vorberechnen
+            n_staende = vorberechnen(timezone.localdate())
+            details.append(f"Startseite vorgerechnet ({n_staende} Stand/Stände)")
+        except Exception as e:
+            details.append(f"Startseite übersprungen ({e})")
+
         msg = "Täglicher Lauf: " + ", ".join(details) + "."
         AktivitaetsLog.objects.create(aktion="Täglicher Lauf (Scheduler)", objekt="", details=msg)
         self.stdout.write(self.style.SUCCESS(f"{organisation}: {msg}"))
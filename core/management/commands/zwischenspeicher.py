@@ -0,0 +1,53 @@
+"""Zwischenspeicher ansehen und verwerfen (`core.services.zwischenspeicher`).
+
+    python manage.py zwischenspeicher                           # Treffer je Bereich
+    python manage.py zwischenspeicher --zuruecksetzen           # Zähler auf null
+    python manage.py zwischenspeicher --vergessen 'vertrag:*'   # alle Verwaltungen
+    python manage.py zwischenspeicher --vergessen liegenschaft:12 --organisation 3
+
+`--vergessen` ist für Änderungen, die an den Signalen vorbeigingen —
+`QuerySet.update()`, Importe mit `bulk_create()`, Roh-SQL. Sonst verwerfen
+die Signale selbst.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Zeigt Treffer/Fehlgriffe des Zwischenspeichers je Bereich oder verwirft Tags."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vergessen', nargs='+', metavar='TAG', default=None,
+                            help="Diese Tags verwerfen, z.B. 'vertrag:*' oder liegenschaft:12.")
+        parser.add_argument('--organisation', type=int, default=None,
+                            help='Nur in dieser Verwaltung (ID). Ohne Angabe: alle.')
+        parser.add_argument('--zuruecksetzen', action='store_true',
+                            help='Treffer- und Fehlgriff-Zähler auf null setzen.')
+
+    def handle(self, *args, **opts):
+        from core.services import zwischenspeicher
+        from core.tenancy import je_organisation
+
+        if opts['vergessen']:
+            def arbeit(organisation):
+                zwischenspeicher.vergessen(*opts['vergessen'])
+                self.stdout.write(f"{organisation}: {', '.join(opts['vergessen'])} verworfen.")
+
+            _, fehler = je_organisation(arbeit, auswahl=opts.get('organisation'), ausgabe=self.stderr)
+            if fehler:
+                raise CommandError(f"{len(fehler)} Verwaltung(en) abgebrochen — "
+                                   f"{', '.join(str(o) for o, _ in fehler)}.")
+            return
+        if opts['zuruecksetzen']:
+            zwischenspeicher.zaehler_zuruecksetzen()
+            self.stdout.write("Zähler zurückgesetzt.")
+            return
+
+        statistik = zwischenspeicher.statistik()
+        if not statistik:
+            self.stdout.write("Noch keine Zugriffe gezählt.")
+            return
+        breite = max(len(b) for b in statistik)
+        for bereich, z in sorted(statistik.items()):
+            quote = f"{z['quote']:.0%}" if z['quote'] is not None else '–'
+            self.stdout.write(f"{bereich:<{breite}}  {z['treffer']:>8} Treffer  "
+                              f"{z['fehlgriffe']:>8} Fehlgriffe  {quote:>5}")
@@ -34,8 +34,13 @@ logger = logging.getLogger(__name__)
 SESSION_SCHLUESSEL = 'aktive_organisation_id'
 
 
-def _organisation_fuer(benutzer, session=None):
-    """Die Organisation dieses Benutzers, oder `None`."""
+def _organisation_fuer(benutzer, session=None, rollen=None):
+    """Die Organisation dieses Benutzers, oder `None`.
+
+    `rollen` (dict) bekommt nebenbei die Rolle je gelesener Mitgliedschaft,
+    im Format von `core.auth.rollen_je_anfrage` — die Zeilen sind ohnehin da,
+    `hat_rolle` muss sie in dieser Anfrage nicht noch einmal holen.
+    """
     from crm.models import Mitgliedschaft
 
     # `alle_organisationen`: DIESE Abfrage bestimmt den Kontext erst — sie
@@ -44,6 +49,9 @@ def _organisation_fuer(benutzer, session=None):
     mitgliedschaften = list(
         Mitgliedschaft.alle_organisationen.filter(benutzer=benutzer)
         .select_related('organisation').order_by('pk')[:5])
+    if rollen is not None:
+        for m in mitgliedschaften:
+            rollen[(benutzer.pk, m.organisation_id)] = m.rolle
 
     if mitgliedschaften:
         if len(mitgliedschaften) > 1 and session is not None:
@@ -105,18 +113,28 @@ class OrganisationMiddleware:
         self.get_response = get_response
 
     def __call__(self, request):
+        from core.auth import rollen_je_anfrage
+        from finance.booking import kontenplan_zwischenspeicher
+
         vorher = aktuelle_organisation()
         try:
             benutzer = getattr(request, 'user', None)
+            rollen = {}
             if benutzer is not None and benutzer.is_authenticated:
                 organisation = _organisation_fuer(
-                    benutzer, getattr(request, 'session', None))
+                    benutzer, getattr(request, 'session', None), rollen)
                 if organisation is not None:
                     setze_organisation(organisation)
+                    # Portal-Konto: keine Mitgliedschaft, also keine Rolle.
+                    rollen.setdefault((benutzer.pk, organisation.pk), None)
                 request.organisation = organisation
             else:
                 request.organisation = None
-            return self.get_response(request)
+            # Kontenplan und Rollen je Anfrage einmal lesen: eine Ansicht, die
+            # zehn Buchungen schreibt, fragt `konto('1100')` sonst zehnmal ab,
+            # und jede Seite fragt `hat_rolle` ein Dutzend Mal.
+            with kontenplan_zwischenspeicher(), rollen_je_anfrage(rollen):
+                return self.get_response(request)
         finally:
             if vorher is None:
                 loesche_organisation()
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_suchdokument'),
+        ('crm', '0040_organisation_zweifaktor_pflicht'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Postausgang',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schluessel', models.CharField(blank=True, max_length=200, null=True, verbose_name='Idempotenz-Schlüssel')),
+                ('an', models.CharField(max_length=254, verbose_name='An')),
+                ('cc', models.JSONField(blank=True, default=list, verbose_name='Kopie an')),
+                ('betreff', models.CharField(max_length=300, verbose_name='Betreff')),
+                ('html', models.TextField(verbose_name='Inhalt (HTML)')),
+                ('status', models.CharField(choices=[('wartend', 'Wartet auf Zustellung'), ('gesendet', 'Gesendet'), ('aufgegeben', 'Aufgegeben')], default='wartend', max_length=12, verbose_name='Status')),
+                ('versuche', models.PositiveSmallIntegerField(default=0, verbose_name='Versuche')),
+                ('faellig_ab', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fällig ab')),
+                ('letzter_fehler', models.TextField(blank=True, default='', verbose_name='Letzter Fehler')),
+                ('erstellt_am', models.DateTimeField(auto_now_add=True, verbose_name='Erstellt am')),
+                ('gesendet_am', models.DateTimeField(blank=True, null=True, verbose_name='Gesendet am')),
+                ('organisation', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s', to='crm.organisation', verbose_name='Organisation')),
+            ],
+            options={
+                'verbose_name': 'Postausgang',
+                'verbose_name_plural': 'Postausgang',
+            },
+        ),
+        migrations.CreateModel(
+            name='PostausgangAnhang',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Dateiname')),
+                ('mime', models.CharField(max_length=100, verbose_name='MIME-Typ')),
+                ('inhalt', models.BinaryField(verbose_name='Inhalt')),
+                ('nachricht', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anhaenge', to='core.postausgang')),
+                ('organisation', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s', to='crm.organisation', verbose_name='Organisation')),
+            ],
+            options={
+                'verbose_name': 'Anhang im Postausgang',
+                'verbose_name_plural': 'Anhänge im Postausgang',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='postausgang',
+            index=models.Index(fields=['status', 'faellig_ab'], name='postausgang_faellig'),
+        ),
+        migrations.AddConstraint(
+            model_name='postausgang',
+            constraint=models.UniqueConstraint(fields=('organisation', 'schluessel'), name='postausgang_schluessel_je_organisation'),
+        ),
+    ]
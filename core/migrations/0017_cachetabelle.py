@@ -0,0 +1,25 @@
+"""Die Tabelle des Datenbank-Caches anlegen (`CACHE_ART=db`, der Standard).
+
+`createcachetable` legt nur an, was fehlt, und nur für konfigurierte
+`DatabaseCache`-Backends — mit Redis, Dateicache oder in den Tests (lokal)
+tut diese Migration nichts. Sie steht hier, damit der Deploy mit `migrate`
+genügt und niemand den Befehl vergessen kann.
+
+Wer später von einer anderen `CACHE_ART` auf `db` wechselt, ruft
+
+    python manage.py createcachetable
+
+selbst auf — eine bereits angewendete Migration läuft nicht erneut.
+"""
+from django.core.management import call_command
+from django.db import migrations
+
+
+def anlegen(apps, schema_editor):
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+    dependencies = [('core', '0016_postausgang')]
+
+    operations = [migrations.RunPython(anlegen, migrations.RunPython.noop)]
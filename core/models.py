@@ -1,6 +1,7 @@
 from core.utils import get_smart_upload_path, get_current_lik, get_current_ref_zins
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 from core.tenancy import AlleOrganisationenManager, TenantManager
 from core.organisation_kette import OrganisationAusKette, organisation_bestimmen
@@ -427,3 +428,118 @@ class Pendenz(OrganisationAusKette):
 
     def __str__(self):
         return f"{self.titel} ({'erledigt' if self.erledigt else 'offen'})"
+
+
+class Suchdokument(models.Model):
+    """Ein Suchdokument je Mieter, Vertrag, Objekt und Debitorenrechnung.
+
+    Die Suche lief als Kette von `icontains` über Vorname, Nachname, E-Mail,
+    Firma und gejointe Mieterfelder — auf beiden Datenbanken ein Durchlauf
+    über die ganze Tabelle samt Joins. Hier steht je Objekt EIN normalisierter
+    Text (Kleinbuchstaben, ohne Akzente), und den indexiert die Datenbank
+    selbst: FTS5 mit Trigramm-Tokenizer auf SQLite, `pg_trgm` auf Postgres
+    (Migration 0015). Gepflegt über Signale, neu aufgebaut mit
+    `python manage.py suchindex_aufbauen`; siehe `core.services.suche`.
+    """
+    organisation = models.ForeignKey('crm.Organisation', on_delete=models.CASCADE,
+                                     editable=False, related_name='%(app_label)s_%(class)s',
+                                     verbose_name='Organisation')
+    ARTEN = [
+        ('mieter', 'Person'),
+        ('vertrag', 'Vertrag'),
+        ('einheit', 'Objekt'),
+        ('rechnung', 'Debitorenrechnung'),
+    ]
+    art = models.CharField("Art", max_length=10, choices=ARTEN)
+    objekt_id = models.PositiveIntegerField("Objekt-ID")
+    titel = models.CharField("Titel", max_length=200, blank=True, default='')
+    text = models.TextField("Suchtext", blank=True, default='')
+
+    objects = TenantManager()
+    alle_organisationen = AlleOrganisationenManager()
+
+    class Meta:
+        verbose_name = "Suchdokument"
+        verbose_name_plural = "Suchdokumente"
+        constraints = [models.UniqueConstraint(fields=['art', 'objekt_id'],
+                                               name='suchdokument_je_objekt')]
+
+    def __str__(self):
+        return f"{self.get_art_display()} {self.objekt_id}: {self.titel}"
+
+
+class Postausgang(models.Model):
+    """Eine ausgehende E-Mail — erst eingereiht, dann zugestellt.
+
+    `core.utils.email_service` öffnete für jede Nachricht eine eigene
+    SMTP-Verbindung und sendete im Request oder in der Schleife des
+    Mahnlaufs. 300 Zahlungserinnerungen hielten den Lauf minutenlang auf, und
+    drosselte der Server nach der hundertsten, waren die übrigen verloren —
+    ein `print` im Log war die einzige Spur.
+
+    Jetzt wird jede Nachricht zuerst hier geschrieben und danach zugestellt
+    (`core.services.postausgang`): über EINE Verbindung je Stapel, mit
+    Wiederholung und wachsendem Abstand, gedrosselt je SMTP-Server. Ein
+    `schluessel` macht das Einreihen wiederholbar: Ein zweiter Mahnlauf am
+    selben Tag reiht dieselbe Erinnerung nicht ein zweites Mal ein.
+    """
+    organisation = models.ForeignKey('crm.Organisation', on_delete=models.CASCADE,
+                                     editable=False, related_name='%(app_label)s_%(class)s',
+                                     verbose_name='Organisation')
+
+    def save(self, *args, **kwargs):
+        if self.organisation_id is None:
+            self.organisation_id = organisation_bestimmen().pk
+        super().save(*args, **kwargs)
+
+    WARTEND = 'wartend'
+    GESENDET = 'gesendet'
+    AUFGEGEBEN = 'aufgegeben'
+    STATUS = [
+        (WARTEND, 'Wartet auf Zustellung'),
+        (GESENDET, 'Gesendet'),
+        (AUFGEGEBEN, 'Aufgegeben'),
+    ]
+    schluessel = models.CharField("Idempotenz-Schlüssel", max_length=200, null=True, blank=True)
+    an = models.CharField("An", max_length=254)
+    cc = models.JSONField("Kopie an", default=list, blank=True)
+    betreff = models.CharField("Betreff", max_length=300)
+    html = models.TextField("Inhalt (HTML)")
+    status = models.CharField("Status", max_length=12, choices=STATUS, default=WARTEND)
+    versuche = models.PositiveSmallIntegerField("Versuche", default=0)
+    #: Frühester nächster Versuch; beim Senden kurz in die Zukunft gesetzt,
+    #: damit kein zweiter Prozess dieselbe Nachricht greift.
+    faellig_ab = models.DateTimeField("Fällig ab", default=timezone.now)
+    letzter_fehler = models.TextField("Letzter Fehler", blank=True, default='')
+    erstellt_am = models.DateTimeField("Erstellt am", auto_now_add=True)
+    gesendet_am = models.DateTimeField("Gesendet am", null=True, blank=True)
+
+    objects = TenantManager()
+    alle_organisationen = AlleOrganisationenManager()
+
+    class Meta:
+        verbose_name = "Postausgang"
+        verbose_name_plural = "Postausgang"
+        indexes = [models.Index(fields=['status', 'faellig_ab'], name='postausgang_faellig')]
+        constraints = [models.UniqueConstraint(fields=['organisation', 'schluessel'],
+                                               name='postausgang_schluessel_je_organisation')]
+
+    def __str__(self):
+        return f"{self.betreff} → {self.an} ({self.get_status_display()})"
+
+
+class PostausgangAnhang(OrganisationAusKette):
+    """Ein Anhang einer ausgehenden E-Mail (PDF-Report, Foto, Mahnung)."""
+    ORGANISATION_PFAD = 'nachricht'
+
+    nachricht = models.ForeignKey(Postausgang, on_delete=models.CASCADE, related_name='anhaenge')
+    name = models.CharField("Dateiname", max_length=255)
+    mime = models.CharField("MIME-Typ", max_length=100)
+    inhalt = models.BinaryField("Inhalt")
+
+    class Meta:
+        verbose_name = "Anhang im Postausgang"
+        verbose_name_plural = "Anhänge im Postausgang"
+
+    def __str__(self):
+        return self.name
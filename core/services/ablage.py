@@ -58,6 +58,60 @@ def ablegen(pdf_bytes, titel, kategorie='korrespondenz', *,
         return None
 
 
+def ablegen_stapel(eintraege, kategorie='korrespondenz'):
+    """Viele PDFs auf einmal ablegen — je Vertrag, mit `dedup` wie `ablegen`.
+
+    `eintraege` ist eine Liste von (pdf_bytes, titel, vertrag, dateiname).
+    Gibt die Dokumente in derselben Reihenfolge zurück.
+
+    `ablegen` kostet je Dokument eine Suche nach dem Vorgänger und ein
+    INSERT; beim Nebenkostenlauf mit hunderten Abrechnungen sind das
+    hunderte Roundtrips. Hier ist es eine Suche für alle, ein `bulk_create`
+    für die neuen und ein `bulk_update` für die ersetzten. Die Dateien selbst
+    schreibt der Speicher weiterhin einzeln.
+
+    Anders als `ablegen` wirft diese Funktion: Der Stapel ist ein Lauf, und
+    ein Lauf soll seinen Fehler melden statt still nichts abzulegen.
+    """
+    from django.db import transaction
+    from rentals.models import Dokument
+
+    if not eintraege:
+        return []
+    # `alle_organisationen`: gesucht wird je (Vertrag, Titel) — die
+    # Mandantengrenze steht im Ausdruck, wie in `ablegen`.
+    vorhanden = {}
+    for dok in Dokument.alle_organisationen.filter(
+            vertrag__in=[v for _, _, v, _ in eintraege],
+            bezeichnung__in={(t or 'Dokument')[:200] for _, t, _, _ in eintraege}).order_by('id'):
+        vorhanden.setdefault((dok.vertrag_id, dok.bezeichnung), dok)
+
+    dokumente, neu, ersetzt = [], [], []
+    for pdf_bytes, titel, vertrag, dateiname in eintraege:
+        titel = (titel or 'Dokument')[:200]
+        if not (dateiname or '').lower().endswith('.pdf'):
+            dateiname = f"{_slug(dateiname or titel)}.pdf"
+        dok = vorhanden.get((vertrag.pk, titel))
+        if dok is None:
+            einheit = getattr(vertrag, 'einheit', None)
+            dok = Dokument(bezeichnung=titel, titel=titel, kategorie=kategorie,
+                           vertrag=vertrag, mieter=vertrag.mieter, einheit=einheit,
+                           liegenschaft=getattr(einheit, 'liegenschaft', None),
+                           # `bulk_create` ruft `save()` nicht auf, das sie
+                           # sonst aus der Kette ableitete.
+                           organisation_id=vertrag.organisation_id)
+            neu.append(dok)
+            vorhanden[(vertrag.pk, titel)] = dok
+        elif dok.pk is not None and dok not in ersetzt:
+            ersetzt.append(dok)
+        dok.datei.save(dateiname, ContentFile(pdf_bytes), save=False)
+        dokumente.append(dok)
+    with transaction.atomic():
+        Dokument.objects.bulk_create(neu)
+        Dokument.alle_organisationen.bulk_update(ersetzt, ['datei'])
+    return dokumente
+
+
 SIGNIERT_TITEL = "Mietvertrag (unterzeichnet)"
 
 
@@ -0,0 +1,153 @@
+"""Admin-Baum: die Seitenleiste des Stammdaten-Admins, stufenweise geladen.
+
+Bis hierhin lud `core.context_processors.admin_baum_navigation` für jede
+/admin/-Seite alle Eigentümer mit allen Liegenschaften, Einheiten, Geräten,
+Verträgen, Mietern und Leerständen — sechs Prefetch-Abfragen und das ganze
+Portfolio im Speicher, damit die Seitenleiste zugeklappte Knoten zeichnen
+konnte. Die Kosten einer Admin-Seite wuchsen so mit dem Bestand.
+
+Jetzt zeichnet die Seite nur die Wurzeln (`wurzeln()`); die Kinder eines
+Knotens holt der Browser beim ersten Aufklappen über `admin_baum_kinder`
+(`kinder(art, pk)`). Die Zahlen hinter den Knoten («3 Liegenschaften ·
+24 Einheiten») kommen aus `zaehler(stufe)` — je Verwaltung und Stufe EINE
+gruppierte Abfrage, zwischengespeichert und über die Tags der gezählten
+Quellen verworfen (`core.services.zwischenspeicher`). Eine Seite kostet damit
+eine Abfrage für die Eigentümer und einen Cache-Zugriff, gleich wie gross
+das Portfolio ist.
+"""
+from django.db.models import Count
+
+#: Stufen, die Kinder haben, in der Reihenfolge des Baums.
+STUFEN = ('eigentuemer', 'liegenschaft', 'einheit')
+
+#: Wovon die Zahlen einer Stufe abhängen. Die Sterne, weil eine neue Einheit
+#: nur ihre Liegenschaft weiterzählt, nicht deren Eigentümer (siehe `BEZUEGE`).
+_TAGS = {
+    'eigentuemer': ('liegenschaft:*', 'einheit:*'),
+    'liegenschaft': ('einheit:*',),
+    'einheit': ('vertrag:*', 'leerstand:*', 'geraet:*'),
+}
+
+
+def _gruppiert(qs, feld):
+    return {z[feld]: z['n'] for z in qs.values(feld).annotate(n=Count('pk')).order_by()}
+
+
+def _zaehler_rechnen(stufe):
+    from portfolio.models import Einheit, Geraet, Liegenschaft
+    from rentals.models import Leerstand, Mietvertrag
+
+    if stufe == 'eigentuemer':
+        liegenschaften = _gruppiert(Liegenschaft.objects.filter(eigentuemer__isnull=False), 'eigentuemer_id')
+        einheiten = _gruppiert(Einheit.objects.filter(liegenschaft__eigentuemer__isnull=False),
+                               'liegenschaft__eigentuemer_id')
+        return {pk: {'liegenschaften': n, 'einheiten': einheiten.get(pk, 0)}
+                for pk, n in liegenschaften.items()}
+    if stufe == 'liegenschaft':
+        return {pk: {'einheiten': n} for pk, n in _gruppiert(Einheit.objects.all(), 'liegenschaft_id').items()}
+    if stufe == 'einheit':
+        teile = {
+            'vertraege': _gruppiert(Mietvertrag.objects.all(), 'einheit_id'),
+            'leerstaende': _gruppiert(Leerstand.objects.all(), 'einheit_id'),
+            'geraete': _gruppiert(Geraet.objects.filter(einheit__isnull=False), 'einheit_id'),
+        }
+        return {pk: {name: werte.get(pk, 0) for name, werte in teile.items()}
+                for pk in set().union(*teile.values())}
+    raise ValueError(f'Unbekannte Stufe {stufe!r} — erwartet: {", ".join(STUFEN)}.')
+
+
+def zaehler(stufe):
+    """{pk: {was: anzahl}} für alle Knoten einer Stufe der laufenden Verwaltung.
+
+    Knoten ohne Kinder fehlen im Ergebnis — `.get(pk, {})`.
+    """
+    from core.services.zwischenspeicher import holen
+    return holen(('admin_baum', stufe), lambda: _zaehler_rechnen(stufe), tags=_TAGS[stufe])
+
+
+def _mehrzahl(anzahl, einzahl, mehrzahl):
+    return f'{anzahl} {einzahl if anzahl == 1 else mehrzahl}'
+
+
+def _zusammenfassung(werte, namen):
+    return ' · '.join(_mehrzahl(werte.get(schluessel, 0), *worte)
+                      for schluessel, worte in namen if werte.get(schluessel))
+
+
+def wurzeln():
+    """Die Eigentümer der laufenden Verwaltung als Wurzelknoten."""
+    from crm.models import Eigentuemer
+
+    anzahl = zaehler('eigentuemer')
+    knoten = []
+    for pk, name in Eigentuemer.objects.order_by('firma_oder_name', 'pk').values_list('pk', 'firma_oder_name'):
+        werte = anzahl.get(pk, {})
+        knoten.append({
+            'art': 'eigentuemer', 'id': pk, 'titel': name,
+            'url': f'/admin/crm/eigentuemer/{pk}/change/',
+            'zusatz': _zusammenfassung(werte, (('liegenschaften', ('Liegenschaft', 'Liegenschaften')),
+                                               ('einheiten', ('Einheit', 'Einheiten')))),
+            'hat_kinder': bool(werte.get('liegenschaften')),
+        })
+    return knoten
+
+
+def kinder(art, pk):
+    """Die Kinder eines Knotens, als Liste von Dicts für die Seitenleiste.
+
+    Wirft `LookupError`, wenn die Art keine Kinder hat oder der Knoten in
+    der laufenden Verwaltung nicht existiert.
+    """
+    from crm.models import Eigentuemer
+    from portfolio.models import Einheit, Geraet, Liegenschaft
+    from rentals.models import Leerstand, Mietvertrag
+
+    if art == 'eigentuemer':
+        if not Eigentuemer.objects.filter(pk=pk).exists():
+            raise LookupError(f'Eigentümer {pk} nicht gefunden.')
+        anzahl = zaehler('liegenschaft')
+        return [{
+            'art': 'liegenschaft', 'id': lg_pk, 'titel': f'{strasse}, {plz} {ort}',
+            'url': f'/admin/portfolio/liegenschaft/{lg_pk}/change/',
+            'zusatz': _zusammenfassung(anzahl.get(lg_pk, {}), (('einheiten', ('Einheit', 'Einheiten')),)),
+            'hat_kinder': bool(anzahl.get(lg_pk, {}).get('einheiten')),
+        } for lg_pk, strasse, plz, ort in Liegenschaft.objects.filter(eigentuemer_id=pk)
+            .order_by('strasse', 'pk').values_list('pk', 'strasse', 'plz', 'ort')]
+
+    if art == 'liegenschaft':
+        if not Liegenschaft.objects.filter(pk=pk).exists():
+            raise LookupError(f'Liegenschaft {pk} nicht gefunden.')
+        anzahl = zaehler('einheit')
+        namen = (('vertraege', ('Vertrag', 'Verträge')), ('leerstaende', ('Leerstand', 'Leerstände')),
+                 ('geraete', ('Gerät', 'Geräte')))
+        return [{
+            'art': 'einheit', 'id': eh_pk, 'titel': bezeichnung,
+            'url': f'/admin/portfolio/einheit/{eh_pk}/change/',
+            'zusatz': _zusammenfassung(anzahl.get(eh_pk, {}), namen),
+            'hat_kinder': bool(anzahl.get(eh_pk)),
+        } for eh_pk, bezeichnung in Einheit.objects.filter(liegenschaft_id=pk)
+            .order_by('bezeichnung', 'pk').values_list('pk', 'bezeichnung')]
+
+    if art == 'einheit':
+        if not Einheit.objects.filter(pk=pk).exists():
+            raise LookupError(f'Einheit {pk} nicht gefunden.')
+        knoten = [{
+            'art': 'vertrag', 'id': v.pk, 'titel': str(v.mieter), 'aktiv': v.aktiv,
+            'url': f'/admin/rentals/mietvertrag/{v.pk}/change/',
+            'zusatz': f'ab {v.beginn:%d.%m.%y}', 'pdf': f'/vertrag/{v.pk}/pdf/',
+        } for v in Mietvertrag.objects.filter(einheit_id=pk).select_related('mieter').order_by('-beginn', '-pk')]
+        knoten += [{
+            'art': 'leerstand', 'id': leer_pk, 'titel': grund,
+            'url': f'/admin/rentals/leerstand/{leer_pk}/change/',
+            'zusatz': f'ab {beginn:%d.%m.%y}',
+        } for leer_pk, grund, beginn in Leerstand.objects.filter(einheit_id=pk)
+            .order_by('-beginn', '-pk').values_list('pk', 'grund', 'beginn')]
+        knoten += [{
+            'art': 'geraet', 'id': g_pk,
+            'titel': ' '.join(t for t in (sonstiges or kategorie, marke, modell) if t) or 'Gerät',
+            'url': f'/admin/portfolio/geraet/{g_pk}/change/',
+        } for g_pk, kategorie, sonstiges, marke, modell in Geraet.objects.filter(einheit_id=pk)
+            .order_by('kategorie', 'pk').values_list('pk', 'kategorie', 'sonstiges_bezeichnung', 'marke', 'modell')]
+        return knoten
+
+    raise LookupError(f'Knoten der Art {art!r} haben keine Kinder.')
@@ -19,7 +19,7 @@ logger = logging.getLogger(__name__)
 # ============================================================
 # 1. SOLLSTELLUNG (monatlicher Mietenlauf)
 # ============================================================
-def run_sollstellung(jahr, monat, user=None, liegenschaft=None):
+def run_sollstellung(jahr, monat, user=None, liegenschaft=None, bulk=False):
     """Erzeugt für alle im Monat aktiven Verträge die Miet-/NK-Rechnung samt
     Buchungssätzen (idempotent — bereits gestellte Verträge werden übersprungen).
     Gibt die Anzahl neu erstellter Rechnungen zurück.
@@ -29,20 +29,23 @@ def run_sollstellung(jahr, monat, user=None, liegenschaft=None):
     nur die gefilterten Verträge zeigte und der Bestätigungsdialog deren Anzahl
     nannte. Wer auf eine Liegenschaft gefiltert hatte, stellte damit unbeabsichtigt
     allen Mietern Rechnung (Praxis-Audit). Der Scheduler ruft weiterhin ohne
-    Parameter auf und deckt das ganze Portfolio ab."""
-    from finance.models import DebitorenRechnung
-    from finance.booking import buche, ensure_kontenplan
+    Parameter auf und deckt das ganze Portfolio ab.
+
+    `bulk=True` schreibt dasselbe Journal mengenbasiert (siehe
+    `_sollstellung_stapel`): eine Abfrage für die bereits gestellten Titel,
+    ein Belegnummern-Block je Verwaltung, Rechnungen und Buchungen per
+    `bulk_create`. Der Einzelweg bleibt der Massstab — beide rechnen über
+    `_sollstellung_posten`, und `SollstellungStapelTests` hält fest, dass das
+    Ergebnis Beleg für Beleg dasselbe ist."""
+    from finance.booking import ensure_kontenplan, kontenplan_zwischenspeicher
     from rentals.models import Mietvertrag
 
     start_date = date(jahr, monat, 1)
     _, last_day = _calendar.monthrange(jahr, monat)
     end_date = date(jahr, monat, last_day)
-    titel = f"Miete & NK {monat:02d}/{jahr}"
-
-    ensure_kontenplan()   # Kontenplan garantieren (kein stiller Buchungsverlust)
 
-    erstellt = 0
-    with transaction.atomic():
+    with kontenplan_zwischenspeicher(), transaction.atomic():
+        ensure_kontenplan()   # Kontenplan garantieren (kein stiller Buchungsverlust)
         # Zeilensperre auf die aktiven Verträge: ein gleichzeitiger zweiter
         # Sollstellungs-Lauf (Button + Scheduler) blockiert bis dieser fertig ist,
         # dann greift der exists()-Check → keine doppelten Monatsmieten.
@@ -59,81 +62,214 @@ def run_sollstellung(jahr, monat, user=None, liegenschaft=None):
         if liegenschaft is not None:
             _basis = _basis.filter(einheit__liegenschaft=liegenschaft)
         locked_ids = list(_basis.select_for_update().values_list('pk', flat=True))
-        vertraege = (Mietvertrag.objects.filter(pk__in=locked_ids)
+        # Feste Reihenfolge: Die Belegnummern folgen der Reihenfolge der
+        # Verträge, und ohne `order_by` bestimmt die Datenbank sie.
+        vertraege = (Mietvertrag.objects.filter(pk__in=locked_ids).order_by('pk')
                      .select_related('mieter', 'einheit__liegenschaft'))
-        for v in vertraege:
-            if DebitorenRechnung.objects.filter(vertrag=v, titel=titel).exclude(status='storniert').exists():
-                continue
-            v_start = max(start_date, v.beginn)
-            v_ende = min(end_date, v.ende) if v.ende else end_date
-            faktor = Decimal((v_ende - v_start).days + 1) / Decimal(last_day)
-            # --- Option B: Bruttobuchung ---
-            # Referenz = die ECHTE vereinbarte Miete (Mieterspiegel/Bilanz-Ertrag),
-            # verrechnet = was der Mieter effektiv zahlt (Referenz − Rabatt/Erlass).
-            # Datierte Komponenten (Gratismonate/gestaffelter Start) haben Vorrang;
-            # sonst Staffel/Anpassung/Basiswert.
-            ref_netto = round((v.effektiver_netto_mietzins(start_date) or Decimal('0')) * faktor, 2)
-            ref_nk = round((v.effektive_nebenkosten(start_date) or Decimal('0')) * faktor, 2)
-            verr_netto = round((v.verrechneter_netto_mietzins(start_date) or Decimal('0')) * faktor, 2)
-            verr_nk = round((v.verrechnete_nebenkosten(start_date) or Decimal('0')) * faktor, 2)
-            # Rabatt = Referenz − verrechnet (nie negativ), aus den gerundeten Werten
-            # abgeleitet, damit Debitor exakt auf den verrechneten Betrag nettoiert.
-            rabatt_netto = max(Decimal('0.00'), ref_netto - verr_netto)
-            rabatt_nk = max(Decimal('0.00'), ref_nk - verr_nk)
-            if ref_netto + ref_nk <= 0:
-                continue
-            # MWST folgt dem effektiv verrechneten Betrag (nicht dem Referenzwert).
-            mwst = Decimal('0.00')
-            if v.mwst_pflichtig and (v.mwst_satz or 0) > 0:
-                mwst = round((verr_netto + verr_nk) * (v.mwst_satz / Decimal('100')), 2)
-            # Der Debitor schuldet nur den verrechneten Betrag (Gratismonat = 0).
-            # Schuldet der Mieter diesen Monat NICHTS (Gratismonat / voller Erlass),
-            # entsteht keine offene Forderung: Die Rechnung wird sofort als 'bezahlt'
-            # markiert (offener Betrag 0). Sonst stünde ein 0.00-Beleg dauerhaft als
-            # «offen» im OP-Buch und tauchte in Mahnlisten/QR-Vorschlägen auf
-            # (Live-Test E). Der volle Referenzertrag + Erlass werden trotzdem
-            # gebucht (Bilanz/Mieterspiegel korrekt), die Rechnung bleibt als
-            # Beleg/Idempotenz-Anker bestehen.
-            netto_schuld = verr_netto + verr_nk + mwst
-            rechnung = DebitorenRechnung.objects.create(
-                vertrag=v, liegenschaft=v.einheit.liegenschaft, einheit=v.einheit,
-                titel=titel, betrag=netto_schuld, faellig_am=start_date,
-                status='bezahlt' if netto_schuld <= 0 else 'offen')
-            lg = v.einheit.liegenschaft if v.einheit_id else None
-            e = v.einheit
-            # Mietertrag: Gewerbe/Parkplätze/Nebenobjekte → 3010, Wohnen → 3000.
-            ertrag_konto = "3010" if (e and e.mietrecht_kategorie in ('gewerbe', 'nebenobjekt')) else "3000"
-            # Nebenkosten: Pauschale ist definitiver Ertrag (keine Jahresabrechnung)
-            # → eigenes Konto 3021; Akonto (Vorschuss, wird abgerechnet) → 3020.
-            if getattr(v, 'nk_abrechnungsart', 'akonto') == 'pauschal':
-                nk_konto, nk_label = "3021", "NK-Pauschal"
-            else:
-                nk_konto, nk_label = "3020", "NK-Akonto"
-            # Vollen Referenzertrag als Ertrag buchen (Bilanz/Mieterspiegel korrekt) …
-            buche("1100", ertrag_konto, ref_netto, f"Mietertrag {v.mieter} - {monat:02d}/{jahr}",
-                  datum=start_date, liegenschaft=lg, debitor=rechnung, user=user)
-            buche("1100", nk_konto, ref_nk, f"{nk_label} {v.mieter} - {monat:02d}/{jahr}",
-                  datum=start_date, liegenschaft=lg, debitor=rechnung, user=user)
-            # … den Rabatt/Erlass als Ertragsminderung gegen den Debitor buchen
-            # (Soll 3090 / Haben 1100 → Debitor nettoiert auf den verrechneten Betrag).
-            buche("3090", "1100", rabatt_netto,
-                  f"Mietzinserlass {v.mieter} - {monat:02d}/{jahr}",
-                  datum=start_date, liegenschaft=lg, debitor=rechnung, user=user)
-            # NK-Erlass auf ein EIGENES Konto (3091), nicht auf 3090: Die
-            # Honorarbasis rechnet auf dem Netto-Mietertrag (3000/3010) und
-            # enthält die Nebenkosten gar nicht. Ein NK-Erlass auf 3090 hätte
-            # eine Basis gemindert, in der die Nebenkosten nie standen — das
-            # Honorar wurde systematisch zu tief und die Basis konnte bei
-            # überwiegend erlassenen Perioden sogar negativ werden (Audit).
-            buche("3091", "1100", rabatt_nk,
-                  f"NK-Erlass {v.mieter} - {monat:02d}/{jahr}",
-                  datum=start_date, liegenschaft=lg, debitor=rechnung, user=user)
-            buche("1100", "2200", mwst, f"MWST {v.mwst_satz}% {v.mieter} - {monat:02d}/{jahr}",
-                  datum=start_date, liegenschaft=lg, debitor=rechnung, user=user)
-            erstellt += 1
+        if bulk:
+            return _sollstellung_stapel(vertraege, jahr, monat, user)
+        return _sollstellung_einzeln(vertraege, jahr, monat, user)
+
+
+def _sollstellung_titel(jahr, monat):
+    return f"Miete & NK {monat:02d}/{jahr}"
+
+
+def _sollstellung_betraege(v, jahr, monat):
+    """Die Beträge EINES Vertrags für den Monat, ohne Buchungstexte.
+
+    Gibt `(ref_netto, ref_nk, rabatt_netto, rabatt_nk, mwst, netto_schuld)`
+    zurück, oder None, wenn für den Vertrag nichts zu stellen ist. Pro-Rata,
+    Rabatt/Erlass und MWST stehen nur hier: Der Lauf (`_sollstellung_posten`)
+    und die Prognose (`core.services.sollstellung_prognose`) rechnen beide
+    damit, die Prognose über viele Monate — deshalb ohne die Texte, die der
+    Lauf für jeden Buchungssatz formatiert.
+    """
+    start_date = date(jahr, monat, 1)
+    _, last_day = _calendar.monthrange(jahr, monat)
+    end_date = date(jahr, monat, last_day)
+    v_start = max(start_date, v.beginn)
+    v_ende = min(end_date, v.ende) if v.ende else end_date
+    faktor = Decimal((v_ende - v_start).days + 1) / Decimal(last_day)
+    # --- Option B: Bruttobuchung ---
+    # Referenz = die ECHTE vereinbarte Miete (Mieterspiegel/Bilanz-Ertrag),
+    # verrechnet = was der Mieter effektiv zahlt (Referenz − Rabatt/Erlass).
+    # Datierte Komponenten (Gratismonate/gestaffelter Start) haben Vorrang;
+    # sonst Staffel/Anpassung/Basiswert.
+    netto, nk, verrechnet_netto, verrechnet_nk = v.mietzins_am(start_date)
+    ref_netto = round((netto or Decimal('0')) * faktor, 2)
+    ref_nk = round((nk or Decimal('0')) * faktor, 2)
+    verr_netto = round((verrechnet_netto or Decimal('0')) * faktor, 2)
+    verr_nk = round((verrechnet_nk or Decimal('0')) * faktor, 2)
+    # Rabatt = Referenz − verrechnet (nie negativ), aus den gerundeten Werten
+    # abgeleitet, damit Debitor exakt auf den verrechneten Betrag nettoiert.
+    rabatt_netto = max(Decimal('0.00'), ref_netto - verr_netto)
+    rabatt_nk = max(Decimal('0.00'), ref_nk - verr_nk)
+    if ref_netto + ref_nk <= 0:
+        return None
+    # MWST folgt dem effektiv verrechneten Betrag (nicht dem Referenzwert).
+    mwst = Decimal('0.00')
+    if v.mwst_pflichtig and (v.mwst_satz or 0) > 0:
+        mwst = round((verr_netto + verr_nk) * (v.mwst_satz / Decimal('100')), 2)
+    # Der Debitor schuldet nur den verrechneten Betrag (Gratismonat = 0).
+    netto_schuld = verr_netto + verr_nk + mwst
+    return ref_netto, ref_nk, rabatt_netto, rabatt_nk, mwst, netto_schuld
+
+
+def _sollstellung_posten(v, jahr, monat):
+    """Rechnungsbetrag und Buchungssätze EINES Vertrags für den Monat.
+
+    Gibt `(netto_schuld, buchungen)` zurück, oder None, wenn für den Vertrag
+    nichts zu stellen ist. `buchungen` ist eine Liste von `(soll, haben,
+    betrag, text)` in der Reihenfolge, in der sie ins Journal gehen.
+
+    Rein rechnerisch — keine Schreibzugriffe. Einzel- und Stapelweg rechnen
+    beide hier, damit sie nicht auseinanderlaufen können.
+    """
+    betraege = _sollstellung_betraege(v, jahr, monat)
+    if betraege is None:
+        return None
+    ref_netto, ref_nk, rabatt_netto, rabatt_nk, mwst, netto_schuld = betraege
+    e = v.einheit
+    # Mietertrag: Gewerbe/Parkplätze/Nebenobjekte → 3010, Wohnen → 3000.
+    ertrag_konto = "3010" if (e and e.mietrecht_kategorie in ('gewerbe', 'nebenobjekt')) else "3000"
+    # Nebenkosten: Pauschale ist definitiver Ertrag (keine Jahresabrechnung)
+    # → eigenes Konto 3021; Akonto (Vorschuss, wird abgerechnet) → 3020.
+    if getattr(v, 'nk_abrechnungsart', 'akonto') == 'pauschal':
+        nk_konto, nk_label = "3021", "NK-Pauschal"
+    else:
+        nk_konto, nk_label = "3020", "NK-Akonto"
+    buchungen = [
+        # Vollen Referenzertrag als Ertrag buchen (Bilanz/Mieterspiegel korrekt) …
+        ("1100", ertrag_konto, ref_netto, f"Mietertrag {v.mieter} - {monat:02d}/{jahr}"),
+        ("1100", nk_konto, ref_nk, f"{nk_label} {v.mieter} - {monat:02d}/{jahr}"),
+        # … den Rabatt/Erlass als Ertragsminderung gegen den Debitor buchen
+        # (Soll 3090 / Haben 1100 → Debitor nettoiert auf den verrechneten Betrag).
+        ("3090", "1100", rabatt_netto, f"Mietzinserlass {v.mieter} - {monat:02d}/{jahr}"),
+        # NK-Erlass auf ein EIGENES Konto (3091), nicht auf 3090: Die
+        # Honorarbasis rechnet auf dem Netto-Mietertrag (3000/3010) und
+        # enthält die Nebenkosten gar nicht. Ein NK-Erlass auf 3090 hätte
+        # eine Basis gemindert, in der die Nebenkosten nie standen — das
+        # Honorar wurde systematisch zu tief und die Basis konnte bei
+        # überwiegend erlassenen Perioden sogar negativ werden (Audit).
+        ("3091", "1100", rabatt_nk, f"NK-Erlass {v.mieter} - {monat:02d}/{jahr}"),
+        ("1100", "2200", mwst, f"MWST {v.mwst_satz}% {v.mieter} - {monat:02d}/{jahr}"),
+    ]
+    return netto_schuld, buchungen
+
+
+def _sollstellung_rechnung(v, jahr, monat, netto_schuld):
+    """Die (ungespeicherte) Monatsrechnung eines Vertrags.
+
+    Schuldet der Mieter diesen Monat NICHTS (Gratismonat / voller Erlass),
+    entsteht keine offene Forderung: Die Rechnung wird sofort als 'bezahlt'
+    markiert (offener Betrag 0). Sonst stünde ein 0.00-Beleg dauerhaft als
+    «offen» im OP-Buch und tauchte in Mahnlisten/QR-Vorschlägen auf
+    (Live-Test E). Der volle Referenzertrag + Erlass werden trotzdem
+    gebucht (Bilanz/Mieterspiegel korrekt), die Rechnung bleibt als
+    Beleg/Idempotenz-Anker bestehen.
+    """
+    from finance.models import DebitorenRechnung
+    return DebitorenRechnung(
+        vertrag=v, liegenschaft=v.einheit.liegenschaft, einheit=v.einheit,
+        titel=_sollstellung_titel(jahr, monat), betrag=netto_schuld,
+        faellig_am=date(jahr, monat, 1),
+        status='bezahlt' if netto_schuld <= 0 else 'offen')
+
+
+def _sollstellung_einzeln(vertraege, jahr, monat, user):
+    """Der Einzelweg: je Vertrag Prüfung, Rechnung und Buchungen nacheinander."""
+    from finance.models import DebitorenRechnung
+    from finance.booking import buche
+
+    titel = _sollstellung_titel(jahr, monat)
+    start_date = date(jahr, monat, 1)
+    erstellt = 0
+    for v in vertraege:
+        if DebitorenRechnung.objects.filter(vertrag=v, titel=titel).exclude(status='storniert').exists():
+            continue
+        posten = _sollstellung_posten(v, jahr, monat)
+        if posten is None:
+            continue
+        netto_schuld, buchungen = posten
+        rechnung = _sollstellung_rechnung(v, jahr, monat, netto_schuld)
+        rechnung.save(force_insert=True)
+        lg = v.einheit.liegenschaft if v.einheit_id else None
+        for soll, haben, betrag, text in buchungen:
+            buche(soll, haben, betrag, text, datum=start_date, liegenschaft=lg, debitor=rechnung, user=user)
+        erstellt += 1
     return erstellt
 
 
+def _sollstellung_stapel(vertraege, jahr, monat, user):
+    """Der Stapelweg: dasselbe Journal wie `_sollstellung_einzeln`, mengenbasiert.
+
+    Der Einzelweg kostet je Vertrag eine `exists()`-Prüfung, ein `create()` und
+    bis zu fünf `buche()` mit je zwei Kontosuchen, einer `Max`-Abfrage für die
+    Belegnummer und einer Abfrage der Periodensperre — bei 3'000 Verträgen
+    Zehntausende Rundreisen, während die Zeilensperre gehalten wird. Hier:
+
+      · die bereits gestellten Verträge in EINER Abfrage,
+      · Mietzins-Bestandteile per `prefetch_related` statt je Vertrag,
+      · jedes Konto einmal aufgelöst (`kontenplan_zwischenspeicher`),
+      · Rechnungen und Buchungen je ein `bulk_create`, Belegnummern als Block.
+
+    `bulk_create` umgeht `save()`. Was `save()` sonst erledigt, steht deshalb
+    hier ausdrücklich: die Organisation aus der Kette, die Betragsprüfung und
+    die QRR-Referenz der Rechnung (braucht den Primärschlüssel, also danach).
+    """
+    from finance.models import DebitorenRechnung, pruefe_dezimalfelder
+    from finance.booking import buchung_vorbereiten, buche_stapel
+    from core.services import suche, zwischenspeicher
+    from core.utils.qr_code import qrr_referenz
+
+    titel = _sollstellung_titel(jahr, monat)
+    start_date = date(jahr, monat, 1)
+    gestellt = set(DebitorenRechnung.objects
+                   .filter(vertrag__in=vertraege.values('pk'), titel=titel)
+                   .exclude(status='storniert').values_list('vertrag_id', flat=True))
+    vertraege = list(vertraege.prefetch_related(
+        'mietzins_komponenten', 'staffelstufen', 'anpassungen', 'einheit__sollmietzinse'))
+
+    offen = []    # (vertrag, rechnung, buchungssätze)
+    for v in vertraege:
+        if v.pk in gestellt:
+            continue
+        posten = _sollstellung_posten(v, jahr, monat)
+        if posten is None:
+            continue
+        netto_schuld, buchungen = posten
+        rechnung = _sollstellung_rechnung(v, jahr, monat, netto_schuld)
+        rechnung.organisation_id = rechnung.organisation_aus_kette()
+        pruefe_dezimalfelder(rechnung)
+        offen.append((v, rechnung, buchungen))
+    if not offen:
+        return 0
+
+    rechnungen = DebitorenRechnung.objects.bulk_create([r for _, r, _ in offen])
+    for r in rechnungen:
+        r.qr_referenz = qrr_referenz(r.vertrag_id, r.pk)[0]
+    # `alle_organisationen`: die eben angelegten Zeilen, über ihren
+    # Primärschlüssel — wie in `DebitorenRechnung.save()`.
+    DebitorenRechnung.alle_organisationen.bulk_update(rechnungen, ['qr_referenz'])
+    # `bulk_create` sendet kein `post_save` — die Dokumente für die Suche
+    # (Titel und Mietername) hier in einem Zug, und die Zwischenspeicher
+    # (Startseite: «Sollstellung ausführen»; Eigentümer-Portal und Reports:
+    # Soll und Ausstand) verwerfen alle Rechnungen.
+    suche.aktualisieren('rechnung', pk__in=[r.pk for r in rechnungen])
+    for organisation_id in {r.organisation_id for r in rechnungen}:
+        zwischenspeicher.vergessen('rechnung:*', organisation_id=organisation_id)
+
+    stapel = []
+    for v, rechnung, buchungen in offen:
+        lg = v.einheit.liegenschaft if v.einheit_id else None
+        for soll, haben, betrag, text in buchungen:
+            stapel.append(buchung_vorbereiten(soll, haben, betrag, text, datum=start_date,
+                                              liegenschaft=lg, debitor=rechnung, user=user))
+    buche_stapel(stapel)
+    return len(offen)
+
+
 # ============================================================
 # 2. MAHNLAUF (Sammellauf über alle fälligen Debitoren)
 # ============================================================
@@ -156,72 +292,174 @@ def verzugszins(betrag, tage, prozent=VERZUGSZINS_PROZENT):
     return (Decimal(betrag) * prozent / Decimal('100') * Decimal(tage) / Decimal('360')).quantize(Decimal('0.01'))
 
 
-def run_mahnlauf(aktive_lg=None, send_email=True, mit_zins=False, user=None):
+def run_mahnlauf(aktive_lg=None, send_email=True, mit_zins=False, user=None, probelauf=False):
     """Führt einen Sammel-Mahnlauf über alle überfälligen offenen Debitoren aus.
     Für jede fällige Rechnung, die noch keine Mahnung der berechneten Stufe hat,
     wird ein revisionssicherer Mahnung-Eintrag erzeugt (+ optional Mahngebühr als
     Debitor, + optional Zahlungserinnerung per E-Mail). Idempotent pro Stufe.
 
+    Der Lauf hat zwei Phasen: `mahnlauf_planen` bestimmt ohne Schreibzugriff,
+    wer welche Stufe bekommt; `mahnlauf_ausfuehren` schreibt Mahnungen,
+    Gebühren und Buchungen und stellt danach zu (`mahnlauf_zustellen`: Beleg
+    in die Akte, E-Mail). `probelauf=True` plant nur und gibt den Plan unter
+    `'plan'` zurück — nichts wird geschrieben oder versandt.
+
     Gibt dict zurück: {'gemahnt': n, 'emails': m, 'gebuehren': CHF, 'zins': CHF}.
     """
+    plan = mahnlauf_planen(aktive_lg=aktive_lg, send_email=send_email, mit_zins=mit_zins)
+    if probelauf:
+        return {'gemahnt': len(plan['schritte']), 'emails': 0,
+                'gebuehren': sum((s['gebuehr'] for s in plan['schritte']), Decimal('0.00')),
+                'zins': sum((s['zins'] for s in plan['schritte']), Decimal('0.00')),
+                'geprueft': plan['geprueft'], 'plan': plan['schritte']}
+    return mahnlauf_ausfuehren(plan, user=user)
+
+
+def mahnlauf_planen(aktive_lg=None, send_email=True, mit_zins=False):
+    """Phase 1 des Mahnlaufs: wer bekommt welche Stufe, Gebühr und welchen Zins.
+
+    Rein lesend. Vorher fragte der Lauf je überfälliger Rechnung die höchste
+    Mahnstufe, beim Zins nochmals alle Mahnungen und für den offenen Betrag die
+    Summe der Zahlungen ab, und las die Mahnstufen-Konfiguration des
+    Eigentümers jedes Mal neu. Hier kommen offener Rest (`offene_posten()`),
+    höchste Stufe und bereits fakturierter Zins als Unterabfragen in EINER
+    Abfrage mit; die
+    Konfiguration wird je Eigentümer einmal gelesen.
+
+    Gibt `{'schritte': [...], 'geprueft': n}` zurück. Ein Schritt ist ein dict
+    mit `rechnung`, `stufe`, `tage`, `faellig`, `offen`, `gebuehr`, `zins`,
+    `kuendigung` und `per_email`.
+    """
+    from django.db.models import DecimalField, IntegerField, OuterRef, Q, Subquery, Sum, Max, Value
+    from django.db.models.functions import Coalesce
     from finance.models import DebitorenRechnung, Mahnung
-    from django.db.models import Q
-    from core.utils.email_service import send_payment_reminder
-    from finance.booking import buche
-    # Mahnstufen + Gebuehr pro Eigentuemer (crm.Eigentuemer.mahn_konfig); Fallback Standard.
-    from core.services.mahnstufen import stufe_fuer_tage as _stufe_cfg, eigentuemer_von_rechnung
+    from core.services.mahnstufen import mahnstufen_config, stufe_aus_config, eigentuemer_von_rechnung
+
+    def _je_rechnung(qs, aggregat, feld):
+        return Subquery(qs.filter(debitoren_rechnung=OuterRef('pk')).order_by()
+                        .values('debitoren_rechnung').annotate(x=aggregat).values('x'),
+                        output_field=feld)
 
+    betrag = DecimalField(max_digits=14, decimal_places=2)
+    null = Value(Decimal('0.00'), output_field=betrag)
     heute = timezone.localdate()
-    qs = (DebitorenRechnung.objects.filter(status__in=['offen', 'teilbezahlt'])
-          .select_related('vertrag__mieter', 'vertrag__einheit__liegenschaft', 'liegenschaft'))
+    # Offener Rest aus `offene_posten()` — bezahlte Rechnungen mit altem
+    # Status kommen gar nicht erst in den Lauf.
+    qs = (DebitorenRechnung.objects.offene_posten()
+          .filter(Q(faellig_am__lt=heute) | Q(faellig_am__isnull=True, datum__lt=heute))
+          .select_related('vertrag__mieter', 'vertrag__einheit__liegenschaft__eigentuemer',
+                          'liegenschaft__eigentuemer')
+          .annotate(
+              hoechste_stufe=_je_rechnung(Mahnung.objects.all(), Max('stufe'), IntegerField()),
+              zins_bisher=Coalesce(_je_rechnung(Mahnung.objects.all(), Sum('zins'), betrag), null))
+          .order_by('pk'))
     if aktive_lg:
         qs = qs.filter(Q(liegenschaft=aktive_lg) | Q(vertrag__einheit__liegenschaft=aktive_lg))
 
-    res = {'gemahnt': 0, 'emails': 0, 'gebuehren': Decimal('0.00'), 'zins': Decimal('0.00'), 'geprueft': 0}
-
+    stufen_je_eigentuemer = {}
+    schritte, geprueft = [], 0
     for r in qs:
         faellig = r.faellig_am or r.datum
         if not faellig or faellig >= heute:
             continue
-        offen = r.offener_betrag
-        if offen <= 0:
-            continue
+        offen = r.offen
         tage = (heute - faellig).days
         # Verjährte Mietzinsforderung (Art. 128 Ziff. 1 OR: 5 Jahre) nicht mehr
         # mahnen — Mahnungen unterbrechen die Verjährung ohnehin nicht; der Fall
         # gehört zur Abschreibung/Betreibung (eigene Verjährungs-Pendenz).
         if tage > 5 * 365:
             continue
-        _s = _stufe_cfg(tage, eigentuemer_von_rechnung(r))
+        # Mahnstufen + Gebuehr pro Eigentuemer (crm.Eigentuemer.mahn_konfig); Fallback Standard.
+        et = eigentuemer_von_rechnung(r)
+        schluessel = et.pk if et is not None else None
+        if schluessel not in stufen_je_eigentuemer:
+            stufen_je_eigentuemer[schluessel] = mahnstufen_config(et)
+        _s = stufe_aus_config(stufen_je_eigentuemer[schluessel], tage)
         if not _s:
             continue
         stufe = _s['stufe']
         # Mahnsperre: Mieter mit laufender Zahlungsvereinbarung nicht mahnen.
         if r.vertrag and r.vertrag.mieter_id and getattr(r.vertrag.mieter, 'mahnsperre', False):
             continue
-        res['geprueft'] += 1
+        geprueft += 1
         # Idempotenz: existiert bereits eine Mahnung dieser (oder höherer) Stufe?
-        hoechste = r.mahnungen.order_by('-stufe').first()
-        if hoechste and hoechste.stufe >= stufe:
+        if r.hoechste_stufe is not None and r.hoechste_stufe >= stufe:
             continue
-
-        gebuehr = _s['gebuehr']
         # Verzugszins nur als DELTA zur bereits fakturierten Summe (Art. 104 OR:
         # derselbe Verzugszeitraum darf nicht bei jeder Mahnstufe erneut verzinst
         # werden — früher stellte Stufe 3 die vollen 60 Tage nochmals in Rechnung,
         # obwohl Stufe 2 bereits 30 Tage fakturiert hatte).
         zins = Decimal('0.00')
         if mit_zins:
-            bereits = sum((m.zins or Decimal('0.00')) for m in r.mahnungen.all())
-            zins = max(Decimal('0.00'), verzugszins(offen, tage) - bereits)
+            zins = max(Decimal('0.00'), verzugszins(offen, tage) - r.zins_bisher)
+        schritte.append({
+            'rechnung': r, 'stufe': stufe, 'tage': tage, 'faellig': faellig, 'offen': offen,
+            'gebuehr': _s['gebuehr'], 'zins': zins, 'kuendigung': _s['kuendigung'],
+            'per_email': bool(send_email and r.vertrag and r.vertrag.mieter.email),
+        })
+    return {'schritte': schritte, 'geprueft': geprueft}
+
+
+def mahnlauf_ausfuehren(plan, user=None, zustellen=None, fortschritt=None):
+    """Phase 2 des Mahnlaufs: den Plan aus `mahnlauf_planen` schreiben.
+
+    Je Schritt in einer Transaktion: Mahnung, Gebühren-/Zinsrechnung und ihre
+    Buchung. Erst wenn alle Schritte geschrieben sind, wird zugestellt — Beleg
+    in die Vertrags-Akte (im Hintergrund) und E-Mail. Das PDF-Rendern und der
+    Versand halten so keine Buchung mehr auf, und ein misslungener Versand
+    rollt nichts zurück.
+    `zustellen` nimmt die Liste der Zustellaufträge entgegen und gibt die Zahl
+    versandter E-Mails zurück (Standard: `mahnlauf_zustellen`, sofort).
+    `fortschritt(n)` wird nach jedem Schritt aufgerufen; gibt es False
+    zurück, endet der Lauf dort — zugestellt wird, was bis dahin geschrieben
+    ist (Abbruch eines Laufauftrags).
+
+    Zwischen Planen und Ausführen kann ein zweiter Lauf dieselbe Rechnung
+    gemahnt haben. Die höchste Stufe wird deshalb vor dem Schreiben nochmals
+    in EINER Abfrage gelesen, und das DB-Unique (Rechnung, Stufe) fängt den
+    Rest ab: Ein solcher Schritt wird übersprungen, nicht doppelt gebucht,
+    und in `res['uebersprungen']` gezählt.
+    """
+    from django.db import IntegrityError
+    from django.db.models import Max
+    from finance.models import DebitorenRechnung, Mahnung
+    from finance.booking import buche
+
+    heute = timezone.localdate()
+    res = {'gemahnt': 0, 'emails': 0, 'gebuehren': Decimal('0.00'), 'zins': Decimal('0.00'),
+           'geprueft': plan['geprueft'], 'uebersprungen': 0}
+    schritte = plan['schritte']
+    stand = dict(Mahnung.objects.filter(debitoren_rechnung__in=[s['rechnung'].pk for s in schritte])
+                 .order_by().values('debitoren_rechnung').annotate(m=Max('stufe'))
+                 .values_list('debitoren_rechnung', 'm'))
+    auftraege = []
+    for i, s in enumerate(schritte, start=1):
+        if fortschritt is not None and i > 1 and fortschritt(i - 1) is False:
+            break
+        r, stufe, gebuehr, zins, offen = s['rechnung'], s['stufe'], s['gebuehr'], s['zins'], s['offen']
+        if stand.get(r.pk, 0) >= stufe:
+            res['uebersprungen'] += 1
+            continue
         with transaction.atomic():
-            Mahnung.objects.create(
-                debitoren_rechnung=r, vertrag=r.vertrag, stufe=stufe, datum=heute,
-                betrag_offen=offen, gebuehr=gebuehr, zins=zins,
-                versandart='email' if (send_email and r.vertrag and r.vertrag.mieter.email) else 'manuell',
-                bemerkung=(f"Verzugszins CHF {zins} ({tage} Tage, Delta zu Vorstufen)" if zins > 0 else ''),
-                erstellt_von=user,
-            )
+            # Nur das Anlegen der Mahnung darf am Unique (Rechnung, Stufe)
+            # scheitern — das ist der parallele Lauf. Eine IntegrityError aus
+            # Gebührenrechnung oder Buchung ist ein echter Fehler und bricht
+            # den Lauf ab, statt still als «schon gemahnt» durchzugehen.
+            try:
+                with transaction.atomic():
+                    Mahnung.objects.create(
+                        debitoren_rechnung=r, vertrag=r.vertrag, stufe=stufe, datum=heute,
+                        betrag_offen=offen, gebuehr=gebuehr, zins=zins,
+                        versandart='email' if s['per_email'] else 'manuell',
+                        bemerkung=(f"Verzugszins CHF {zins} ({s['tage']} Tage, Delta zu Vorstufen)"
+                                   if zins > 0 else ''),
+                        erstellt_von=user,
+                    )
+            except IntegrityError:
+                logger.info("Mahnlauf: %s. Mahnung zu Rechnung %s schon gestellt — übersprungen",
+                            stufe, r.pk)
+                res['uebersprungen'] += 1
+                continue
             zusatz = gebuehr + zins
             if zusatz > 0 and r.vertrag_id:
                 lg = r.liegenschaft or (r.vertrag.einheit.liegenschaft if r.vertrag.einheit_id else None)
@@ -245,24 +483,52 @@ def run_mahnlauf(aktive_lg=None, send_email=True, mit_zins=False, user=None):
         res['gemahnt'] += 1
         res['gebuehren'] += gebuehr
         res['zins'] += zins
-        # Beleg in die Vertrags-Akte — sonst weist der Mahnlauf zwar Historie und
-        # Gebühren aus, unter Vertrag → Dokumente liegt aber nichts. Ausserhalb
-        # der Transaktion und fehlertolerant: ein misslungenes PDF darf einen
-        # bereits gebuchten Mahnschritt nicht zurückrollen.
         if r.vertrag_id:
+            auftraege.append({'vertrag': r.vertrag, 'stufe': stufe, 'datum': heute, 'offen': offen,
+                              'faellig': s['faellig'], 'per_email': s['per_email']})
+    res['emails'] = (zustellen or mahnlauf_zustellen)(auftraege)
+    return res
+
+
+def mahnlauf_zustellen(auftraege):
+    """Zustellung der geschriebenen Mahnungen: Beleg in die Vertrags-Akte und,
+    wo vorgesehen, die Zahlungserinnerung per E-Mail. Gibt die Zahl der
+    eingereihten E-Mails zurück; zugestellt werden sie nach dem Commit
+    gesammelt über eine Verbindung (`postausgang.anstossen`).
+
+    Die Belege rendert der Lauf nicht selbst: Ein PDF je Mahnung hielt ihn —
+    im Request wie im Scheduler — um Sekunden je Vertrag auf. Sie gehen als
+    EIN Laufauftrag `mahnbelege` an den Worker (`faelle.laufauftraege`), der
+    sie nacheinander ablegt.
+
+    Beides fehlertolerant: Ohne Beleg unter Vertrag → Dokumente weist der
+    Lauf zwar Historie und Gebühren aus, aber ein misslungenes PDF oder ein
+    Versandfehler darf keinen gebuchten Mahnschritt zurückrollen — die
+    Buchungen sind zu diesem Zeitpunkt bereits geschrieben.
+    """
+    from core.services.postausgang import anstossen
+    from core.utils.email_service import send_payment_reminder
+    from faelle import laufauftraege
+
+    belege = [{'vertrag': a['vertrag'].pk, 'stufe': a['stufe'],
+               'datum': a['datum'].isoformat(), 'betrag': f"{a['offen']:.2f}"}
+              for a in auftraege]
+    if belege:
+        try:
+            laufauftraege.einreihen('mahnbelege', belege=belege)
+        except Exception:
+            logger.exception("Mahnlauf: Ablage der %s Belege nicht eingereiht", len(belege))
+    emails = 0
+    for a in auftraege:
+        if a['per_email']:
             try:
-                from core.services.ablage import ablage_mahnung
-                ablage_mahnung(r.vertrag, stufe=stufe, datum=heute,
-                               betrag=f"{offen:.2f}")
-            except Exception:
-                logger.debug("Fehler bewusst übergangen", exc_info=True)
-        if send_email and r.vertrag and r.vertrag.mieter.email:
-            try:
-                if send_payment_reminder(r.vertrag, faellig, offen):
-                    res['emails'] += 1
+                if send_payment_reminder(a['vertrag'], a['faellig'], a['offen'], stufe=a['stufe']):
+                    emails += 1
             except Exception:
                 logger.debug("Fehler bewusst übergangen", exc_info=True)
-    return res
+    if emails:
+        anstossen()
+    return emails
 
 
 def run_adress_umzuege():
@@ -0,0 +1,677 @@
+"""Bank-Import: einen Kontoauszug (camt.053/054 oder Bank-CSV) zuordnen und verbuchen.
+
+Der Import lief als Schleife über die Auszugszeilen, und jede Zeile war ein
+eigener kleiner Import: zwei `exists()` für den Duplikatschutz, ein
+`Bankbewegung.objects.create`, dann Zahlungseingang, `rechnung.save()` und
+`buche()` — mit Kontosuche, Belegnummer und Periodensperre je Buchung —, danach
+die eben angelegte Bankbewegung nochmals über ihre Referenz gesucht. Um eine
+bezahlte Rechnung aus dem Referenz-Index zu nehmen, wurde der ganze Index
+durchlaufen. Ein Jahresauszug mit einigen tausend Zeilen hielt die Anfrage
+minutenlang.
+
+Hier in zwei Schritten, wie beim Mahnlauf:
+
+  · `planen` liest, was der Abgleich braucht, in einer festen Zahl von
+    Abfragen — offene Posten samt offenem Rest, alle bekannten Bank-Referenzen
+    der Datei (Duplikate), fremde QR-Referenzen (Doppelzahlungen), gelernte
+    Absender; die Namen der Vertragsparteien stehen im Zahler-Index
+    (`core.services.zahlerindex`) — und entscheidet jede Zeile im Speicher. Der offene Rest jeder
+    Rechnung wird dabei mitgeführt, so dass zwei Zahlungen auf dieselbe
+    Rechnung genau so ausgehen wie nacheinander gebucht.
+  · `ausfuehren` schreibt je Auszug der Datei in EINER Transaktion:
+    Zahlungseingänge, Buchungen (`buche_stapel`), Bankbewegungen und den
+    Rechnungsstatus je mit einer Anweisung.
+
+Die Regeln selbst sind unverändert — Referenz, Name+Betrag, gelernter
+Absender, Doppelzahlung auf 2030, sonst ungeklärt auf 1190; Belastungen
+bleiben offen im Bank-Eingang. Die Periodensperre wird schon beim Planen
+geprüft: Eine gesperrte Zeile wird gar nicht erst geschrieben und bleibt für
+den Re-Import nach dem Entsperren frei. Greift die Sperre erst beim Schreiben
+(jemand sperrt zwischen Planen und Ausführen), rollt der betroffene Auszug als
+Ganzes zurück und zählt als gesperrt.
+
+Die Web-Ansicht (`fw_camt_import`) und der Befehl `bank_import` gehen beide
+über `lese_datei` → `planen` → `ausfuehren`.
+"""
+import re
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+#: Grösse der `IN`-Listen beim Vorladen. SQLite begrenzt die Parameter je
+#: Anweisung; ein Jahresauszug hat leicht mehr Zeilen.
+IN_BLOCK = 500
+
+#: Was mit einer Auszugszeile geschieht.
+ARTEN = ('duplikat', 'belastung', 'gesperrt', 'referenz', 'name_betrag', 'gelernt',
+         'doppelzahlung', 'ungeklaert')
+
+
+def _norm(s):
+    return ''.join(ch for ch in (s or '').lower() if ch.isalnum())
+
+
+def _bloecke(werte):
+    werte = list(werte)
+    for i in range(0, len(werte), IN_BLOCK):
+        yield werte[i:i + IN_BLOCK]
+
+
+# ---------------------------------------------------------------------------
+# Lesen
+# ---------------------------------------------------------------------------
+
+def erkenne_format(datei):
+    """'camt.053' oder 'Bank-CSV' — nach dem Anfang der Datei.
+
+    XML (camt) beginnt mit '<', alles andere wird als Bank-CSV gelesen. Nur
+    den Anfang ansehen: camt wird aus der Datei gestreamt und nie als Ganzes
+    in den Speicher gelesen.
+    """
+    anfang = datei.read(1024).lstrip(b'\xef\xbb\xbf \t\r\n')
+    datei.seek(0)
+    return 'camt.053' if anfang.startswith(b'<') else 'Bank-CSV'
+
+
+def lese_datei(datei, quelle):
+    """`(eintraege, kopf)` einer Auszugsdatei im Format `quelle` (`erkenne_format`).
+
+    Bei camt auch Belastungen (Lieferantenzahlungen, Gebühren, Zinsen,
+    Daueraufträge) — ohne sie ist die Bank nicht abstimmbar (Praxis-Audit).
+    Eine CSV hat keinen Kopf; `kopf` ist dann leer.
+    """
+    if quelle == 'camt.053':
+        from core.services.camt import lese_camt
+        return lese_camt(datei, nur_gutschriften=False)
+    return lese_csv(datei.read()), {}
+
+
+def lese_csv(raw):
+    """Parst einen Bank-Kontoauszug als CSV (PostFinance/Raiffeisen/ZKB/UBS-Exporte).
+
+    Header-basiert und tolerant: Trennzeichen (; , Tab) wird erkannt, Spalten
+    werden über Schlüsselwörter gefunden (Datum, Betrag/Gutschrift, Referenz,
+    Text/Mitteilung, Auftraggeber). Nur Gutschriften (positive Beträge bzw.
+    Gutschrift-Spalte) werden übernommen. Rückgabe: gleiche Struktur wie
+    der camt-Leser → derselbe Zuordnungs-/Verbuchungspfad."""
+    import csv as _csv
+    import io as _io
+
+    text = None
+    for enc in ('utf-8-sig', 'cp1252', 'latin-1'):
+        try:
+            text = raw.decode(enc)
+            break
+        except (UnicodeDecodeError, AttributeError):
+            continue
+    if text is None:
+        raise ValueError("Datei-Codierung nicht erkannt")
+
+    # Trennzeichen aus den ersten nicht-leeren Zeilen bestimmen
+    probe = [z for z in text.splitlines() if z.strip()][:10]
+    if not probe:
+        return []
+    zaehl = {d: sum(z.count(d) for z in probe) for d in (';', ',', '\t')}
+    delim = max(zaehl, key=zaehl.get)
+    zeilen = list(_csv.reader(_io.StringIO(text), delimiter=delim))
+
+    KEY = {
+        'datum': ('datum', 'date', 'buchungsdatum', 'valuta', 'booking'),
+        'betrag': ('betrag', 'amount', 'umsatz'),
+        'gut': ('gutschrift', 'credit', 'haben', 'eingang'),
+        'last': ('lastschrift', 'belastung', 'debit', 'soll', 'ausgang'),
+        'ref': ('referenz', 'reference', 'qrr', 'esr', 'referenznummer'),
+        'text': ('mitteilung', 'buchungstext', 'beschreibung', 'verwendungszweck',
+                 'text', 'details', 'avisierung', 'zahlungszweck'),
+        # Ohne Treffer hier bleibt der Auftraggeber leer und die Zeile im
+        # Bankabgleich sagt nur «von der Bank nicht geliefert» — darum breit fassen.
+        'name': ('auftraggeber', 'absender', 'zahlungspflichtiger', 'einzahler',
+                 'name', 'gegenpartei', 'debitor', 'begünstigter', 'beguenstigter',
+                 'partner', 'kontoinhaber', 'zahler', 'counterparty', 'payer'),
+    }
+
+    def _spalte(kopf, schluessel):
+        for i, z in enumerate(kopf):
+            zl = (z or '').strip().lower()
+            if any(k in zl for k in KEY[schluessel]):
+                return i
+        return None
+
+    # Header-Zeile suchen (erste Zeile mit Datum- UND Betrag/Gutschrift-Spalte)
+    kopf_idx = None
+    sp = {}
+    for i, z in enumerate(zeilen[:15]):
+        if _spalte(z, 'datum') is not None and (
+                _spalte(z, 'betrag') is not None or _spalte(z, 'gut') is not None):
+            kopf_idx = i
+            sp = {k: _spalte(z, k) for k in KEY}
+            break
+    if kopf_idx is None:
+        raise ValueError("Keine Kopfzeile mit Datum- und Betrag-/Gutschrift-Spalte gefunden. "
+                         "Erwartet werden Spalten wie «Datum», «Betrag» oder «Gutschrift», "
+                         "optional «Referenz», «Mitteilung», «Auftraggeber».")
+
+    def _dec(s):
+        s = (s or '').strip().replace("'", '').replace(' ', '').replace(' ', '')
+        s = s.replace('CHF', '').replace('chf', '')
+        if not s:
+            return None
+        if ',' in s and '.' not in s:
+            s = s.replace(',', '.')
+        else:
+            s = s.replace(',', '')
+        try:
+            return Decimal(s)
+        except Exception:
+            return None
+
+    def _datum(s):
+        from datetime import datetime as _dt
+        s = (s or '').strip()[:10]
+        for fmt in ('%d.%m.%Y', '%Y-%m-%d', '%d/%m/%Y', '%d.%m.%y'):
+            try:
+                return _dt.strptime(s, fmt).date()
+            except ValueError:
+                continue
+        return None
+
+    eintraege = []
+    for z in zeilen[kopf_idx + 1:]:
+        if not any((c or '').strip() for c in z):
+            continue
+
+        def wert(k):
+            i = sp.get(k)
+            return z[i] if i is not None and i < len(z) else ''
+
+        # Gutschrift bestimmen: eigene Spalte hat Vorrang, sonst positiver Betrag
+        betrag = _dec(wert('gut')) if sp.get('gut') is not None else None
+        if betrag is None:
+            b = _dec(wert('betrag'))
+            if b is None or b <= 0:
+                continue   # Belastung/Leerzeile → kein Zahlungseingang
+            if sp.get('last') is not None and _dec(wert('last')):
+                continue   # Zeile ist als Belastung markiert
+            betrag = b
+        if betrag is None or betrag <= 0:
+            continue
+
+        info = (wert('text') or '').strip()
+        referenz = (wert('ref') or '').strip().replace(' ', '')
+        if not referenz:
+            # QRR (27-stellig) auch aus dem Buchungstext fischen
+            m27 = re.search(r'\b(\d[\d ]{25,40}\d)\b', info)
+            if m27:
+                kandidat = m27.group(1).replace(' ', '')
+                if len(kandidat) == 27:
+                    referenz = kandidat
+        eintraege.append({
+            'betrag': betrag, 'referenz': referenz, 'datum': _datum(wert('datum')),
+            'info': info, 'acct_ref': '', 'dbtr_name': (wert('name') or '').strip(),
+        })
+    return eintraege
+
+
+# ---------------------------------------------------------------------------
+# Planen
+# ---------------------------------------------------------------------------
+
+def _bank_referenzen(eintraege, heute):
+    """Setzt `acct_ref` jeder Zeile — die Bank-Referenz oder ein Ersatzschlüssel.
+
+    Fehlt eine eindeutige Referenz (kein AcctSvcrRef/TxId,
+    EndToEndId=NOTPROVIDED), wird ein zusammengesetzter Schlüssel aus
+    Datum|Betrag|Auftraggeber|QRR gebildet — so wird der erneute Import
+    derselben Datei nicht doppelt verbucht, ohne verschiedene ref-lose
+    Zahlungen fälschlich zu verschmelzen.
+    """
+    komposit_lauf = {}
+    for e in eintraege:
+        aref = e.get('acct_ref', '')
+        if not aref:
+            _dat = (e.get('datum') or heute)
+            aref = f"camt:{_dat:%Y-%m-%d}|{e.get('betrag','')}|{_norm(e.get('dbtr_name',''))}|{e.get('referenz','')}"
+            # Laufnummer je Schlüssel: zwei ECHTE Zahlungen am selben Tag über
+            # denselben Betrag (z.B. zwei Mieter mit gleicher Miete, beide ohne
+            # Auftraggebername) ergaben sonst denselben Schlüssel — die zweite
+            # wurde als «Duplikat» verworfen und das Geld verschwand (Audit).
+            # Beim erneuten Import derselben Datei entstehen dieselben Nummern,
+            # die Idempotenz bleibt also erhalten.
+            # Auf Feldlänge kürzen (bank_referenz = 140 Zeichen), bevor die
+            # Laufnummer angehängt wird — ein langer Auftraggebername hätte den
+            # Import sonst mit einem DataError abgebrochen. Die Kürzung ist
+            # deterministisch, der Wiederholungs-Import erzeugt denselben Wert.
+            aref = aref[:130]
+            komposit_lauf[aref] = komposit_lauf.get(aref, 0) + 1
+            if komposit_lauf[aref] > 1:
+                aref = f"{aref}#{komposit_lauf[aref]}"
+        e['acct_ref'] = aref[:140]
+
+
+def _bekannte_referenzen(arefs):
+    """Die Bank-Referenzen aus `arefs`, die schon importiert sind.
+
+    Stornierte Zahlungen zählen NICHT — sonst liesse sich eine rückgängig
+    gemachte Import-Datei nie wieder importieren (jede Zeile fiele als
+    «Duplikat» durch). Nur aktive (verbuchte) Zahlungen/Bewegungen zählen.
+    """
+    from finance.models import Bankbewegung, Zahlungseingang
+    bekannt = set()
+    for block in _bloecke(set(arefs)):
+        bekannt.update(Zahlungseingang.objects.filter(bank_referenz__in=block)
+                       .exclude(status='storniert').values_list('bank_referenz', flat=True))
+        bekannt.update(Bankbewegung.objects.filter(bank_referenz__in=block)
+                       .values_list('bank_referenz', flat=True))
+    return bekannt
+
+
+def _sperre():
+    """`buchung_gesperrt_bis` der eigenen Verwaltung — frisch gelesen, wie
+    `finance.models.pruefe_periodensperre`."""
+    from core.organisation_kette import organisation_bestimmen
+    from crm.models import Organisation
+    return (Organisation.objects.filter(pk=organisation_bestimmen().pk)
+            .values_list('buchung_gesperrt_bis', flat=True).first())
+
+
+def planen(eintraege, *, heute=None):
+    """Entscheidet für jede Zeile, was mit ihr geschieht — ohne zu schreiben.
+
+    Gibt `{'schritte': [...], 'heute': datum}` zurück, ein Schritt je Zeile
+    in Dateireihenfolge: dict mit `eintrag`, `art` (siehe `ARTEN`),
+    `rechnung`, `vertrag`, `betrag` (auf die Rechnung), `ueberschuss`
+    (Überzahlung als Mieterguthaben), `rest` (offen danach) und `absender`
+    (gelernter Absender).
+    Setzt `acct_ref` in jedem Eintrag.
+    """
+    from core.services import zahler as _zahler, zahlerindex
+    from core.utils.qr_code import qrr_referenz
+    from finance.models import DebitorenRechnung, ZahlerZuordnung
+
+    heute = heute or timezone.localdate()
+    _bank_referenzen(eintraege, heute)
+    bekannt = _bekannte_referenzen(e['acct_ref'] for e in eintraege)
+    sperre = _sperre()
+
+    # Offene Posten samt offenem Rest in EINER Abfrage. `rest` führt den Rest
+    # während des Planens nach; die Indizes werden einmal aufgebaut.
+    offene = list(DebitorenRechnung.objects.offene_posten()
+                  .select_related('vertrag__mieter', 'vertrag__einheit__liegenschaft')
+                  .order_by('pk'))
+    rest = {r.pk: r.offen for r in offene}
+    ref_index = {}          # QR-Referenz → Rechnung
+    nach_betrag = {}        # offener Rest → Rechnungen (Name+Betrag)
+    je_vertrag = {}         # Vertrag → Rechnungen (gelernter Absender)
+    for r in offene:
+        schluessel = set()
+        if r.qr_referenz:
+            schluessel.add(r.qr_referenz.replace(' ', ''))
+        if r.vertrag_id:
+            raw, _ = qrr_referenz(r.vertrag_id, r.id)
+            schluessel.add(raw)
+            nach_betrag.setdefault(rest[r.pk], []).append(r)
+            je_vertrag.setdefault(r.vertrag_id, []).append(r)
+        for s in schluessel:
+            ref_index.setdefault(s, r)
+
+    # Referenzen, die keine offene Rechnung tragen: Gehören sie zu einer
+    # bezahlten, ist der Zahler bekannt (Doppelzahlung).
+    fremde = {e['referenz'] for e in eintraege
+              if e.get('referenz') and e['referenz'] not in ref_index and e['betrag'] > 0}
+    bezahlte = {}
+    for block in _bloecke(fremde):
+        for r in (DebitorenRechnung.objects.filter(qr_referenz__in=block, vertrag__isnull=False)
+                  .select_related('vertrag__mieter', 'vertrag__einheit__liegenschaft')):
+            bezahlte.setdefault(r.qr_referenz, r)
+
+    # Namen der Vertragsparteien für Name+Betrag aus dem Zahler-Index. Die
+    # gelernten Absender dagegen frisch aus der Datenbank, eine Abfrage für die
+    # ganze Datei: Eine Umbuchung auf einen anderen Vertrag, die ein anderer
+    # Worker eben gelernt hat, darf nicht erst nach `GUELTIGKEIT` greifen —
+    # eine falsch zugeordnete Zahlung kostet mehr als die Abfrage.
+    zahler_index = zahlerindex.index()
+    # Gelernte Absender der ganzen Datei in einer Abfrage statt je Zeile.
+    absender = {}
+    for e in eintraege:
+        if e['betrag'] > 0:
+            name, _rest_txt, _ = _zahler.aus_bewegung(e.get('dbtr_name'), e.get('info'))
+            absender[id(e)] = name
+    gelernt = {}
+    namen = {_zahler.normalisiere(n)[:160] for n in absender.values() if _zahler.normalisiere(n)}
+    for block in _bloecke(namen):
+        for z in (ZahlerZuordnung.objects.filter(name_norm__in=block)
+                  .select_related('vertrag__einheit__liegenschaft', 'vertrag__mieter')):
+            gelernt[z.name_norm] = z.vertrag
+
+    def _bezahlen(schritt, r, betrag):
+        alt = rest[r.pk]
+        rest[r.pk] = schritt['rest'] = alt - betrag
+        liste = nach_betrag.get(alt)
+        if liste is not None and r in liste:
+            liste.remove(r)
+        if rest[r.pk] > 0:
+            nach_betrag.setdefault(rest[r.pk], []).append(r)
+
+    gesehen = set()
+    schritte = []
+    for e in eintraege:
+        aref = e['acct_ref']
+        schritt = {'eintrag': e, 'art': None, 'rechnung': None, 'vertrag': None,
+                   'betrag': e['betrag'], 'ueberschuss': Decimal('0.00'), 'rest': None,
+                   'absender': ''}
+        schritte.append(schritt)
+        if aref in bekannt or aref in gesehen:
+            schritt['art'] = 'duplikat'
+            continue
+        betrag_e = e['betrag']
+        # Belastungen wandern in den Bank-Eingang zur Zuordnung. Automatisch
+        # buchen wäre geraten — das Gegenkonto (Lieferant, Gebühr, Zins, Miete
+        # des Eigentümers) steht nicht im Auszug.
+        if betrag_e < 0:
+            gesehen.add(aref)
+            schritt['art'] = 'belastung'
+            continue
+        # Gesperrte Periode: nicht schreiben, auch keine Bankbewegung — sonst
+        # gälte die Zeile beim Re-Import nach dem Entsperren als Duplikat und
+        # die Zahlung würde NIE gebucht (QS-Befund).
+        if sperre and (e.get('datum') or heute) <= sperre:
+            schritt['art'] = 'gesperrt'
+            continue
+        gesehen.add(aref)
+
+        # 1) Exakte QRR-Referenz
+        rechnung = ref_index.get(e['referenz']) if e['referenz'] else None
+        if rechnung and rechnung.vertrag_id and rest[rechnung.pk] > 0:
+            offen = rest[rechnung.pk]
+            betrag = min(max(betrag_e, Decimal('0.01')), offen)
+            # Überzahlung: den vollen Bankeingang abbilden — der Überschuss wird als
+            # Mieterguthaben auf 2030 gebucht. Ohne das läge auf 1020 weniger als auf
+            # dem realen Kontoauszug → Bankabgleich geht nie auf und die Überzahlung
+            # verschwindet. 2030 statt 1190 (Audit W6): der Mieter ist bekannt, das
+            # ist eine echte Verbindlichkeit und kein ungeklärter Durchlaufposten.
+            schritt.update(art='referenz', rechnung=rechnung, betrag=betrag,
+                           ueberschuss=max(betrag_e - offen, Decimal('0.00')))
+            _bezahlen(schritt, rechnung, betrag)
+            continue
+
+        # 2) Fuzzy: exakter Betrag + Name des Auftraggebers passt eindeutig.
+        # Der Name passt, wenn eine Vertragspartei (Haupt-, Zweit-, WG-Mieter,
+        # Firma) als zusammenhängende Wortfolge darin steht — nicht als
+        # Teilzeichenkette: «Ott» steckt sonst in «Scott» und die Zahlung ginge
+        # an den falschen Mieter. Passen mehrere Rechnungen, entscheidet nur
+        # ein voller Name (Vor- und Nachname) gegen blosse Nachnamen.
+        _dbtr_raw = e.get('dbtr_name', '')
+        if not zahlerindex.tokens(_dbtr_raw):
+            _dbtr_raw = e.get('info', '')
+        treffer = zahler_index.namens_treffer(_dbtr_raw)
+        kandidaten = [r for r in nach_betrag.get(betrag_e, ()) if r.vertrag_id in treffer]
+        if len(kandidaten) > 1:
+            bester = max(treffer[r.vertrag_id] for r in kandidaten)
+            oben = [r for r in kandidaten if treffer[r.vertrag_id] == bester]
+            if bester >= zahlerindex.VOLLNAME and len(oben) == 1:
+                kandidaten = oben
+        if len(kandidaten) == 1:
+            schritt.update(art='name_betrag', rechnung=kandidaten[0])
+            _bezahlen(schritt, kandidaten[0], betrag_e)
+            continue
+
+        # 2b) Gelernter Absender: Wurde dieser Zahler schon einmal von Hand
+        # zugeordnet, gilt die Entscheidung weiter. Konservativ — nur wenn der
+        # Vertrag GENAU EINE offene Rechnung hat und der Betrag hineinpasst.
+        # Bei mehreren offenen Rechnungen wäre die Wahl geraten, und geratene
+        # Zahlungszuordnungen sind teurer als eine Minute Handarbeit.
+        name = absender.get(id(e), '')
+        gelernter_vertrag = gelernt.get(_zahler.normalisiere(name)[:160]) if name else None
+        if gelernter_vertrag is not None:
+            kand = [r for r in je_vertrag.get(gelernter_vertrag.id, ()) if rest[r.pk] > 0]
+            if len(kand) == 1 and betrag_e <= rest[kand[0].pk]:
+                schritt.update(art='gelernt', rechnung=kand[0], absender=name)
+                _bezahlen(schritt, kand[0], betrag_e)
+                continue
+
+        # 3) Nicht zuordenbar → parken (nichts geht verloren).
+        # Trägt die Zahlung eine QRR, deren Rechnung bereits bezahlt ist, ist der
+        # Zahler bekannt: das ist eine Doppelzahlung des Mieters und gehört als
+        # Guthaben auf 2030, nicht als «ungeklärt» auf 1190 — dort wäre sie
+        # optisch ein Fremdeingang und der Mieter bekäme sein Geld nie zurück.
+        if e['referenz']:
+            bekannte = ref_index.get(e['referenz']) or bezahlte.get(e['referenz'])
+            if bekannte is not None and bekannte.vertrag_id:
+                schritt.update(art='doppelzahlung', rechnung=bekannte, vertrag=bekannte.vertrag)
+                continue
+        schritt['art'] = 'ungeklaert'
+    return {'schritte': schritte, 'heute': heute}
+
+
+# ---------------------------------------------------------------------------
+# Ausführen
+# ---------------------------------------------------------------------------
+
+def _liegenschaft(vertrag):
+    return vertrag.einheit.liegenschaft if vertrag and vertrag.einheit_id else None
+
+
+def ausfuehren(plan, kopf, *, bank_nr='1020', quelle='camt.053', dateiname='', user=None):
+    """Schreibt den Plan aus `planen`: Kontoauszug, dann je Auszug der Datei
+    (`eintrag['auszug']`, bei CSV einer) eine Transaktion.
+
+    Gibt ein dict mit den Zählern zurück — `verbucht`, `fuzzy`, `gelernt`,
+    `geklaert` (auf 1190), `guthaben` (auf 2030), `duplikate`, `gesperrt`,
+    `belastungen`, `zugeordnet_summe` — sowie `auszug` und `bank_nr`.
+    """
+    from core.organisation_kette import organisation_bestimmen
+    from core.services import zahler as _zahler
+    from finance.booking import konto, kontenplan_zwischenspeicher
+    from finance.models import Buchungskonto, Kontoauszug
+
+    heute = plan['heute']
+    # Zielkonto der Bank: wählbar, damit mehrere Bankkonten buchbar sind.
+    # Vorher war «1020» im ganzen Import hart verdrahtet (Praxis-Audit).
+    bank_nr = (bank_nr or '1020').strip()
+    konto_bank = Buchungskonto.objects.filter(nummer=bank_nr).first()
+    if konto_bank is None:
+        bank_nr, konto_bank = '1020', konto('1020')
+    konto_clearing, _ = Buchungskonto.objects.get_or_create(
+        nummer="1190", defaults={'bezeichnung': 'Durchlaufkonto (ungeklärte Zahlungen)', 'typ': 'bilanz'})
+    # W6: Überzahlung eines BEKANNTEN Mieters ist kein ungeklärter Posten, sondern
+    # eine echte Verbindlichkeit → 2030 «Guthaben Mieter» statt Durchlaufkonto 1190.
+    konto_guthaben = konto("2030")
+    organisation_id = organisation_bestimmen().pk
+
+    # Kontoauszug mit Schlusssaldo festhalten — die Grundlage des Abstimmungsnachweises.
+    auszug = Kontoauszug.objects.create(
+        konto=konto_bank, iban=(kopf.get('iban') or '')[:34],
+        von=kopf.get('von'), bis=kopf.get('bis'),
+        eroeffnungssaldo=kopf.get('eroeffnung'), schlusssaldo=kopf.get('schluss'),
+        dateiname=(dateiname or '')[:255], quelle=quelle, importiert_von=user)
+
+    je_auszug = {}
+    for s in plan['schritte']:
+        if s['art'] not in ('duplikat', 'gesperrt'):
+            je_auszug.setdefault(s['eintrag'].get('auszug', 0), []).append(s)
+    for teil in je_auszug.values():
+        try:
+            # Offen schon in Anfrage und Befehl; hier für Aufrufer ohne —
+            # sonst sucht jede vorbereitete Buchung ihre zwei Konten.
+            with kontenplan_zwischenspeicher(), transaction.atomic():
+                _schreiben(teil, auszug, konto_bank, konto_clearing, konto_guthaben,
+                           organisation_id, bank_nr, quelle, heute, user)
+        except PermissionError:
+            for s in teil:
+                s['art'] = 'gesperrt'
+
+    erg = {'auszug': auszug, 'bank_nr': bank_nr, 'verbucht': 0, 'fuzzy': 0, 'gelernt': 0,
+           'geklaert': 0, 'guthaben': 0, 'duplikate': 0, 'gesperrt': 0, 'belastungen': 0,
+           'zugeordnet_summe': Decimal('0.00')}
+    treffer = {}
+    for s in plan['schritte']:
+        art = s['art']
+        if art in ('referenz', 'name_betrag', 'gelernt'):
+            erg['verbucht'] += 1
+            erg['zugeordnet_summe'] += s['betrag'] + s['ueberschuss']
+            if s['ueberschuss'] > 0:
+                erg['guthaben'] += 1
+            if art == 'name_betrag':
+                erg['fuzzy'] += 1
+            elif art == 'gelernt':
+                erg['gelernt'] += 1
+                treffer[s['absender']] = treffer.get(s['absender'], 0) + 1
+        elif art == 'doppelzahlung':
+            erg['guthaben'] += 1
+        elif art == 'ungeklaert':
+            erg['geklaert'] += 1
+        elif art == 'belastung':
+            erg['belastungen'] += 1
+        elif art == 'duplikat':
+            erg['duplikate'] += 1
+        elif art == 'gesperrt':
+            erg['gesperrt'] += 1
+    for name, n in treffer.items():
+        _zahler.zaehle_treffer(name, n)
+    if any(erg[k] for k in ('verbucht', 'guthaben', 'geklaert')):
+        # `bulk_create`/`bulk_update` lösen keine Signale aus — der
+        # Zwischenspeicher (Startseite, Eigentümer-Portal) muss hier
+        # ausdrücklich neu rechnen.
+        from core.services import zwischenspeicher
+        zwischenspeicher.vergessen('zahlung:*', 'rechnung:*', organisation_id=organisation_id)
+    return erg
+
+
+def _schreiben(schritte, auszug, konto_bank, konto_clearing, konto_guthaben, organisation_id,
+               bank_nr, quelle, heute, user):
+    """Ein Auszug der Datei: alles mit je einer Anweisung, in Dateireihenfolge.
+
+    `bulk_create` geht an `save()` vorbei; die Organisation aus der Kette und
+    die Betragsprüfung stehen deshalb hier, wie in `_sollstellung_stapel`.
+    """
+    from finance.booking import buchung_vorbereiten, buche_stapel
+    from finance.models import (Bankbewegung, DebitorenRechnung, Zahlungseingang,
+                                pruefe_dezimalfelder)
+
+    zahlungen = []      # (schritt, zahlung, ueberzahlung)
+    for s in schritte:
+        e, art, r = s['eintrag'], s['art'], s['rechnung']
+        if art == 'belastung':
+            continue
+        datum = e['datum'] or heute
+        aref = e['acct_ref']
+        if art in ('referenz', 'name_betrag', 'gelernt'):
+            via = {'referenz': 'Referenz', 'name_betrag': 'Name+Betrag',
+                   'gelernt': f"gelernter Absender {s['absender']}"}[art]
+            z = Zahlungseingang(
+                vertrag=r.vertrag, betrag=s['betrag'], datum_eingang=datum,
+                buchungs_monat=(r.faellig_am or r.datum or heute).replace(day=1),
+                bemerkung=f"{quelle}-Import ({via}) {r.titel}"[:255], bank_referenz=aref,
+                liegenschaft=_liegenschaft(r.vertrag), debitoren_rechnung=r,
+                erstellt_von=user, status='verbucht')
+            ueber = None
+            if s['ueberschuss'] > 0:
+                ueber = Zahlungseingang(
+                    vertrag=r.vertrag, betrag=s['ueberschuss'], datum_eingang=datum,
+                    buchungs_monat=datum.replace(day=1),
+                    bemerkung=f"{quelle} Überzahlung {r.titel} (Guthaben Mieter)"[:255],
+                    bank_referenz=f"{aref}:ueber"[:140], konto=konto_guthaben,
+                    liegenschaft=_liegenschaft(r.vertrag), erstellt_von=user, status='verbucht')
+            zahlungen.append((s, z, ueber))
+        elif art == 'doppelzahlung':
+            v = s['vertrag']
+            zahlungen.append((s, Zahlungseingang(
+                vertrag=v, betrag=e['betrag'], datum_eingang=datum,
+                buchungs_monat=datum.replace(day=1),
+                bemerkung=f"{quelle} Doppelzahlung {r.titel} (Guthaben Mieter)"[:255],
+                bank_referenz=aref, konto=konto_guthaben, liegenschaft=_liegenschaft(v),
+                erstellt_von=user, status='verbucht'), None))
+        else:
+            zahlungen.append((s, Zahlungseingang(
+                betrag=e['betrag'], datum_eingang=datum, buchungs_monat=datum.replace(day=1),
+                bemerkung=f"{quelle} UNGEKLÄRT: {e.get('dbtr_name','') or e.get('info','') or e.get('referenz','')}"[:255],
+                bank_referenz=aref, konto=konto_clearing, erstellt_von=user, status='verbucht'), None))
+
+    neu = [z for _, z, u in zahlungen for z in (z, u) if z is not None]
+    for z in neu:
+        if z.organisation_id is None:
+            z.organisation_id = z.organisation_aus_kette() or organisation_id
+        pruefe_dezimalfelder(z)
+    Zahlungseingang.objects.bulk_create(neu)
+
+    # Buchungen in derselben Reihenfolge, in der der Einzelweg sie schrieb.
+    stapel, zahlung_je_schritt, rechnungen = [], {}, {}
+    for s, z, ueber in zahlungen:
+        e, art, r = s['eintrag'], s['art'], s['rechnung']
+        datum = e['datum'] or heute
+        zahlung_je_schritt[id(s)] = z
+        if art in ('referenz', 'name_betrag', 'gelernt'):
+            v = r.vertrag
+            # Der Rest nach der LETZTEN Zahlung dieses Auszugs entscheidet.
+            r.status = 'bezahlt' if s['rest'] <= 0 else 'teilbezahlt'
+            rechnungen[r.pk] = r
+            stapel.append(buchung_vorbereiten(bank_nr, "1100", s['betrag'],
+                                              f"{quelle} {v.mieter} - {r.titel}", datum=datum,
+                                              liegenschaft=_liegenschaft(v), zahlung=z, user=user))
+            if ueber is not None:
+                stapel.append(buchung_vorbereiten(
+                    bank_nr, "2030", ueber.betrag, f"{quelle} Überzahlung {v.mieter} - {r.titel}",
+                    datum=datum, liegenschaft=_liegenschaft(v), zahlung=ueber, user=user))
+        elif art == 'doppelzahlung':
+            v = s['vertrag']
+            stapel.append(buchung_vorbereiten(bank_nr, "2030", e['betrag'],
+                                              f"{quelle} Doppelzahlung {v.mieter} - {r.titel}",
+                                              datum=datum, liegenschaft=_liegenschaft(v),
+                                              zahlung=z, user=user))
+        else:
+            stapel.append(buchung_vorbereiten(
+                bank_nr, "1190", e['betrag'],
+                f"{quelle} ungeklärt: {e.get('dbtr_name','') or e.get('referenz','')}",
+                datum=datum, zahlung=z, user=user))
+    buche_stapel(stapel)
+
+    # Jede Zeile des Auszugs wird festgehalten — auch die, die sich nicht
+    # automatisch zuordnen lässt. Erst dadurch ist das Bankkonto abstimmbar
+    # und der Auszug im Programm nachvollziehbar (Praxis-Audit). Eine auf
+    # 1190 geparkte Gutschrift IST gebucht — bliebe sie «offen», zeigte der
+    # Saldoabgleich eine Differenz, die es gar nicht gibt.
+    bewegungen = []
+    for s in schritte:
+        e, art = s['eintrag'], s['art']
+        z = zahlung_je_schritt.get(id(s))
+        bemerkung = ''
+        if art == 'doppelzahlung':
+            bemerkung = f"Doppelzahlung → 2030 ({s['rechnung'].titel})"
+        elif art == 'ungeklaert':
+            bemerkung = "ungeklärt → Durchlaufkonto 1190"
+        bew = Bankbewegung(
+            auszug=auszug, konto=konto_bank, organisation_id=konto_bank.organisation_id,
+            datum=e.get('datum') or heute, valuta=e.get('valuta'), betrag=e['betrag'],
+            text=(e.get('info') or '')[:255], gegenpartei=(e.get('dbtr_name') or '')[:160],
+            referenz=(e.get('referenz') or '')[:40], bank_referenz=e['acct_ref'],
+            status='offen' if z is None else 'verbucht', zahlung=z,
+            liegenschaft=z.liegenschaft if z is not None else None, bemerkung=bemerkung[:255])
+        pruefe_dezimalfelder(bew)
+        bewegungen.append(bew)
+    Bankbewegung.objects.bulk_create(bewegungen)
+
+    if rechnungen:
+        # `alle_organisationen`: die eben geladenen Zeilen, über ihren
+        # Primärschlüssel — wie in `DebitorenRechnung.save()`.
+        DebitorenRechnung.alle_organisationen.bulk_update(list(rechnungen.values()), ['status'])
+
+
+def saldoabgleich(auszug):
+    """`(buch_saldo, differenz)` des Bankkontos zum Schlusssaldo des Auszugs.
+
+    Der Nachweis, dass Buchhaltung und Bankkonto übereinstimmen. None, wenn
+    der Auszug keinen Schlusssaldo trägt (CSV).
+    """
+    from django.db.models import Sum
+    from finance.models import Buchung
+
+    if auszug.schlusssaldo is None:
+        return None
+    bq = Buchung.objects.filter(ist_storno=False, storniert_am__isnull=True)
+    if auszug.bis:
+        bq = bq.filter(datum__lte=auszug.bis)
+    s = bq.filter(soll_konto=auszug.konto).aggregate(t=Sum('betrag'))['t'] or Decimal('0.00')
+    h = bq.filter(haben_konto=auszug.konto).aggregate(t=Sum('betrag'))['t'] or Decimal('0.00')
+    buch_saldo = (s - h).quantize(Decimal('0.01'))
+    return buch_saldo, (auszug.schlusssaldo - buch_saldo).quantize(Decimal('0.01'))
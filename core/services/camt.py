@@ -0,0 +1,282 @@
+"""camt.053/054-Kontoauszüge (ISO 20022) in einem Durchgang lesen.
+
+Der Import las eine Datei zweimal vollständig als DOM ein — einmal für die
+Bewegungen, einmal für Kopf und Salden — und lief dann jedes Mal über ALLE
+Elemente. Ein Jahresauszug eines grossen Mietzinskontos hat mehrere tausend
+<Ntry> und einige zehn Megabyte; als Baum im Speicher ist das ein Vielfaches.
+
+`CamtLeser` liest mit `iterparse` und verarbeitet jede <Ntry> und jede <Bal>
+in dem Moment, in dem sie vollständig ist; danach wird das Element aus dem
+Baum entfernt. Im Speicher liegt damit nie mehr als eine Buchung samt ihrem
+Pfad. Die Regeln je Buchung sind dieselben wie bisher im Bankabgleich
+(Sammelbuchungen aufteilen, Valuta, Gegenpartei je Richtung, NOTPROVIDED).
+
+Eine Datei darf mehrere Auszüge enthalten (<Stmt> in camt.053, <Ntfctn> in
+camt.054, <Rpt> in camt.052). Jede Bewegung trägt unter `auszug` den Index
+ihres Auszugs; `auszuege` hält die Kopfdaten je Auszug, `kopf` die der ganzen
+Datei.
+"""
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+
+#: Elemente, die einen Auszug eröffnen (camt.053 / camt.054 / camt.052).
+AUSZUG_ELEMENTE = ('Stmt', 'Ntfctn', 'Rpt')
+
+
+@lru_cache(maxsize=512)
+def _localname(tag):
+    """Entfernt den XML-Namespace ({...}Ntry -> Ntry).
+
+    Gemerkt: Eine Datei hat ein paar Dutzend verschiedene Tags, aber
+    Millionen Elemente."""
+    return tag.split('}')[-1] if '}' in tag else tag
+
+
+def _finde(el, *pfad):
+    """Namespace-agnostisches Suchen entlang eines Pfads von Localnames."""
+    cur = el
+    for name in pfad:
+        gefunden = None
+        for kind in cur:
+            if _localname(kind.tag) == name:
+                gefunden = kind
+                break
+        if gefunden is None:
+            return None
+        cur = gefunden
+    return cur
+
+
+def _datum(el):
+    if el is None or not el.text:
+        return None
+    try:
+        return date.fromisoformat(el.text.strip()[:10])
+    except ValueError:
+        return None
+
+
+def _tx_details(el, richtung='CRDT'):
+    """Liest Referenz / Mitteilung / Bank-Tx-Ref / Gegenpartei aus einem
+    camt-Teilbaum (<Ntry> oder einzelne <TxDtls>).
+
+    Die Gegenpartei ist bei einer Gutschrift der Auftraggeber (<Dbtr>), bei einer
+    Belastung der Zahlungsempfaenger (<Cdtr>) — sonst bleibt der Lieferantenname
+    im Bank-Eingang leer."""
+    referenz = info = acct_ref = dbtr_name = ''
+    gegen_tag = 'Dbtr' if richtung == 'CRDT' else 'Cdtr'
+    in_dbtr = False
+    for sub in el.iter():
+        ln = _localname(sub.tag)
+        if ln == 'CdtrRefInf':
+            ref_el = _finde(sub, 'Ref')
+            if ref_el is not None and ref_el.text:
+                referenz = ref_el.text.strip().replace(' ', '')
+        elif ln == 'Ustrd' and not info and sub.text:
+            info = sub.text.strip()
+        elif ln in ('AcctSvcrRef', 'TxId', 'EndToEndId') and not acct_ref and sub.text:
+            # 'NOTPROVIDED' ist bei Swiss-QR-Gutschriften der Standardwert und
+            # KEINE eindeutige Transaktionsreferenz — sonst würden mehrere
+            # verschiedene Zahlungen fälschlich als Duplikat verworfen.
+            _cand = sub.text.strip()
+            if _cand.upper() != 'NOTPROVIDED':
+                acct_ref = _cand
+        elif ln == gegen_tag:
+            in_dbtr = True
+        elif ln == 'Nm' and in_dbtr and not dbtr_name and sub.text:
+            dbtr_name = sub.text.strip(); in_dbtr = False
+    return {'referenz': referenz, 'info': info,
+            'acct_ref': acct_ref, 'dbtr_name': dbtr_name}
+
+
+def buchung_eintraege(ntry, nur_gutschriften=True):
+    """Die Bewegungen EINER <Ntry> als Liste von dicts — leer, wenn sie nicht zählt.
+
+    Schlüssel: `betrag` (Belastungen negativ), `datum`, `valuta`, `referenz`,
+    `info`, `acct_ref`, `dbtr_name`.
+    """
+    cdtdbt = _finde(ntry, 'CdtDbtInd')
+    richtung = (cdtdbt.text or '').strip() if cdtdbt is not None else ''
+    if richtung not in ('CRDT', 'DBIT'):
+        return []
+    if nur_gutschriften and richtung != 'CRDT':
+        return []
+    vorzeichen = Decimal('1') if richtung == 'CRDT' else Decimal('-1')
+    amt_el = _finde(ntry, 'Amt')
+    if amt_el is None or not (amt_el.text or '').strip():
+        return []
+    try:
+        betrag = Decimal((amt_el.text or '0').strip())
+    except Exception:
+        return []
+    # Buchungsdatum (Element mit Text ist in ET „falsy", daher explizit is-None prüfen)
+    dt_el = _finde(ntry, 'BookgDt', 'Dt')
+    if dt_el is None:
+        dt_el = _finde(ntry, 'ValDt', 'Dt')
+    datum = _datum(dt_el)
+    # Valutadatum separat — es ist das buchhalterisch massgebende Datum und
+    # wich bisher stillschweigend dem Erfassungstag (Praxis-Audit).
+    valuta = _datum(_finde(ntry, 'ValDt', 'Dt'))
+
+    # Sammelbuchung: enthält der Eintrag mehrere <TxDtls>, ist jede davon eine
+    # eigene Zahlung mit eigener QRR. Ohne diese Aufteilung würde der GESAMT-
+    # betrag der zuletzt gefundenen Referenz zugeordnet und alle übrigen Mieter
+    # blieben unbezahlt (Audit, kritisch) — Schweizer Banken fassen QR-Eingänge
+    # eines Tages regelmässig so zusammen (camt.054: <Btch> mit <TxDtls>).
+    txdtls = [t for t in ntry.iter() if _localname(t.tag) == 'TxDtls']
+    if len(txdtls) > 1:
+        summe_tx = Decimal('0.00')
+        teil_eintraege = []
+        for tx in txdtls:
+            tx_amt = _finde(tx, 'Amt')
+            try:
+                tx_betrag = Decimal((tx_amt.text or '0').strip()) if tx_amt is not None else None
+            except Exception:
+                tx_betrag = None
+            if tx_betrag is None or tx_betrag <= 0:
+                teil_eintraege = []      # unvollständig → als Ganzes behandeln
+                break
+            teil_eintraege.append((tx, tx_betrag))
+            summe_tx += tx_betrag
+        # Nur aufteilen, wenn die Einzelbeträge den Eintrag exakt ergeben —
+        # sonst ginge Geld verloren oder würde doppelt verbucht.
+        if teil_eintraege and summe_tx == betrag:
+            return [{'betrag': tx_betrag * vorzeichen, 'datum': datum, 'valuta': valuta,
+                     **_tx_details(tx, richtung)}
+                    for tx, tx_betrag in teil_eintraege]
+
+    # Referenz + Info + Bank-Tx-Ref (Duplikatschutz) + Gegenpartei (Fuzzy)
+    return [{'betrag': betrag * vorzeichen, 'datum': datum, 'valuta': valuta,
+             **_tx_details(ntry, richtung)}]
+
+
+def _saldo(bal):
+    """`(code, wert)` einer <Bal>, oder None. Habensaldo (CRDT) ist positiv."""
+    code = ''
+    for sub in bal.iter():
+        if _localname(sub.tag) == 'Cd' and sub.text:
+            code = sub.text.strip().upper()
+            break
+    amt = _finde(bal, 'Amt')
+    if amt is None or not (amt.text or '').strip():
+        return None
+    try:
+        wert = Decimal(amt.text.strip())
+    except Exception:
+        return None
+    vz = _finde(bal, 'CdtDbtInd')
+    if vz is not None and (vz.text or '').strip() == 'DBIT':
+        wert = -wert
+    return code, wert
+
+
+def _leerer_kopf():
+    return {'iban': '', 'von': None, 'bis': None, 'eroeffnung': None, 'schluss': None}
+
+
+class CamtLeser:
+    """Liest einen camt-Auszug inkrementell; Iterieren liefert die Bewegungen.
+
+        leser = CamtLeser(datei, nur_gutschriften=False)
+        for eintrag in leser:
+            ...
+        leser.kopf        # IBAN, Periode, Eröffnungs- und Schlusssaldo
+
+    `quelle` ist ein Dateiobjekt (auch ein Upload) oder `bytes`. Die Datei wird
+    genau einmal gelesen; `kopf` und `auszuege` sind erst nach dem vollen
+    Durchlauf vollständig — die Salden stehen in camt.053 zwar vor den
+    Buchungen, die Periode je nach Bank aber nicht.
+
+    Ungültiges XML wirft `xml.etree.ElementTree.ParseError`, sobald der Leser
+    die Stelle erreicht.
+    """
+
+    def __init__(self, quelle, nur_gutschriften=True):
+        import io
+        self.quelle = io.BytesIO(quelle) if isinstance(quelle, (bytes, bytearray)) else quelle
+        self.nur_gutschriften = nur_gutschriften
+        self.auszuege = []
+        self._gelesen = False
+
+    @property
+    def kopf(self):
+        """Kopfdaten der ganzen Datei: IBAN des ersten Auszugs, Periode über
+        alle Auszüge, Eröffnungssaldo des ersten und Schlusssaldo des letzten."""
+        kopf = _leerer_kopf()
+        for a in self.auszuege:
+            kopf['iban'] = kopf['iban'] or a['iban']
+            if a['von'] and (kopf['von'] is None or a['von'] < kopf['von']):
+                kopf['von'] = a['von']
+            if a['bis'] and (kopf['bis'] is None or a['bis'] > kopf['bis']):
+                kopf['bis'] = a['bis']
+            if kopf['eroeffnung'] is None:
+                kopf['eroeffnung'] = a['eroeffnung']
+            if a['schluss'] is not None:
+                kopf['schluss'] = a['schluss']
+        return kopf
+
+    def __iter__(self):
+        import xml.etree.ElementTree as ET
+
+        if self._gelesen:
+            raise RuntimeError('CamtLeser liest seine Quelle nur einmal.')
+        self._gelesen = True
+        pfad = []            # (localname, element) vom Wurzelelement bis hier
+        in_buchung = 0       # wie viele <Ntry> offen sind (IBAN/Periode darin zählen nicht)
+        auszug = None
+        for ereignis, el in ET.iterparse(self.quelle, events=('start', 'end')):
+            if ereignis == 'start':
+                name = _localname(el.tag)
+                pfad.append((name, el))
+                if name == 'Ntry':
+                    in_buchung += 1
+                elif name in AUSZUG_ELEMENTE and not in_buchung:
+                    auszug = _leerer_kopf()
+                    self.auszuege.append(auszug)
+                continue
+
+            name, _ = pfad.pop()
+            if name == 'Ntry':
+                in_buchung -= 1
+                if auszug is None:       # Buchung ohne Auszugselement: einer für alles
+                    auszug = _leerer_kopf()
+                    self.auszuege.append(auszug)
+                for eintrag in buchung_eintraege(el, self.nur_gutschriften):
+                    eintrag['auszug'] = len(self.auszuege) - 1
+                    yield eintrag
+                self._entfernen(pfad, el)
+            elif in_buchung or auszug is None:
+                continue
+            elif name == 'IBAN' and el.text and not auszug['iban']:
+                auszug['iban'] = el.text.strip().replace(' ', '')
+            elif name in ('FrDtTm', 'ToDtTm'):
+                d = _datum(el)
+                if d is not None:
+                    auszug['von' if name == 'FrDtTm' else 'bis'] = d
+            elif name == 'Bal':
+                saldo = _saldo(el)
+                if saldo is not None:
+                    code, wert = saldo
+                    if code in ('OPBD', 'PRCD'):
+                        auszug['eroeffnung'] = wert
+                    elif code in ('CLBD', 'CLAV'):
+                        auszug['schluss'] = wert
+                self._entfernen(pfad, el)
+            elif name in AUSZUG_ELEMENTE:
+                self._entfernen(pfad, el)
+
+    @staticmethod
+    def _entfernen(pfad, el):
+        """Gibt ein fertig gelesenes Element frei — samt Eintrag im Elternteil,
+        sonst sammelten sich tausende leere Hüllen unter dem Auszug."""
+        el.clear()
+        if pfad:
+            pfad[-1][1].remove(el)
+
+
+def lese_camt(quelle, nur_gutschriften=True):
+    """`(eintraege, kopf)` eines camt-Auszugs in einem Durchgang."""
+    leser = CamtLeser(quelle, nur_gutschriften=nur_gutschriften)
+    eintraege = list(leser)
+    return eintraege, leser.kopf
@@ -0,0 +1,195 @@
+"""Portfolio-Kennzahlen eines Eigentümers: Objekte, Belegung, Soll, Rendite, Ausstand, Dokumente.
+
+Das Eigentümer-Portal, der Portfolio-Report (PDF) und der Report-Versand
+(`send_eigentuemer_reports`) zeigen dieselben Zahlen. Gerechnet wurden sie in
+`core.views.portal._portfolio_daten` Objekt für Objekt: je Einheit eine
+Abfrage nach dem aktiven Vertrag, je Liegenschaft eine nach den Dokumenten und
+zwei nach den offenen Posten. Ein Eigentümer mit 40 Liegenschaften und 600
+Einheiten löste so bei JEDEM Aufruf des Portals weit über 600 Abfragen aus.
+
+Hier sind es sechs, unabhängig von der Grösse des Portfolios: Liegenschaften,
+Einheiten, aktive Verträge, die neusten Dokumente je Liegenschaft (Fenster-
+funktion) und die offenen Posten je Liegenschaft (eine gruppierte Summe je
+Zuordnungsweg, siehe `_ausstaende`).
+
+Das Ergebnis liegt je Eigentümer und Tag im Zwischenspeicher
+(`core.services.zwischenspeicher`). Verworfen wird es über die Tags in
+`TAGS`: Jede Änderung an Rechnung, Zahlung, Vertrag, Mietzins, Objekt,
+Dokument, Mieter oder Eigentümer zählt deren Stand weiter — vor und nach dem
+Commit, wie überall im Zwischenspeicher. Der Tag gehört zum Schlüssel, weil
+«überfällig» vom Datum abhängt. Was an den Signalen vorbeigeht —
+`QuerySet.update()`, Roh-SQL —, sieht das Portal spätestens nach
+`GUELTIGKEIT` Sekunden; `bulk_create` der Sollstellung und des Bankimports
+verwirft `rechnung:*` und `zahlung:*` ausdrücklich.
+"""
+from decimal import Decimal
+
+#: Höchstalter eines gespeicherten Portfolios in Sekunden — das Netz für
+#: Änderungen, die kein Signal auslösen.
+GUELTIGKEIT = 15 * 60
+
+#: Dokumente je Liegenschaft im Portal.
+DOKUMENTE_JE_LIEGENSCHAFT = 20
+
+#: Wovon das Portfolio abhängt — die Antwort auf «was macht das Portal
+#: ungültig?». Alle Arten mit Stern: Von einer Zahlung oder einem
+#: Mietzinsbestandteil zum Eigentümer führen zwei bis vier Joins, und die
+#: Signale fragen nicht selbst ab. Mieter und Eigentümer stehen mit Namen im
+#: Ergebnis.
+TAGS = ('rechnung:*', 'zahlung:*', 'vertrag:*', 'mietzins:*', 'liegenschaft:*',
+        'einheit:*', 'sollmietzins:*', 'dokument:*', 'mieter:*')
+
+
+def portfolio_daten(eigentuemer, *, zwischenspeicher=True):
+    """Alle Kennzahlen des Portals für `eigentuemer` als dict.
+
+    Schlüssel wie bisher `_portfolio_daten`: `liegenschaften` (je Objekt mit
+    `einheiten`, `dokumente`, `ausstand`, …), `total_soll`, `jahres_soll`,
+    `total_einheiten`, `total_vermietet`, `total_leer`,
+    `total_versicherungswert`, `bruttorendite`, `leerquote`, `total_ausstand`,
+    `total_ueberfaellig`. `zwischenspeicher=False` rechnet frisch.
+    """
+    from django.utils import timezone
+    from core.services.zwischenspeicher import holen
+
+    heute = timezone.localdate()
+    if not zwischenspeicher:
+        return _berechnen(eigentuemer, heute)
+    return holen(('eigentuemer_portfolio', eigentuemer.pk, heute),
+                 lambda: _berechnen(eigentuemer, heute),
+                 tags=(*TAGS, f'eigentuemer:{eigentuemer.pk}'), gueltigkeit=GUELTIGKEIT)
+
+
+def _berechnen(eigentuemer, heute):
+    from django.db.models import F, Window
+    from django.db.models.functions import RowNumber
+
+    from portfolio.models import Dokument, Einheit
+    from rentals.models import Mietvertrag
+
+    lgs = list(eigentuemer.liegenschaften.all().order_by('pk'))
+    lg_ids = [lg.pk for lg in lgs]
+    einheiten = {}
+    for e in Einheit.objects.filter(liegenschaft_id__in=lg_ids).order_by('pk'):
+        einheiten.setdefault(e.liegenschaft_id, []).append(e)
+
+    # Je Einheit der zuletzt begonnene aktive Vertrag — wie vorher
+    # `.order_by('-beginn').first()` je Einheit, nur in einer Abfrage.
+    vertraege = {}
+    for v in (Mietvertrag.objects.filter(einheit__liegenschaft_id__in=lg_ids, status='aktiv')
+              .select_related('mieter').order_by('-beginn')):
+        vertraege.setdefault(v.einheit_id, v)
+
+    dokumente = {}
+    for d in (Dokument.objects.filter(liegenschaft_id__in=lg_ids)
+              .annotate(rang=Window(RowNumber(), partition_by=[F('liegenschaft_id')],
+                                    order_by=[F('datum').desc(), F('pk').desc()]))
+              .filter(rang__lte=DOKUMENTE_JE_LIEGENSCHAFT)
+              .order_by('liegenschaft_id', 'rang')):
+        dokumente.setdefault(d.liegenschaft_id, []).append(
+            {'id': d.id, 'titel': d.titel, 'kategorie': d.kategorie, 'datum': d.datum})
+
+    ausstaende = _ausstaende(lg_ids, heute)
+
+    liegenschaften = []
+    total_soll = Decimal('0.00')
+    total_einheiten = 0
+    total_vermietet = 0
+    total_versicherungswert = Decimal('0.00')
+    total_ausstand = Decimal('0.00')
+    total_ueberfaellig = Decimal('0.00')
+    for lg in lgs:
+        einheiten_rows = []
+        lg_soll = Decimal('0.00')
+        lg_einheiten = 0
+        lg_vermietet = 0
+        for e in einheiten.get(lg.pk, []):
+            vertrag = vertraege.get(e.pk)
+            brutto = vertrag.brutto_mietzins if vertrag else Decimal('0.00')
+            lg_soll += brutto
+            lg_einheiten += 1
+            if vertrag:
+                lg_vermietet += 1
+            einheiten_rows.append({
+                'bezeichnung': e.bezeichnung,
+                'typ': e.get_typ_display(),
+                'zimmer': e.zimmer,
+                'flaeche': e.flaeche_m2,
+                'mieter': str(vertrag.mieter) if vertrag else None,
+                'seit': vertrag.beginn if vertrag else None,
+                'brutto': brutto if vertrag else None,
+            })
+        total_soll += lg_soll
+        total_einheiten += lg_einheiten
+        total_vermietet += lg_vermietet
+        vw = lg.versicherungswert or Decimal('0.00')
+        total_versicherungswert += vw
+        lg_jahr = lg_soll * 12
+        lg_leer = lg_einheiten - lg_vermietet
+        lg_ausstand, lg_ueberfaellig = ausstaende.get(lg.pk, (Decimal('0.00'), Decimal('0.00')))
+        total_ausstand += lg_ausstand
+        total_ueberfaellig += lg_ueberfaellig
+        liegenschaften.append({
+            'id': lg.id,
+            'adresse': f"{lg.strasse}, {lg.plz} {lg.ort}",
+            'baujahr': lg.baujahr,
+            'einheiten': einheiten_rows,
+            'soll_monat': lg_soll,
+            'jahres_soll': lg_jahr,
+            'versicherungswert': vw if vw else None,
+            'rendite': (float(lg_jahr) / float(vw) * 100) if vw else None,
+            'leer': lg_leer,
+            'leerquote': (lg_leer / lg_einheiten * 100) if lg_einheiten else 0,
+            'dokumente': dokumente.get(lg.pk, []),
+            'ausstand': lg_ausstand,
+            'ueberfaellig': lg_ueberfaellig,
+        })
+
+    total_leer = total_einheiten - total_vermietet
+    jahres_soll = total_soll * 12
+    return {
+        'liegenschaften': liegenschaften,
+        'total_soll': total_soll,
+        'jahres_soll': jahres_soll,
+        'total_einheiten': total_einheiten,
+        'total_vermietet': total_vermietet,
+        'total_leer': total_leer,
+        'total_versicherungswert': total_versicherungswert if total_versicherungswert else None,
+        'bruttorendite': ((float(jahres_soll) / float(total_versicherungswert) * 100)
+                          if total_versicherungswert else None),
+        'leerquote': (total_leer / total_einheiten * 100) if total_einheiten else 0,
+        'total_ausstand': total_ausstand,
+        'total_ueberfaellig': total_ueberfaellig,
+    }
+
+
+def _ausstaende(lg_ids, heute):
+    """`{liegenschaft_id: (ausstand, ueberfaellig)}` aus den offenen Posten.
+
+    Eine Rechnung gehört zu einer Liegenschaft, wenn sie direkt daran hängt
+    ODER ihr Vertrag dort liegt. Zählen beide Wege auf verschiedene
+    Liegenschaften, zählt sie bei beiden — wie bisher, als je Liegenschaft mit
+    `Q(liegenschaft=lg) | Q(vertrag__einheit__liegenschaft=lg)` gefragt wurde.
+    Deshalb zwei gruppierte Summen, die zweite ohne die Rechnungen, die die
+    erste bei derselben Liegenschaft schon gezählt hat.
+    """
+    from django.db.models import F, Q, Sum
+    from django.db.models.functions import Coalesce
+
+    from finance.models import DebitorenRechnung
+
+    null = Decimal('0.00')
+    offene = (DebitorenRechnung.objects.offene_posten()
+              .annotate(_f=Coalesce('faellig_am', 'datum')).order_by())
+    summen = {'s': Sum('offen'), 'u': Sum('offen', filter=Q(_f__lt=heute))}
+    ergebnis = {}
+    for gruppe, qs in (
+            ('liegenschaft_id', offene.filter(liegenschaft_id__in=lg_ids)),
+            ('vertrag__einheit__liegenschaft_id',
+             offene.filter(vertrag__einheit__liegenschaft_id__in=lg_ids)
+             .exclude(liegenschaft_id=F('vertrag__einheit__liegenschaft_id')))):
+        for zeile in qs.values(gruppe).annotate(**summen):
+            ausstand, ueberfaellig = ergebnis.get(zeile[gruppe], (null, null))
+            ergebnis[zeile[gruppe]] = (ausstand + (zeile['s'] or null),
+                                       ueberfaellig + (zeile['u'] or null))
+    return ergebnis
@@ -49,13 +49,18 @@ def sammle_inbox(aktive_lg=None, lg_query='', modus='profi', pendenz_ziel=None,
     eintraege = []
 
     # ---------- GELD (Aggregate aus dem Finanz-Arbeitskorb) ----------
-    deb_qs = DebitorenRechnung.objects.filter(status__in=['offen', 'teilbezahlt'])
+    # Offene Posten aus `offene_posten()`: Summe und Anzahl rechnet die
+    # Datenbank; geladen werden nur die überfälligen, weil deren Mahnstufe
+    # von der Eigentümer-Konfiguration abhängt.
+    from django.db.models import Count, Sum
+    from django.db.models.functions import Coalesce
+    deb_qs = DebitorenRechnung.objects.offene_posten()
     if aktive_lg:
         deb_qs = deb_qs.filter(Q(liegenschaft=aktive_lg) | Q(vertrag__einheit__liegenschaft=aktive_lg))
-    deb = [r for r in deb_qs.select_related('liegenschaft__eigentuemer',
-                                            'vertrag__einheit__liegenschaft__eigentuemer')
-                             .prefetch_related('zahlungseingaenge') if r.offener_betrag > 0]
-    deb_ueberf = [r for r in deb if (r.faellig_am or r.datum) and (r.faellig_am or r.datum) < heute]
+    deb = deb_qs.aggregate(n=Count('id'), s=Sum('offen'))
+    deb_ueberf = list(deb_qs.annotate(_f=Coalesce('faellig_am', 'datum')).filter(_f__lt=heute)
+                      .select_related('liegenschaft__eigentuemer',
+                                      'vertrag__einheit__liegenschaft__eigentuemer'))
     # «Mahnen» nur für Forderungen, deren für die Überfälligkeit fällige Mahnstufe
     # noch NICHT in der Historie erfasst ist. Sonst bleibt die Aufgabe stehen,
     # obwohl der Nutzer die Mahnung bereits erfasst hat (Nutzer-Bug).
@@ -82,10 +87,10 @@ def sammle_inbox(aktive_lg=None, lg_query='', modus='profi', pendenz_ziel=None,
                                   '/neu/mahnwesen/' + lg_query,
                                   'Erinnerung senden' if einfach else 'Mahnen',
                                   dringend=True, chf=chf, ordnung=10))
-    if deb:
-        chf = sum((r.offener_betrag for r in deb), Decimal('0.00'))
-        titel = (f"{len(deb)} offene Zahlungen abgleichen" if einfach
-                 else f"{len(deb)} offene Forderungen mit der Bank abgleichen")
+    if deb['n']:
+        chf = deb['s'] or Decimal('0.00')
+        titel = (f"{deb['n']} offene Zahlungen abgleichen" if einfach
+                 else f"{deb['n']} offene Forderungen mit der Bank abgleichen")
         eintraege.append(_eintrag('geld', titel,
                                   'Bankgutschriften den Mietern zuordnen',
                                   '/neu/bankabgleich/' + lg_query, 'Abgleichen',
@@ -72,24 +72,44 @@ def abschluss_buchungen_q(jahr=None):
     return Q(beleg_text__startswith=BELEG_PREFIX) | Q(beleg_text__contains=f": {BELEG_PREFIX} ")
 
 
+def abschluss_merkmal(beleg_text):
+    """`abschluss_buchungen_q()` für EINEN Belegtext, in Python.
+
+    Gibt `(ist_abschluss, jahr)` zurück: `ist_abschluss` entspricht dem Q ohne
+    Jahr, `jahr` dem Jahr, für das das Q mit Jahr zutrifft (0, wenn keines).
+    Das Saldenbuch (`finance.models.Saldenbuch`) merkt sich beides je Zeile,
+    damit seine Auswertungen dieselben Buchungen ausklammern wie die Abfragen
+    über das Journal. Ändert sich das Q, muss sich das hier mitändern.
+    """
+    import re
+    text = beleg_text or ''
+    ist_abschluss = text.startswith(BELEG_PREFIX) or f": {BELEG_PREFIX} " in text
+    if not ist_abschluss:
+        return False, 0
+    treffer = (re.match(rf"{BELEG_PREFIX} (\d+) —", text)
+               or re.search(rf": {BELEG_PREFIX} (\d+) —", text))
+    return True, int(treffer.group(1)) if treffer else 0
+
+
 def salden_erfolgskonten(jahr, liegenschaft=None):
     """Saldo je Erfolgskonto für das Geschäftsjahr (ohne bereits gebuchte
     Abschlussbuchungen). Rückgabe: Liste von (konto, saldo) — Ertrag positiv im
     Haben, Aufwand positiv im Soll."""
-    from django.db.models import Sum
-    from finance.models import Buchung, Buchungskonto
-    von, bis = date(jahr, 1, 1), date(jahr, 12, 31)
+    from finance.models import Buchungskonto, Saldenbuch
+    # Aus dem Saldenbuch statt aus dem Journal: höchstens zwölf Zeilen je
+    # Konto (und Liegenschaft) statt zweier Summen über alle Buchungen.
+    # Abschlussbuchungen UND ihre Storni ausschliessen — sonst zählte ein
+    # erneuter Abschluss nach einer Rücknahme die Storno-Gegenbuchung als
+    # echten Ertrag/Aufwand mit (H6). `abschluss_jahr` ist dasselbe Merkmal
+    # wie `abschluss_buchungen_q(jahr)`, beim Buchen festgehalten.
+    zeilen = Saldenbuch.objects.filter(jahr=jahr).exclude(abschluss_jahr=jahr)
+    if liegenschaft:
+        zeilen = zeilen.filter(liegenschaft=liegenschaft)
+    summen = Saldenbuch.summen(zeilen)
+    _0 = Decimal('0.00')
     ergebnis = []
     for k in Buchungskonto.objects.filter(typ__in=['ertrag', 'aufwand']).order_by('nummer'):
-        # Abschlussbuchungen UND ihre Storni ausschliessen — sonst zählte ein
-        # erneuter Abschluss nach einer Rücknahme die Storno-Gegenbuchung als
-        # echten Ertrag/Aufwand mit (H6).
-        q = Buchung.objects.filter(datum__gte=von, datum__lte=bis).exclude(
-            abschluss_buchungen_q(jahr))
-        if liegenschaft:
-            q = q.filter(liegenschaft=liegenschaft)
-        soll = q.filter(soll_konto=k).aggregate(t=Sum('betrag'))['t'] or Decimal('0.00')
-        haben = q.filter(haben_konto=k).aggregate(t=Sum('betrag'))['t'] or Decimal('0.00')
+        soll, haben = summen.get(k.pk, (_0, _0))
         saldo = (haben - soll) if k.typ == 'ertrag' else (soll - haben)
         if saldo != 0:
             ergebnis.append((k, saldo.quantize(Decimal('0.01'))))
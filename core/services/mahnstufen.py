@@ -67,7 +67,13 @@ def mahnstufen_config(eigentuemer):
 
 def stufe_fuer_tage(tage, eigentuemer=None):
     """Hoechste zutreffende Stufe (dict) fuer 'tage' ueberfaellig — oder None."""
-    for s in mahnstufen_config(eigentuemer):
+    return stufe_aus_config(mahnstufen_config(eigentuemer), tage)
+
+
+def stufe_aus_config(stufen, tage):
+    """Wie `stufe_fuer_tage`, aber auf einer bereits geladenen `mahnstufen_config`
+    — fuer Laeufe, die die Konfig einmal je Eigentuemer statt je Rechnung lesen."""
+    for s in stufen:
         if tage >= s['ab_tage']:
             return s
     return None
@@ -0,0 +1,182 @@
+"""Nebenkostenlauf: alle Abrechnungen eines Jahres in einem Zug.
+
+Bis hierhin entstand eine NK-Abrechnung je Periode mit dem Knopf «Versand»
+auf ihrer Detailseite: rechnen, je Mieter ein PDF zeichnen, einzeln ablegen.
+Zum Septembertermin sind das hunderte Abrechnungen, Periode um Periode von
+Hand, und alle PDFs hintereinander auf einem Prozessor.
+
+Der Lauf trennt die drei Arbeiten, weil sie verschieden teuer sind:
+
+  1. RECHNEN — je Periode `hole_abrechnung` (verbuchte Perioden aus dem
+     eingefrorenen Stand, sonst live). Das braucht die Datenbank und bleibt
+     im Prozess.
+  2. ZEICHNEN — reine reportlab-Arbeit ohne Datenbank. Sie geht mit
+     `prozesse` > 1 an einen Prozess-Pool (fork), in Stapeln von `STAPEL`.
+  3. ABLEGEN — je Stapel `ablage.ablegen_stapel`: eine Suche, ein
+     `bulk_create`, ein `bulk_update` statt zweier Abfragen je Dokument.
+
+Nach jedem Stapel wird das MANIFEST geschrieben — eine JSON-Datei im
+Ablagebereich der Verwaltung (`manifest_pfad`), je Abrechnung eine Zeile mit
+Periode, Vertrag, Mieter, Saldo und abgelegtem Dokument. Sie ist zugleich der
+Wiederaufsetzpunkt: Ein zweiter Lauf überspringt, was dort schon steht, und
+macht beim ersten fehlenden Stapel weiter. Stirbt der Lauf zwischen Ablage
+und Manifest, legt der nächste denselben Stapel noch einmal ab — die Ablage
+ersetzt dann das Dokument gleichen Titels am selben Vertrag, statt ein
+zweites anzulegen. `neu=True` verwirft das Manifest und rechnet alles neu.
+
+Der Lauf gilt für die Verwaltung des Kontexts; über alle Verwaltungen geht
+der Befehl `nebenkostenlauf` mit `je_organisation`.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+#: Abrechnungen je Stapel: so viele werden gezeichnet, abgelegt und ins
+#: Manifest geschrieben, bevor der nächste beginnt.
+STAPEL = 100
+
+
+def manifest_pfad(organisation, jahr):
+    """Wo das Manifest eines Laufs liegt — unter dem Präfix der Verwaltung,
+    wie jede ihrer Dateien (siehe `core.utils.get_smart_upload_path`)."""
+    return f'organisation/{organisation.pk}/nebenkostenlauf/{jahr}/manifest.json'
+
+
+def manifest_lesen(organisation, jahr):
+    pfad = manifest_pfad(organisation, jahr)
+    if not default_storage.exists(pfad):
+        return None
+    with default_storage.open(pfad, 'rb') as datei:
+        return json.loads(datei.read().decode('utf-8'))
+
+
+def _manifest_schreiben(organisation, jahr, manifest):
+    pfad = manifest_pfad(organisation, jahr)
+    manifest['stand'] = timezone.now().isoformat(timespec='seconds')
+    inhalt = json.dumps(manifest, ensure_ascii=False, indent=1, default=str).encode('utf-8')
+    # Ersetzen statt daneben legen: `save` hängte sonst ein Suffix an.
+    if default_storage.exists(pfad):
+        default_storage.delete(pfad)
+    default_storage.save(pfad, ContentFile(inhalt))
+
+
+def _schluessel(periode_id, vertrag_id):
+    return f'{periode_id}:{vertrag_id}'
+
+
+def abrechnungen_sammeln(jahr, erledigt=()):
+    """Schritt 1: alle Perioden, die im Jahr enden, rechnen.
+
+    Gibt `(seiten, periodenfehler)` zurück: `seiten` ist eine Liste von
+    (Periode, Vertrag, Kontext) ohne die `erledigt`-Schlüssel,
+    `periodenfehler` ein dict Periode-ID → Meldung der Engine.
+    """
+    from finance.models import AbrechnungsPeriode
+    from core.services.nk_abrechnung import mieter_kontexte
+    from core.utils.billing import hole_abrechnung
+
+    seiten, periodenfehler = [], {}
+    perioden = (AbrechnungsPeriode.objects.filter(ende_datum__year=jahr)
+                .select_related('liegenschaft', 'organisation').order_by('ende_datum', 'pk'))
+    for periode in perioden:
+        result = hole_abrechnung(periode)
+        if result.get('error'):
+            periodenfehler[str(periode.pk)] = result['error']
+            continue
+        for vertrag, kontext in mieter_kontexte(periode, result):
+            if _schluessel(periode.pk, vertrag.pk) not in erledigt:
+                seiten.append((periode, vertrag, kontext))
+    return seiten, periodenfehler
+
+
+def nebenkostenlauf(jahr, *, prozesse=1, neu=False, fortschritt=None):
+    """Alle NK-Abrechnungen eines Jahres rechnen, zeichnen, ablegen.
+
+    `fortschritt(erledigt, gesamt)` wird nach jedem Stapel aufgerufen; gibt
+    er False zurück, hält der Lauf dort an — das Manifest ist dann auf dem
+    Stand des letzten Stapels, und der nächste Lauf macht weiter.
+
+    Gibt ein dict zurück: `abgelegt` (in diesem Lauf), `uebersprungen`
+    (schon im Manifest), `fehler` (Perioden, die die Engine nicht rechnen
+    konnte), `sekunden`, `je_sekunde` (abgelegte Abrechnungen je Sekunde
+    über den ganzen Lauf, Rechnen eingeschlossen) und `manifest` (Pfad).
+    """
+    from core.services.ablage import ablegen_stapel
+    from core.organisation_kette import organisation_bestimmen
+
+    organisation = organisation_bestimmen()
+    beginn = time.monotonic()
+    manifest = None if neu else manifest_lesen(organisation, jahr)
+    if not manifest:
+        manifest = {'jahr': jahr, 'organisation': organisation.pk,
+                    'begonnen': timezone.now().isoformat(timespec='seconds'),
+                    'abrechnungen': {}, 'fehler': {}}
+    erledigt = manifest['abrechnungen']
+
+    seiten, periodenfehler = abrechnungen_sammeln(jahr, erledigt)
+    manifest['fehler'] = periodenfehler
+    uebersprungen, gesamt, abgelegt = len(erledigt), len(seiten), 0
+    if not gesamt:
+        _manifest_schreiben(organisation, jahr, manifest)
+    with _zeichner(prozesse if gesamt > 1 else 1) as zeichnen:
+        for start in range(0, gesamt, STAPEL):
+            stapel = seiten[start:start + STAPEL]
+            pdfs = zeichnen([k for _, _, k in stapel])
+            dokumente = ablegen_stapel([
+                (pdf, f"Nebenkostenabrechnung {periode.bezeichnung}", vertrag,
+                 f"NK_{periode.bezeichnung}_{vertrag.pk}")
+                for pdf, (periode, vertrag, _) in zip(pdfs, stapel)])
+            for dok, (periode, vertrag, kontext) in zip(dokumente, stapel):
+                erledigt[_schluessel(periode.pk, vertrag.pk)] = {
+                    'periode': periode.pk, 'liegenschaft': periode.liegenschaft_id,
+                    'vertrag': vertrag.pk, 'mieter': kontext['adresse'][0],
+                    'saldo': str(kontext['saldo']), 'dokument': dok.pk, 'datei': dok.datei.name,
+                }
+            abgelegt += len(stapel)
+            _manifest_schreiben(organisation, jahr, manifest)
+            if fortschritt is not None and fortschritt(abgelegt, gesamt) is False:
+                break
+
+    sekunden = time.monotonic() - beginn
+    ergebnis = {
+        'abgelegt': abgelegt, 'uebersprungen': uebersprungen, 'fehler': len(periodenfehler),
+        'sekunden': round(sekunden, 1),
+        'je_sekunde': round(abgelegt / sekunden, 1) if sekunden and abgelegt else 0,
+        'manifest': manifest_pfad(organisation, jahr),
+    }
+    logger.info('Nebenkostenlauf %s %s: %s abgelegt in %.1f s (%s/s), %s übersprungen',
+                organisation, jahr, abgelegt, sekunden, ergebnis['je_sekunde'], uebersprungen)
+    return ergebnis
+
+
+@contextmanager
+def _zeichner(prozesse):
+    """Zeichnet Kontexte zu PDFs — im Prozess oder über einen Pool.
+
+    Der Pool entsteht einmal je Lauf, nicht je Stapel: Das Starten der
+    Prozesse kostet mehr als ein Stapel kleiner PDFs. Die Kinder brauchen
+    keine Datenbank (die Kontexte tragen alle Zahlen), die geerbte Verbindung
+    bleibt darin unbenutzt.
+
+    Ein Daemon-Prozess darf keine Kinder haben; läuft der Lauf in einem (etwa
+    im Worker eines Prozess-Pools), zeichnet er im Prozess.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from core.services.nk_abrechnung import generate_nk_pdf_einzeln
+
+    if prozesse <= 1 or multiprocessing.current_process().daemon:
+        yield lambda kontexte: [generate_nk_pdf_einzeln(k) for k in kontexte]
+        return
+    with ProcessPoolExecutor(max_workers=prozesse,
+                             mp_context=multiprocessing.get_context('fork')) as pool:
+        yield lambda kontexte: list(pool.map(
+            generate_nk_pdf_einzeln, kontexte,
+            chunksize=max(1, len(kontexte) // (prozesse * 4))))
@@ -136,6 +136,50 @@ def _draw_page(c, k):
                      "Ein allfälliges Guthaben wird Ihnen gutgeschrieben. Beanstandungen sind innert 30 Tagen schriftlich mitzuteilen.")
 
 
+def mieter_kontexte(periode, result):
+    """Die Seiten einer Periode: Liste von (Vertrag, Kontext für `_draw_page`).
+
+    `result` ist die Engine-Ausgabe (`hole_abrechnung`). Leerstände und
+    Zeilen ohne Vertrag fallen weg. Die Verträge kommen in EINER Abfrage —
+    der Nebenkostenlauf ruft das für hunderte Perioden auf.
+    """
+    from rentals.models import Mietvertrag
+
+    vw = periode.organisation      # die Verwaltung DIESER Abrechnungsperiode
+    lg = periode.liegenschaft
+    periode_str = f"{periode.bezeichnung} ({periode.start_datum:%d.%m.%Y}–{periode.ende_datum:%d.%m.%Y})"
+    positionen = result.get('belege_details', [])
+    total_kosten = result.get('total_kosten', Decimal('0.00'))
+    zeilen = [a for a in result.get('abrechnungen', [])
+              if a.get('vertrag_id') and a.get('typ') != 'leerstand']
+    vertraege = Mietvertrag.objects.select_related('mieter', 'mitmieter', 'einheit__liegenschaft') \
+        .in_bulk([a['vertrag_id'] for a in zeilen])
+
+    seiten = []
+    for a in zeilen:
+        v = vertraege.get(a['vertrag_id'])
+        if not v:
+            continue
+        m = v.mieter
+        namen = m.display_name
+        zweit = (v.mitmieter.display_name if v.mitmieter_id else (v.mitmieter_name or '')).strip()
+        if zweit:
+            namen += f" & {zweit}"
+        adresse = [namen]
+        if m.strasse:
+            adresse.append(m.strasse)
+        if m.plz or m.ort:
+            adresse.append(f"{m.plz or ''} {m.ort or ''}".strip())
+        seiten.append((v, {
+            'verwaltung': vw, 'periode': periode_str,
+            'objekt': f"{lg.strasse}, {lg.plz} {lg.ort} · {v.einheit.bezeichnung}" if lg and v.einheit_id else (v.einheit.bezeichnung if v.einheit_id else ''),
+            'adresse': adresse, 'positionen': positionen, 'total_kosten': total_kosten,
+            'kosten_anteil': a.get('kosten_anteil', 0), 'akonto': a.get('akonto', 0),
+            'saldo': a.get('saldo', 0), 'nachzahlung': a.get('nachzahlung', False),
+        }))
+    return seiten
+
+
 def generate_nk_pdf_einzeln(kontext):
     """Ein Mieter → einseitige Abrechnung (Bytes)."""
     buf = io.BytesIO()
@@ -0,0 +1,280 @@
+"""Postausgang: ausgehende E-Mails einreihen und gesammelt zustellen.
+
+Bisher öffnete jede Nachricht ihre eigene SMTP-Verbindung (Anmeldung, TLS,
+dann genau ein Mail) und wurde dort gesendet, wo sie entstand — im Request,
+in der Schleife des Mahnlaufs, im Report-Befehl. Ein Lauf mit 300
+Erinnerungen wartete 300 Verbindungsaufbauten ab, und drosselte der Server
+unterwegs, scheiterte der Rest ohne Spur ausser einem `print`.
+
+Jetzt:
+
+  · `einreihen()` schreibt die Nachricht in `core.Postausgang` — samt
+    Anhängen, mit optionalem `schluessel`: Wer zweimal mit demselben
+    Schlüssel einreiht, bekommt die erste Nachricht zurück statt einer
+    zweiten. `sofort=True` stellt gleich danach im selben Aufruf zu (die
+    Einzelmails aus der Oberfläche, die der Benutzer erwartet, solange er
+    noch auf die Seite schaut); misslingt das, bleibt die Nachricht stehen
+    und wird wiederholt.
+  · `abarbeiten()` stellt fällige Nachrichten zu: über EINE Verbindung je
+    Stapel, höchstens `JE_MINUTE` je SMTP-Server (`POSTAUSGANG_JE_MINUTE`).
+    Ein vorübergehender Fehler (4xx, Verbindung abgebrochen) verschiebt die
+    Nachricht um `WARTEN` × 4^(Versuch-1) und beendet den Stapel — wer
+    gerade drosselt, soll nicht weiter beschickt werden. Ein endgültiger
+    (5xx, Empfänger abgelehnt) oder der `MAX_VERSUCHE`-te gibt auf.
+  · `anstossen()` arbeitet nach dem Commit in einem eigenen Thread ab — für
+    Läufe, die viele Nachrichten einreihen und nicht auf die Zustellung
+    warten sollen (Mahnlauf).
+  · `python manage.py postausgang_senden` ist das Netz: Er holt nach, was
+    verschoben wurde oder einem abgebrochenen Prozess liegen blieb. Der
+    tägliche Lauf ruft ihn mit auf.
+  · `aufraeumen()` löscht zugestellte und aufgegebene Nachrichten nach
+    `POSTAUSGANG_AUFBEWAHREN_TAGE` — mit ihnen die Anhänge, die sonst als
+    Blob für immer in der Datenbank lägen. Der tägliche Lauf ruft es auf.
+
+Damit zwei Prozesse dieselbe Nachricht nicht doppelt senden, wird jede vor
+dem Senden beansprucht: `faellig_ab` wird nur dann um `SPERRE` vorgestellt,
+wenn es noch den gelesenen Wert hat. Wer dabei verliert, lässt sie aus.
+Stirbt ein Prozess mitten im Senden, ist die Nachricht nach `SPERRE` wieder
+fällig — im schlimmsten Fall geht sie dann zweimal hinaus, nie keinmal.
+"""
+import logging
+import smtplib
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+#: Nachrichten je Verbindung und Durchgang.
+STAPEL = 50
+
+#: Erster Abstand nach einem Fehlschlag; jeder weitere vervierfacht ihn
+#: (1, 4, 16, 64 Minuten, dann gut 4 Stunden).
+WARTEN = timedelta(minutes=1)
+MAX_VERSUCHE = 6
+
+#: So lange gehört eine Nachricht dem Prozess, der sie gerade sendet.
+SPERRE = timedelta(minutes=10)
+
+_LETZTER_VERSAND = {}         # SMTP-Server → time.monotonic() des letzten Mails
+_DROSSEL_SPERRE = threading.Lock()
+
+
+def einreihen(an, betreff, html, *, anhaenge=(), cc=(), schluessel=None, sofort=False):
+    """Eine Nachricht in den Postausgang stellen. Gibt den `Postausgang`
+    zurück, oder None ohne Empfänger.
+
+    `anhaenge` ist eine Liste von (Dateiname, Bytes[, MIME-Typ]); ohne Typ
+    gilt PDF für `.pdf`, sonst `application/octet-stream`. Liegt unter
+    `schluessel` schon eine Nachricht, kommt diese zurück; `.neu` sagt, ob
+    dieser Aufruf sie eingereiht hat.
+    """
+    from core.models import Postausgang, PostausgangAnhang
+
+    if not an:
+        return None
+    if schluessel:
+        vorhanden = Postausgang.objects.filter(schluessel=schluessel).first()
+        if vorhanden is not None:
+            vorhanden.neu = False
+            return vorhanden
+    try:
+        with transaction.atomic():
+            nachricht = Postausgang.objects.create(
+                schluessel=schluessel or None, an=an, cc=[a for a in cc if a],
+                betreff=betreff[:300], html=html)
+            PostausgangAnhang.objects.bulk_create([
+                PostausgangAnhang(organisation_id=nachricht.organisation_id, nachricht=nachricht,
+                                  name=a[0], inhalt=a[1],
+                                  mime=a[2] if len(a) > 2 else _mime(a[0]))
+                for a in anhaenge if a[1]])
+    except IntegrityError:
+        # Ein paralleler Aufruf war mit demselben Schlüssel schneller.
+        vorhanden = Postausgang.objects.get(schluessel=schluessel)
+        vorhanden.neu = False
+        return vorhanden
+    nachricht.neu = True
+    if sofort:
+        abarbeiten(ids=[nachricht.pk])
+        nachricht.refresh_from_db()
+    return nachricht
+
+
+def _mime(name):
+    return 'application/pdf' if name.lower().endswith('.pdf') else 'application/octet-stream'
+
+
+def _host():
+    """Wofür gedrosselt wird: der SMTP-Server, oder das Backend, wenn keiner."""
+    if settings.EMAIL_BACKEND.endswith('smtp.EmailBackend'):
+        return f"{settings.EMAIL_HOST}:{settings.EMAIL_PORT}"
+    return settings.EMAIL_BACKEND
+
+
+def _drosseln(host):
+    """Höchstens `POSTAUSGANG_JE_MINUTE` Nachrichten je Minute an `host` —
+    im Prozess; mehrere Worker teilen sich die Grenze nicht."""
+    je_minute = getattr(settings, 'POSTAUSGANG_JE_MINUTE', 0)
+    if not je_minute:
+        return
+    with _DROSSEL_SPERRE:
+        abstand = 60 / je_minute - (time.monotonic() - _LETZTER_VERSAND.get(host, 0))
+        if abstand > 0:
+            time.sleep(abstand)
+        _LETZTER_VERSAND[host] = time.monotonic()
+
+
+def _mail(nachricht, verbindung):
+    import os
+    from django.core.mail import EmailMessage
+
+    mail = EmailMessage(subject=nachricht.betreff, body=nachricht.html,
+                        from_email=settings.DEFAULT_FROM_EMAIL, to=[nachricht.an],
+                        cc=nachricht.cc or [],
+                        reply_to=[os.environ.get('EMAIL_REPLY_USER', 'reply@immoswiss.app')],
+                        connection=verbindung)
+    mail.content_subtype = "html"
+    for anhang in nachricht.anhaenge.all():
+        mail.attach(anhang.name, bytes(anhang.inhalt), anhang.mime)
+    return mail
+
+
+def _endgueltig(fehler):
+    """Lohnt sich ein weiterer Versuch nicht? 5xx und abgelehnte Empfänger."""
+    if isinstance(fehler, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(fehler, smtplib.SMTPResponseException) and fehler.smtp_code >= 500
+
+
+def _voruebergehend(fehler):
+    """Drosselt oder fehlt der Server? Dann den Stapel beenden."""
+    if isinstance(fehler, smtplib.SMTPResponseException):
+        return 400 <= fehler.smtp_code < 500
+    return isinstance(fehler, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+def abarbeiten(ids=None, organisation=None, stapel=STAPEL):
+    """Fällige Nachrichten über eine Verbindung zustellen.
+
+    Gibt einen Counter mit `gesendet`, `verschoben` und `aufgegeben` zurück.
+    `ids` beschränkt auf bestimmte Nachrichten (Sofortversand),
+    `organisation` auf eine Verwaltung (Nachlauf mit `--organisation`).
+    """
+    from django.core.mail import get_connection
+    from core.models import Postausgang
+
+    ergebnis = Counter()
+    jetzt = timezone.now()
+    # `alle_organisationen`: Der Postausgang stellt für jede Verwaltung zu und
+    # läuft dafür ohne Kontext. Gelesen wird nur, was ohnehin hinausgeht —
+    # jede Nachricht trägt Empfänger und Inhalt fertig in sich.
+    faellig = Postausgang.alle_organisationen.filter(status=Postausgang.WARTEND,
+                                                     faellig_ab__lte=jetzt)
+    if ids is not None:
+        faellig = faellig.filter(pk__in=ids)
+    if organisation is not None:
+        faellig = faellig.filter(organisation=organisation)
+    kandidaten = list(faellig.order_by('faellig_ab', 'pk').values_list('pk', 'faellig_ab')[:stapel])
+    if not kandidaten:
+        return ergebnis
+
+    host = _host()
+    verbindung = get_connection(fail_silently=False)
+    try:
+        for pk, faellig_ab in kandidaten:
+            if not Postausgang.alle_organisationen.filter(
+                    pk=pk, status=Postausgang.WARTEND, faellig_ab=faellig_ab
+            ).update(faellig_ab=jetzt + SPERRE):
+                continue
+            nachricht = Postausgang.alle_organisationen.prefetch_related('anhaenge').get(pk=pk)
+            _drosseln(host)
+            try:
+                verbindung.send_messages([_mail(nachricht, verbindung)])
+            except Exception as fehler:                      # noqa: BLE001
+                versuche = nachricht.versuche + 1
+                aufgeben = _endgueltig(fehler) or versuche >= MAX_VERSUCHE
+                Postausgang.alle_organisationen.filter(pk=pk).update(
+                    versuche=versuche, letzter_fehler=f"{type(fehler).__name__}: {fehler}"[:2000],
+                    status=Postausgang.AUFGEGEBEN if aufgeben else Postausgang.WARTEND,
+                    faellig_ab=timezone.now() + WARTEN * 4 ** (versuche - 1))
+                ergebnis['aufgegeben' if aufgeben else 'verschoben'] += 1
+                logger.warning('Postausgang %s an %s: %s (Versuch %s%s)', pk, nachricht.an,
+                               fehler, versuche, ', aufgegeben' if aufgeben else '')
+                if _voruebergehend(fehler):
+                    break
+                continue
+            Postausgang.alle_organisationen.filter(pk=pk).update(
+                status=Postausgang.GESENDET, versuche=nachricht.versuche + 1,
+                gesendet_am=timezone.now(), letzter_fehler='')
+            ergebnis['gesendet'] += 1
+    finally:
+        try:
+            verbindung.close()
+        except Exception:                                    # noqa: BLE001
+            logger.debug("Verbindung liess sich nicht sauber schliessen", exc_info=True)
+    if ergebnis['gesendet'] and ids is None:
+        logger.info('Postausgang: %s gesendet, %s verschoben, %s aufgegeben',
+                    ergebnis['gesendet'], ergebnis['verschoben'], ergebnis['aufgegeben'])
+    return ergebnis
+
+
+def alles_abarbeiten(organisation=None):
+    """Stapel um Stapel, bis nichts Fälliges mehr zugestellt werden kann."""
+    gesamt = Counter()
+    while True:
+        ergebnis = abarbeiten(organisation=organisation)
+        gesamt.update(ergebnis)
+        # Ein Stapel ohne Versand heisst: leer oder der Server drosselt.
+        if not ergebnis['gesendet']:
+            return gesamt
+
+
+def aufraeumen(organisation=None, tage=None):
+    """Zugestellte und aufgegebene Nachrichten löschen, die älter sind als
+    `tage` (Standard: `POSTAUSGANG_AUFBEWAHREN_TAGE`). Gibt die Zahl zurück.
+
+    Belegt ist der Versand danach weiterhin im Mieter-Journal
+    (`journal_email`); der Postausgang ist eine Warteschlange, kein Archiv.
+    Gelöscht wird in Stapeln und ohne die Blobs zu lesen.
+    """
+    from core.models import Postausgang, PostausgangAnhang
+
+    tage = getattr(settings, 'POSTAUSGANG_AUFBEWAHREN_TAGE', 90) if tage is None else tage
+    # `alle_organisationen`: wie `abarbeiten` — der Lauf räumt für jede
+    # Verwaltung auf, und gelöscht wird nur, was ohnehin erledigt ist.
+    alt = Postausgang.alle_organisationen.filter(
+        status__in=(Postausgang.GESENDET, Postausgang.AUFGEGEBEN),
+        erstellt_am__lt=timezone.now() - timedelta(days=tage))
+    if organisation is not None:
+        alt = alt.filter(organisation=organisation)
+    geloescht = 0
+    while ids := list(alt.values_list('pk', flat=True)[:STAPEL * 10]):
+        with transaction.atomic():
+            PostausgangAnhang.alle_organisationen.filter(nachricht__in=ids).defer('inhalt').delete()
+            geloescht += Postausgang.alle_organisationen.filter(pk__in=ids).delete()[1].get(
+                Postausgang._meta.label, 0)
+    return geloescht
+
+
+def anstossen():
+    """Nach dem Commit im Hintergrund abarbeiten — der Aufrufer wartet nicht.
+
+    Der Thread ist bewusst kein Daemon: Ein Befehl, der einreiht und endet,
+    wartet so auf die Zustellung, statt sie beim Beenden abzuschneiden.
+    """
+    def _im_hintergrund():
+        from django.db import connections
+        try:
+            alles_abarbeiten()
+        except Exception:                                    # noqa: BLE001
+            logger.exception('Postausgang: Hintergrundversand abgebrochen')
+        finally:
+            connections.close_all()
+
+    transaction.on_commit(lambda: threading.Thread(target=_im_hintergrund,
+                                                   name='postausgang').start())
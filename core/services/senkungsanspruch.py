@@ -0,0 +1,92 @@
+"""Senkungsanspruch (Art. 270a OR) für den ganzen Bestand — als Merkmal am Vertrag.
+
+WARUM ES DIESE DATEI GIBT
+
+Ob ein Mieter eine Herabsetzung verlangen kann, hängt an zwei Zahlen: dem
+Referenzzinssatz seiner Verwaltung und der Basis, auf der sein Mietzins
+heute beruht — der jüngsten wirksamen Anpassung, sonst der Vertragsbasis
+(`Mietvertrag.effektive_basis`). `Mietvertrag.mietzinspotenzial` vergleicht
+die beiden je Vertrag, in Python. Die Lage der Startseite prüfte deshalb nur
+eine Stichprobe von 400 Verträgen; wer mehr hatte, bekam eine zu kleine Zahl
+und keinen Hinweis darauf.
+
+Hier steht derselbe Vergleich als EINE Abfrage: Die wirksame Basis ist eine
+Unterabfrage auf die jüngste Anpassung, der Zinsstand ein Parameter. Das
+Ergebnis liegt als `Mietvertrag.senkungsanspruch` am Vertrag — die Lage, das
+Mietzinsmodul und das Admin zählen und filtern darauf, gleich wie gross der
+Bestand ist.
+
+WANN DAS MERKMAL NACHGEFÜHRT WIRD
+
+  · Ändert sich der Referenzzinssatz einer Verwaltung (Marktdaten, Profil),
+    für ihren ganzen Bestand — Signal auf `crm.Organisation`.
+  · Ändert sich ein Vertrag oder eine seiner Anpassungen, für diesen Vertrag
+    — Signale in `rentals.models`.
+  · Im täglichen Lauf für jede Verwaltung: Eine Anpassung mit künftigem
+    `wirksam_ab` wird ohne Speichern wirksam, und `QuerySet.update()` oder
+    `bulk_create` lösen kein Signal aus.
+"""
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def wirksamer_zins(stichtag):
+    """Ausdruck für den Referenzzins, auf dem der Mietzins am `stichtag` beruht.
+
+    Dieselbe Regel wie `Mietvertrag.effektive_basis`: die jüngste wirksame
+    Anpassung — trägt sie keinen Zins, die Vertragsbasis.
+    """
+    from rentals.models import MietzinsAnpassung
+
+    # `alle_organisationen`: Die Unterabfrage hängt über `vertrag=OuterRef` am
+    # Vertrag der äusseren Abfrage; die Mandantengrenze steht dort.
+    juengste = (MietzinsAnpassung.alle_organisationen
+                .filter(vertrag=OuterRef('pk'), wirksam_ab__lte=stichtag)
+                .order_by('-wirksam_ab', '-pk')
+                .values('neuer_referenzzinssatz')[:1])
+    return Coalesce(Subquery(juengste), F('basis_referenzzinssatz'))
+
+
+def anspruchsberechtigte(organisation, stichtag=None):
+    """Aktive Verträge der `organisation`, deren wirksame Basis über ihrem
+    aktuellen Referenzzinssatz liegt — gerechnet, nicht aus dem Merkmal."""
+    from rentals.models import Mietvertrag
+
+    stichtag = stichtag or timezone.localdate()
+    # `alle_organisationen`: Die Verwaltung ist ausdrücklich übergeben und
+    # steht im Filter. Aufgerufen wird aus Signalen und dem täglichen Lauf,
+    # oft ohne Kontext — und aus dem Signal einer Verwaltung, während der
+    # Kontext einer anderen gesetzt sein kann.
+    vertraege = Mietvertrag.alle_organisationen.filter(organisation=organisation, status='aktiv')
+    zins = organisation.aktueller_referenzzinssatz
+    if zins is None:
+        return vertraege.none()
+    return (vertraege.annotate(wirksamer_zins=wirksamer_zins(stichtag))
+            .filter(wirksamer_zins__gt=zins))
+
+
+def aktualisieren(organisation, stichtag=None, vertrag_ids=None):
+    """`senkungsanspruch` für den Bestand der `organisation` nachführen.
+
+    `vertrag_ids` beschränkt den Lauf auf diese Verträge. Geschrieben wird
+    nur, was sich ändert — zwei UPDATE-Abfragen, gleich wie viele Verträge.
+    Rückgabe: Anzahl geänderter Verträge.
+    """
+    from core.services.zwischenspeicher import vergessen
+    from rentals.models import Mietvertrag
+
+    # `alle_organisationen`: wie in `anspruchsberechtigte`.
+    bestand = Mietvertrag.alle_organisationen.filter(organisation=organisation)
+    if vertrag_ids is not None:
+        bestand = bestand.filter(pk__in=vertrag_ids)
+    anspruch = anspruchsberechtigte(organisation, stichtag).values('pk')
+
+    geaendert = (bestand.filter(senkungsanspruch=False, pk__in=anspruch)
+                 .update(senkungsanspruch=True))
+    geaendert += (bestand.filter(senkungsanspruch=True).exclude(pk__in=anspruch)
+                  .update(senkungsanspruch=False))
+    if geaendert:
+        # `update()` sendet kein Signal; die Lage hängt an `vertrag:*`.
+        vergessen('vertrag:*', organisation_id=organisation.pk)
+    return geaendert
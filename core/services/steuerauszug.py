@@ -23,50 +23,48 @@ def steuerauszug_daten(eigentuemer, jahr):
     per = {l.id: {'ertrag': Decimal('0'), 'ausgaben': Decimal('0'), 'afa': Decimal('0'),
                   'honorar': Decimal('0')} for l in lgs}
 
-    # 1) Ist-Mieterträge (verbuchte Zahlungseingänge im Jahr)
-    zes = (Zahlungseingang.objects.filter(status='verbucht', datum_eingang__year=jahr)
-           .select_related('vertrag__einheit'))
-    for z in zes:
-        lid = None
-        if z.vertrag_id and z.vertrag and z.vertrag.einheit_id:
-            lid = z.vertrag.einheit.liegenschaft_id
-        if lid not in per:
-            lid = z.liegenschaft_id
-        if lid in per:
-            per[lid]['ertrag'] += z.betrag or Decimal('0')
+    # Jede Summe als gruppierte Abfrage je Liegenschaft: Vorher kamen ALLE
+    # verbuchten Zahlungen der Verwaltung im Jahr in den Speicher, auch die
+    # fremder Eigentümer, und wurden erst in Python zugeordnet.
+    from django.db.models import Q, Sum
+
+    def _summen(qs, gruppe, feld):
+        for zeile in qs.order_by().values(gruppe).annotate(s=Sum('betrag')):
+            if zeile[gruppe] in per:
+                per[zeile[gruppe]][feld] += zeile['s'] or Decimal('0')
+
+    # 1) Ist-Mieterträge (verbuchte Zahlungseingänge im Jahr) — über den
+    # Vertrag, und nur wenn der nicht zu einer eigenen Liegenschaft führt,
+    # über die direkt erfasste Liegenschaft.
+    zes = Zahlungseingang.objects.filter(status='verbucht', datum_eingang__year=jahr)
+    _summen(zes.filter(vertrag__einheit__liegenschaft_id__in=lg_ids),
+            'vertrag__einheit__liegenschaft_id', 'ertrag')
+    _summen(zes.filter(liegenschaft_id__in=lg_ids).exclude(vertrag__einheit__liegenschaft_id__in=lg_ids),
+            'liegenschaft_id', 'ertrag')
 
     # 2) Ausgaben (Kreditorenrechnungen, ohne Stornos)
-    krs = (KreditorenRechnung.objects.filter(liegenschaft_id__in=lg_ids, datum__year=jahr)
-           .exclude(status='storniert'))
-    for k in krs:
-        if k.liegenschaft_id in per:
-            per[k.liegenschaft_id]['ausgaben'] += k.betrag or Decimal('0')
+    _summen(KreditorenRechnung.objects.filter(liegenschaft_id__in=lg_ids, datum__year=jahr)
+            .exclude(status='storniert'), 'liegenschaft_id', 'ausgaben')
 
     # 3) Abschreibungen (AfA) des Jahres
-    afas = (Abschreibung.objects.filter(jahr=jahr, anlage__liegenschaft_id__in=lg_ids)
-            .select_related('anlage'))
-    for a in afas:
-        lid = a.anlage.liegenschaft_id
-        if lid in per:
-            per[lid]['afa'] += a.betrag or Decimal('0')
+    _summen(Abschreibung.objects.filter(jahr=jahr, anlage__liegenschaft_id__in=lg_ids),
+            'anlage__liegenschaft_id', 'afa')
 
     # 4) Verwaltungshonorar (Konto 4500) — wird direkt gebucht (Soll 4500/Haben
     # Bank), nie als Kreditorenrechnung, und fehlte deshalb in den Ausgaben.
     # Netto Soll−Haben je Liegenschaft: Stornos heben sich damit von selbst auf.
     from finance.models import Buchung, Buchungskonto
-    from django.db.models import Q
     k4500 = Buchungskonto.objects.filter(nummer='4500').first()
     if k4500:
         hqs = (Buchung.objects
                .filter(liegenschaft_id__in=lg_ids, datum__year=jahr)
                .filter(Q(soll_konto=k4500) | Q(haben_konto=k4500)))
-        for b in hqs:
-            if b.liegenschaft_id not in per:
-                continue
-            if b.soll_konto_id == k4500.id:
-                per[b.liegenschaft_id]['honorar'] += b.betrag or Decimal('0')
-            if b.haben_konto_id == k4500.id:
-                per[b.liegenschaft_id]['honorar'] -= b.betrag or Decimal('0')
+        for zeile in (hqs.order_by().values('liegenschaft_id')
+                      .annotate(soll=Sum('betrag', filter=Q(soll_konto=k4500)),
+                                haben=Sum('betrag', filter=Q(haben_konto=k4500)))):
+            if zeile['liegenschaft_id'] in per:
+                per[zeile['liegenschaft_id']]['honorar'] += ((zeile['soll'] or Decimal('0'))
+                                                             - (zeile['haben'] or Decimal('0')))
 
     zeilen = []
     tot = {'ertrag': Decimal('0'), 'ausgaben': Decimal('0'), 'afa': Decimal('0'),
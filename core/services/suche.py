@@ -0,0 +1,402 @@
+"""Suchindex: ein Suchdokument je Person, Vertrag, Objekt und Debitorenrechnung.
+
+Gesucht wurde bisher mit einer Kette von `icontains` je Maske — Vorname,
+Nachname, E-Mail, Firma, dazu gejointe Mieter- und Liegenschaftsfelder. Das
+ist auf Postgres wie auf SQLite ein Durchlauf über die ganze Tabelle samt
+Joins, findet «Müller» nicht unter «Mueller» oder «Muller», und jede Maske
+suchte über etwas andere Felder. Die Telefonsuche der globalen Suche lud
+dafür bis zu 500 Personen in Python.
+
+Jetzt steht je Objekt EIN Text in `core.Suchdokument` (`art`, `objekt_id`):
+alles, worüber man das Objekt sucht, normalisiert (Kleinbuchstaben, ohne
+Akzente, Telefonnummern zusätzlich als reine Ziffern), die Teile durch « | »
+getrennt. Den Text indexiert die Datenbank (Migration 0015):
+
+  · SQLite — eine FTS5-Tabelle `core_suchdokument_fts` mit Trigramm-
+    Tokenizer, per Trigger mit `core_suchdokument` gleich gehalten;
+  · Postgres — ein GIN-Index mit `gin_trgm_ops` (`pg_trgm`).
+
+Zwei Wege hinein:
+
+  · `filtern(qs, art, q)` für die Listen — Teilstring wie bisher, nur über
+    den Index: `Mieter.objects` bleibt die Abfrage, der Index liefert die IDs.
+  · `suchen(q)` für die globale Suche — nach Ähnlichkeit sortiert und
+    tippfehlertolerant: Kandidaten über gemeinsame Trigramme (FTS5 nach bm25,
+    Postgres nach `word_similarity`), bewertet als Anteil der Trigramme der
+    Anfrage, die im Dokument vorkommen. «Mustr» findet «Muster».
+
+Gepflegt wird der Index über Signale (am Ende von `finance.models`): Wer
+gespeichert wird, bekommt sein Dokument neu — und nur wenn sich sein Text
+dabei geändert hat, auch die Dokumente, in denen sein Name steht (ein
+umbenannter Mieter ändert seine Verträge und Rechnungen). Was an den Signalen
+vorbeigeht — `QuerySet.update()`, `bulk_create()` ausser der Sollstellung,
+Roh-SQL — holt `python manage.py suchindex_aufbauen` nach.
+
+Liegenschaften haben kein Dokument: Strasse, Ort, PLZ und EGID sind
+Spalten einer kleinen Tabelle, die Suche darüber braucht keinen Index.
+"""
+import unicodedata
+
+from django.db import connection
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+ARTEN = ('mieter', 'vertrag', 'einheit', 'rechnung')
+
+#: So viele Kandidaten holt `suchen()` aus dem Index, bevor es bewertet.
+KANDIDATEN = 200
+
+#: Ab diesem Anteil gemeinsamer Trigramme gilt ein Dokument als Treffer.
+#: 0.4 lässt einen vertauschten Buchstaben in einem fünfstelligen Namen zu
+#: («Meier» ↔ «Maier»), aber kein blosses gemeinsames «er».
+AEHNLICH_AB = 0.4
+
+#: Dokumente je Schreibvorgang beim Neuaufbau.
+STAPEL = 500
+
+_FTS = 'core_suchdokument_fts'
+_FTS_VORHANDEN = {}           # Datenbankname → bool
+
+_MODELLE = {
+    'mieter': 'crm.Mieter',
+    'vertrag': 'rentals.Mietvertrag',
+    'einheit': 'portfolio.Einheit',
+    'rechnung': 'finance.DebitorenRechnung',
+}
+
+
+def normalisiere(text):
+    """Kleinbuchstaben, ohne Akzente, Leerraum zusammengezogen."""
+    zerlegt = unicodedata.normalize('NFKD', str(text or ''))
+    ohne = ''.join(ch for ch in zerlegt if not unicodedata.combining(ch))
+    return ' '.join(ohne.lower().split())
+
+
+def suchformen(q):
+    """Die Formen, unter denen `q` gesucht wird.
+
+    Die normalisierte Anfrage — und wenn sie wie eine Telefonnummer aussieht
+    (nur Ziffern und Trennzeichen, mindestens fünf Ziffern), zusätzlich die
+    reinen Ziffern: «079 123 45 67» findet «+41791234567» und umgekehrt.
+    """
+    nq = normalisiere(q)
+    if not nq:
+        return []
+    formen = [nq]
+    ziffern = ''.join(ch for ch in nq if ch.isdigit())
+    if len(ziffern) >= 5 and all(ch.isdigit() or ch in ' +/.-()' for ch in nq) and ziffern != nq:
+        formen.append(ziffern)
+    return formen
+
+
+# ----------------------------------------------------------------------
+# Dokumente
+# ----------------------------------------------------------------------
+# Jede Quelle liefert (organisation_id, pk, titel, [textteile]).
+#
+# `alle_organisationen` in allen vier: Aufgerufen wird aus Signalen, also
+# oft ohne Kontext, und immer mit einer Bedingung über Schlüssel eines eben
+# gespeicherten Objekts oder seiner Nachbarn — die Organisation kommt mit dem
+# Datensatz und wird ins Dokument übernommen, nicht geraten.
+
+def _telefone(*nummern):
+    roh = [n for n in nummern if n]
+    return roh + [''.join(ch for ch in n if ch.isdigit()) for n in roh]
+
+
+def _person(m):
+    return [f'{m.vorname} {m.nachname}', m.firmen_name]
+
+
+def _mieter(bedingung):
+    from crm.models import Mieter
+
+    for m in Mieter.alle_organisationen.filter(bedingung).only(
+            'organisation', 'typ', 'vorname', 'nachname', 'firmen_name', 'email', 'ort',
+            'mobile', 'telefon_privat', 'telefon_geschaeft'):
+        yield m.organisation_id, m.pk, m.display_name, [
+            *_person(m), m.email, m.ort,
+            *_telefone(m.mobile, m.telefon_privat, m.telefon_geschaeft)]
+
+
+def _vertrag(bedingung):
+    from rentals.models import Mietvertrag
+
+    for v in (Mietvertrag.alle_organisationen.filter(bedingung)
+              .select_related('mieter', 'mitmieter', 'einheit__liegenschaft')
+              .prefetch_related('weitere_mieter')):
+        lg = v.einheit.liegenschaft
+        parteien = [v.mieter, v.mitmieter, *v.weitere_mieter.all()]
+        yield v.organisation_id, v.pk, f'{v.mieter.display_name} · {v.einheit.bezeichnung}', [
+            *(teil for p in parteien if p is not None for teil in _person(p)),
+            v.mitmieter_name, v.einheit.bezeichnung, lg.strasse, lg.ort]
+
+
+def _einheit(bedingung):
+    from portfolio.models import Einheit
+
+    for e in Einheit.alle_organisationen.filter(bedingung).select_related('liegenschaft'):
+        lg = e.liegenschaft
+        yield e.organisation_id, e.pk, f'{lg.strasse} · {e.bezeichnung}', [
+            e.bezeichnung, e.etage, lg.strasse, lg.ort]
+
+
+def _rechnung(bedingung):
+    from finance.models import DebitorenRechnung
+
+    for r in (DebitorenRechnung.alle_organisationen.filter(bedingung)
+              .select_related('vertrag__mieter')):
+        mieter = r.vertrag.mieter if r.vertrag_id else None
+        yield r.organisation_id, r.pk, r.titel, [r.titel, *(_person(mieter) if mieter else [])]
+
+
+_QUELLEN = {'mieter': _mieter, 'vertrag': _vertrag, 'einheit': _einheit, 'rechnung': _rechnung}
+
+
+def aktualisieren(art, *bedingungen, **filter_):
+    """Die Dokumente aller Objekte von `art`, die die Bedingung erfüllen, neu
+    schreiben. Gibt die IDs zurück, deren Text sich geändert hat.
+
+    Geschrieben wird nur, was sich geändert hat — ein Mieter, dessen Telefon-
+    nummer gleich blieb, kostet zwei Lesezugriffe und keinen Schreibzugriff.
+    """
+    from core.models import Suchdokument
+
+    neu = {}
+    for organisation_id, pk, titel, teile in _QUELLEN[art](Q(*bedingungen, **filter_)):
+        text = ' | '.join(t for t in (normalisiere(teil) for teil in teile) if t)
+        neu[pk] = (organisation_id, (titel or '')[:200], text)
+    if not neu:
+        return set()
+    # `alle_organisationen`: dieselben Objekte wie oben, über ihre Schlüssel.
+    alt = {objekt_id: (titel, text) for objekt_id, titel, text in
+           Suchdokument.alle_organisationen.filter(art=art, objekt_id__in=list(neu))
+           .values_list('objekt_id', 'titel', 'text')}
+    geaendert = [Suchdokument(organisation_id=organisation_id, art=art, objekt_id=pk,
+                              titel=titel, text=text)
+                 for pk, (organisation_id, titel, text) in neu.items()
+                 if alt.get(pk) != (titel, text)]
+    if geaendert:
+        Suchdokument.alle_organisationen.bulk_create(
+            geaendert, batch_size=STAPEL, update_conflicts=True,
+            unique_fields=['art', 'objekt_id'], update_fields=['organisation', 'titel', 'text'])
+    return {d.objekt_id for d in geaendert}
+
+
+def entfernen(art, ids):
+    from core.models import Suchdokument
+
+    # `alle_organisationen`: gelöschte Objekte, über ihre Schlüssel.
+    Suchdokument.alle_organisationen.filter(art=art, objekt_id__in=list(ids)).delete()
+
+
+def neu_aufbauen():
+    """Alle Dokumente der Verwaltung im Kontext neu schreiben und verwaiste
+    entfernen. Gibt {art: geänderte Dokumente} zurück."""
+    from django.apps import apps
+    from core.models import Suchdokument
+
+    ergebnis = {}
+    for art in ARTEN:
+        modell = apps.get_model(_MODELLE[art])
+        ids = list(modell.objects.order_by('pk').values_list('pk', flat=True))
+        geaendert = 0
+        for i in range(0, len(ids), STAPEL):
+            geaendert += len(aktualisieren(art, pk__in=ids[i:i + STAPEL]))
+        verwaist, _ = (Suchdokument.objects.filter(art=art)
+                       .exclude(objekt_id__in=modell.objects.values('pk')).delete())
+        ergebnis[art] = geaendert + verwaist
+    return ergebnis
+
+
+# ----------------------------------------------------------------------
+# Signale
+# ----------------------------------------------------------------------
+#: Modell → (Art, Felder, die im Dokument stehen). Ein `save(update_fields=…)`
+#: ohne eines davon lässt den Index in Ruhe.
+_QUELLFELDER = {
+    'crm.Mieter': ('mieter', {'typ', 'vorname', 'nachname', 'firmen_name', 'email', 'ort',
+                              'mobile', 'telefon_privat', 'telefon_geschaeft'}),
+    'rentals.Mietvertrag': ('vertrag', {'mieter', 'mitmieter', 'mitmieter_name', 'einheit'}),
+    'portfolio.Einheit': ('einheit', {'bezeichnung', 'etage', 'liegenschaft'}),
+    'portfolio.Liegenschaft': (None, {'strasse', 'ort'}),
+    'finance.DebitorenRechnung': ('rechnung', {'titel', 'vertrag'}),
+}
+
+
+def gespeichert(instance, created=False, update_fields=None):
+    """`post_save`: das eigene Dokument und, wenn sich dessen Text geändert
+    hat, die Dokumente, in denen das Objekt vorkommt."""
+    label = instance._meta.label
+    art, felder = _QUELLFELDER[label]
+    if update_fields and not felder & {f.removesuffix('_id') for f in update_fields}:
+        return
+    pk = instance.pk
+    if label == 'portfolio.Liegenschaft':
+        if not created and aktualisieren('einheit', liegenschaft=pk):
+            aktualisieren('vertrag', einheit__liegenschaft=pk)
+        return
+    if not aktualisieren(art, pk=pk) or created:
+        return
+    if art == 'mieter':
+        aktualisieren('vertrag', Q(mieter=pk) | Q(mitmieter=pk) | Q(weitere_mieter=pk))
+        aktualisieren('rechnung', vertrag__mieter=pk)
+    elif art == 'vertrag':
+        aktualisieren('rechnung', vertrag=pk)
+    elif art == 'einheit':
+        aktualisieren('vertrag', einheit=pk)
+
+
+def geloescht(instance):
+    art, _ = _QUELLFELDER[instance._meta.label]
+    if art is not None:
+        entfernen(art, [instance.pk])
+
+
+# ----------------------------------------------------------------------
+# Abfragen
+# ----------------------------------------------------------------------
+def _fts():
+    """Gibt es die FTS5-Tabelle? Nur auf SQLite, und nur wenn Migration 0015
+    sie anlegen konnte (FTS5 fehlt in manchen SQLite-Builds)."""
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _FTS_VORHANDEN:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [_FTS])
+            _FTS_VORHANDEN[name] = cursor.fetchone() is not None
+    return _FTS_VORHANDEN[name]
+
+
+def _phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def treffer(art, q):
+    """`objekt_id` aller Dokumente von `art`, die `q` als Teilstring enthalten
+    — als Unterabfrage für `pk__in`."""
+    from core.models import Suchdokument
+
+    dokumente = Suchdokument.objects.filter(art=art)
+    formen = suchformen(q)
+    if formen and _fts() and all(len(f) >= 3 for f in formen):
+        # Der Trigramm-Tokenizer beantwortet eine Phrase als Teilstring —
+        # ab drei Zeichen, darunter gibt es kein Trigramm.
+        dokumente = dokumente.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {_FTS} WHERE {_FTS} MATCH %s',
+            [' OR '.join(_phrase(f) for f in formen)]))
+    elif formen:
+        bedingung = Q()
+        for f in formen:
+            # `contains`, nicht `icontains`: Der Text ist schon klein
+            # geschrieben, und nur `LIKE` (ohne `UPPER`) nimmt auf Postgres
+            # den Trigramm-Index.
+            bedingung |= Q(text__contains=f)
+        dokumente = dokumente.filter(bedingung)
+    return dokumente.values('objekt_id')
+
+
+def filtern(qs, art, q):
+    """`qs` auf die Objekte einschränken, deren Dokument `q` enthält."""
+    return qs.filter(pk__in=treffer(art, q))
+
+
+def _trigramme(text):
+    """Trigramme je Wort, vorn und hinten mit Leerzeichen aufgefüllt — so
+    zählt auch der Wortanfang, wo sich Tippfehler selten verstecken."""
+    trigramme = set()
+    for wort in text.split():
+        wort = f' {wort} '
+        trigramme.update(wort[i:i + 3] for i in range(len(wort) - 2))
+    return trigramme
+
+
+def _bewertung(formen, text):
+    """1 und mehr für einen Teilstring (Wortanfang zählt etwas mehr), sonst
+    der Anteil der Trigramme der Anfrage, die im Dokument vorkommen."""
+    beste = 0.0
+    doc_trigramme = None
+    for f in formen:
+        stelle = text.find(f)
+        if stelle >= 0:
+            beste = max(beste, 1.1 if stelle == 0 or text[stelle - 1] in ' |' else 1.0)
+            continue
+        anfrage = _trigramme(f)
+        if not anfrage:
+            continue
+        if doc_trigramme is None:
+            doc_trigramme = _trigramme(text)
+        beste = max(beste, len(anfrage & doc_trigramme) / len(anfrage))
+    return beste
+
+
+def _kandidaten(formen, arten):
+    """(art, objekt_id, titel, text) der Dokumente, die für `formen` in Frage
+    kommen — höchstens `KANDIDATEN`, die ähnlichsten zuerst."""
+    from core.models import Suchdokument
+    from core.tenancy import OrganisationsFehler, aktuelle_organisation
+
+    dokumente = Suchdokument.objects.filter(art__in=arten)
+    lang = [f for f in formen if len(f) >= 3]
+    if lang and _fts():
+        org = aktuelle_organisation()
+        if org is None:
+            raise OrganisationsFehler('suche.suchen() ohne gesetzte Organisation.')
+        trigramme = sorted({f[i:i + 3] for f in lang for i in range(len(f) - 2)})
+        platz = ', '.join(['%s'] * len(arten))
+        with connection.cursor() as cursor:
+            # Roh-SQL, weil bm25() nur neben dem MATCH derselben Abfrage geht.
+            # Die Organisation steht deshalb hier ausdrücklich im WHERE — und
+            # vor dem LIMIT, damit fremde Dokumente keinen Platz belegen.
+            cursor.execute(
+                f'SELECT d.art, d.objekt_id, d.titel, d.text FROM {_FTS} '
+                f'JOIN core_suchdokument d ON d.id = {_FTS}.rowid '
+                f'WHERE {_FTS} MATCH %s AND d.organisation_id = %s AND d.art IN ({platz}) '
+                f'ORDER BY bm25({_FTS}) LIMIT %s',
+                [' OR '.join(_phrase(t) for t in trigramme), getattr(org, 'pk', org),
+                 *arten, KANDIDATEN])
+            return cursor.fetchall()
+    if lang and connection.vendor == 'postgresql':
+        # `<%` ist `word_similarity` über der Schwelle von pg_trgm (0.6) —
+        # über den GIN-Index, wie `LIKE` für den Teilstring.
+        bedingung = Q()
+        for f in formen:
+            bedingung |= Q(text__contains=f) | Q(RawSQL('%s <%% "core_suchdokument"."text"', [f],
+                                                          output_field=BooleanField()))
+        dokumente = (dokumente.filter(bedingung)
+                     .annotate(rang=RawSQL('word_similarity(%s, "core_suchdokument"."text")',
+                                           [formen[0]]))
+                     .order_by('-rang'))
+    else:
+        bedingung = Q()
+        for f in formen:
+            bedingung |= Q(text__contains=f)
+        dokumente = dokumente.filter(bedingung)
+    return list(dokumente.values_list('art', 'objekt_id', 'titel', 'text')[:KANDIDATEN])
+
+
+def suchen(q, arten=ARTEN, limit=20):
+    """Die besten Treffer für `q` je Art: {art: [objekt_id, …]}, bester zuerst.
+
+    Tippfehlertolerant ab drei Zeichen; darunter nur Teilstring.
+    """
+    ergebnis = {art: [] for art in arten}
+    formen = suchformen(q)
+    if not formen:
+        return ergebnis
+    bewertet = []
+    for art, objekt_id, titel, text in _kandidaten(formen, arten):
+        wert = _bewertung(formen, text)
+        if wert >= AEHNLICH_AB:
+            bewertet.append((-wert, titel.lower(), art, objekt_id))
+    for _, _, art, objekt_id in sorted(bewertet):
+        if len(ergebnis[art]) < limit:
+            ergebnis[art].append(objekt_id)
+    return ergebnis
+
+
+def in_reihenfolge(qs, ids):
+    """Die Objekte zu `ids` aus `qs`, in der Reihenfolge von `ids`."""
+    objekte = qs.in_bulk(ids)
+    return [objekte[i] for i in ids if i in objekte]
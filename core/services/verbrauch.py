@@ -0,0 +1,93 @@
+"""Zählerverbrauch im Zeitraum: letzter minus erster Stand, für viele Zähler auf einmal.
+
+Die NK-Abrechnung (HKVO-Verbrauchskosten) fragte die Stände Zähler für Zähler
+ab — eine Abfrage je Zähler, bei einer grossen Liegenschaft mit Wärme-,
+Wasser- und Stromzählern je Wohnung mehrere hundert. Hier holt EINE Abfrage
+mit Fensterfunktionen je Zähler den ersten und letzten Stand im Zeitraum und
+die Zahl der Ablesungen.
+
+Dieselbe Rechnung brauchen die Abrechnung, die Objektseite und jede spätere
+Verbrauchsübersicht; deshalb steht sie hier und nicht in `core.utils.billing`.
+
+Regeln (unverändert aus der Abrechnung übernommen):
+  · Ein Zähler braucht mindestens ZWEI Ablesungen im Zeitraum, sonst hat er
+    keinen Verbrauch.
+  · Bei mehreren Ablesungen am selben Tag gilt beim ersten Stand die zuerst,
+    beim letzten die zuletzt erfasste.
+  · In die Summen je Einheit geht nur positiver Verbrauch ein — ein
+    rückwärts laufender Zähler ist ein Erfassungsfehler, kein Guthaben.
+"""
+from decimal import Decimal
+
+#: Zählerart → Stichworte im freien Typfeld (`Zaehler.typ`). Die Reihenfolge
+#: zählt: «Energie» war in der Abrechnung immer Wärme, nicht Strom.
+ARTEN = {
+    'waerme': ('heiz', 'wärme', 'waerme', 'wmz', 'energie', 'wärmemenge'),
+    'wasser': ('wasser',),
+    'strom': ('strom', 'elektr'),
+}
+
+
+def zaehler_art(typ):
+    """'waerme', 'wasser', 'strom' oder 'sonstig' für ein `Zaehler.typ`."""
+    typ = (typ or '').lower()
+    for art, stichworte in ARTEN.items():
+        if any(s in typ for s in stichworte):
+            return art
+    return 'sonstig'
+
+
+def verbrauch_je_zaehler(zaehler, von, bis):
+    """`{zaehler_id: verbrauch}` für eine Auswahl von Zählern (QuerySet oder IDs).
+
+    Zähler mit weniger als zwei Ablesungen im Zeitraum fehlen im Ergebnis.
+    Der Verbrauch kann null oder negativ sein; was davon zählt, entscheidet
+    der Aufrufer.
+    """
+    from django.db.models import Count, F, Window
+    from django.db.models.functions import FirstValue
+
+    from portfolio.models import ZaehlerStand
+
+    je_zaehler = {'partition_by': [F('zaehler_id')]}
+    staende = (ZaehlerStand.objects.filter(zaehler__in=zaehler, datum__gte=von, datum__lte=bis)
+               .annotate(erster=Window(FirstValue('wert'), order_by=[F('datum').asc(), F('pk').asc()],
+                                       **je_zaehler),
+                         letzter=Window(FirstValue('wert'), order_by=[F('datum').desc(), F('pk').desc()],
+                                        **je_zaehler),
+                         anzahl=Window(Count('pk'), **je_zaehler))
+               .values_list('zaehler_id', 'erster', 'letzter', 'anzahl')
+               .order_by()
+               .distinct())
+    return {zid: (letzter or Decimal('0')) - (erster or Decimal('0'))
+            for zid, erster, letzter, anzahl in staende if anzahl >= 2}
+
+
+def verbrauch_je_einheit(liegenschaft, von, bis, *, arten=None):
+    """Verbrauch je Einheit und Zählerart: `{einheit_id: {art: verbrauch}}`.
+
+    Allgemeine Zähler der Liegenschaft (Allgemeinstrom, Hauptwasser) stehen
+    unter dem Schlüssel `None`. `arten` schränkt auf bestimmte Zählerarten ein
+    (z.B. `('waerme',)` für die HKVO). Zwei Abfragen, unabhängig von der Zahl
+    der Zähler.
+    """
+    from django.db.models import Q
+
+    from portfolio.models import Zaehler
+
+    zaehler = {}
+    for z in Zaehler.objects.filter(Q(einheit__liegenschaft=liegenschaft) | Q(liegenschaft=liegenschaft)):
+        art = zaehler_art(z.typ)
+        if arten is None or art in arten:
+            zaehler[z.pk] = (z.einheit_id, art)
+    if not zaehler:
+        return {}
+
+    ergebnis = {}
+    for zid, verbrauch in verbrauch_je_zaehler(list(zaehler), von, bis).items():
+        if verbrauch <= 0:
+            continue
+        einheit_id, art = zaehler[zid]
+        je_art = ergebnis.setdefault(einheit_id, {})
+        je_art[art] = je_art.get(art, Decimal('0')) + verbrauch
+    return ergebnis
@@ -81,12 +81,13 @@ def finde_vertrag(name):
     return eintrag.vertrag if eintrag else None
 
 
-def zaehle_treffer(name):
-    """Protokolliert, dass die gelernte Zuordnung wieder gegriffen hat."""
+def zaehle_treffer(name, anzahl=1):
+    """Protokolliert, dass die gelernte Zuordnung wieder gegriffen hat —
+    `anzahl` Mal, wenn ein Import denselben Absender mehrmals trifft."""
     from django.db.models import F
     from django.utils import timezone
     from finance.models import ZahlerZuordnung
     schluessel = normalisiere(name)
     if schluessel:
         (ZahlerZuordnung.objects.filter(name_norm=schluessel[:160])
-         .update(treffer=F('treffer') + 1, zuletzt=timezone.now()))
+         .update(treffer=F('treffer') + anzahl, zuletzt=timezone.now()))
@@ -0,0 +1,336 @@
+"""Zahler-Index: Wer könnte diese Zahlung ohne Referenz geschickt haben?
+
+Zahlungen ohne QR-Referenz wurden bisher Zeile für Zeile geraten: Der Import
+zerlegte für jede Auszugszeile den Auftraggeber in Wörter und verglich ihn mit
+dem Nachnamen jedes Mieters mit offener Rechnung über denselben Betrag, der
+gelernte Absender kam aus einer eigenen Abfrage, und der Bankabgleich bot für
+geparkte Zahlungen gar keinen Vorschlag an. Mitmieter und Firmen zählten
+nicht — eine Zahlung von «Anna Muster» für den Vertrag von Hans Muster ging
+nur über den gemeinsamen Nachnamen, eine von «Muster Immobilien AG» nie.
+
+Der Index hält je Verwaltung einmal aufgebaut:
+
+  · `namen` — jede Wortfolge, unter der ein Vertrag zahlt (Nachname, Vor- und
+    Nachname in beiden Reihenfolgen, Firmenname; für Haupt-, Zweit- und
+    WG-Mieter sowie den freien Mitmieter-Namen), mit dem Gewicht des Treffers;
+  · `gelernt` — die von Hand getroffenen Zuordnungen (`ZahlerZuordnung`);
+  · `vertraege` — Beginn, Ende und erwarteter Monatsbetrag (brutto) je Vertrag.
+
+`kandidaten(name, betrag, datum)` sucht die Wortfolgen des Auftraggebers in
+`namen` und `gelernt` nach und bewertet Betrag und Datum — ein paar
+Dict-Zugriffe statt eines Vergleichs mit jeder Rechnung. Ein Name passt wie
+bisher nur als zusammenhängende Wortfolge: «Ott» steckt nicht in «Scott».
+
+Gehalten wird der Index im Prozess. Jede Änderung an Mieter, Vertrag oder
+gelerntem Absender zählt seinen Stand im Zwischenspeicher weiter
+(`STAND_TAG`, Signale am Ende von `finance.models`); ein Index mit älterem
+Stand wird neu gebaut.
+Nach dem Commit zieht der Prozess, der die Änderung geschrieben hat, seinen
+Index nach, statt ihn wegzuwerfen — nur den betroffenen Vertrag. Was an den
+Signalen vorbeigeht (`QuerySet.update()`, Roh-SQL) und, mit
+`CACHE_ART=lokal`, was ein anderer Worker ändert, sieht der Index spätestens
+nach `GUELTIGKEIT` Sekunden.
+"""
+import re
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+#: Höchstalter eines Index in Sekunden — das Netz für Änderungen, die kein
+#: Signal auslösen oder in einem anderen Worker geschahen.
+GUELTIGKEIT = 15 * 60
+
+#: Gewicht eines Treffers je nach Art des Namens.
+NACHNAME = Decimal('0.60')
+VOLLNAME = Decimal('0.85')
+FIRMA = Decimal('0.80')
+GELERNT = Decimal('0.95')
+
+#: Ab dieser Bewertung zeigt der Bankabgleich einen Vorschlag.
+VORSCHLAG_AB = Decimal('0.60')
+
+_INDIZES = {}                 # organisation_id → {'stand', 'gebaut', 'index'}
+_SPERRE = threading.Lock()
+
+
+def normalisiere(wort):
+    return ''.join(ch for ch in (wort or '').lower() if ch.isalnum())
+
+
+def tokens(name):
+    """Wortweise normalisierte Tokens eines Namens (Reihenfolge erhalten)."""
+    return [t for t in (normalisiere(w) for w in re.split(r'\s+', name or '')) if t]
+
+
+class ZahlerIndex:
+    """Der Index einer Verwaltung. Ohne Datenbankzugriff — aufgebaut und
+    nachgezogen wird er über `_vertraege_laden` und die Signale."""
+
+    def __init__(self):
+        self.namen = {}           # Token-Tupel → {vertrag_id: gewicht}
+        self.gelernt = {}         # name_norm → vertrag_id
+        self.vertraege = {}       # vertrag_id → {'beginn', 'ende', 'erwartet', 'mieter'}
+        self._namen_je_vertrag = {}
+        self._vertraege_je_mieter = {}
+        self._mieter_je_vertrag = {}
+        self._gelernt_je_pk = {}
+        self._laengste = 1
+        self._sperre = threading.Lock()
+
+    # -- Pflege --------------------------------------------------------------
+
+    def vertrag_aufnehmen(self, vertrag_id, *, beginn, ende, erwartet, mieter, namen, mieter_ids):
+        """Nimmt einen Vertrag auf oder ersetzt ihn. `namen`: [(tokens, gewicht)]."""
+        with self._sperre:
+            self._entfernen(vertrag_id)
+            self.vertraege[vertrag_id] = {'beginn': beginn, 'ende': ende,
+                                          'erwartet': erwartet, 'mieter': mieter}
+            schluessel = []
+            for toks, gewicht in namen:
+                toks = tuple(toks)
+                if not toks:
+                    continue
+                treffer = self.namen.setdefault(toks, {})
+                if gewicht > treffer.get(vertrag_id, 0):
+                    treffer[vertrag_id] = gewicht
+                schluessel.append(toks)
+                self._laengste = max(self._laengste, len(toks))
+            self._namen_je_vertrag[vertrag_id] = schluessel
+            self._mieter_je_vertrag[vertrag_id] = list(mieter_ids)
+            for m in mieter_ids:
+                self._vertraege_je_mieter.setdefault(m, set()).add(vertrag_id)
+
+    def vertrag_entfernen(self, vertrag_id):
+        with self._sperre:
+            self._entfernen(vertrag_id)
+
+    def _entfernen(self, vertrag_id):
+        self.vertraege.pop(vertrag_id, None)
+        for toks in self._namen_je_vertrag.pop(vertrag_id, ()):
+            treffer = self.namen.get(toks)
+            if treffer is not None:
+                treffer.pop(vertrag_id, None)
+                if not treffer:
+                    del self.namen[toks]
+        for m in self._mieter_je_vertrag.pop(vertrag_id, ()):
+            self._vertraege_je_mieter.get(m, set()).discard(vertrag_id)
+
+    def vertraege_von(self, mieter_id):
+        """Verträge, an denen `mieter_id` beteiligt ist — ohne Abfrage, für
+        das Nachziehen nach einer Mieter-Änderung (auch nach dem Löschen,
+        wenn die Datenbank den Bezug nicht mehr kennt)."""
+        return set(self._vertraege_je_mieter.get(mieter_id, ()))
+
+    def gelernt_setzen(self, pk, name_norm, vertrag_id):
+        """Setzt oder (mit `vertrag_id=None`) entfernt einen gelernten Absender."""
+        with self._sperre:
+            alt = self._gelernt_je_pk.pop(pk, None)
+            if alt is not None and self.gelernt.get(alt[0]) == alt[1]:
+                del self.gelernt[alt[0]]
+            if vertrag_id is not None and name_norm:
+                self.gelernt[name_norm] = vertrag_id
+                self._gelernt_je_pk[pk] = (name_norm, vertrag_id)
+
+    # -- Abfrage -------------------------------------------------------------
+
+    def namens_treffer(self, name):
+        """`{vertrag_id: gewicht}` aller Verträge, deren Name als
+        zusammenhängende Wortfolge im Auftraggeber vorkommt."""
+        heu = tokens(name)
+        treffer = {}
+        with self._sperre:
+            for n in range(1, min(self._laengste, len(heu)) + 1):
+                for i in range(len(heu) - n + 1):
+                    for vid, gewicht in self.namen.get(tuple(heu[i:i + n]), {}).items():
+                        if gewicht > treffer.get(vid, 0):
+                            treffer[vid] = gewicht
+        return treffer
+
+    def kandidaten(self, name, betrag=None, datum=None):
+        """Mögliche Verträge für eine Zahlung, beste zuerst.
+
+        Liste von dicts mit `vertrag_id`, `score` (0…1), `grund` ('gelernt'
+        oder 'name') und `mieter`. Der Name trägt die Bewertung; ein Betrag
+        gleich dem Monatsbrutto hebt sie, ein anderer senkt sie. Eine Zahlung
+        mehr als einen Monat vor Vertragsbeginn fällt weg, eine mehr als drei
+        Monate nach Vertragsende zählt halb (Nachzahlungen gibt es).
+        """
+        gruende = {vid: ('name', g) for vid, g in self.namens_treffer(name).items()}
+        gelernter = self.gelernt.get(normalisiere(name)[:160])
+        if gelernter is not None and gelernter in self.vertraege:
+            gruende[gelernter] = ('gelernt', GELERNT)
+        ergebnis = []
+        for vid, (grund, score) in gruende.items():
+            v = self.vertraege.get(vid)
+            if v is None:
+                continue
+            if betrag is not None and v['erwartet']:
+                score = min(score + Decimal('0.15'), Decimal('1')) if betrag == v['erwartet'] \
+                    else score * Decimal('0.85')
+            if datum is not None:
+                if v['beginn'] and datum < v['beginn'] - timedelta(days=31):
+                    continue
+                if v['ende'] and datum > v['ende'] + timedelta(days=90):
+                    score = score / 2
+            ergebnis.append({'vertrag_id': vid, 'score': score.quantize(Decimal('0.01')),
+                             'grund': grund, 'mieter': v['mieter']})
+        ergebnis.sort(key=lambda k: (-k['score'], k['vertrag_id']))
+        return ergebnis
+
+
+# ---------------------------------------------------------------------------
+# Aufbau
+# ---------------------------------------------------------------------------
+
+def _person_namen(vorname, nachname):
+    nach = tokens(nachname)
+    vor = tokens(vorname)
+    namen = [(nach, NACHNAME)]
+    if vor and nach:
+        namen += [(vor + nach, VOLLNAME), (nach + vor, VOLLNAME)]
+    return namen
+
+
+def _mieter_namen(m):
+    namen = _person_namen(m.vorname, m.nachname)
+    if m.firmen_name:
+        namen.append((tokens(m.firmen_name), FIRMA))
+    return namen
+
+
+def _freier_name(name):
+    """Der freie Mitmieter-Name («Anna Muster»): ganz, und das letzte Wort
+    als Nachname."""
+    toks = tokens(name)
+    if len(toks) < 2:
+        return [(toks, NACHNAME)]
+    return [(toks, VOLLNAME), (toks[-1:], NACHNAME)]
+
+
+def _vertraege_laden(index, vertrag_ids=None):
+    """Nimmt die Verträge (alle oder `vertrag_ids`) frisch aus der Datenbank
+    auf; angefragte, die es nicht mehr gibt, fallen heraus.
+
+    Alle Verträge, auch beendete und Entwürfe: Eine Rechnung eines alten
+    Vertrags kann noch offen sein, und der Import ordnet nur zu, was eine
+    offene Rechnung hat. Die Bewertung nach Datum übernimmt `kandidaten`.
+    """
+    from rentals.models import Mietvertrag
+
+    qs = Mietvertrag.objects.select_related('mieter', 'mitmieter').prefetch_related('weitere_mieter')
+    if vertrag_ids is not None:
+        qs = qs.filter(pk__in=list(vertrag_ids))
+    gefunden = set()
+    for v in qs.order_by('pk'):
+        gefunden.add(v.pk)
+        parteien = v.alle_mieter
+        namen = [n for p in parteien for n in _mieter_namen(p)]
+        if v.mitmieter_name:
+            namen += _freier_name(v.mitmieter_name)
+        index.vertrag_aufnehmen(
+            v.pk, beginn=v.beginn, ende=v.ende, erwartet=v.brutto_mietzins,
+            mieter=v.mieter.display_name if v.mieter_id else '—',
+            namen=namen, mieter_ids=[p.pk for p in parteien])
+    for vid in set(vertrag_ids or ()) - gefunden:
+        index.vertrag_entfernen(vid)
+
+
+def _bauen():
+    from finance.models import ZahlerZuordnung
+
+    index = ZahlerIndex()
+    _vertraege_laden(index)
+    for pk, name_norm, vertrag_id in ZahlerZuordnung.objects.values_list('pk', 'name_norm', 'vertrag_id'):
+        index.gelernt_setzen(pk, name_norm, vertrag_id)
+    return index
+
+
+# ---------------------------------------------------------------------------
+# Stand und Zugriff
+# ---------------------------------------------------------------------------
+
+#: Der Stand des Index im Zwischenspeicher (`zwischenspeicher.stand`).
+STAND_TAG = 'zahlerindex'
+
+
+def index(organisation_id=None):
+    """Der aktuelle Index der Verwaltung (Standard: die des Kontexts)."""
+    from core.services import zwischenspeicher
+    from core.tenancy import organisation_kontext
+
+    if organisation_id is None:
+        from core.organisation_kette import organisation_bestimmen
+        organisation_id = organisation_bestimmen().pk
+    stand = zwischenspeicher.stand(STAND_TAG, organisation_id=organisation_id)
+    eintrag = _INDIZES.get(organisation_id)
+    if (eintrag is not None and eintrag['stand'] == stand
+            and time.monotonic() - eintrag['gebaut'] < GUELTIGKEIT):
+        return eintrag['index']
+    # Gebaut wird über die gefilterten Manager. Ohne Kontext, oder im Kontext
+    # einer anderen Verwaltung, stünde unter dieser Verwaltung ein fremder
+    # oder gar kein Bestand.
+    with organisation_kontext(organisation_id):
+        neu = _bauen()
+    with _SPERRE:
+        _INDIZES[organisation_id] = {'stand': stand, 'gebaut': time.monotonic(), 'index': neu}
+    return neu
+
+
+def geaendert(organisation_id, nachziehen):
+    """Meldet eine Änderung: den Stand weiterzählen wie
+    `zwischenspeicher.vergessen` — sofort (ausser beim Datenbank-Cache) und
+    nach dem Commit —, nach dem Commit den eigenen Index mit
+    `nachziehen(index)` nachführen.
+
+    Nachziehen erst nach dem Commit: Bei einem Rollback darf die Änderung
+    nicht im Index landen; dann bleibt der Stand verschieden und der Index
+    wird beim nächsten Zugriff neu gebaut. Nachgezogen wird nur ein Index,
+    dessen Stand allein diese Änderung weitergezählt hat; hat dazwischen
+    jemand anderes gezählt, fehlt ihm etwas, und er wird verworfen.
+    """
+    from django.db import transaction
+    from core.services import zwischenspeicher
+
+    if not organisation_id:
+        return
+    gezaehlt = []
+    if zwischenspeicher.vor_dem_commit_zaehlen():
+        gezaehlt.append(zwischenspeicher.zaehlen(STAND_TAG, organisation_id=organisation_id))
+    transaction.on_commit(lambda: _nachziehen(organisation_id, gezaehlt, nachziehen))
+
+
+def _nachziehen(organisation_id, gezaehlt, nachziehen):
+    from core.services import zwischenspeicher
+    from core.tenancy import organisation_kontext
+
+    gezaehlt = [*gezaehlt, zwischenspeicher.zaehlen(STAND_TAG, organisation_id=organisation_id)]
+    with _SPERRE:
+        eintrag = _INDIZES.get(organisation_id)
+        if eintrag is None:
+            return
+        vorher = eintrag['stand']
+        if (None in gezaehlt or not isinstance(vorher, int)
+                or gezaehlt != list(range(vorher + 1, vorher + 1 + len(gezaehlt)))):
+            del _INDIZES[organisation_id]
+            return
+    with organisation_kontext(organisation_id):
+        nachziehen(eintrag['index'])
+    eintrag['stand'] = gezaehlt[-1]
+
+
+# -- Was die Signale nachziehen ---------------------------------------------
+
+def vertrag_geaendert(organisation_id, vertrag_id):
+    geaendert(organisation_id, lambda idx: _vertraege_laden(idx, [vertrag_id]))
+
+
+def mieter_geaendert(organisation_id, mieter_id):
+    # Die betroffenen Verträge kennt der Index selbst: Ein Mieter kommt nur
+    # über einen Vertrag (oder dessen WG-Liste) dazu, und das meldet der
+    # Vertrag. Nach dem Löschen wüsste die Datenbank sie nicht mehr.
+    geaendert(organisation_id, lambda idx: _vertraege_laden(idx, idx.vertraege_von(mieter_id)))
+
+
+def gelernt_geaendert(organisation_id, pk, name_norm, vertrag_id):
+    geaendert(organisation_id, lambda idx: idx.gelernt_setzen(pk, name_norm, vertrag_id))
@@ -0,0 +1,442 @@
+"""Zwischenspeicher: je Verwaltung getrennt, über Worker geteilt, nach Tags verworfen.
+
+Bis hierhin hielt jede Stelle, die etwas zwischenspeicherte, ihren eigenen
+Stand: das Eigentümer-Portfolio einen Zähler je Verwaltung, der Zahler-Index
+einen zweiten, der LIK-Abruf einen festen Schlüssel. Wer ein Dashboard oder
+einen Mieterspiegel zwischenspeichern wollte, hätte einen vierten bauen
+müssen — und dabei selbst an die Organisation im Schlüssel denken.
+
+Hier gibt es das einmal; das Portfolio speichert über `holen`, der
+Zahler-Index hält seinen Stand über `stand`/`zaehlen`:
+
+  · `holen(teile, berechnen, tags=…)` und der Dekorator `zwischenspeichern`
+    — der Schlüssel läuft immer über `core.tenancy.cache_key`, trägt also die
+    Organisation des Kontexts. Ohne Kontext wirft er, statt einen geteilten
+    Eintrag anzulegen.
+  · TAGS — ein Eintrag nennt, wovon er abhängt: `'liegenschaft:12'` (genau
+    diese Liegenschaft), `'vertrag:*'` (irgendein Vertrag). `vergessen(tag)`
+    macht alle Einträge mit diesem Tag ungültig; die Signale am Ende von
+    `finance.models` rufen es für jede gespeicherte oder gelöschte Zeile der
+    Quellen in `TAG_ARTEN` auf.
+  · ZÄHLER — Treffer und Fehlgriffe je Bereich (`statistik()`, Befehl
+    `zwischenspeicher`).
+  · STÄNDE für Stellen, die nicht über `holen` speichern, aber dieselbe
+    Ungültigkeit brauchen — der Zahler-Index, den jeder Prozess selbst hält:
+    `stand(tag)` und `zaehlen(tag)`, mit derselben Regel, wann gezählt wird.
+
+WIE DAS VERWERFEN GEHT. Jeder Tag hat einen Stand im Cache. Ein Eintrag merkt sich beim Schreiben die Stände
+seiner Tags; beim Lesen kommen Eintrag und Stände in EINEM `get_many`, und
+weicht ein Stand ab, ist es ein Fehlgriff. Gelöscht wird nichts — alte
+Einträge laufen ab. Die Stände werden VOR dem Rechnen gelesen: Ändert sich
+etwas, während gerechnet wird, ist der frische Eintrag gleich wieder alt,
+statt einen veralteten Wert unter neuem Stand zu tragen.
+
+`'vertrag:12'` hängt an zwei Ständen: seinem eigenen und dem für «alle
+Verträge» (`vergessen('vertrag:*')`). `'vertrag:*'` hängt an einem Stand, den
+JEDER Vertrag weiterzählt. Ein Signal zählt also `vertrag:12` und `vertrag:*`
+weiter; wer nach `QuerySet.update()` alle Verträge verwerfen will, ruft
+`vergessen('vertrag:*')`.
+
+Die Signale kennen nur die direkten Bezüge einer Zeile (`BEZUEGE`): Ein
+Vertrag zählt `einheit:…` und `mieter:…` weiter, aber nicht die
+Liegenschaft hinter der Einheit — das hätte je Speichern eine Abfrage
+gekostet. Wer über zwei Stufen hinweg abhängt, nimmt den Stern
+(`'vertrag:*'`). Was an den Signalen vorbeigeht, sieht der Eintrag
+spätestens nach seiner `gueltigkeit`.
+
+Geteilt über die Worker ist das nur mit geteiltem Cache; `CACHES` in den
+Settings stellt dafür ohne Redis den Datenbank-Cache bereit. Er schreibt in
+die Transaktion der App; gezählt wird mit ihm deshalb erst nach dem Commit
+(`vor_dem_commit_zaehlen`). Wer viele Schreiber je Verwaltung hat, nimmt
+`CACHE_ART=redis`.
+"""
+import functools
+import hashlib
+import inspect
+import threading
+import time
+from datetime import date, datetime
+
+#: Standard-Höchstalter eines Eintrags in Sekunden — das Netz für
+#: Änderungen, die kein Signal auslösen.
+GUELTIGKEIT = 15 * 60
+
+#: So oft (Sekunden) schreibt ein Prozess seine Treffer/Fehlgriffe in den
+#: geteilten Cache — nicht bei jedem Zugriff, sonst kostete jeder Treffer
+#: einen Schreibvorgang.
+ZAEHLER_TAKT = 60
+
+#: Modell → Art im Tag. Für diese Quellen zählen die Signale den Stand weiter.
+#: Die Organisation selbst (Zinsstand, LIK) zählt `organisation:<pk>` weiter;
+#: sie hat einen eigenen Empfänger am Ende von `finance.models`.
+TAG_ARTEN = {
+    'portfolio.Liegenschaft': 'liegenschaft',
+    'portfolio.Einheit': 'einheit',
+    'portfolio.Sollmietzins': 'sollmietzins',
+    'portfolio.Dokument': 'dokument',
+    'portfolio.Geraet': 'geraet',
+    'portfolio.Wartungsfrist': 'wartungsfrist',
+    'rentals.Mietvertrag': 'vertrag',
+    'rentals.VertragMietzins': 'mietzins',
+    'rentals.Staffelstufe': 'mietzins',
+    'rentals.MietzinsAnpassung': 'mietzins',
+    'rentals.Dokument': 'dokument',
+    'rentals.Leerstand': 'leerstand',
+    'rentals.Kuendigung': 'kuendigung',
+    'crm.Mieter': 'mieter',
+    'crm.Eigentuemer': 'eigentuemer',
+    'finance.DebitorenRechnung': 'rechnung',
+    'finance.Zahlungseingang': 'zahlung',
+    'finance.Mahnung': 'mahnung',
+    'finance.KreditorenRechnung': 'kreditor',
+    'finance.KreditorenZahlung': 'kreditor',
+    'core.Pendenz': 'pendenz',
+    'faelle.Fall': 'fall',
+    'faelle.Fallschritt': 'fall',
+    'faelle.Lauf': 'lauf',
+    'faelle.Blockade': 'lauf',
+    'tickets.SchadenMeldung': 'schaden',
+    'tickets.HandwerkerAuftrag': 'auftrag',
+}
+
+#: Fremdschlüssel, deren Ziel beim Speichern einer Zeile mit verworfen wird.
+BEZUEGE = ('liegenschaft', 'einheit', 'vertrag', 'mieter', 'eigentuemer')
+
+_ALLE = '*'
+_ALLE_EINZELN = '**'          # Stand «alle einzeln» hinter `vergessen('art:*')`
+
+_ZAEHLER = {}                 # bereich → [treffer, fehlgriffe] seit dem letzten Schreiben
+_ZAEHLER_STAND = {'geschrieben': time.monotonic()}
+_SPERRE = threading.Lock()
+
+
+class _Fehlt:
+    """Marke für «kein Eintrag» — `None` ist ein gültiger Wert."""
+
+
+class Unvollstaendig(Exception):
+    """Aus `berechnen` geworfen: Der Wert gilt für DIESEN Aufruf, wird aber
+    nicht gespeichert.
+
+    Für Ergebnisse, die trotz ausgefallener Quelle angezeigt werden sollen —
+    einmal gezeigt ist eine Lücke ein Fehler, gespeichert sieht sie jeder aus
+    dem Team bis zum Ablauf.
+    """
+
+    def __init__(self, wert):
+        super().__init__('Ergebnis unvollständig — nicht zwischengespeichert.')
+        self.wert = wert
+
+
+# ---------------------------------------------------------------------------
+# Schlüssel und Stände
+# ---------------------------------------------------------------------------
+
+def _teil(wert):
+    """Ein Argument als stabiler Text: Modelle nach Label und PK, Daten als
+    ISO — `repr` eines Modells nennt nur `__str__`, und der ist nicht eindeutig."""
+    from django.db import models
+
+    if isinstance(wert, models.Model):
+        return f'{wert._meta.label_lower}#{wert.pk}'
+    if isinstance(wert, (date, datetime)):
+        return wert.isoformat()
+    if isinstance(wert, (list, tuple)):
+        return '[' + ','.join(_teil(w) for w in wert) + ']'
+    if isinstance(wert, (set, frozenset)):
+        return '{' + ','.join(sorted(_teil(w) for w in wert)) + '}'
+    if isinstance(wert, dict):
+        return '{' + ','.join(f'{k}={_teil(v)}' for k, v in sorted(wert.items())) + '}'
+    return repr(wert)
+
+
+def eintrag_schluessel(bereich, *teile):
+    """Schlüssel eines Eintrags — mit Organisation, die Teile gehasht (lange
+    Argumentlisten sprengten sonst die Schlüssellänge mancher Backends)."""
+    from core.tenancy import cache_key
+    kennung = hashlib.sha1('|'.join(_teil(t) for t in teile).encode('utf-8')).hexdigest()[:20]
+    return cache_key('zs', bereich, kennung)
+
+
+def _stand_schluessel(tag, organisation_id=None):
+    from core.tenancy import cache_key, organisation_kontext
+    if organisation_id is None:
+        return cache_key('zs-tag', tag)
+    with organisation_kontext(organisation_id):
+        return cache_key('zs-tag', tag)
+
+
+def _staende(tags):
+    """Die Stände, an denen Einträge mit `tags` hängen (sortiert, ohne Doppel)."""
+    staende = set()
+    for tag in tags:
+        art, _, kennung = str(tag).partition(':')
+        staende.add(str(tag))
+        if kennung and kennung != _ALLE:
+            staende.add(f'{art}:{_ALLE_EINZELN}')
+    return sorted(staende)
+
+
+def _startwert():
+    # Aus der Uhr statt 1: Wird ein Stand verdrängt und neu angelegt, darf er
+    # keinen alten Wert wiederholen, den ein Eintrag noch trägt.
+    return int(time.time() * 1000)
+
+
+def _weiterzaehlen(schluessel):
+    """Einen Stand um eins weiterzählen. Gibt den neuen Wert zurück, oder
+    None, wenn er aus der Uhr neu angelegt werden musste.
+
+    Zuerst `incr`: Der Stand ist fast immer schon da, und ein vorangestelltes
+    `add` kostete bei jedem Weiterzählen einen zweiten Schreibversuch — beim
+    Datenbank-Cache samt Zählung der Tabelle.
+    """
+    from django.core.cache import cache
+    try:
+        return cache.incr(schluessel)
+    except ValueError:             # nie angelegt oder verdrängt
+        pass
+    if cache.add(schluessel, _startwert(), None):
+        return None
+    try:
+        return cache.incr(schluessel)
+    except ValueError:             # zwischen add und incr verdrängt
+        cache.set(schluessel, _startwert(), None)
+        return None
+
+
+def vor_dem_commit_zaehlen():
+    """Ob Stände schon VOR dem Commit weitergezählt werden.
+
+    Nicht mit dem Datenbank-Cache: Er schreibt über die Verbindung der App,
+    also in die offene Transaktion. Kein anderer Worker sähe den Stand vor
+    dem Commit — und bis dahin hielte jeder Schreiber einer Verwaltung die
+    Zeilen der Stände gesperrt, die alle teilen (`vertrag:*`). Gleichzeitige
+    Speichervorgänge warteten aufeinander, und ein Speichern kostete doppelt
+    so viele Cache-Abfragen. Dort wird nur nach dem Commit gezählt.
+    """
+    from django.core.cache import caches
+    from django.core.cache.backends.db import DatabaseCache
+    return not isinstance(caches['default'], DatabaseCache)
+
+
+def stand(tag, *, organisation_id=None):
+    """Der Stand genau dieses Tags (ohne die Stern-Stände); fehlt er, wird er
+    angelegt. Für Stellen, die einen Stand selbst vergleichen statt über
+    `holen` zu gehen — der Zahler-Index im Prozess, die Zeitachse.
+
+    Nicht als 0 lesen: Ein verdrängter Stand käme sonst immer wieder als 0
+    zurück, und was einmal unter 0 gespeichert wurde, gälte jedes Mal wieder.
+    """
+    from django.core.cache import cache
+    schluessel = _stand_schluessel(tag, organisation_id)
+    wert = cache.get(schluessel)
+    if wert is None:
+        cache.add(schluessel, _startwert(), None)
+        wert = cache.get(schluessel)
+    return wert
+
+
+def zaehlen(tag, *, organisation_id=None):
+    """Den Stand genau dieses Tags jetzt weiterzählen — ohne Stern-Stände und
+    ohne Rücksicht auf die Transaktion; das entscheidet der Aufrufer (siehe
+    `vor_dem_commit_zaehlen`). Gibt den neuen Wert zurück, oder None, wenn
+    der Stand neu angelegt werden musste."""
+    return _weiterzaehlen(_stand_schluessel(tag, organisation_id))
+
+
+def vergessen(*tags, organisation_id=None):
+    """Alle Einträge mit einem dieser Tags ungültig machen.
+
+    `'vertrag:12'` trifft die Einträge dieses Vertrags und die mit
+    `'vertrag:*'`; `'vertrag:*'` trifft alle Vertragseinträge. Ohne
+    `organisation_id` gilt die Verwaltung des Kontexts.
+
+    Sofort weitergezählt, damit bis zum Commit niemand einen alten Eintrag
+    liest — und nach dem Commit noch einmal: Wer zwischen den beiden Zeiten
+    rechnete, sah die Datenbank noch ohne die Änderung und hat sein Ergebnis
+    unter dem neuen Stand abgelegt. Mit dem Datenbank-Cache nur nach dem
+    Commit (`vor_dem_commit_zaehlen`).
+    """
+    from django.db import transaction
+
+    if not tags:
+        return
+    zaehlen = set()
+    for tag in tags:
+        art, _, kennung = str(tag).partition(':')
+        zaehlen.add(str(tag))
+        if kennung == _ALLE:
+            zaehlen.add(f'{art}:{_ALLE_EINZELN}')
+        elif kennung:
+            zaehlen.add(f'{art}:{_ALLE}')
+    schluessel = [_stand_schluessel(t, organisation_id) for t in sorted(zaehlen)]
+    in_transaktion = transaction.get_connection().in_atomic_block
+    if not in_transaktion or vor_dem_commit_zaehlen():
+        for s in schluessel:
+            _weiterzaehlen(s)
+    if in_transaktion:
+        transaction.on_commit(lambda: [_weiterzaehlen(s) for s in schluessel])
+
+
+def tags_fuer(instanz):
+    """Die Tags, die eine gespeicherte oder gelöschte Zeile verwirft: ihr
+    eigener und die ihrer direkten Bezüge (`BEZUEGE`)."""
+    art = TAG_ARTEN.get(instanz._meta.label)
+    if art is None:
+        return []
+    tags = [f'{art}:{instanz.pk}'] if instanz.pk is not None else [f'{art}:{_ALLE}']
+    for feld in BEZUEGE:
+        ziel = getattr(instanz, f'{feld}_id', None)
+        if ziel is not None:
+            tags.append(f'{feld}:{ziel}')
+    return tags
+
+
+# ---------------------------------------------------------------------------
+# Lesen und Schreiben
+# ---------------------------------------------------------------------------
+
+def holen(teile, berechnen, *, tags=(), gueltigkeit=GUELTIGKEIT):
+    """Den Wert zu `teile` aus dem Zwischenspeicher — oder `berechnen()`.
+
+    `teile` ist ein Tupel; das erste Element benennt den Bereich (für die
+    Zähler), alle zusammen den Eintrag. `tags` siehe Modul-Docstring. Wirft
+    `berechnen` `Unvollstaendig`, kommt dessen Wert ungespeichert zurück.
+    """
+    from django.core.cache import cache
+
+    teile = tuple(teile) if isinstance(teile, (list, tuple)) else (teile,)
+    bereich = str(teile[0])
+    schluessel = eintrag_schluessel(*teile)
+    stand_namen = _staende(tags)
+    stand_schluessel = [_stand_schluessel(t) for t in stand_namen]
+
+    gefunden = cache.get_many([schluessel, *stand_schluessel])
+    staende = [gefunden.get(s) for s in stand_schluessel]
+    eintrag = gefunden.get(schluessel, _Fehlt)
+    if (eintrag is not _Fehlt and None not in staende
+            and isinstance(eintrag, tuple) and eintrag[0] == tuple(staende)):
+        _zaehlen(bereich, treffer=True)
+        return eintrag[1]
+
+    _zaehlen(bereich, treffer=False)
+    fehlend = [s for s, wert in zip(stand_schluessel, staende) if wert is None]
+    if fehlend:
+        for s in fehlend:
+            cache.add(s, _startwert(), None)
+        nachgelesen = cache.get_many(fehlend)
+        staende = [nachgelesen.get(s) if wert is None else wert
+                   for s, wert in zip(stand_schluessel, staende)]
+    try:
+        wert = berechnen()
+    except Unvollstaendig as unvollstaendig:
+        return unvollstaendig.wert
+    if None not in staende:
+        cache.set(schluessel, (tuple(staende), wert), gueltigkeit)
+    return wert
+
+
+def zwischenspeichern(*tags, gueltigkeit=GUELTIGKEIT, bereich=None):
+    """Dekorator: das Ergebnis je Verwaltung und Argumenten zwischenspeichern.
+
+    Tags sind Formatvorlagen über die Argumente der Funktion
+    (`'liegenschaft:{liegenschaft.pk}'`, `'vertrag:{vertrag_id}'`) oder
+    feste Tags (`'vertrag:*'`). Wer sie aus den Argumenten erst berechnen
+    muss, gibt statt Texten EINE Funktion mit derselben Signatur, die die
+    Tags liefert.
+
+        @zwischenspeichern('liegenschaft:{liegenschaft.pk}', 'vertrag:*')
+        def belegung(liegenschaft, stichtag): ...
+
+    Ohne Zwischenspeicher: `belegung.__wrapped__(…)`.
+    """
+    def dekorieren(funktion):
+        signatur = inspect.signature(funktion)
+        name = bereich or f'{funktion.__module__}.{funktion.__qualname__}'
+
+        @functools.wraps(funktion)
+        def verpackt(*args, **kwargs):
+            gebunden = signatur.bind(*args, **kwargs)
+            gebunden.apply_defaults()
+            if len(tags) == 1 and callable(tags[0]):
+                eintrag_tags = list(tags[0](*gebunden.args, **gebunden.kwargs))
+            else:
+                eintrag_tags = [t.format(**gebunden.arguments) for t in tags]
+            teile = (name, *(f'{k}={_teil(v)}' for k, v in gebunden.arguments.items()))
+            return holen(teile, lambda: funktion(*args, **kwargs),
+                         tags=eintrag_tags, gueltigkeit=gueltigkeit)
+        return verpackt
+    return dekorieren
+
+
+# ---------------------------------------------------------------------------
+# Zähler
+# ---------------------------------------------------------------------------
+
+# Die Zähler tragen KEINE Organisation: Sie sagen, wie gut ein Bereich trifft,
+# nicht was darin steht — und der Betrieb will sie über alle Verwaltungen.
+_ZAEHLER_PRAEFIX = 'zs-zaehler'
+_BEREICHE = f'{_ZAEHLER_PRAEFIX}:bereiche'
+
+
+def _zaehlen(bereich, treffer):
+    with _SPERRE:
+        _ZAEHLER.setdefault(bereich, [0, 0])[0 if treffer else 1] += 1
+        faellig = time.monotonic() - _ZAEHLER_STAND['geschrieben'] >= ZAEHLER_TAKT
+    if faellig:
+        zaehler_schreiben()
+
+
+def zaehler_schreiben():
+    """Die Zähler dieses Prozesses in den geteilten Cache addieren."""
+    from django.core.cache import cache
+
+    with _SPERRE:
+        offen = {b: z for b, z in _ZAEHLER.items() if any(z)}
+        _ZAEHLER.clear()
+        _ZAEHLER_STAND['geschrieben'] = time.monotonic()
+    if not offen:
+        return
+    bekannt = set(cache.get(_BEREICHE) or ())
+    if not set(offen) <= bekannt:
+        cache.set(_BEREICHE, sorted(bekannt | set(offen)), None)
+    for b, (treffer, fehlgriffe) in offen.items():
+        for art, anzahl in (('treffer', treffer), ('fehlgriffe', fehlgriffe)):
+            if not anzahl:
+                continue
+            schluessel = f'{_ZAEHLER_PRAEFIX}:{b}:{art}'
+            if not cache.add(schluessel, anzahl, None):
+                try:
+                    cache.incr(schluessel, anzahl)
+                except ValueError:
+                    cache.set(schluessel, anzahl, None)
+
+
+def statistik():
+    """Treffer und Fehlgriffe je Bereich über alle Prozesse, seit dem letzten
+    `zaehler_zuruecksetzen()`: {bereich: {'treffer', 'fehlgriffe', 'quote'}}."""
+    from django.core.cache import cache
+
+    zaehler_schreiben()
+    bereiche = cache.get(_BEREICHE) or []
+    werte = cache.get_many([f'{_ZAEHLER_PRAEFIX}:{b}:{art}'
+                            for b in bereiche for art in ('treffer', 'fehlgriffe')])
+    ergebnis = {}
+    for b in bereiche:
+        treffer = werte.get(f'{_ZAEHLER_PRAEFIX}:{b}:treffer', 0)
+        fehlgriffe = werte.get(f'{_ZAEHLER_PRAEFIX}:{b}:fehlgriffe', 0)
+        gesamt = treffer + fehlgriffe
+        ergebnis[b] = {'treffer': treffer, 'fehlgriffe': fehlgriffe,
+                       'quote': round(treffer / gesamt, 3) if gesamt else None}
+    return ergebnis
+
+
+def zaehler_zuruecksetzen():
+    from django.core.cache import cache
+
+    with _SPERRE:
+        _ZAEHLER.clear()
+    bereiche = cache.get(_BEREICHE) or []
+    cache.delete_many([f'{_ZAEHLER_PRAEFIX}:{b}:{art}'
+                       for b in bereiche for art in ('treffer', 'fehlgriffe')] + [_BEREICHE])
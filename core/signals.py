@@ -6,6 +6,7 @@ wer wann von wo im System war."""
 from django.contrib.auth.signals import (
     user_logged_in, user_logged_out, user_login_failed,
 )
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 from core.auth import log_aktion, client_ip
@@ -59,3 +60,18 @@ def _on_login_failed(sender, credentials, request=None, **kwargs):
                'Falsches Passwort oder unbekannter Benutzer',
                kategorie='sicherheit', ip=client_ip(request) if request else None,
                user=benutzer)
+
+
+# Gemerkte Rollen der laufenden Anfrage (`core.auth.rollen_je_anfrage`)
+# verwerfen, sobald sich eine Mitgliedschaft ändert — wer in der
+# Benutzerverwaltung sich selbst herabstuft, soll das schon beim Rendern der
+# Antwort merken, nicht erst beim nächsten Klick.
+def _rollen_vergessen(sender, instance, **kwargs):
+    from core.auth import rollen_vergessen
+    rollen_vergessen(instance.benutzer_id)
+
+
+post_save.connect(_rollen_vergessen, sender='crm.Mitgliedschaft',
+                  dispatch_uid='core.rollen_vergessen')
+post_delete.connect(_rollen_vergessen, sender='crm.Mitgliedschaft',
+                    dispatch_uid='core.rollen_vergessen_loeschen')
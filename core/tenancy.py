@@ -34,6 +34,7 @@ Unterschied ist Absicht: `alle_organisationen` steht sichtbar im Code und lässt
 sich greppen; ein stiller Kontextverzicht nicht.
 """
 import logging
+import sys
 from contextlib import contextmanager
 from contextvars import ContextVar
 
@@ -168,7 +169,7 @@ def kontext_des_objekts(objekt):
         yield organisation
 
 
-def je_organisation(arbeit, auswahl=None, ausgabe=None):
+def je_organisation(arbeit, auswahl=None, ausgabe=None, parallel=1, protokoll=None):
     """Führt `arbeit(organisation)` je Verwaltung mit gesetztem Kontext aus.
 
     DER WEG FÜR JEDEN SCHEDULER-BEFEHL. Ein Management-Command läuft ohne
@@ -188,10 +189,21 @@ def je_organisation(arbeit, auswahl=None, ausgabe=None):
     kann. Der Scheduler sieht so, dass etwas schieflief, und trotzdem hat
     jede heile Verwaltung ihren Lauf.
 
+    Je Verwaltung ist ein Kontenplan-Zwischenspeicher offen
+    (`finance.booking.kontenplan_zwischenspeicher`): Ein Lauf, der hunderte
+    Buchungen schreibt, liest jedes Konto einmal statt einmal je Buchung.
+
+    `parallel` > 1 verteilt die Verwaltungen auf so viele Prozesse (siehe
+    `_parallel`). `protokoll` ist dann der Strom für die normale Ausgabe
+    (`self.stdout` des Befehls), `ausgabe` der für Fehler — beide bekommen
+    die Ausgabe jeder Verwaltung am Stück statt verzahnt.
+
     Gibt `(ergebnisse, fehler)` zurück: `ergebnisse` ist die Liste der
-    Rückgabewerte von `arbeit`, `fehler` eine Liste `(organisation, ausnahme)`.
+    Rückgabewerte von `arbeit`, `fehler` eine Liste `(organisation, ausnahme)`
+    — beide in der Reihenfolge der Verwaltungen, auch parallel.
     """
     from crm.models import Organisation
+    from finance.booking import kontenplan_zwischenspeicher
 
     organisationen = Organisation.objects.order_by('pk')
     if auswahl is not None:
@@ -199,10 +211,15 @@ def je_organisation(arbeit, auswahl=None, ausgabe=None):
         if not organisationen.exists():
             raise ValueError(f'Keine Verwaltung mit ID {auswahl}.')
 
+    if parallel > 1:
+        organisationen = list(organisationen)
+        if len(organisationen) > 1:
+            return _parallel(arbeit, organisationen, parallel, ausgabe, protokoll)
+
     ergebnisse, fehler = [], []
     for organisation in organisationen:
         try:
-            with organisation_kontext(organisation):
+            with organisation_kontext(organisation), kontenplan_zwischenspeicher():
                 ergebnisse.append(arbeit(organisation))
         except Exception as ausnahme:                     # noqa: BLE001
             fehler.append((organisation, ausnahme))
@@ -212,6 +229,191 @@ def je_organisation(arbeit, auswahl=None, ausgabe=None):
     return ergebnisse, fehler
 
 
+#: Was die Kindprozesse von `_parallel` ausführen. Ein Modulwert statt eines
+#: Arguments: `arbeit` ist fast immer eine Lambda über `self` des Befehls und
+#: lässt sich nicht picklen. Die Kinder entstehen per fork und erben ihn.
+_PARALLEL = {}
+
+
+def _parallel(arbeit, organisationen, prozesse, ausgabe, protokoll):
+    """`je_organisation` über einen Prozess-Pool.
+
+    Bei dutzenden Verwaltungen ist das Nachtfenster sonst die Summe aller
+    Läufe. Threads helfen dabei nicht: Die Läufe rechnen in Python, und der
+    GIL liesse sie doch nacheinander laufen.
+
+    Was gleich bleiben muss wie im seriellen Lauf, und warum es das tut:
+
+      · DER KONTEXT. Jedes Kind setzt ihn je Verwaltung mit
+        `organisation_kontext` — die ContextVar gehört dem Prozess, es gibt
+        nichts, was zwischen zwei Kindern durchsickern könnte. Geerbt wird
+        der Zustand des Elternprozesses, und der ist im Befehl ohne Kontext.
+      · DIE VERBINDUNG. Vor dem fork werden alle Verbindungen geschlossen;
+        jedes Kind öffnet beim ersten Zugriff seine eigene und behält sie für
+        alle Verwaltungen, die es abarbeitet. Eine geerbte offene Verbindung
+        teilten sich sonst zwei Prozesse auf demselben Socket.
+      · DIE FEHLER. Gefangen wird im Kind, je Verwaltung; zurück kommen
+        `(organisation, ausnahme)` wie seriell. Lässt sich eine Ausnahme nicht
+        picklen, kommt sie als RuntimeError mit demselben Text.
+      · DIE AUSGABE. Jedes Kind schneidet mit, was eine Verwaltung schreibt —
+        `protokoll`/`ausgabe` ebenso wie print und Logging auf stdout/stderr —,
+        und der Elternprozess gibt es je Verwaltung am Stück aus, sobald sie
+        fertig ist.
+
+      · EIN GESTORBENES KIND. Es reisst den Pool mit; die Verwaltungen, die
+        es nicht zu Ende gebracht hat, laufen je in einem eigenen Kind nach.
+        Als Fehler zählt nur die, deren Kind auch dann stirbt.
+
+    Nur für Prozesse mit fork (Linux, also der Scheduler). Rückgabewerte, die
+    sich nicht picklen lassen, kommen als None zurück; die Befehle werten
+    ohnehin nur die Fehler aus.
+    """
+    from django.db import connections
+
+    nach_pk = {o.pk: o for o in organisationen}
+    ergebnisse, fehler = {}, {}
+
+    def auswerten(pk, ergebnis, ausnahme, spur, raus, err):
+        organisation = nach_pk[pk]
+        _weitergeben(protokoll, sys.stdout, raus)
+        _weitergeben(ausgabe, sys.stderr, err)
+        if ausnahme is None:
+            ergebnisse[pk] = ergebnis
+            return
+        fehler[pk] = ausnahme
+        logger.error('%s: Lauf abgebrochen\n%s', organisation, spur)
+        if ausgabe is not None:
+            ausgabe.write(f'FEHLER {organisation}: {ausnahme}')
+
+    connections.close_all()
+    _PARALLEL.update(arbeit=arbeit, ausgabe=ausgabe, protokoll=protokoll)
+    try:
+        offen = _im_pool(list(nach_pk), min(prozesse, len(nach_pk)), auswerten)
+        # Stirbt ein Kind (Speicher, Signal), ist der ganze Pool kaputt: JEDE
+        # noch offene Verwaltung bekommt BrokenProcessPool, auch die, die nie
+        # angefangen hat — welche das Kind getötet hat, sagt er nicht. Diese
+        # laufen darum nochmals, jede in einem eigenen Kind: Die übrigen
+        # kommen so durch, und stirbt eines wieder, ist es diese Verwaltung.
+        if offen:
+            logger.warning('Kindprozess gestorben — %s Verwaltung(en) laufen einzeln nach', len(offen))
+        for pk in sorted(offen):
+            for tot in _im_pool([pk], 1, auswerten).values():
+                auswerten(pk, None, tot, repr(tot), '', '')
+    finally:
+        _PARALLEL.clear()
+    return ([ergebnisse[pk] for pk in nach_pk if pk in ergebnisse],
+            [(nach_pk[pk], fehler[pk]) for pk in nach_pk if pk in fehler])
+
+
+def _im_pool(pks, prozesse, auswerten):
+    """Die Verwaltungen `pks` in einem frischen Pool; jedes Ergebnis geht an
+    `auswerten`. Zurück kommen `{pk: BrokenProcessPool}` für die, die ein
+    gestorbenes Kind nie zu Ende gebracht hat."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from concurrent.futures.process import BrokenProcessPool
+
+    offen = {}
+    with ProcessPoolExecutor(max_workers=prozesse,
+                             mp_context=multiprocessing.get_context('fork')) as pool:
+        laeufe = {pool.submit(_im_kind, pk): pk for pk in pks}
+        for lauf in as_completed(laeufe):
+            pk = laeufe[lauf]
+            try:
+                teile = lauf.result()
+            except BrokenProcessPool as tot:
+                offen[pk] = tot
+                continue
+            except Exception as ausnahme:                 # noqa: BLE001
+                # Das Ergebnis kam nicht über die Leitung — für diese
+                # Verwaltung ein Fehler, der Pool selbst ist heil.
+                teile = (pk, None, ausnahme, repr(ausnahme), '', '')
+            auswerten(*teile)
+    return offen
+
+
+def _im_kind(pk):
+    """Eine Verwaltung im Kindprozess: Kontext setzen, ausführen, mitschneiden."""
+    import pickle
+    import traceback
+    from crm.models import Organisation
+    from finance.booking import kontenplan_zwischenspeicher
+
+    ergebnis = ausnahme = None
+    spur = ''
+    with _mitschneiden(_PARALLEL['protokoll'], _PARALLEL['ausgabe']) as mitschnitt:
+        try:
+            organisation = Organisation.objects.get(pk=pk)
+            with organisation_kontext(organisation), kontenplan_zwischenspeicher():
+                ergebnis = _PARALLEL['arbeit'](organisation)
+        except Exception as fehler:                       # noqa: BLE001
+            ausnahme, spur = fehler, traceback.format_exc()
+    try:
+        pickle.dumps(ergebnis)
+    except Exception:                                     # noqa: BLE001
+        ergebnis = None
+    if ausnahme is not None:
+        try:
+            pickle.loads(pickle.dumps(ausnahme))
+        except Exception:                                 # noqa: BLE001
+            ausnahme = RuntimeError(f'{type(ausnahme).__name__}: {ausnahme}')
+    return pk, ergebnis, ausnahme, spur, mitschnitt['protokoll'], mitschnitt['ausgabe']
+
+
+@contextmanager
+def _mitschneiden(protokoll, ausgabe):
+    """Fängt die Ausgabe einer Verwaltung im Kindprozess ab.
+
+    Zwei Wege, weil zwei Arten geschrieben wird: Die `OutputWrapper` des
+    Befehls (`self.stdout`/`self.stderr`) bekommen für die Dauer einen
+    StringIO untergeschoben; print und Logging gehen auf die Dateideskriptoren
+    1 und 2, die dafür in eine temporäre Datei zeigen.
+    """
+    import io
+    import os
+    import tempfile
+
+    mitschnitt = {'protokoll': '', 'ausgabe': ''}
+    stroeme = [(schluessel, strom, io.StringIO())
+               for schluessel, strom in (('protokoll', protokoll), ('ausgabe', ausgabe))
+               if hasattr(strom, '_out')]
+    vorher = [strom._out for _, strom, _ in stroeme]
+    for _, strom, puffer in stroeme:
+        strom._out = puffer
+    sys.stdout.flush()
+    sys.stderr.flush()
+    dateien = {fd: tempfile.TemporaryFile() for fd in (1, 2)}
+    gerettet = {fd: os.dup(fd) for fd in dateien}
+    for fd, datei in dateien.items():
+        os.dup2(datei.fileno(), fd)
+    try:
+        yield mitschnitt
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, alt in gerettet.items():
+            os.dup2(alt, fd)
+            os.close(alt)
+        for (_, strom, _), alt in zip(stroeme, vorher):
+            strom._out = alt
+        for schluessel, _, puffer in stroeme:
+            mitschnitt[schluessel] += puffer.getvalue()
+        for fd, schluessel in ((1, 'protokoll'), (2, 'ausgabe')):
+            dateien[fd].seek(0)
+            mitschnitt[schluessel] += dateien[fd].read().decode('utf-8', 'replace')
+            dateien[fd].close()
+
+
+def _weitergeben(strom, ersatz, text):
+    """Mitgeschnittene Ausgabe einer Verwaltung im Elternprozess ausgeben —
+    am Strom vorbei an dessen Ziel, damit der `OutputWrapper` sie nicht ein
+    zweites Mal einfärbt."""
+    if text:
+        ziel = getattr(strom, '_out', strom) or ersatz
+        ziel.write(text)
+        ziel.flush()
+
+
 def cache_key(*teile):
     """Cache-Schlüssel mit Organisations-ID.
 
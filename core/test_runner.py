@@ -1,4 +1,5 @@
-"""Testläufer, der jeden Test in einer eigenen Kopie des Kontexts ausführt.
+"""Testläufer, der jeden Test in einer eigenen Kopie des Kontexts ausführt —
+und mit leerem Cache.
 
 WARUM ES DEN BRAUCHT
 --------------------
@@ -24,6 +25,15 @@ aufräumen) wäre eine Liste, die irgendwann unvollständig ist.
 Der Eingriff sitzt an `SimpleTestCase.run`, also an genau einer Stelle, und er
 ändert am Testergebnis nichts — er begrenzt nur die Lebensdauer der
 Kontextvariablen auf den einzelnen Test.
+
+DER ZWISCHENSPEICHER GEHÖRT DAZU
+--------------------------------
+Dasselbe gilt für den Cache: Er überlebt das Zurückrollen der Datenbank. Ein
+Test, der die Startseite aufruft, hinterlässt ihren Stand unter dem Schlüssel
+seiner Organisation — und der nächste Test bekommt nach dem Zurückrollen oft
+dieselbe Primärschlüssel-Nummer und damit denselben Schlüssel. Er läse den
+Stand eines Bestands, den es nicht mehr gibt. Deshalb beginnt jeder Test mit
+leeren Caches.
 """
 import contextvars
 
@@ -35,13 +45,17 @@ _UMHUELLT = '_mandanten_kontext_umhuellt'
 
 
 def kontext_je_test_aktivieren():
-    """Hüllt `SimpleTestCase.run` in eine Kontext-Kopie. Idempotent."""
+    """Hüllt `SimpleTestCase.run` in eine Kontext-Kopie und leert vorher die
+    Caches. Idempotent."""
     if getattr(SimpleTestCase, _UMHUELLT, False):
         return
 
     original = SimpleTestCase.run
 
     def run(self, result=None):
+        from django.core.cache import caches
+        for cache in caches.all(initialized_only=True):
+            cache.clear()
         return contextvars.copy_context().run(original, self, result)
 
     SimpleTestCase.run = run
@@ -49,7 +63,7 @@ def kontext_je_test_aktivieren():
 
 
 class MandantenTestRunner(DiscoverRunner):
-    """Djangos Standardläufer, plus Kontext-Kopie je Test."""
+    """Djangos Standardläufer, plus Kontext-Kopie und leerer Cache je Test."""
 
     def setup_test_environment(self, **kwargs):
         super().setup_test_environment(**kwargs)
@@ -4,7 +4,7 @@ from datetime import date
 from decimal import Decimal
 from unittest import skipUnless
 
-from django.test import TestCase, Client
+from django.test import SimpleTestCase, TestCase, Client
 from ._helfer import (
     _test_organisation,
     ZXING_DA, _team_user, _basis_objekte, _seed_konten, _P3_CAMT, Mieter,
@@ -1017,6 +1017,92 @@ class BankAbgleichP3Tests(TestCase):
 # ============================================================
 
 
+class CamtLeserTests(SimpleTestCase):
+    """`core.services.camt.CamtLeser`: ein Durchgang, mehrere Auszüge,
+    camt.054-Sammelbuchungen."""
+
+    _MEHRFACH = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.04"><BkToCstmrStmt>
+ <Stmt>
+  <Acct><Id><IBAN>CH93 0076 2011 6238 5295 7</IBAN></Id></Acct>
+  <FrToDt><FrDtTm>2024-01-01T00:00:00</FrDtTm><ToDtTm>2024-01-31T00:00:00</ToDtTm></FrToDt>
+  <Bal><Tp><CdOrPrtry><Cd>OPBD</Cd></CdOrPrtry></Tp><Amt Ccy="CHF">100.00</Amt>
+       <CdtDbtInd>DBIT</CdtDbtInd></Bal>
+  <Bal><Tp><CdOrPrtry><Cd>CLBD</Cd></CdOrPrtry></Tp><Amt Ccy="CHF">500.00</Amt>
+       <CdtDbtInd>CRDT</CdtDbtInd></Bal>
+  <Ntry><Amt Ccy="CHF">600.00</Amt><CdtDbtInd>CRDT</CdtDbtInd><BookgDt><Dt>2024-01-05</Dt></BookgDt>
+   <NtryDtls><TxDtls><RltdPties><Dbtr><Nm>Anna</Nm><Acct><Id><IBAN>CH5604835012345678009</IBAN></Id></Acct>
+   </Dbtr></RltdPties></TxDtls></NtryDtls></Ntry>
+ </Stmt>
+ <Stmt>
+  <Acct><Id><IBAN>CH9300762011623852957</IBAN></Id></Acct>
+  <FrToDt><FrDtTm>2024-02-01T00:00:00</FrDtTm><ToDtTm>2024-02-29T00:00:00</ToDtTm></FrToDt>
+  <Bal><Tp><CdOrPrtry><Cd>OPBD</Cd></CdOrPrtry></Tp><Amt Ccy="CHF">500.00</Amt>
+       <CdtDbtInd>CRDT</CdtDbtInd></Bal>
+  <Bal><Tp><CdOrPrtry><Cd>CLBD</Cd></CdOrPrtry></Tp><Amt Ccy="CHF">450.00</Amt>
+       <CdtDbtInd>CRDT</CdtDbtInd></Bal>
+  <Ntry><Amt Ccy="CHF">50.00</Amt><CdtDbtInd>DBIT</CdtDbtInd><BookgDt><Dt>2024-02-03</Dt></BookgDt></Ntry>
+ </Stmt>
+</BkToCstmrStmt></Document>"""
+
+    _CAMT054 = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.054.001.04"><BkToCstmrDbtCdtNtfctn>
+ <Ntfctn>
+  <Acct><Id><IBAN>CH9300762011623852957</IBAN></Id></Acct>
+  <Ntry><Amt Ccy="CHF">3000.00</Amt><CdtDbtInd>CRDT</CdtDbtInd><BookgDt><Dt>2024-03-01</Dt></BookgDt>
+   <NtryDtls><Btch><NbOfTxs>2</NbOfTxs></Btch>
+    <TxDtls><Amt Ccy="CHF">1700.00</Amt><Refs><AcctSvcrRef>B-1</AcctSvcrRef></Refs>
+     <RmtInf><Strd><CdtrRefInf><Ref>21 00000 00003 13947 14300 09017</Ref></CdtrRefInf></Strd></RmtInf></TxDtls>
+    <TxDtls><Amt Ccy="CHF">1300.00</Amt><Refs><AcctSvcrRef>B-2</AcctSvcrRef></Refs>
+     <RltdPties><Dbtr><Nm>Berta</Nm></Dbtr></RltdPties></TxDtls>
+   </NtryDtls></Ntry>
+ </Ntfctn>
+</BkToCstmrDbtCdtNtfctn></Document>"""
+
+    def test_ein_durchgang_wie_bisher(self):
+        from core.services.camt import lese_camt
+        from core.views.fw import _camt_kopf, _camt_parse
+        eintraege, kopf = lese_camt(_P3_CAMT.encode(), nur_gutschriften=False)
+        self.assertEqual(eintraege, _camt_parse(_P3_CAMT.encode(), nur_gutschriften=False))
+        self.assertEqual(kopf, _camt_kopf(_P3_CAMT.encode()))
+        self.assertEqual([e['betrag'] for e in eintraege], [Decimal('800.00'), Decimal('-350.00')])
+
+    def test_mehrere_auszuege(self):
+        from core.services.camt import CamtLeser
+        leser = CamtLeser(self._MEHRFACH.encode(), nur_gutschriften=False)
+        eintraege = list(leser)
+        self.assertEqual([(e['betrag'], e['auszug']) for e in eintraege],
+                         [(Decimal('600.00'), 0), (Decimal('-50.00'), 1)])
+        self.assertEqual(eintraege[0]['dbtr_name'], 'Anna')
+        self.assertEqual(len(leser.auszuege), 2)
+        # IBAN des Auszugskontos, nicht die des Auftraggebers in der Buchung
+        self.assertEqual(leser.auszuege[0]['iban'], 'CH9300762011623852957')
+        self.assertEqual(leser.auszuege[0]['eroeffnung'], Decimal('-100.00'))
+        self.assertEqual(leser.kopf, {'iban': 'CH9300762011623852957',
+                                      'von': date(2024, 1, 1), 'bis': date(2024, 2, 29),
+                                      'eroeffnung': Decimal('-100.00'), 'schluss': Decimal('450.00')})
+
+    def test_camt054_sammelbuchung_wird_aufgeteilt(self):
+        from core.services.camt import lese_camt
+        eintraege, kopf = lese_camt(self._CAMT054.encode())
+        self.assertEqual([e['betrag'] for e in eintraege], [Decimal('1700.00'), Decimal('1300.00')])
+        self.assertEqual(eintraege[0]['referenz'], '210000000003139471430009017')
+        self.assertEqual(eintraege[1]['dbtr_name'], 'Berta')
+        self.assertEqual(kopf['iban'], 'CH9300762011623852957')
+        self.assertIsNone(kopf['schluss'])
+
+    def test_liest_inkrementell(self):
+        """Die erste Buchung kommt, bevor der Rest der Datei gelesen ist — ein
+        Fehler weiter hinten fällt erst dort auf."""
+        import xml.etree.ElementTree as ET
+        from core.services.camt import CamtLeser
+        kaputt = _P3_CAMT.split('<Ntry>\n   <Amt Ccy="CHF">350.00')[0] + '<Ntry><kaputt></Ntry>'
+        leser = iter(CamtLeser(kaputt.encode()))
+        self.assertEqual(next(leser)['betrag'], Decimal('800.00'))
+        with self.assertRaises(ET.ParseError):
+            next(leser)
+
+
 class QrStrukturierteAdresseTests(TestCase):
     """QR-Rechnung nach Swiss Implementation Guidelines v2.4.
 
@@ -1300,3 +1386,169 @@ class CamtImportRueckgaengigTests(TestCase):
         self.assertEqual(r.status, 'bezahlt')
         self.assertEqual(Zahlungseingang.objects.filter(debitoren_rechnung=r,
                                                         status='verbucht').count(), 1)
+
+
+class BankImportStapelTests(TestCase):
+    """`core.services.bankimport`: im Speicher zuordnen, je Auszug gesammelt
+    schreiben — mit denselben Ergebnissen wie Zeile für Zeile."""
+
+    def _setup(self):
+        from core.services.automation import run_sollstellung
+        from finance.models import DebitorenRechnung
+        _seed_konten()
+        _basis_objekte()
+        run_sollstellung(2024, 3)
+        return DebitorenRechnung.objects.get(titel='Miete & NK 03/2024')
+
+    def test_mehrere_zahlungen_auf_dieselbe_rechnung(self):
+        # Teilzahlung, Rest, dann nochmals dieselbe Referenz: der mitgeführte
+        # offene Rest entscheidet wie beim Buchen nacheinander.
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from finance.models import Zahlungseingang
+        r = self._setup()
+        csv = ("Datum;Buchungstext;Referenz;Gutschrift\n"
+               f"05.03.2024;Teil 1;{r.qr_referenz};1'000.00\n"
+               f"06.03.2024;Teil 2;{r.qr_referenz};700.00\n"
+               f"07.03.2024;nochmals;{r.qr_referenz};50.00\n").encode('utf-8')
+        c = Client(); c.force_login(_team_user())
+        c.post('/neu/bankabgleich/camt-import/',
+               {'camt_datei': SimpleUploadedFile('auszug.csv', csv, content_type='text/csv')})
+        r.refresh_from_db()
+        self.assertEqual(r.status, 'bezahlt')
+        self.assertEqual(Zahlungseingang.objects.filter(debitoren_rechnung=r).count(), 2)
+        doppel = Zahlungseingang.objects.get(konto__nummer='2030')
+        self.assertEqual(doppel.betrag, Decimal('50.00'))
+        self.assertEqual(doppel.vertrag_id, r.vertrag_id)
+
+    def test_abfragen_wachsen_nicht_mit_den_zeilen(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.services import bankimport
+        self._setup()
+
+        def _abfragen(n, tag):
+            eintraege = [{'betrag': Decimal('10.00') + i, 'referenz': '', 'datum': date(2024, 3, tag),
+                          'info': '', 'acct_ref': f'Q{tag}-{i}', 'dbtr_name': f'Fremd {i} AG'}
+                         for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                erg = bankimport.ausfuehren(bankimport.planen(eintraege), {}, quelle='Bank-CSV')
+            self.assertEqual(erg['geklaert'], n)
+            return len(ctx)
+
+        _abfragen(1, 4)     # legt Konten, Belegnummernkreis und Saldenzeilen an
+        self.assertEqual(_abfragen(3, 5), _abfragen(30, 6))
+
+    def test_befehl_bank_import(self):
+        import io
+        import tempfile
+        from django.core.management import call_command
+        from finance.models import Bankbewegung, Zahlungseingang
+        r = self._setup()
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as f:
+            f.write(("Datum;Buchungstext;Referenz;Gutschrift\n"
+                     f"05.03.2024;Gutschrift QR;{r.qr_referenz};1'700.00\n").encode('utf-8'))
+        org = Organisation.objects.first()
+        out = io.StringIO()
+        call_command('bank_import', f.name, '--organisation', str(org.pk), '--probelauf', stdout=out)
+        self.assertIn('1 referenz', out.getvalue())
+        self.assertFalse(Bankbewegung.objects.exists())
+
+        call_command('bank_import', f.name, '--organisation', str(org.pk), stdout=io.StringIO())
+        r.refresh_from_db()
+        self.assertEqual(r.status, 'bezahlt')
+        self.assertEqual(Zahlungseingang.objects.filter(debitoren_rechnung=r).count(), 1)
+        self.assertEqual(Bankbewegung.objects.get().status, 'verbucht')
+
+
+class ZahlerIndexTests(TestCase):
+    """`core.services.zahlerindex`: Namen aller Vertragsparteien und gelernte
+    Absender je Verwaltung, nach Änderungen nachgezogen statt neu gebaut."""
+
+    def _setup(self):
+        from core.services.automation import run_sollstellung
+        from finance.models import DebitorenRechnung
+        _seed_konten()
+        lg, e, m, v = _basis_objekte()
+        v.mitmieter_name = 'Anna Beispiel'
+        v.save()
+        run_sollstellung(2024, 3)
+        return m, v, DebitorenRechnung.objects.get(titel='Miete & NK 03/2024')
+
+    def test_kandidaten_mit_bewertung(self):
+        from core.services import zahlerindex
+        m, v, _r = self._setup()
+        idx = zahlerindex.index()
+        beste = idx.kandidaten('MUSTER HANS', Decimal('1700.00'), date(2024, 3, 5))[0]
+        self.assertEqual((beste['vertrag_id'], beste['score'], beste['grund']),
+                         (v.pk, Decimal('1.00'), 'name'))
+        # Mitmieter nur über den freien Namen, Betrag weicht ab: tiefer bewertet.
+        self.assertEqual(idx.kandidaten('Anna Beispiel', Decimal('800.00'))[0]['score'],
+                         Decimal('0.72'))
+        self.assertEqual(idx.kandidaten('Peter Mustermann'), [])
+        # Vor Vertragsbeginn kein Kandidat.
+        self.assertEqual(idx.kandidaten('Hans Muster', datum=date(2023, 6, 1)), [])
+
+    def test_import_ordnet_mitmieter_zu(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        _m, _v, r = self._setup()
+        csv = ("Datum;Auftraggeber;Buchungstext;Gutschrift\n"
+               "05.03.2024;Anna Beispiel;Miete Maerz;1'700.00\n").encode('utf-8')
+        c = Client(); c.force_login(_team_user())
+        c.post('/neu/bankabgleich/camt-import/',
+               {'camt_datei': SimpleUploadedFile('auszug.csv', csv, content_type='text/csv')})
+        r.refresh_from_db()
+        self.assertEqual(r.status, 'bezahlt')
+
+    def test_nachziehen_ohne_neuaufbau(self):
+        from core.services import zahlerindex
+        m, v, _r = self._setup()
+        idx = zahlerindex.index()
+        with self.captureOnCommitCallbacks(execute=True):
+            m.nachname = 'Neumann'
+            m.save()
+        self.assertIs(zahlerindex.index(), idx)
+        self.assertEqual(idx.kandidaten('Hans Muster'), [])
+        self.assertEqual(idx.kandidaten('Hans Neumann')[0]['vertrag_id'], v.pk)
+
+        # Ohne Commit (Rollback) bleibt der Index alt und wird neu gebaut.
+        m.nachname = 'Altmann'
+        m.save()
+        neu = zahlerindex.index()
+        self.assertIsNot(neu, idx)
+        self.assertEqual(neu.kandidaten('Hans Altmann')[0]['vertrag_id'], v.pk)
+
+    def test_vor_dem_commit_gebauter_index_gilt_danach_nicht_mehr(self):
+        """Ein anderer Worker baut zwischen dem Weiterzählen und dem Commit
+        neu — ohne die Änderung, aber mit dem neuen Stand. Der zweite Schritt
+        nach dem Commit macht ihn ungültig."""
+        from core.services import zahlerindex
+        m, v, _r = self._setup()
+        with self.captureOnCommitCallbacks(execute=True):
+            m.nachname = 'Neumann'
+            m.save()
+            zahlerindex._INDIZES.clear()
+            dazwischen = zahlerindex.index()
+            im_anderen_worker = dict(zahlerindex._INDIZES[v.organisation_id])
+        zahlerindex._INDIZES[v.organisation_id] = im_anderen_worker
+        self.assertIsNot(zahlerindex.index(), dazwischen)
+
+    def test_index_baut_im_kontext_seiner_verwaltung(self):
+        from core.services import zahlerindex
+        from core.tenancy import ohne_organisation
+        _m, v, _r = self._setup()
+        zahlerindex._INDIZES.clear()
+        with ohne_organisation():
+            idx = zahlerindex.index(v.organisation_id)
+        self.assertEqual(idx.kandidaten('Hans Muster')[0]['vertrag_id'], v.pk)
+
+    def test_vorschlag_im_bankabgleich(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        _m, _v, r = self._setup()
+        csv = ("Datum;Auftraggeber;Buchungstext;Gutschrift\n"
+               "05.03.2024;Hans Muster;Teilzahlung;800.00\n").encode('utf-8')
+        c = Client(); c.force_login(_team_user())
+        c.post('/neu/bankabgleich/camt-import/',
+               {'camt_datei': SimpleUploadedFile('auszug.csv', csv, content_type='text/csv')})
+        html = c.get('/neu/bankabgleich/').content.decode()
+        self.assertIn('Vorschlag: Hans Muster', html)
+        self.assertIn(f'value="{r.id}" selected', html)
@@ -351,6 +351,408 @@ class SollstellungKontierungTests(TestCase):
         self.assertEqual(r.betrag, Decimal('2100.00'))
 
 
+class SollstellungStapelTests(TestCase):
+    """Der Stapelweg (`bulk=True`) schreibt Beleg für Beleg dasselbe Journal wie
+    der Einzelweg — Belegnummern, Texte, Konten, Beträge, Rechnungen."""
+
+    class _Zurueck(Exception):
+        pass
+
+    def setUp(self):
+        from finance.booking import buche
+        from rentals.models import VertragMietzins
+        org = _test_organisation()
+        lg = Liegenschaft.objects.create(organisation=org, strasse='Stapel 1', plz='8000', ort='Zürich',
+                                         versicherungswert=Decimal('1'))
+        # Eine bestehende Buchung: der Block muss hinter ihr weiterzählen.
+        buche('4000', '1020', Decimal('10'), 'Vorbestand', datum=date(2026, 1, 15), liegenschaft=lg)
+
+        def _vertrag(bez, typ, netto, nk, **felder):
+            e = Einheit.objects.create(liegenschaft=lg, bezeichnung=bez, typ=typ,
+                                       nettomiete_aktuell=netto, nebenkosten_aktuell=nk)
+            m = Mieter.objects.create(typ='person', vorname='M', nachname=bez)
+            felder.setdefault('beginn', date(2025, 1, 1))
+            return Mietvertrag.objects.create(mieter=m, einheit=e, netto_mietzins=netto,
+                                              nebenkosten=nk, status='aktiv', **felder)
+
+        _vertrag('Whg 1', 'wohnung', Decimal('1500'), Decimal('200'))
+        _vertrag('Laden', 'gew', Decimal('2000'), Decimal('150'), nk_abrechnungsart='pauschal',
+                 mwst_pflichtig=True, mwst_satz=Decimal('8.1'))
+        _vertrag('Whg 2', 'wohnung', Decimal('1333'), Decimal('177'), beginn=date(2026, 3, 11))
+        gratis = _vertrag('Whg 3', 'wohnung', Decimal('1800'), Decimal('250'))
+        VertragMietzins.objects.create(vertrag=gratis, gueltig_ab=date(2026, 1, 1),
+                                       netto_mietzins=Decimal('1800'), nebenkosten=Decimal('250'),
+                                       rabatt_netto=Decimal('1800'), rabatt_nk=Decimal('50'))
+        self.schon = _vertrag('Whg 5', 'wohnung', Decimal('1000'), Decimal('90'))
+
+    def _journal(self):
+        from finance.models import Buchung, DebitorenRechnung
+        from core.utils.qr_code import qrr_referenz
+        rechnungen = {}
+        for r in DebitorenRechnung.objects.order_by('pk'):
+            # Primärschlüssel vergleichen sich nicht über einen Rückbau hinweg
+            # (Postgres-Sequenzen rollen nicht zurück) — die QRR muss aber zu
+            # IHREM Schlüssel passen.
+            self.assertEqual(r.qr_referenz, qrr_referenz(r.vertrag_id, r.pk)[0])
+            rechnungen[r.pk] = (r.vertrag_id, r.titel, r.betrag, r.datum, r.faellig_am, r.status,
+                                r.liegenschaft_id, r.einheit_id, r.organisation_id)
+        buchungen = [
+            (b.beleg_nr, b.datum, b.beleg_text, b.soll_konto.nummer, b.haben_konto.nummer, b.betrag,
+             b.liegenschaft_id, rechnungen.get(b.debitoren_rechnung_id), b.erstellt_von_id,
+             b.ist_storno, b.organisation_id)
+            for b in Buchung.objects.select_related('soll_konto', 'haben_konto').order_by('beleg_nr')]
+        return sorted(rechnungen.values()), buchungen
+
+    def _lauf(self, bulk):
+        from django.db import transaction
+        from core.services.automation import run_sollstellung
+        try:
+            with transaction.atomic():
+                run_sollstellung(2026, 2, bulk=False)      # Vormonat, identisch gestellt
+                self.assertTrue(run_sollstellung(2026, 3, bulk=bulk) >= 1)
+                ergebnis = self._journal()
+                raise self._Zurueck
+        except self._Zurueck:
+            pass
+        return ergebnis
+
+    def test_stapel_und_einzeln_schreiben_dasselbe_journal(self):
+        einzeln = self._lauf(bulk=False)
+        stapel = self._lauf(bulk=True)
+        self.assertEqual(einzeln, stapel)
+        # Der Vergleich ist nur etwas wert, wenn alle Buchungsarten vorkamen.
+        texte = ' '.join(b[2] for b in stapel[1])
+        for teil in ('Mietertrag', 'NK-Akonto', 'NK-Pauschal', 'Mietzinserlass', 'NK-Erlass', 'MWST'):
+            self.assertIn(teil, texte)
+        nummern = [b[0] for b in stapel[1]]
+        self.assertEqual(nummern, list(range(1, len(nummern) + 1)))
+
+    def test_stapel_ist_idempotent(self):
+        from core.services.automation import run_sollstellung
+        from finance.models import DebitorenRechnung
+        run_sollstellung(2026, 3, bulk=False)
+        DebitorenRechnung.objects.filter(titel='Miete & NK 03/2026').exclude(vertrag=self.schon).delete()
+        self.assertEqual(run_sollstellung(2026, 3, bulk=True), 4)
+        self.assertEqual(run_sollstellung(2026, 3, bulk=True), 0)
+        self.assertEqual(DebitorenRechnung.objects.filter(titel='Miete & NK 03/2026').count(), 5)
+
+    def test_stapel_abfragen_wachsen_nicht_mit_den_vertraegen(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.services.automation import run_sollstellung
+        with CaptureQueriesContext(connection) as wenige:
+            run_sollstellung(2026, 3, bulk=True)
+        lg = Liegenschaft.objects.get(strasse='Stapel 1')
+        for i in range(20):
+            e = Einheit.objects.create(liegenschaft=lg, bezeichnung=f'Zus {i}', typ='wohnung')
+            m = Mieter.objects.create(typ='person', vorname='Z', nachname=str(i))
+            Mietvertrag.objects.create(mieter=m, einheit=e, beginn=date(2025, 1, 1), status='aktiv',
+                                       netto_mietzins=Decimal('900'), nebenkosten=Decimal('80'))
+        with CaptureQueriesContext(connection) as viele:
+            self.assertEqual(run_sollstellung(2026, 4, bulk=True), 25)
+        self.assertLessEqual(len(viele), len(wenige) + 2)
+
+    def test_stapel_respektiert_periodensperre(self):
+        from core.services.automation import run_sollstellung
+        from finance.models import DebitorenRechnung
+        _test_organisation(buchung_gesperrt_bis=date(2026, 3, 31))
+        with self.assertRaises(PermissionError):
+            run_sollstellung(2026, 3, bulk=True)
+        self.assertFalse(DebitorenRechnung.objects.filter(titel='Miete & NK 03/2026').exists())
+
+
+class SollstellungPrognoseTests(TestCase):
+    """Die Prognose rechnet je Vertrag und Monat denselben Betrag, den der
+    Mietenlauf später stellt — und schreibt dabei nichts."""
+
+    setUp = SollstellungStapelTests.setUp
+
+    def _ergaenzen(self):
+        from rentals.models import VertragMietzins
+        lg = Liegenschaft.objects.get(strasse='Stapel 1')
+        lg.eigentuemer = Eigentuemer.objects.create(firma_oder_name='Erben Stapel')
+        lg.save()
+        e = Einheit.objects.create(liegenschaft=lg, bezeichnung='Whg 6', typ='wohnung')
+        m = Mieter.objects.create(typ='person', vorname='A', nachname='Auszug')
+        Mietvertrag.objects.create(mieter=m, einheit=e, beginn=date(2025, 1, 1), ende=date(2026, 4, 17),
+                                   status='gekuendigt', netto_mietzins=Decimal('1210'),
+                                   nebenkosten=Decimal('140'))
+        VertragMietzins.objects.create(vertrag=self.schon, gueltig_ab=date(2026, 5, 1),
+                                       netto_mietzins=Decimal('1040'), nebenkosten=Decimal('95'))
+
+    def test_gleich_wie_der_lauf(self):
+        from core.services.automation import run_sollstellung
+        from core.services.sollstellung_prognose import prognose
+        from finance.models import Buchung, DebitorenRechnung
+        self._ergaenzen()
+        ergebnis = prognose(date(2026, 2, 10), 6)
+        self.assertEqual(ergebnis['monate'], [(2026, m) for m in range(2, 8)])
+        self.assertFalse(DebitorenRechnung.objects.exists())
+        self.assertEqual(Buchung.objects.count(), 1)
+
+        for i, (jahr, monat) in enumerate(ergebnis['monate']):
+            run_sollstellung(jahr, monat, bulk=True)
+            gestellt = dict(DebitorenRechnung.objects.filter(titel=f'Miete & NK {monat:02d}/{jahr}')
+                            .values_list('vertrag_id', 'betrag'))
+            for zeile in ergebnis['zeilen']:
+                self.assertEqual(zeile['betraege'][i], gestellt.get(zeile['vertrag'].pk, Decimal('0.00')),
+                                 (zeile['vertrag'], monat))
+            self.assertEqual(ergebnis['total'][i], sum(gestellt.values()))
+        # Pro-Rata am Ende und Mietzinswechsel kamen vor
+        auszug = next(z for z in ergebnis['zeilen'] if z['vertrag'].ende)
+        self.assertEqual(auszug['betraege'][3:], [Decimal('0.00')] * 3)
+        self.assertLess(auszug['betraege'][2], auszug['betraege'][1])
+
+    def test_verdichten(self):
+        from core.services.sollstellung_prognose import prognose, verdichten
+        self._ergaenzen()
+        ergebnis = prognose(date(2026, 3, 1), 4)
+        je_et = verdichten(ergebnis, 'eigentuemer')
+        self.assertEqual([z['bezeichnung'] for z in je_et], ['Erben Stapel'])
+        self.assertEqual(je_et[0]['betraege'], ergebnis['total'])
+        self.assertEqual(verdichten(ergebnis, 'liegenschaft')[0]['betraege'], ergebnis['total'])
+        self.assertEqual(len(verdichten(ergebnis, 'vertrag')), len(ergebnis['zeilen']))
+        with self.assertRaises(ValueError):
+            verdichten(ergebnis, 'mieter')
+
+    def test_abfragen_wachsen_nicht_mit_vertraegen_und_monaten(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.services.sollstellung_prognose import prognose
+        with CaptureQueriesContext(connection) as wenige:
+            prognose(date(2026, 1, 1), 2)
+        lg = Liegenschaft.objects.get(strasse='Stapel 1')
+        for i in range(20):
+            e = Einheit.objects.create(liegenschaft=lg, bezeichnung=f'Zus {i}', typ='wohnung')
+            m = Mieter.objects.create(typ='person', vorname='Z', nachname=str(i))
+            Mietvertrag.objects.create(mieter=m, einheit=e, beginn=date(2025, 1, 1), status='aktiv',
+                                       netto_mietzins=Decimal('900'), nebenkosten=Decimal('80'))
+        with CaptureQueriesContext(connection) as viele:
+            prognose(date(2026, 1, 1), 24)
+        self.assertEqual(len(viele), len(wenige))
+
+    def test_json_und_csv(self):
+        self._ergaenzen()
+        c = Client(); c.force_login(_team_user())
+        r = c.get('/neu/sollstellung/prognose/?von=2026-03&monate=3&nach=eigentuemer')
+        self.assertEqual(r.status_code, 200)
+        daten = r.json()
+        self.assertEqual(daten['monate'], ['03/2026', '04/2026', '05/2026'])
+        self.assertEqual(daten['zeilen'][0]['bezeichnung'], 'Erben Stapel')
+        self.assertEqual(Decimal(daten['summe']), sum(Decimal(b) for b in daten['total']))
+        r = c.get('/neu/sollstellung/prognose/?von=2026-13&monate=x&format=csv')
+        self.assertEqual(r.status_code, 200)
+        zeilen = r.content.decode('utf-8-sig').splitlines()
+        self.assertNotIn('\ufeff', ''.join(zeilen))
+        self.assertTrue(zeilen[0].startswith('ID;Liegenschaft;'))
+        self.assertEqual(len(zeilen[0].split(';')), 2 + 12 + 1)
+        self.assertTrue(zeilen[-1].startswith(';Total;'))
+
+
+class BelegnummernkreisTests(TestCase):
+    """Belegnummern kommen aus dem Zähler der Verwaltung — lückenlos, je
+    Organisation ab 1, und ein Rückbau gibt reservierte Nummern zurück."""
+
+    def setUp(self):
+        self.org = _test_organisation()
+        self.lg = Liegenschaft.objects.create(organisation=self.org, strasse='Beleg 1', plz='8000',
+                                              ort='Zürich', versicherungswert=Decimal('1'))
+
+    def _buche(self, text='Test'):
+        from finance.booking import buche
+        return buche('4000', '1020', Decimal('10'), text, liegenschaft=self.lg)
+
+    def test_folge_und_block(self):
+        from django.db import transaction
+        from finance.models import Belegnummernkreis
+        self.assertEqual([self._buche().beleg_nr for _ in range(3)], [1, 2, 3])
+        with transaction.atomic():
+            self.assertEqual(Belegnummernkreis.reservieren(self.org.pk, 5), range(4, 9))
+        self.assertEqual(self._buche().beleg_nr, 9)
+
+    def test_rueckbau_hinterlaesst_keine_luecke(self):
+        from django.db import transaction
+        self._buche()
+        try:
+            with transaction.atomic():
+                self.assertEqual(self._buche().beleg_nr, 2)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(self._buche().beleg_nr, 2)
+
+    def test_jede_verwaltung_zaehlt_fuer_sich(self):
+        from django.db import transaction
+        from finance.models import Belegnummernkreis
+        for _ in range(4):
+            self._buche()
+        andere = Organisation.objects.create(firma='Andere AG', strasse='X 1', plz='3000', ort='Bern')
+        with transaction.atomic():
+            self.assertEqual(Belegnummernkreis.reservieren(andere.pk, 2), range(1, 3))
+
+    def test_zaehler_hinter_dem_journal_holt_auf(self):
+        """Nach `loaddata` oder einem Handeingriff: Die nächste Buchung zieht
+        nicht die belegte Nummer, sondern gleicht an und nimmt die nächste."""
+        from finance.models import Belegnummernkreis
+        for _ in range(3):
+            self._buche()
+        Belegnummernkreis.objects.update(letzte_nr=1)
+        self.assertEqual(self._buche().beleg_nr, 4)
+        self.assertEqual(Belegnummernkreis.objects.get().letzte_nr, 4)
+
+    def test_sequenzen_richten_gleicht_an_und_meldet_luecken(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from finance.models import Belegnummernkreis, Buchung
+        self._buche()
+        Buchung.objects.update(beleg_nr=5)
+        Belegnummernkreis.objects.update(letzte_nr=1)
+        aus = StringIO()
+        call_command('sequenzen_richten', stdout=aus)
+        self.assertIn('nicht lückenlos', aus.getvalue())
+        self.assertEqual(Belegnummernkreis.objects.get(organisation=self.org).letzte_nr, 5)
+
+
+class KontenplanZwischenspeicherTests(TestCase):
+    """Im Zwischenspeicher fragt `buche()` jede Kontonummer einmal ab; ein
+    geändertes Buchungskonto wird nicht aus dem Speicher geliefert."""
+
+    def setUp(self):
+        from finance.booking import ensure_kontenplan
+        self.org = _test_organisation()
+        self.lg = Liegenschaft.objects.create(organisation=self.org, strasse='Konto 1', plz='8000',
+                                              ort='Zürich', versicherungswert=Decimal('1'))
+        ensure_kontenplan()
+
+    def _konto_abfragen(self, queries):
+        return [q for q in queries
+                if q['sql'].startswith('SELECT') and 'FROM "core_buchungskonto"' in q['sql']]
+
+    def test_jedes_konto_einmal(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from finance.booking import buche, kontenplan_zwischenspeicher
+        with kontenplan_zwischenspeicher(), CaptureQueriesContext(connection) as ctx:
+            for _ in range(10):
+                buche('4000', '1020', Decimal('10'), 'Test', liegenschaft=self.lg)
+        self.assertEqual(len(self._konto_abfragen(ctx.captured_queries)), 2)
+
+    def test_ohne_speicher_unveraendert(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from finance.booking import buche
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(3):
+                buche('4000', '1020', Decimal('10'), 'Test', liegenschaft=self.lg)
+        self.assertEqual(len(self._konto_abfragen(ctx.captured_queries)), 6)
+
+    def test_speichern_leert_den_speicher(self):
+        from finance.booking import konto, kontenplan_zwischenspeicher
+        from finance.models import Buchungskonto
+        with kontenplan_zwischenspeicher():
+            k = konto('4000')
+            Buchungskonto.objects.filter(pk=k.pk).update(bezeichnung='Alt')
+            self.assertIs(konto('4000'), k)
+            frisch = Buchungskonto.objects.get(pk=k.pk)
+            frisch.bezeichnung = 'Neu'
+            frisch.save()
+            self.assertEqual(konto('4000').bezeichnung, 'Neu')
+
+    def test_fremde_verwaltung_sieht_eigenes_konto(self):
+        from core.tenancy import organisation_kontext
+        from finance.booking import ensure_kontenplan, konto, kontenplan_zwischenspeicher
+        andere = Organisation.objects.create(firma='Andere AG', strasse='X 1', plz='3000', ort='Bern')
+        with kontenplan_zwischenspeicher():
+            eigenes = konto('4000')
+            with organisation_kontext(andere):
+                ensure_kontenplan()
+                fremdes = konto('4000')
+        self.assertNotEqual(eigenes.pk, fremdes.pk)
+        self.assertEqual(fremdes.organisation_id, andere.pk)
+
+
+class SaldenbuchTests(TestCase):
+    """Das Saldenbuch läuft mit jedem Schreibweg des Journals mit — Einzel-
+    buchung, Stapel, Storno, Rückbau, gelöschte Liegenschaft — und die
+    Auswertungen daraus zeigen dieselben Zahlen wie das Journal."""
+
+    def setUp(self):
+        self.org = _test_organisation()
+        self.lg = Liegenschaft.objects.create(organisation=self.org, strasse='Saldo 1', plz='8000',
+                                              ort='Zürich', versicherungswert=Decimal('1'))
+
+    def _abweichungen(self):
+        from finance.models import Saldenbuch
+        return Saldenbuch.abweichungen(self.org.pk)
+
+    def test_einzelbuchung_und_storno(self):
+        from finance.booking import buche, storniere_buchung
+        from finance.models import Saldenbuch
+        buche('3000', '1100', Decimal('1500'), 'Miete', datum=date(2025, 3, 1), liegenschaft=self.lg)
+        b = buche('3000', '1100', Decimal('200'), 'Miete', datum=date(2025, 3, 2), liegenschaft=self.lg)
+        storniere_buchung(b, datum=date(2025, 4, 1))
+        self.assertEqual(self._abweichungen(), [])
+        zeile = Saldenbuch.objects.get(konto__nummer='3000', jahr=2025, monat=3)
+        self.assertEqual((zeile.soll, zeile.haben), (Decimal('1700.00'), Decimal('0.00')))
+
+    def test_rueckbau_laesst_saldenbuch_stehen(self):
+        from django.db import transaction
+        from finance.booking import buche
+        from finance.models import Saldenbuch
+        buche('3000', '1100', Decimal('100'), 'Miete', datum=date(2025, 3, 1))
+        try:
+            with transaction.atomic():
+                buche('3000', '1100', Decimal('50'), 'Miete', datum=date(2025, 3, 1))
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(Saldenbuch.objects.get(konto__nummer='3000').soll, Decimal('100.00'))
+
+    def test_stapel_sollstellung(self):
+        from core.services.automation import run_sollstellung
+        e = Einheit.objects.create(liegenschaft=self.lg, bezeichnung='Whg', typ='wohnung',
+                                   nettomiete_aktuell=Decimal('1500'), nebenkosten_aktuell=Decimal('200'))
+        Mietvertrag.objects.create(mieter=Mieter.objects.create(typ='person', vorname='A', nachname='B'),
+                                   einheit=e, netto_mietzins=Decimal('1500'), nebenkosten=Decimal('200'),
+                                   status='aktiv', beginn=date(2025, 1, 1))
+        run_sollstellung(2025, 5, bulk=True)
+        self.assertEqual(self._abweichungen(), [])
+
+    def test_jahresabschluss_aus_dem_saldenbuch(self):
+        from core.services.jahresabschluss import buche_jahresabschluss, salden_erfolgskonten
+        from finance.booking import buche
+        buche('1100', '3000', Decimal('1200'), 'Miete', datum=date(2025, 6, 1), liegenschaft=self.lg)
+        buche('4000', '1020', Decimal('300'), 'Unterhalt', datum=date(2025, 7, 1), liegenschaft=self.lg)
+        vorher = [(k.nummer, s) for k, s in salden_erfolgskonten(2025)]
+        self.assertEqual(vorher, [('3000', Decimal('1200.00')), ('4000', Decimal('300.00'))])
+        buche_jahresabschluss(2025)
+        # Die Abschlussbuchungen selbst zählen nicht mit.
+        self.assertEqual([(k.nummer, s) for k, s in salden_erfolgskonten(2025)], vorher)
+        self.assertEqual(self._abweichungen(), [])
+
+    def test_geloeschte_liegenschaft_zaehlt_ohne_liegenschaft_weiter(self):
+        from finance.booking import buche
+        from finance.models import Saldenbuch
+        buche('3000', '1100', Decimal('100'), 'Miete', datum=date(2025, 3, 1), liegenschaft=self.lg)
+        self.lg.delete()
+        self.assertEqual(self._abweichungen(), [])
+        self.assertEqual(Saldenbuch.objects.get(konto__nummer='3000').liegenschaft_id, None)
+
+    def test_befehl_prueft_und_baut_neu_auf(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from finance.booking import buche
+        from finance.models import Buchung
+        buche('3000', '1100', Decimal('100'), 'Miete', datum=date(2025, 3, 1))
+        Buchung.objects.update(betrag=Decimal('90'))          # am Saldenbuch vorbei
+        with self.assertRaises(CommandError):
+            call_command('saldenbuch', '--pruefen', stdout=StringIO())
+        call_command('saldenbuch', stdout=StringIO())
+        self.assertEqual(self._abweichungen(), [])
+        call_command('saldenbuch', '--pruefen', stdout=StringIO())
+
+
 class FinanzGuardTests(TestCase):
     """Sofort-Paket aus dem Buchhalter-Audit: Guards & Eingabe-Validierung."""
 
@@ -178,8 +178,12 @@ class MahnlaufTests(TestCase):
 
     def test_mahnlauf_legt_die_mahnung_in_die_akte(self):
         from core.services.automation import run_mahnlauf
+        from faelle import laufauftraege
         r = self._ueberfaellig(40)
         run_mahnlauf(send_email=False)
+        # Der Lauf rendert den Beleg nicht selbst — er reiht ihn ein.
+        self.assertEqual(self._mahn_dokumente(r.vertrag), [])
+        self.assertEqual(laufauftraege.abarbeiten(), 1)
         dok = self._mahn_dokumente(r.vertrag)
         self.assertEqual(len(dok), 1, "Mahnlauf legte kein Dokument am Vertrag ab")
         self.assertIn('2. Mahnung', dok[0].bezeichnung)
@@ -221,10 +225,140 @@ class MahnlaufTests(TestCase):
         from core.services.automation import run_mahnlauf
         from finance.models import Mahnung
         r = self._ueberfaellig(40)
+        from faelle import laufauftraege
+        from faelle.lauf_models import Laufauftrag
         with patch('core.services.ablage.ablage_mahnung', side_effect=RuntimeError('kaputt')):
             res = run_mahnlauf(send_email=False)
+            laufauftraege.abarbeiten()
         self.assertEqual(res['gemahnt'], 1)
         self.assertTrue(Mahnung.objects.filter(debitoren_rechnung=r).exists())
+        auftrag = Laufauftrag.objects.get(art='mahnbelege')
+        self.assertEqual((auftrag.status, auftrag.ergebnis),
+                         (Laufauftrag.FERTIG, {'abgelegt': 0, 'fehler': 1}))
+
+    # ---------- Zwei Phasen: planen, dann ausführen ----------
+
+    def test_probelauf_schreibt_nichts(self):
+        from core.services.automation import run_mahnlauf
+        from finance.models import Buchung, DebitorenRechnung, Mahnung
+        r = self._ueberfaellig(40)
+        buchungen = Buchung.objects.count()
+        res = run_mahnlauf(mit_zins=True, probelauf=True)
+        self.assertEqual([(s['rechnung'], s['stufe'], s['gebuehr'], s['per_email']) for s in res['plan']],
+                         [(r, 2, Decimal('20.00'), True)])
+        self.assertEqual(res['gemahnt'], 1)
+        self.assertGreater(res['zins'], Decimal('0.00'))
+        self.assertFalse(Mahnung.objects.exists())
+        self.assertEqual(DebitorenRechnung.objects.count(), 1)
+        self.assertEqual(Buchung.objects.count(), buchungen)
+        self.assertEqual(self._mahn_dokumente(), [])
+        # Der echte Lauf danach stellt genau den geplanten Schritt.
+        self.assertEqual(run_mahnlauf(send_email=False, mit_zins=True)['zins'], res['zins'])
+
+    def test_plan_rechnet_mit_teilzahlung_und_bisherigem_zins(self):
+        from core.services.automation import mahnlauf_planen, run_mahnlauf, verzugszins
+        from finance.models import Mahnung, Zahlungseingang
+        r = self._ueberfaellig(40)
+        Zahlungseingang.objects.create(vertrag=r.vertrag, debitoren_rechnung=r, betrag=Decimal('500'),
+                                       datum_eingang=r.faellig_am, status='verbucht')
+        Zahlungseingang.objects.create(vertrag=r.vertrag, debitoren_rechnung=r, betrag=Decimal('900'),
+                                       datum_eingang=r.faellig_am, status='offen')
+        Mahnung.objects.create(debitoren_rechnung=r, vertrag=r.vertrag, stufe=1,
+                               zins=Decimal('1.10'), betrag_offen=Decimal('1200'))
+        schritt, = mahnlauf_planen(mit_zins=True)['schritte']
+        self.assertEqual(schritt['offen'], r.offener_betrag)
+        self.assertEqual(schritt['offen'], Decimal('1200'))
+        self.assertEqual(schritt['zins'], verzugszins(Decimal('1200'), 40) - Decimal('1.10'))
+        self.assertEqual(run_mahnlauf(send_email=False)['gemahnt'], 1)
+        self.assertEqual(mahnlauf_planen()['schritte'], [])
+
+    def test_planen_abfragen_wachsen_nicht_mit_den_rechnungen(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.services.automation import mahnlauf_planen
+        r = self._ueberfaellig(40)
+        lg = r.liegenschaft
+        lg.eigentuemer = Eigentuemer.objects.create(firma_oder_name='Streng AG', mahn_konfig=[
+            {'stufe': 1, 'aktiv': True, 'ab_tage': 5, 'gebuehr': '10.00'},
+            {'stufe': 2, 'aktiv': False}, {'stufe': 3, 'aktiv': False}])
+        lg.save()
+        with CaptureQueriesContext(connection) as wenige:
+            mahnlauf_planen(mit_zins=True)
+        from finance.models import DebitorenRechnung, Mahnung
+        for tage in (10, 20, 35, 70, 100):
+            n = DebitorenRechnung.objects.create(
+                vertrag=r.vertrag, liegenschaft=lg, titel=f'Miete -{tage}', betrag=Decimal('1700'),
+                datum=r.datum, faellig_am=_heute() - timedelta(days=tage), status='offen')
+            Mahnung.objects.create(debitoren_rechnung=n, vertrag=r.vertrag, stufe=1)
+        with CaptureQueriesContext(connection) as viele:
+            plan = mahnlauf_planen(mit_zins=True)
+        self.assertEqual(len(viele), len(wenige))
+        # Eigentümer-Konfig gilt (ab 5 Tagen Stufe 1, Gebühr 10), Stufe 1 ist
+        # bei den neuen schon gestellt — nur die erste Rechnung bleibt.
+        self.assertEqual([(s['rechnung'].pk, s['gebuehr']) for s in plan['schritte']],
+                         [(r.pk, Decimal('10.00'))])
+        self.assertEqual(plan['geprueft'], 6)
+
+    def test_zustellung_erst_nach_allen_buchungen(self):
+        from core.services.automation import mahnlauf_ausfuehren, mahnlauf_planen
+        from finance.models import Mahnung
+        self._ueberfaellig(40); self._ueberfaellig(70)
+        gesehen = []
+
+        def zustellen(auftraege):
+            gesehen.append((len(auftraege), Mahnung.objects.count()))
+            return 0
+        res = mahnlauf_ausfuehren(mahnlauf_planen(), zustellen=zustellen)
+        self.assertEqual(res['gemahnt'], 2)
+        self.assertEqual(gesehen, [(2, 2)])
+
+    def test_ausfuehren_ueberspringt_inzwischen_gestellte_stufe(self):
+        from core.services.automation import mahnlauf_ausfuehren, mahnlauf_planen
+        from finance.models import Mahnung
+        r = self._ueberfaellig(40)
+        plan = mahnlauf_planen(send_email=False)
+        Mahnung.objects.create(debitoren_rechnung=r, vertrag=r.vertrag, stufe=2)   # paralleler Lauf
+        res = mahnlauf_ausfuehren(plan)
+        self.assertEqual((res['gemahnt'], res['uebersprungen']), (0, 1))
+        self.assertEqual(Mahnung.objects.count(), 1)
+
+    def test_ausfuehren_zaehlt_die_im_lauf_gestellte_stufe(self):
+        """Der parallele Lauf schreibt NACH dem Lesen des Stands — das
+        Unique fängt es ab, der Schritt wird gezählt, der Rest läuft weiter."""
+        from core.services.automation import mahnlauf_ausfuehren, mahnlauf_planen
+        from finance.models import Mahnung
+        self._ueberfaellig(40); self._ueberfaellig(70)
+        plan = mahnlauf_planen(send_email=False)
+        zweiter = plan['schritte'][1]
+
+        def fortschritt(n):
+            Mahnung.objects.create(debitoren_rechnung=zweiter['rechnung'],
+                                   vertrag=zweiter['rechnung'].vertrag, stufe=zweiter['stufe'])
+        res = mahnlauf_ausfuehren(plan, fortschritt=fortschritt, zustellen=lambda a: 0)
+        self.assertEqual((res['gemahnt'], res['uebersprungen']), (1, 1))
+        self.assertEqual(Mahnung.objects.count(), 2)
+
+    def test_fehler_in_der_buchung_ist_kein_paralleler_lauf(self):
+        from unittest import mock
+        from django.db import IntegrityError
+        from core.services.automation import mahnlauf_ausfuehren, mahnlauf_planen
+        from finance.models import Mahnung
+        self._ueberfaellig(40)
+        plan = mahnlauf_planen(send_email=False)
+        with mock.patch('finance.booking.buche', side_effect=IntegrityError('konto')):
+            with self.assertRaises(IntegrityError):
+                mahnlauf_ausfuehren(plan, zustellen=lambda a: 0)
+        self.assertFalse(Mahnung.objects.exists())
+
+    def test_vorschau_in_der_oberflaeche(self):
+        from finance.models import Mahnung
+        r = self._ueberfaellig(40)
+        c = Client(); c.force_login(_team_user())
+        antwort = c.post('/neu/mahnwesen/lauf/', {'probelauf': 'on', 'lg': r.liegenschaft_id})
+        self.assertEqual(antwort.status_code, 200)
+        self.assertContains(antwort, 'Mahnlauf-Vorschau')
+        self.assertContains(antwort, '2. Mahnung')
+        self.assertFalse(Mahnung.objects.exists())
 
 
 class FinanzCockpitTests(TestCase):
@@ -633,6 +767,63 @@ class DebitorenAgingTests(TestCase):
         self.assertEqual(len(r.context['rows']), 0)
 
 
+class OffenePostenQuerySetTests(TestCase):
+    """`DebitorenRechnung.objects.mit_offen()` / `offene_posten()`: der offene
+    Rest in SQL, gleich wie `offener_betrag`."""
+
+    def _daten(self):
+        from finance.models import DebitorenRechnung, Zahlungseingang
+        lg, e, m, v = _basis_objekte()
+
+        def rechnung(betrag, status='offen'):
+            return DebitorenRechnung.objects.create(vertrag=v, titel='Miete', betrag=Decimal(betrag),
+                                                    datum=date(2025, 1, 1), status=status)
+        offen = rechnung('1700')
+        teil = rechnung('1700', status='teilbezahlt')
+        voll = rechnung('1000')          # Status nie nachgeführt, aber bezahlt
+        ueber = rechnung('500')          # überzahlt: Rest 0, nicht negativ
+        rechnung('900', status='bezahlt')
+        for r, betrag, status in ((teil, '700', 'verbucht'), (teil, '300', 'verbucht'),
+                                  (teil, '999', 'offen'),     # nicht verbucht: zählt nicht
+                                  (voll, '1000', 'verbucht'), (ueber, '800', 'verbucht')):
+            Zahlungseingang.objects.create(vertrag=v, debitoren_rechnung=r, betrag=Decimal(betrag),
+                                           datum_eingang=date(2025, 1, 15), status=status)
+        return offen, teil, voll, ueber
+
+    def test_annotation_wie_property(self):
+        from finance.models import DebitorenRechnung
+        self._daten()
+        for r in DebitorenRechnung.objects.all():
+            annotiert = DebitorenRechnung.objects.mit_offen().get(pk=r.pk)
+            self.assertEqual(annotiert.offen, r.offener_betrag, r)
+        teil = DebitorenRechnung.objects.mit_offen().get(status='teilbezahlt')
+        self.assertEqual(teil.bezahlt, Decimal('1000.00'))
+        self.assertEqual(teil.offen, Decimal('700.00'))
+
+    def test_offene_posten_filtert_in_der_datenbank(self):
+        from django.db.models import Sum
+        from finance.models import DebitorenRechnung
+        offen, teil, _, _ = self._daten()
+        qs = DebitorenRechnung.objects.offene_posten()
+        self.assertEqual(set(qs.values_list('pk', flat=True)), {offen.pk, teil.pk})
+        self.assertEqual(qs.aggregate(s=Sum('offen'))['s'], Decimal('2400.00'))
+        self.assertEqual(list(qs.order_by('-offen').values_list('pk', flat=True)), [offen.pk, teil.pk])
+
+    def test_property_liest_annotation_ohne_abfrage(self):
+        from finance.models import DebitorenRechnung
+        self._daten()
+        rechnungen = list(DebitorenRechnung.objects.offene_posten())
+        with self.assertNumQueries(0):
+            summe = sum(r.offener_betrag for r in rechnungen)
+        self.assertEqual(summe, Decimal('2400.00'))
+
+    def test_rueckbezug_und_zweitmanager_kennen_mit_offen(self):
+        from finance.models import DebitorenRechnung
+        offen, *_ = self._daten()
+        self.assertEqual(offen.vertrag.debitoren_rechnungen.offene_posten().count(), 2)
+        self.assertEqual(DebitorenRechnung.alle_organisationen.offene_posten().count(), 2)
+
+
 class DebitorVorschauTests(TestCase):
     """Live-Vorschau bei der Ad-hoc-Debitorenrechnung (wie im Vertragsassistenten)."""
 
@@ -884,6 +1075,9 @@ class FinanzUIP5Tests(TestCase):
                                    nebenkosten=Decimal('150.00'))
         c = Client(); c.force_login(_team_user())
         c.post('/neu/sollstellung/starten/', {'jahr': 2024, 'monat': 5, 'lg': lg1.id})
+        # Der Knopf reiht ein; im Test läuft kein Worker, also hier abarbeiten.
+        from faelle.laufauftraege import abarbeiten
+        self.assertEqual(abarbeiten(), 1)
         titel = 'Miete & NK 05/2024'
         self.assertTrue(DebitorenRechnung.objects.filter(vertrag=v1, titel=titel).exists())
         self.assertFalse(DebitorenRechnung.objects.filter(vertrag__einheit=e2,
@@ -906,6 +1100,8 @@ class FinanzUIP5Tests(TestCase):
                                    nebenkosten=Decimal('150.00'))
         c = Client(); c.force_login(_team_user())
         c.post('/neu/sollstellung/starten/', {'jahr': 2024, 'monat': 5})
+        from faelle.laufauftraege import abarbeiten
+        abarbeiten()
         titel = 'Miete & NK 05/2024'
         self.assertEqual(DebitorenRechnung.objects.filter(titel=titel).count(), 2)
 
@@ -958,6 +1154,42 @@ class FinanzUIP5Tests(TestCase):
         r = c.get(f'/neu/debitoren/?lg={lg.id}')
         self.assertContains(r, f'seite=2&status=&q=&lg={lg.id}'.replace('status=&q=&', ''))
 
+    def test_blaettern_ueber_den_schluessel_deckt_sich_mit_offset(self):
+        """Weiter/Zurück über `nach`/`vor` liefert dieselben Seiten wie
+        `?seite=n` — über die Grenze offen/erledigt hinweg, ohne Lücke."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from finance.models import DebitorenRechnung
+        from finance.booking import ensure_kontenplan
+        ensure_kontenplan()
+        lg, e, m, v = _basis_objekte()
+        for i in range(130):
+            DebitorenRechnung.objects.create(
+                vertrag=v, liegenschaft=lg, einheit=e, titel=f'Position {i}',
+                betrag=Decimal('100.00'), datum=date(2024, 5, 1),
+                faellig_am=date(2024, 1, 1) + timedelta(days=i % 40),
+                status='offen' if i < 70 else 'bezahlt')
+        c = Client(); c.force_login(_team_user())
+        per_offset = [[z['r'].id for z in c.get(f'/neu/debitoren/?seite={n}').context['page']]
+                      for n in (1, 2, 3)]
+        seiten, url = [], '/neu/debitoren/'
+        for _n in range(3):
+            page = c.get(url).context['page']
+            seiten.append([z['r'].id for z in page])
+            url = f'/neu/debitoren/?seite={page.next_page_number()}&nach={page.weiter}'
+        self.assertEqual(seiten, per_offset)
+        self.assertIsNone(page.weiter)
+        self.assertEqual(page.paginator.count, 130)
+        zurueck = c.get(f'/neu/debitoren/?seite=2&vor={page.zurueck}').context['page']
+        self.assertEqual([z['r'].id for z in zurueck], per_offset[1])
+        # Beim Weiterblättern wird nicht mehr gezählt: dieselbe Seite über
+        # den Schlüssel kommt ohne die zwei `count()` der Abschnitte aus.
+        with CaptureQueriesContext(connection) as per_seite:
+            c.get('/neu/debitoren/?seite=2')
+        with CaptureQueriesContext(connection) as per_schluessel:
+            c.get(f'/neu/debitoren/?seite=2&vor={page.zurueck}')
+        self.assertEqual(len(per_schluessel), len(per_seite) - 2)
+
     # ---------- Apostroph im Namen bricht keinen Bestätigungsdialog ----------
     def test_apostroph_im_lieferantennamen_bricht_den_dialog_nicht(self):
         """Ein unmaskierter Name beendete den JS-String — der onsubmit-Handler
@@ -335,3 +335,47 @@ class BenutzerlisteTests(ZweiBestaende):
         self._als_a()
         antwort = self.client.get(reverse('fw_benutzer_bearbeiten', args=[self.a.benutzer.pk]))
         self.assertEqual(antwort.status_code, 200)
+
+
+class RollenJeAnfrageTests(ZweiBestaende):
+    """`hat_rolle` fragt je Anfrage nicht mehr nach (`core.auth.rollen_je_anfrage`).
+
+    Gemessen beim Umstellen: Die Vertragsseite stellte 22 Abfragen an
+    `Mitgliedschaft` — Dekorator, Badges, Navigation und `darf_oeffnen` je
+    Aktionsknopf. Danach ist es die eine der Middleware.
+    """
+
+    def test_eine_seite_liest_die_mitgliedschaft_einmal(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_login(self.a.benutzer)
+        with CaptureQueriesContext(connection) as abfragen:
+            antwort = self.client.get(f'/neu/vertraege/{self.a.vertrag.pk}/')
+        self.assertEqual(antwort.status_code, 200)
+        # Ausser der Frage der Zweifaktor-Middleware, ob eine der Verwaltungen
+        # den zweiten Faktor verlangt — das ist keine Rollenfrage.
+        rollenfragen = [q['sql'] for q in abfragen.captured_queries
+                        if 'FROM "crm_mitgliedschaft"' in q['sql']
+                        and '"zweifaktor_pflicht")' not in q['sql']]
+        self.assertEqual(len(rollenfragen), 1, rollenfragen)
+
+    def test_gemerkte_rolle_gilt_je_verwaltung_und_folgt_der_aenderung(self):
+        from core.auth import SCHREIB_ROLLEN, TEAM_ROLLEN, hat_rolle, rollen_je_anfrage
+        from core.tenancy import organisation_kontext
+        from crm.models import Mitgliedschaft
+
+        benutzer = self.a.benutzer
+        with rollen_je_anfrage(), organisation_kontext(self.a.organisation):
+            self.assertTrue(hat_rolle(benutzer, SCHREIB_ROLLEN))
+            with self.assertNumQueries(0):
+                self.assertTrue(hat_rolle(benutzer, TEAM_ROLLEN))
+            with organisation_kontext(self.b.organisation):
+                self.assertFalse(hat_rolle(benutzer, TEAM_ROLLEN))
+            m = Mitgliedschaft.objects.get(benutzer=benutzer)
+            m.rolle = Mitgliedschaft.ROLLE_LESEZUGRIFF
+            m.save()
+            self.assertFalse(hat_rolle(benutzer, SCHREIB_ROLLEN))
+            self.assertTrue(hat_rolle(benutzer, TEAM_ROLLEN))
+            m.delete()
+            self.assertFalse(hat_rolle(benutzer, TEAM_ROLLEN))
@@ -850,6 +850,71 @@ class AdminUmgehungTests(IsolationsBasis):
             list(modeladmin.get_queryset(anfrage))
 
 
+class AdminBaumTests(IsolationsBasis):
+    """Die Admin-Seitenleiste lädt stufenweise — und nur aus der eigenen
+    Verwaltung (`core.services.admin_baum`)."""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        cache.clear()
+        type(self.a.benutzer).objects.filter(pk=self.a.benutzer.pk).update(is_staff=True)
+
+    def _wurzeln(self, benutzer=None):
+        from django.test import RequestFactory
+
+        from core.context_processors import admin_baum_navigation
+        anfrage = RequestFactory().get('/admin/')
+        anfrage.user = benutzer or type(self.a.benutzer).objects.get(pk=self.a.benutzer.pk)
+        return admin_baum_navigation(anfrage)
+
+    def test_seite_laedt_nur_wurzeln_mit_gespeicherten_zahlen(self):
+        from core.tenancy import organisation_kontext
+
+        benutzer = type(self.a.benutzer).objects.get(pk=self.a.benutzer.pk)
+        with organisation_kontext(self.a.organisation):
+            # Ausgewertet wird erst im Template — der Prozessor allein fragt nichts ab.
+            with self.assertNumQueries(0):
+                wurzeln = self._wurzeln(benutzer)['custom_admin_nav']
+            erste = wurzeln()
+            with self.assertNumQueries(1):      # nur die Eigentümer, die Zahlen aus dem Cache
+                self.assertEqual(wurzeln(), erste)
+        self.assertEqual([k['id'] for k in erste], [self.a.eigentuemer.pk])
+        self.assertEqual(erste[0]['zusatz'], '1 Liegenschaft · 1 Einheit')
+        self.assertTrue(erste[0]['hat_kinder'])
+
+    def test_kinder_je_stufe_und_nichts_fremdes(self):
+        from portfolio.models import Einheit
+
+        def kinder(art, pk):
+            antwort = self.client.get(f'/admin/baum/{art}/{pk}/')
+            self.assertEqual(antwort.status_code, 200)
+            return antwort.json()['kinder']
+
+        lg = kinder('eigentuemer', self.a.eigentuemer.pk)
+        self.assertEqual([(k['art'], k['id']) for k in lg], [('liegenschaft', self.a.liegenschaft.pk)])
+        einheiten = kinder('liegenschaft', self.a.liegenschaft.pk)
+        self.assertEqual([k['id'] for k in einheiten], [self.a.einheit.pk])
+        blaetter = kinder('einheit', self.a.einheit.pk)
+        self.assertIn(('vertrag', self.a.vertrag.pk), [(k['art'], k['id']) for k in blaetter])
+
+        # Eine neue Einheit zählt sofort mit — das Signal verwirft die Zahlen.
+        Einheit.objects.create(liegenschaft=self.a.liegenschaft, bezeichnung='Neu', typ='whg',
+                               organisation_id=self.a.organisation.pk)
+        self.assertEqual(kinder('eigentuemer', self.a.eigentuemer.pk)[0]['zusatz'], '2 Einheiten')
+
+        for art, pk in (('eigentuemer', self.b.eigentuemer.pk), ('liegenschaft', self.b.liegenschaft.pk),
+                        ('einheit', self.b.einheit.pk), ('vertrag', self.a.vertrag.pk)):
+            with self.subTest(art=art):
+                self.assertEqual(self.client.get(f'/admin/baum/{art}/{pk}/').status_code, 404)
+
+    def test_nur_fuer_admin_benutzer(self):
+        type(self.a.benutzer).objects.filter(pk=self.a.benutzer.pk).update(is_staff=False)
+        antwort = self.client.get(f'/admin/baum/eigentuemer/{self.a.eigentuemer.pk}/')
+        self.assertEqual(antwort.status_code, 302)
+        self.assertEqual(self._wurzeln(), {})
+
+
 class CacheSchluesselTests(IsolationsBasis):
     """Ein Cache-Key ohne Organisations-ID ist ein Datenleck mit Verzögerung."""
 
@@ -712,6 +712,100 @@ class VertragMietzinsKomponentenTests(TestCase):
         self.assertEqual(okt.betrag, Decimal('1250.00'))   # 1000 + 250 wie bisher
 
 
+class MietzinsZeitachseTests(TestCase):
+    """Die Zeitachse liefert an jedem Datum dasselbe wie die Regeln direkt
+    (`_netto_am` & Co.), wird einmal gerechnet und nach jeder Änderung an
+    einer ihrer Quellen neu."""
+
+    def setUp(self):
+        _test_organisation()
+        lg, e, m, self.v = _basis_objekte()
+        self.v.beginn = date(2026, 1, 1)
+        self.v.netto_mietzins = Decimal('1000'); self.v.nebenkosten = Decimal('250')
+        self.v.save()
+
+    def _tage(self):
+        from datetime import timedelta
+        return [date(2025, 12, 1) + timedelta(days=n) for n in range(0, 800, 7)]
+
+    def _vergleiche(self, v):
+        for tag in self._tage():
+            self.assertEqual(
+                (v.effektiver_netto_mietzins(tag), v.effektive_nebenkosten(tag),
+                 v.verrechneter_netto_mietzins(tag), v.verrechnete_nebenkosten(tag)),
+                (v._netto_am(tag), v._nk_am(tag), v._verrechnet_netto_am(tag), v._verrechnet_nk_am(tag)),
+                tag)
+
+    def test_gleiche_werte_wie_die_regeln(self):
+        from portfolio.models import Sollmietzins
+        from rentals.models import MietzinsAnpassung, Staffelstufe, VertragMietzins
+        v = self.v
+        self._vergleiche(v)
+        MietzinsAnpassung.objects.create(vertrag=v, wirksam_ab=date(2026, 7, 1),
+                                         neuer_netto_mietzins=Decimal('1030'))
+        self._vergleiche(v)
+        v.mietzins_modell = 'staffel'
+        Staffelstufe.objects.create(vertrag=v, ab_datum=date(2027, 1, 1), netto_mietzins=Decimal('1100'))
+        self._vergleiche(v)
+        Sollmietzins.objects.create(einheit=v.einheit, gueltig_ab=date(2026, 3, 1),
+                                    netto_mietzins=Decimal('990'), nebenkosten=Decimal('240'),
+                                    rabatt_netto=Decimal('990'))
+        self._vergleiche(v)
+        VertragMietzins.objects.create(vertrag=v, gueltig_ab=date(2027, 6, 1),
+                                       netto_mietzins=Decimal('1200'), nebenkosten=Decimal('260'),
+                                       rabatt_nk=Decimal('60'))
+        self._vergleiche(v)
+        self.assertEqual(v.verrechnete_nebenkosten(date(2027, 6, 1)), Decimal('200'))
+
+    def test_einmal_gerechnet_danach_ohne_abfrage(self):
+        from rentals.models import Mietvertrag, VertragMietzins
+        VertragMietzins.objects.create(vertrag=self.v, gueltig_ab=date(2026, 4, 1),
+                                       netto_mietzins=Decimal('900'), nebenkosten=Decimal('250'))
+        v = (Mietvertrag.objects.select_related('einheit')
+             .prefetch_related('mietzins_komponenten', 'staffelstufen', 'anpassungen',
+                               'einheit__sollmietzinse').get(pk=self.v.pk))
+        v.effektiver_netto_mietzins(date(2026, 1, 1))
+        with self.assertNumQueries(0):
+            for tag in self._tage():
+                v.effektiver_netto_mietzins(tag)
+                v.verrechnete_nebenkosten(tag)
+        self.assertEqual([p[0] for p in v.mietzins_zeitachse()], [date.min, date(2026, 4, 1)])
+
+    def test_aenderung_an_einer_quelle_verwirft_die_zeitachse(self):
+        from portfolio.models import Sollmietzins
+        from rentals.models import VertragMietzins
+        v = self.v
+        self.assertEqual(v.effektiver_netto_mietzins(date(2026, 5, 1)), Decimal('1000'))
+        k = VertragMietzins.objects.create(vertrag=v, gueltig_ab=date(2026, 4, 1),
+                                           netto_mietzins=Decimal('900'), nebenkosten=Decimal('250'))
+        self.assertEqual(v.effektiver_netto_mietzins(date(2026, 5, 1)), Decimal('900'))
+        k.delete()
+        self.assertEqual(v.effektiver_netto_mietzins(date(2026, 5, 1)), Decimal('1000'))
+        Sollmietzins.objects.create(einheit=v.einheit, gueltig_ab=date(2026, 2, 1),
+                                    netto_mietzins=Decimal('950'), nebenkosten=Decimal('250'))
+        self.assertEqual(v.effektiver_netto_mietzins(date(2026, 5, 1)), Decimal('950'))
+        # Ungespeicherte Feldänderung am Vertrag selbst
+        v.nebenkosten = Decimal('300')
+        self.assertEqual(v.effektive_nebenkosten(date(2025, 12, 1)), Decimal('300'))
+
+    def test_staende_bleiben_begrenzt_und_verdraengte_verwerfen_trotzdem(self):
+        """Der Stand eines Vertrags fällt heraus, nachdem er weitergezählt
+        wurde — die vorher gemerkte Zeitachse darf trotzdem nicht gelten."""
+        from unittest.mock import patch
+        from rentals import models as rentals_models
+        from rentals.models import VertragMietzins
+        v = self.v
+        with patch.object(rentals_models, '_ZEITACHSE_HOECHSTENS', 2):
+            self.assertEqual(v.effektiver_netto_mietzins(date(2026, 5, 1)), Decimal('1000'))
+            VertragMietzins.objects.create(vertrag=v, gueltig_ab=date(2026, 4, 1),
+                                           netto_mietzins=Decimal('900'), nebenkosten=Decimal('250'))
+            for pk in (-1, -2):
+                rentals_models._zeitachse_weiterzaehlen('vertrag', pk)
+            self.assertNotIn(('vertrag', v.pk), rentals_models._ZEITACHSE_STAND)
+            self.assertLessEqual(len(rentals_models._ZEITACHSE_STAND), 2)
+            self.assertEqual(v.effektiver_netto_mietzins(date(2026, 5, 1)), Decimal('900'))
+
+
 class VertragMietzinsUITests(TestCase):
     """Komponenten am Vertrag: UI (Mietzins-Tab), Add/Del, PDF-Anzeige."""
 
@@ -1061,3 +1155,82 @@ class VertragMietzinsRabattTests(TestCase):
         self.assertIn('Referenzmiete', html)
         self.assertIn('Zu bezahlen', html)
         self.assertIn('mietzinsfrei', html)
+
+
+class SenkungsanspruchTests(TestCase):
+    """`Mietvertrag.senkungsanspruch`: für den ganzen Bestand nachgeführt,
+    sobald sich Zinsstand, Vertrag oder Anpassung ändern."""
+
+    def _vertrag(self, basis='1.50'):
+        _lg, _e, _m, v = _basis_objekte()
+        v.basis_referenzzinssatz = Decimal(basis)
+        v.save()
+        return v
+
+    def _anspruch(self, v):
+        v.refresh_from_db(fields=['senkungsanspruch'])
+        return v.senkungsanspruch
+
+    def _frisch(self, v):
+        # Frisch geladen, damit `mietzinspotenzial` den neuen Zinsstand liest
+        # und nicht die beim Anlegen zwischengespeicherte Verwaltung.
+        return Mietvertrag.alle_organisationen.get(pk=v.pk)
+
+    def test_merkmal_folgt_zins_vertrag_und_anpassung(self):
+        from core.services.senkungsanspruch import aktualisieren
+        from core.tenancy import organisation_kontext
+        from faelle.lage import _senkungsansprueche
+        from rentals.models import MietzinsAnpassung
+
+        _test_organisation(aktueller_referenzzinssatz=Decimal('1.50'))
+        v = self._vertrag('1.50')
+        self.assertFalse(self._anspruch(v))
+        # Die Verwaltung senkt ihren Zinsstand → Anspruch, ohne den Vertrag anzufassen.
+        vw = _test_organisation(aktueller_referenzzinssatz=Decimal('1.25'))
+        self.assertTrue(self._anspruch(v))
+        self.assertEqual(self._frisch(v).mietzinspotenzial, 'decrease')
+        with organisation_kontext(vw):
+            self.assertEqual(_senkungsansprueche(), 1)
+
+        # Eine wirksame Anpassung auf den neuen Satz erledigt ihn; gelöscht lebt er wieder auf.
+        anpassung = MietzinsAnpassung.objects.create(
+            vertrag=v, wirksam_ab=date(2025, 1, 1), neuer_netto_mietzins=Decimal('1455'),
+            neuer_referenzzinssatz=Decimal('1.25'))
+        self.assertFalse(self._anspruch(v))
+        anpassung.delete()
+        self.assertTrue(self._anspruch(v))
+
+        # Eine künftige Anpassung gilt erst ab ihrem Stichtag — das holt der tägliche Lauf nach.
+        MietzinsAnpassung.objects.create(
+            vertrag=v, wirksam_ab=date(2099, 1, 1), neuer_netto_mietzins=Decimal('1455'),
+            neuer_referenzzinssatz=Decimal('1.25'))
+        self.assertTrue(self._anspruch(v))
+        self.assertEqual(aktualisieren(vw, stichtag=date(2099, 1, 1)), 1)
+        self.assertFalse(self._anspruch(v))
+
+        # Nur aktive Verträge haben einen Anspruch.
+        aktualisieren(vw)
+        self.assertTrue(self._anspruch(v))
+        v.status = 'gekuendigt'
+        v.save()
+        self.assertFalse(self._anspruch(v))
+
+    def test_ganzer_bestand_in_zwei_abfragen(self):
+        from core.services.senkungsanspruch import aktualisieren
+
+        _test_organisation(aktueller_referenzzinssatz=Decimal('1.75'))
+        vertraege = [self._vertrag('1.75') for _ in range(12)]
+        vertraege.append(self._vertrag('1.25'))
+        # Ohne Signal gesenkt, wie ein Import es täte: Nichts ist nachgeführt.
+        Organisation.objects.update(aktueller_referenzzinssatz=Decimal('1.50'))
+        vw = _test_organisation()
+        self.assertFalse(any(self._anspruch(v) for v in vertraege))
+
+        with self.assertNumQueries(2):
+            self.assertEqual(aktualisieren(vw), 12)
+        self.assertEqual([self._anspruch(v) for v in vertraege], [True] * 12 + [False])
+        # Dasselbe Ergebnis wie die Prüfung je Vertrag.
+        self.assertEqual([self._anspruch(v) for v in vertraege],
+                         [self._frisch(v).mietzinspotenzial == 'decrease' for v in vertraege])
+        with self.assertNumQueries(2):
+            self.assertEqual(aktualisieren(vw), 0)
@@ -144,6 +144,104 @@ class NkAbrechnungVersandTests(TestCase):
         self.assertTrue(generate_nk_pdf_einzeln(k2).startswith(b'%PDF'))
 
 
+class NebenkostenlaufTests(TestCase):
+    """`core.services.nebenkostenlauf`: ein Jahr in einem Zug, wiederaufsetzbar."""
+
+    _periode = NkAbrechnungVersandTests._periode
+
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        tmp = tempfile.TemporaryDirectory(); self.addCleanup(tmp.cleanup)
+        ov = override_settings(MEDIA_ROOT=tmp.name); ov.enable()
+        self.addCleanup(ov.disable)
+        self.lg, self.e, self.m, self.v, self.p = self._periode()
+        e2 = Einheit.objects.create(liegenschaft=self.lg, bezeichnung='2.5 Zi', typ='wohnung',
+                                    flaeche_m2=Decimal('40'))
+        m2 = Mieter.objects.create(typ='person', vorname='Otto', nachname='Zwei',
+                                   strasse='Weg 2', plz='8000', ort='ZH')
+        self.v2 = Mietvertrag.objects.create(mieter=m2, einheit=e2, beginn=date(2023, 1, 1),
+                                             netto_mietzins=Decimal('900'), nebenkosten=Decimal('100'),
+                                             status='aktiv', nk_abrechnungsart='akonto')
+
+    def _dokumente(self):
+        from rentals.models import Dokument
+        return Dokument.objects.filter(bezeichnung='Nebenkostenabrechnung NK 2023')
+
+    def test_legt_je_mieter_ab_und_schreibt_das_manifest(self):
+        from core.services.nebenkostenlauf import manifest_lesen, nebenkostenlauf
+        res = nebenkostenlauf(2023)
+        self.assertEqual((res['abgelegt'], res['uebersprungen'], res['fehler']), (2, 0, 0))
+        self.assertEqual(sorted(self._dokumente().values_list('vertrag_id', flat=True)),
+                         sorted([self.v.pk, self.v2.pk]))
+        manifest = manifest_lesen(_test_organisation(), 2023)
+        zeile = manifest['abrechnungen'][f'{self.p.pk}:{self.v.pk}']
+        self.assertEqual(zeile['mieter'], 'Nina Kosten')
+        self.assertEqual(zeile['dokument'], self._dokumente().get(vertrag=self.v).pk)
+        # Andere Jahre bleiben unberührt.
+        self.assertEqual(nebenkostenlauf(2022)['abgelegt'], 0)
+
+    def test_zweiter_lauf_ueberspringt_und_neu_ersetzt_ohne_doppel(self):
+        from core.services.nebenkostenlauf import nebenkostenlauf
+        nebenkostenlauf(2023)
+        res = nebenkostenlauf(2023)
+        self.assertEqual((res['abgelegt'], res['uebersprungen']), (0, 2))
+        res = nebenkostenlauf(2023, neu=True)
+        self.assertEqual((res['abgelegt'], res['uebersprungen']), (2, 0))
+        self.assertEqual(self._dokumente().count(), 2)
+
+    def test_angehalten_macht_der_naechste_lauf_weiter(self):
+        from unittest import mock
+        from core.services import nebenkostenlauf as lauf
+        with mock.patch.object(lauf, 'STAPEL', 1):
+            res = lauf.nebenkostenlauf(2023, fortschritt=lambda erledigt, gesamt: False)
+            self.assertEqual(res['abgelegt'], 1)
+            self.assertEqual(self._dokumente().count(), 1)
+            res = lauf.nebenkostenlauf(2023)
+        self.assertEqual((res['abgelegt'], res['uebersprungen']), (1, 1))
+        self.assertEqual(self._dokumente().count(), 2)
+
+    def test_zeichnen_im_prozess_pool(self):
+        import multiprocessing
+        from core.services.nebenkostenlauf import nebenkostenlauf
+        # Unter `manage.py test --parallel` ist der Testprozess ein Daemon und
+        # dürfte keinen Pool starten; für die Dauer des Tests nicht.
+        konfig = multiprocessing.current_process()._config
+        daemon = konfig.get('daemon')
+        konfig['daemon'] = False
+        self.addCleanup(konfig.__setitem__, 'daemon', daemon)
+        res = nebenkostenlauf(2023, prozesse=2)
+        self.assertEqual(res['abgelegt'], 2)
+        for d in self._dokumente():
+            with d.datei.open('rb') as f:
+                self.assertTrue(f.read().startswith(b'%PDF'))
+
+    def test_ablegen_stapel_ersetzt_gleichen_titel(self):
+        from core.services.ablage import ablegen_stapel
+        erster, = ablegen_stapel([(b'%PDF-1', 'Brief', self.v, 'brief')])
+        zweiter, dritter = ablegen_stapel([(b'%PDF-2', 'Brief', self.v, 'brief'),
+                                           (b'%PDF-3', 'Brief', self.v2, 'brief')])
+        self.assertEqual(zweiter.pk, erster.pk)
+        self.assertNotEqual(dritter.pk, erster.pk)
+        self.assertEqual(dritter.organisation_id, self.v2.organisation_id)
+        with zweiter.datei.open('rb') as f:
+            self.assertEqual(f.read(), b'%PDF-2')
+
+    def test_knopf_reiht_einen_auftrag_ein(self):
+        from faelle.laufauftraege import abarbeiten
+        from faelle.lauf_models import Laufauftrag
+        c = Client(); c.force_login(_team_user())
+        self.assertIn('/neu/nebenkosten/lauf/', c.get('/neu/nebenkosten/').content.decode())
+        r = c.post('/neu/nebenkosten/lauf/', {'jahr': '2023'})
+        auftrag = Laufauftrag.objects.get(art='nebenkostenlauf')
+        self.assertTrue(r['Location'].startswith(f'/neu/auftraege/{auftrag.pk}/'))
+        abarbeiten()
+        auftrag.refresh_from_db()
+        self.assertEqual(auftrag.status, 'fertig', auftrag.fehler)
+        self.assertEqual(auftrag.ergebnis['abgelegt'], 2)
+        self.assertTrue(auftrag.datei)
+
+
 class NkNachzahlungQrTests(TestCase):
     def setUp(self):
         _test_organisation()   # bucht ohne eigene Liegenschaft — Verwaltung muss existieren
@@ -484,3 +582,155 @@ class NebenkostenPersonenTests(TestCase):
         self.assertEqual(anteil[v1.id], Decimal('100.00'))
         self.assertEqual(anteil[v2.id], Decimal('300.00'))
         self.assertEqual(Decimal(str(r['differenz'])), Decimal('0.00'))
+
+
+class NkVerteilungRegressionTests(TestCase):
+    """Die Verteilung rechnet monatsweise und in einem Durchgang über alle
+    Verträge — auf den Rappen dieselben Zeilen wie die frühere Tagesschleife.
+
+    Die erwarteten Werte stammen aus der Engine vor der Umstellung: eine
+    Periode über den Jahreswechsel mit Schaltjahr, Ein- und Auszügen mitten im
+    Monat, Leerstand, Akonto und Pauschal und allen vier Schlüsseln."""
+
+    ERWARTET = ('15646.81', [
+        ('mieter_akonto', 'E0', '01.07.24', '3507.21', '2154.10', '1353.11'),
+        ('mieter_akonto', 'E1', '01.07.24', '275.20', '417.05', '-141.85'),
+        ('mieter_akonto', 'E1', '01.11.24', '1201.44', '1031.48', '169.96'),
+        ('leerstand', 'E1', '-', '59.87', '0.00', '59.87'),
+        ('mieter_pauschal', 'E2', '17.08.24', '5157.52', '5157.52', '0.00'),
+        ('leerstand', 'E2', '-', '153.02', '0.00', '153.02'),
+        ('leerstand', 'E3', '-', '1593.84', '0.00', '1593.84'),
+        ('mieter_akonto', 'E4', '01.07.24', '2205.64', '1274.75', '930.88'),
+        ('leerstand', 'E4', '-', '933.09', '0.00', '933.09'),
+        ('mieter_pauschal', 'E5', '01.07.24', '2286.36', '2286.36', '0.00'),
+    ])
+
+    def _periode(self):
+        from finance.models import AbrechnungsPeriode, NebenkostenBeleg
+        lg = Liegenschaft.objects.create(organisation=_test_organisation(), strasse='Verteilung 1',
+                                         plz='4500', ort='SO', versicherungswert=Decimal('1'))
+        vertraege = [
+            # (Fläche, Volumen, [(Beginn, Ende, Akonto/Monat, Art, Personen), ...])
+            ('71.5', '190', [(date(2020, 1, 1), None, '180', 'akonto', 2)]),
+            ('48', None, [(date(2023, 5, 1), date(2024, 10, 14), '120', 'akonto', 1),
+                          (date(2024, 11, 1), None, '130', 'akonto', 3)]),
+            ('102.25', '300.5', [(date(2024, 8, 17), None, '250', 'pauschal', 4)]),
+            ('33', '80', []),
+            ('64', '171', [(date(2021, 3, 1), date(2025, 2, 28), '160', 'akonto', 2)]),
+            ('88.8', None, [(date(2019, 1, 1), None, '0', 'inbegriffen', 1)]),
+        ]
+        for i, (m2, m3, liste) in enumerate(vertraege):
+            e = Einheit.objects.create(liegenschaft=lg, bezeichnung=f'E{i}', typ='wohnung',
+                                       flaeche_m2=Decimal(m2),
+                                       volumen_m3=Decimal(m3) if m3 else None)
+            for j, (beginn, ende, akonto, art, personen) in enumerate(liste):
+                m = Mieter.objects.create(typ='person', vorname='M', nachname=f'{i}{j}',
+                                          strasse='W', plz='4500', ort='SO')
+                Mietvertrag.objects.create(mieter=m, einheit=e, beginn=beginn, ende=ende,
+                                           netto_mietzins=Decimal('1000'), nebenkosten=Decimal(akonto),
+                                           status='aktiv' if ende is None else 'beendet',
+                                           nk_abrechnungsart=art, anzahl_personen=personen)
+        p = AbrechnungsPeriode.objects.create(liegenschaft=lg, bezeichnung='2024/25',
+                                              start_datum=date(2024, 7, 1),
+                                              ende_datum=date(2025, 6, 30))
+        for text, kategorie, schluessel, betrag in [
+                ('Heizung', 'heizung', 'm2', '8123.45'), ('Hauswart', 'hauswart', 'm2', '3100.10'),
+                ('Lift', 'lift', 'einheit', '1777.77'), ('Kehricht', 'kehricht', 'personen', '955.20'),
+                ('Wasser', 'wasser', 'm3', '1234.56')]:
+            NebenkostenBeleg.objects.create(periode=p, text=text, kategorie=kategorie,
+                                            verteilschluessel=schluessel, betrag=Decimal(betrag),
+                                            datum=date(2024, 12, 1))
+        return p
+
+    def test_zeilen_auf_den_rappen_unveraendert(self):
+        from core.utils.billing import berechne_abrechnung
+        r = berechne_abrechnung(self._periode().id)
+        zeilen = [(z['typ'], z['einheit'], z['von'], str(z['kosten_anteil']), str(z['akonto']),
+                   str(z['saldo'])) for z in r['abrechnungen']]
+        self.assertEqual((str(r['total_kosten']), zeilen), self.ERWARTET)
+
+    def test_heizgradtage_monatsweise_wie_tageweise(self):
+        import calendar
+        import datetime
+        from core.utils.billing import HGT_VERTEILUNG, get_heizgradtage_fuer_zeitraum
+
+        def tageweise(von, bis):
+            total, tag = Decimal('0'), von
+            while tag <= bis:
+                total += Decimal(HGT_VERTEILUNG[tag.month]) / calendar.monthrange(tag.year, tag.month)[1]
+                tag += datetime.timedelta(days=1)
+            return total / 100
+
+        for von, bis in [(date(2024, 7, 1), date(2025, 6, 30)), (date(2024, 2, 10), date(2024, 2, 10)),
+                         (date(2023, 12, 17), date(2024, 3, 3)), (date(2024, 6, 1), date(2024, 8, 31))]:
+            with self.subTest(von=von, bis=bis):
+                self.assertEqual(get_heizgradtage_fuer_zeitraum(von, bis).quantize(Decimal('1e-20')),
+                                 tageweise(von, bis).quantize(Decimal('1e-20')))
+        self.assertEqual(get_heizgradtage_fuer_zeitraum(date(2024, 5, 2), date(2024, 5, 1)), 0)
+
+    def test_abfragen_wachsen_nicht_mit_den_einheiten(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.utils.billing import berechne_abrechnung
+        p = self._periode()
+        with CaptureQueriesContext(connection) as wenige:
+            berechne_abrechnung(p.id)
+        for i in range(10):
+            e = Einheit.objects.create(liegenschaft=p.liegenschaft, bezeichnung=f'X{i}',
+                                       typ='wohnung', flaeche_m2=Decimal('40'))
+            Mietvertrag.objects.create(
+                mieter=Mieter.objects.create(typ='person', vorname='X', nachname=str(i)),
+                einheit=e, beginn=date(2024, 1, 1), netto_mietzins=Decimal('900'),
+                nebenkosten=Decimal('100'), status='aktiv', nk_abrechnungsart='akonto')
+        with CaptureQueriesContext(connection) as viele:
+            berechne_abrechnung(p.id)
+        self.assertEqual(len(viele), len(wenige))
+
+
+class ZaehlerVerbrauchTests(TestCase):
+    """`core.services.verbrauch`: erster und letzter Stand im Zeitraum je
+    Zähler aus einer Abfrage, summiert je Einheit und Zählerart."""
+
+    def setUp(self):
+        from portfolio.models import Zaehler, ZaehlerStand
+        self.lg, self.e1, _, _ = _basis_objekte()
+        self.e2 = Einheit.objects.create(liegenschaft=self.lg, bezeichnung='B', typ='wohnung',
+                                         flaeche_m2=Decimal('50'))
+
+        def zaehler(typ, staende, **ort):
+            z = Zaehler.objects.create(typ=typ, zaehler_nummer=typ, **ort)
+            for tag, wert in staende:
+                ZaehlerStand.objects.create(zaehler=z, datum=tag, wert=Decimal(wert))
+            return z
+
+        self.wmz1 = zaehler('Wärmezähler', [(date(2023, 12, 31), '50'), (date(2024, 1, 5), '100'),
+                                            (date(2024, 6, 30), '160'), (date(2024, 12, 31), '400')],
+                            einheit=self.e1)
+        zaehler('Heizung WMZ', [(date(2024, 1, 1), '10'), (date(2024, 12, 31), '70')], einheit=self.e2)
+        zaehler('Wasser warm', [(date(2024, 2, 1), '5'), (date(2024, 2, 1), '6'),
+                                (date(2024, 11, 1), '26')], einheit=self.e1)
+        zaehler('Strom', [(date(2024, 3, 1), '900')], einheit=self.e2)        # nur eine Ablesung
+        zaehler('Allgemeinstrom', [(date(2024, 1, 1), '1000'), (date(2024, 12, 1), '2500')],
+                liegenschaft=self.lg)
+
+    def test_je_einheit_und_art(self):
+        from core.services.verbrauch import verbrauch_je_einheit
+        self.assertEqual(verbrauch_je_einheit(self.lg, date(2024, 1, 1), date(2024, 12, 31)), {
+            self.e1.id: {'waerme': Decimal('300'), 'wasser': Decimal('21')},
+            self.e2.id: {'waerme': Decimal('60')},
+            None: {'strom': Decimal('1500')},
+        })
+
+    def test_eine_abfrage_fuer_alle_staende(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.services.verbrauch import verbrauch_je_einheit
+        with CaptureQueriesContext(connection) as ctx:
+            verbrauch_je_einheit(self.lg, date(2024, 1, 1), date(2024, 12, 31))
+        self.assertEqual(len(ctx), 2)
+
+    def test_hkvo_verteilt_nach_gemessenem_verbrauch(self):
+        from core.utils.billing import _heiz_verbrauch_pro_einheit
+        self.assertEqual(_heiz_verbrauch_pro_einheit(self.lg, date(2024, 1, 1), date(2024, 12, 31)),
+                         {self.e1.id: Decimal('300'), self.e2.id: Decimal('60')})
+        self.assertEqual(_heiz_verbrauch_pro_einheit(self.lg, date(2024, 7, 1), date(2024, 12, 31)), {})
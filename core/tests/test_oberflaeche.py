@@ -120,6 +120,22 @@ class NachtN4UITests(TestCase):
         self.assertIn('Seite 2/2', body2)
 
 
+    def test_personenliste_blaettert(self):
+        from core.views.fw.listen import LISTE_GROESSE
+        lg, e, m, v = _basis_objekte()
+        for i in range(LISTE_GROESSE + 4):
+            Mieter.objects.create(vorname='P', nachname=f'Person {i:03d}')
+        u = _team_user(); c = Client(); c.force_login(u)
+        r = c.get('/neu/personen/')
+        page = r.context['page']
+        self.assertEqual(page.paginator.count, LISTE_GROESSE + 5)
+        self.assertEqual(len(r.context['rows']), LISTE_GROESSE)
+        self.assertEqual(r.context['mit_vertrag_count'], 1)
+        self.assertContains(r, f'nach={page.weiter}')
+        r2 = c.get(f'/neu/personen/?seite=2&nach={page.weiter}')
+        self.assertEqual([z['m'].nachname for z in r2.context['rows']],
+                         [f'Person {i:03d}' for i in range(LISTE_GROESSE - 1, LISTE_GROESSE + 4)])
+
 class NachtN10UIDetailTests(TestCase):
     """Nacht-Audit N10: Vertrag-Detail-Aktionsleiste mit Dropdown, Pflichtfelder,
     CHF-Präfixe, echte Links in Detail-Tabellen."""
@@ -705,3 +721,51 @@ class FaviconKonsistenzTests(TestCase):
         r = Client().get('/login/')
         self.assertEqual(r.status_code, 200)
         self.assertContains(r, 'rel="icon"')
+
+
+class SuchindexTests(TestCase):
+    """Suche über `core.Suchdokument` (core.services.suche): tippfehler-
+    tolerant in der globalen Suche, Teilstring in den Listen, nachgezogen
+    über Signale, neu aufgebaut per Befehl."""
+
+    def test_globale_suche_verzeiht_tippfehler_und_akzente(self):
+        _lg, e, m, v = _basis_objekte()
+        c = Client(); c.force_login(_team_user())
+        r = c.get('/neu/suche/?q=Mustr')
+        self.assertEqual([p.pk for p in r.context['personen']], [m.pk])
+        self.assertEqual([x.pk for x in r.context['vertraege']], [v.pk])
+        # «Zuerich» findet das Objekt an der Zürcher Adresse
+        r = c.get('/neu/suche/?q=Zuerich')
+        self.assertEqual([x.pk for x in r.context['objekte']], [e.pk])
+        r = c.get('/neu/suche/?q=qqqxxx')
+        self.assertEqual(r.context['total'], 0)
+
+    def test_umbenannter_mieter_zieht_vertrag_und_rechnung_nach(self):
+        from finance.models import DebitorenRechnung
+        _lg, _e, m, v = _basis_objekte()
+        rechnung = DebitorenRechnung.objects.create(vertrag=v, titel='Mietzins Mai',
+                                                    betrag=Decimal('1700'))
+        m.nachname = 'Brändli'
+        m.save()
+        c = Client(); c.force_login(_team_user())
+        r = c.get('/neu/vertraege/?q=brandli')
+        self.assertEqual([row['v'].pk for row in r.context['rows']], [v.pk])
+        r = c.get('/neu/debitoren/?q=Brändli')
+        self.assertIn(rechnung.pk, [row['r'].pk for row in r.context['rows']])
+        r = c.get('/neu/vertraege/?q=Muster')
+        self.assertEqual(r.context['rows'], [])
+
+    def test_neuaufbau_stellt_den_index_wieder_her(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from core.models import Suchdokument
+        _basis_objekte()
+        vorher = set(Suchdokument.objects.values_list('art', 'objekt_id', 'text'))
+        self.assertEqual({art for art, _, _ in vorher}, {'mieter', 'vertrag', 'einheit'})
+        Suchdokument.objects.all().delete()
+        call_command('suchindex_aufbauen', stdout=StringIO())
+        self.assertEqual(set(Suchdokument.objects.values_list('art', 'objekt_id', 'text')), vorher)
+        # Ein zweiter Lauf findet nichts mehr zu tun.
+        aus = StringIO()
+        call_command('suchindex_aufbauen', stdout=aus)
+        self.assertIn('mieter 0, vertrag 0, einheit 0, rechnung 0', aus.getvalue())
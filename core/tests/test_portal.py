@@ -4,10 +4,11 @@ from datetime import date, timedelta
 from decimal import Decimal
 
 from django.contrib import admin
-from django.test import TestCase, Client
+from django.core.mail.backends import locmem
+from django.test import TestCase, Client, override_settings
 from ._helfer import (
     _test_organisation,
-    _team_user, _basis_objekte, Mieter, Eigentuemer, Organisation,
+    _team_user, _basis_objekte, _seed_konten, Mieter, Eigentuemer, Organisation,
     Liegenschaft, Einheit, Mietvertrag, User)
 
 
@@ -47,6 +48,99 @@ class EigentuemerPortalTests(TestCase):
         self.assertEqual(c.get(f'/portal/dokument/{d.id}/').status_code, 404)
 
 
+class EigentuemerPortfolioTests(TestCase):
+    """`core.services.eigentuemer_portfolio`: feste Zahl Abfragen, gleiche
+    Zahlen wie vorher, Zwischenspeicher mit Verwerfen bei Änderungen."""
+
+    def _portfolio(self, liegenschaften=1):
+        from finance.models import DebitorenRechnung
+        lg, e, m, v = _basis_objekte()
+        md = Eigentuemer.objects.create(firma_oder_name='Eigentümer AG')
+        lg.eigentuemer = md; lg.save()
+        heute = date.today()
+        DebitorenRechnung.objects.create(vertrag=v, titel='Miete alt', betrag=Decimal('1700'),
+                                         datum=heute - timedelta(days=40),
+                                         faellig_am=heute - timedelta(days=35), status='offen')
+        for i in range(liegenschaften - 1):
+            weitere = Liegenschaft.objects.create(organisation=_test_organisation(), eigentuemer=md,
+                                                  strasse=f'Weg {i}', plz='8000', ort='Zürich')
+            for j in range(3):
+                einheit = Einheit.objects.create(liegenschaft=weitere, bezeichnung=f'{j}. OG')
+                if j:
+                    Mietvertrag.objects.create(mieter=m, einheit=einheit, beginn=date(2024, 1, 1),
+                                               netto_mietzins=Decimal('1000'), nebenkosten=Decimal('100'),
+                                               status='aktiv')
+        return md, lg, v
+
+    def test_kennzahlen(self):
+        from core.services.eigentuemer_portfolio import portfolio_daten
+        md, lg, v = self._portfolio(liegenschaften=2)
+        d = portfolio_daten(md, zwischenspeicher=False)
+        self.assertEqual(len(d['liegenschaften']), 2)
+        self.assertEqual(d['total_einheiten'], 4)
+        self.assertEqual(d['total_vermietet'], 3)
+        self.assertEqual(d['total_soll'], Decimal('3900.00'))      # 1700 + 2 × 1100
+        self.assertEqual(d['jahres_soll'], Decimal('46800.00'))
+        self.assertAlmostEqual(d['bruttorendite'], 4.68)
+        self.assertEqual(d['total_ausstand'], Decimal('1700.00'))
+        self.assertEqual(d['total_ueberfaellig'], Decimal('1700.00'))
+        erste = d['liegenschaften'][0]
+        self.assertEqual(erste['id'], lg.pk)
+        self.assertEqual(erste['einheiten'][0]['mieter'], str(v.mieter))
+
+    def test_abfragen_unabhaengig_von_der_groesse(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from core.services.eigentuemer_portfolio import portfolio_daten
+        klein, *_ = self._portfolio(liegenschaften=1)
+        with CaptureQueriesContext(connection) as k:
+            portfolio_daten(klein, zwischenspeicher=False)
+        gross, *_ = self._portfolio(liegenschaften=6)
+        with CaptureQueriesContext(connection) as g:
+            portfolio_daten(gross, zwischenspeicher=False)
+        self.assertEqual(len(k.captured_queries), len(g.captured_queries))
+
+    def test_zwischenspeicher_und_verwerfen(self):
+        from finance.models import Zahlungseingang
+        from core.services.eigentuemer_portfolio import portfolio_daten
+        md, lg, v = self._portfolio()
+        self.assertEqual(portfolio_daten(md)['total_ausstand'], Decimal('1700.00'))
+        with self.assertNumQueries(0):
+            portfolio_daten(md)
+        rechnung = v.debitoren_rechnungen.get()
+        Zahlungseingang.objects.create(vertrag=v, debitoren_rechnung=rechnung, betrag=Decimal('700'),
+                                       datum_eingang=date.today(), status='verbucht')
+        self.assertEqual(portfolio_daten(md)['total_ausstand'], Decimal('1000.00'))
+
+    def test_mieter_und_eigentuemer_verwerfen_das_portfolio(self):
+        # Namen stehen im gespeicherten Portfolio — eine Umbenennung darf
+        # nicht bis zum Ablauf alt bleiben.
+        from core.services.eigentuemer_portfolio import portfolio_daten
+        md, lg, v = self._portfolio()
+        portfolio_daten(md)
+        v.mieter.nachname = 'Neumann'
+        v.mieter.save()
+        self.assertIn('Neumann', portfolio_daten(md)['liegenschaften'][0]['einheiten'][0]['mieter'])
+        with self.assertNumQueries(0):
+            portfolio_daten(md)
+        md.firma_oder_name = 'Neue Eig AG'
+        md.save()
+        with self.assertNumQueries(6):
+            portfolio_daten(md)
+
+    def test_sollstellung_im_stapel_verwirft_das_portfolio(self):
+        # `bulk_create` sendet kein Signal — ohne ausdrückliches Verwerfen
+        # zeigte das Portal den alten Ausstand bis zum Ablauf.
+        from core.services.automation import run_sollstellung
+        from core.services.eigentuemer_portfolio import portfolio_daten
+        md, lg, v = self._portfolio()
+        _seed_konten()
+        vorher = portfolio_daten(md)['total_ausstand']
+        heute = date.today()
+        self.assertEqual(run_sollstellung(heute.year, heute.month, bulk=True), 1)
+        self.assertGreater(portfolio_daten(md)['total_ausstand'], vorher)
+
+
 class MieterPortalTests(TestCase):
     def _mieter_login(self):
         lg, e, m, v = _basis_objekte()
@@ -372,6 +466,24 @@ class MieterDokumenteTests(TestCase):
         zf = zipfile.ZipFile(io.BytesIO(r.content))
         self.assertTrue(any('Mietvertrag' in n for n in zf.namelist()))
 
+    def test_vertragspaket_im_hintergrund(self):
+        """Der Knopf reiht ein; das ZIP liegt danach beim Auftrag."""
+        import io, zipfile
+        from faelle.lauf_models import Laufauftrag
+        from faelle.laufauftraege import abarbeiten
+        lg, e, m, v = _basis_objekte()
+        c = Client(); c.force_login(_team_user())
+        r = c.post(f'/vertrag/{v.id}/dokumente-zip/einreihen/')
+        auftrag = Laufauftrag.alle_organisationen.get()
+        self.assertTrue(r['Location'].startswith(f'/neu/auftraege/{auftrag.pk}/'))
+        self.assertEqual(abarbeiten(), 1)
+        auftrag.refresh_from_db()
+        self.assertEqual(auftrag.status, Laufauftrag.FERTIG, auftrag.fehler)
+        datei = c.get(f'/neu/auftraege/{auftrag.pk}/datei/')
+        zf = zipfile.ZipFile(io.BytesIO(b''.join(datei.streaming_content)))
+        self.assertTrue(any('Mietvertrag' in n for n in zf.namelist()))
+        self.assertContains(c.get(f'/neu/auftraege/{auftrag.pk}/'), 'Datei herunterladen')
+
 
 class SicherheitsIsolationTests(TestCase):
     """Stellt sicher, dass Portale strikt isoliert sind (keine Cross-Tenant-Lecks)."""
@@ -629,6 +741,131 @@ class EigentuemerReportVersandTests(TestCase):
         self.assertEqual(len(mail.outbox), 0)
 
 
+class _ZaehlBackend(locmem.EmailBackend):
+    """Locmem mit Zähler: wie viele Verbindungen, und auf Wunsch ein Fehler
+    statt der Zustellung."""
+    verbindungen = 0
+    fehler = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _ZaehlBackend.verbindungen += 1
+
+    def send_messages(self, messages):
+        if _ZaehlBackend.fehler is not None:
+            raise _ZaehlBackend.fehler
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='core.tests.test_portal._ZaehlBackend')
+class PostausgangTests(TestCase):
+    def setUp(self):
+        _test_organisation()
+        _ZaehlBackend.verbindungen = 0
+        _ZaehlBackend.fehler = None
+
+    def test_ein_stapel_eine_verbindung(self):
+        from django.core import mail
+        from core.models import Postausgang
+        from core.services.postausgang import abarbeiten, einreihen
+        for i in range(5):
+            einreihen(f'm{i}@example.ch', f'Erinnerung {i}', '<p>x</p>',
+                      anhaenge=[('brief.pdf', b'%PDF-1.4')])
+        ergebnis = abarbeiten()
+        self.assertEqual(ergebnis['gesendet'], 5)
+        self.assertEqual(_ZaehlBackend.verbindungen, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].attachments[0][0], 'brief.pdf')
+        self.assertFalse(Postausgang.objects.exclude(status=Postausgang.GESENDET).exists())
+        self.assertEqual(abarbeiten()['gesendet'], 0)
+
+    def test_schluessel_reiht_nur_einmal_ein(self):
+        from core.models import Postausgang
+        from core.services.postausgang import einreihen
+        erste = einreihen('a@example.ch', 'Report', '<p>x</p>', schluessel='report:1:2024')
+        zweite = einreihen('a@example.ch', 'Report', '<p>x</p>', schluessel='report:1:2024')
+        self.assertEqual(erste.pk, zweite.pk)
+        self.assertEqual(Postausgang.objects.count(), 1)
+
+    def test_report_lauf_zweimal_sendet_einmal(self):
+        from django.core import mail
+        from django.core.management import call_command
+        import io
+        lg, e, m, v = _basis_objekte()
+        lg.eigentuemer = Eigentuemer.objects.create(firma_oder_name='Eig AG', email='eig@example.ch')
+        lg.save()
+        call_command('send_eigentuemer_reports', '--jahr', '2024', stdout=io.StringIO())
+        zweiter = io.StringIO()
+        call_command('send_eigentuemer_reports', '--jahr', '2024', stdout=zweiter)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('0 Report-Mail(s) versendet (Jahr 2024), 1 schon eingereiht', zweiter.getvalue())
+
+    def test_voruebergehender_fehler_verschiebt_und_bricht_stapel_ab(self):
+        import smtplib
+        from django.utils import timezone
+        from core.models import Postausgang
+        from core.services.postausgang import abarbeiten, einreihen
+        einreihen('a@example.ch', 'Eins', '<p>x</p>')
+        einreihen('b@example.ch', 'Zwei', '<p>x</p>')
+        _ZaehlBackend.fehler = smtplib.SMTPResponseException(451, b'Too many messages')
+        ergebnis = abarbeiten()
+        self.assertEqual(ergebnis['verschoben'], 1)     # der zweite wird gar nicht versucht
+        erste, zweite = Postausgang.objects.order_by('pk')
+        self.assertEqual((erste.status, erste.versuche), (Postausgang.WARTEND, 1))
+        self.assertGreater(erste.faellig_ab, timezone.now())
+        self.assertIn('451', erste.letzter_fehler)
+        self.assertEqual(zweite.versuche, 0)
+
+        # Wieder fällig und der Server nimmt an → zugestellt.
+        _ZaehlBackend.fehler = None
+        Postausgang.objects.filter(pk=erste.pk).update(faellig_ab=timezone.now())
+        self.assertEqual(abarbeiten()['gesendet'], 2)
+
+    def test_endgueltiger_fehler_gibt_auf(self):
+        import smtplib
+        from core.models import Postausgang
+        from core.utils.email_service import send_ticket_email
+        _ZaehlBackend.fehler = smtplib.SMTPResponseException(550, b'Mailbox unavailable')
+        self.assertFalse(send_ticket_email('weg@example.ch', 'Betreff', 'Text'))
+        self.assertEqual(Postausgang.objects.get().status, Postausgang.AUFGEGEBEN)
+
+    def test_aufraeumen_loescht_erledigte_samt_anhaengen(self):
+        from django.utils import timezone
+        from core.models import Postausgang, PostausgangAnhang
+        from core.services.postausgang import aufraeumen, einreihen
+        alt = timezone.now() - timedelta(days=91)
+        for status, erstellt in ((Postausgang.GESENDET, alt), (Postausgang.AUFGEGEBEN, alt),
+                                 (Postausgang.WARTEND, alt), (Postausgang.GESENDET, timezone.now())):
+            n = einreihen('a@example.ch', status, '<p>x</p>', anhaenge=[('brief.pdf', b'%PDF-1.4')])
+            Postausgang.objects.filter(pk=n.pk).update(status=status, erstellt_am=erstellt)
+        self.assertEqual(aufraeumen(), 2)
+        self.assertEqual(sorted(Postausgang.objects.values_list('status', flat=True)),
+                         [Postausgang.GESENDET, Postausgang.WARTEND])
+        self.assertEqual(PostausgangAnhang.objects.count(), 2)
+        self.assertEqual(aufraeumen(), 0)
+
+    def test_zahlungserinnerung_ins_journal_nur_wenn_neu_eingereiht(self):
+        """Ein paralleler Lauf reiht dieselbe Erinnerung zwischen Vorprüfung
+        und `einreihen` ein — er schreibt das Journal, dieser nicht."""
+        from unittest.mock import patch
+        from crm.models import Kommunikation
+        from core.models import Postausgang
+        from core.services import postausgang
+        from core.utils.email_service import send_payment_reminder
+        lg, e, m, v = _basis_objekte()
+        m.email = 'hans@example.ch'; m.save()
+        echt = postausgang.einreihen
+
+        def parallel(an, *args, schluessel=None, **kwargs):
+            echt(an, 'Vom anderen Lauf', '<p>x</p>', schluessel=schluessel)
+            return echt(an, *args, schluessel=schluessel, **kwargs)
+
+        with patch.object(postausgang, 'einreihen', side_effect=parallel):
+            self.assertFalse(send_payment_reminder(v, date(2026, 5, 1), Decimal('100'), stufe=1))
+        self.assertEqual(Postausgang.objects.count(), 1)
+        self.assertFalse(Kommunikation.objects.filter(mieter=m, typ='email').exists())
+
+
 class NachtN3MieterportalTests(TestCase):
     """Nacht-Audit N3: Passwort-Reset/Ändern, Foto-Upload, Mieterkonto-Seite,
     Meine Daten, Rechnungsarchiv."""
@@ -207,3 +207,92 @@ class KeinDoppelterTeillaufTests(ZweiBestaende):
                          stdout=StringIO(), stderr=StringIO())
         self.assertEqual(unterbefehl.call_count, 1,
                          f'Fristen-Mail {unterbefehl.call_count}× ausgelöst statt einmal.')
+
+
+class ParallelTests(ZweiBestaende):
+    """`--parallel`: dieselben Zusagen, nur über mehrere Prozesse.
+
+    Die Kinder entstehen per fork und erben dabei die In-Memory-Testdatenbank
+    samt offener Testtransaktion — sie sehen also den Bestand der Fixtures,
+    schreiben aber in ihre eigene Kopie. Geprüft wird darum, was sie
+    zurückgeben, nicht was sie schreiben.
+    """
+
+    def setUp(self):
+        # Unter `manage.py test --parallel` läuft dieser Test selbst in einem
+        # Daemon-Prozess, und der darf keine Kinder haben. Der Scheduler kennt
+        # diese Lage nicht; für die Dauer des Tests wird sie aufgehoben.
+        import multiprocessing
+        konfig = multiprocessing.current_process()._config
+        daemon = konfig.get('daemon')
+        konfig['daemon'] = False
+        self.addCleanup(konfig.__setitem__, 'daemon', daemon)
+
+    def test_kein_bestand_sickert_in_die_andere_verwaltung(self):
+        import os
+        from core.tenancy import aktuelle_organisation, je_organisation
+        from rentals.models import Mietvertrag
+
+        def arbeit(organisation):
+            return (organisation.pk, aktuelle_organisation().pk, os.getpid(),
+                    sorted(Mietvertrag.objects.values_list('organisation_id', flat=True)))
+
+        ergebnisse, fehler = je_organisation(arbeit, parallel=2)
+
+        self.assertEqual(fehler, [])
+        self.assertEqual([e[0] for e in ergebnisse],
+                         [self.a.organisation.pk, self.b.organisation.pk],
+                         'Die Ergebnisse kommen nicht in der Reihenfolge der Verwaltungen.')
+        for organisation, kontext, pid, vertraege in ergebnisse:
+            self.assertNotEqual(pid, os.getpid(), 'Der Lauf war nicht in einem Kindprozess.')
+            self.assertEqual(kontext, organisation)
+            self.assertEqual(set(vertraege), {organisation},
+                             'Im Kindprozess war der Bestand einer fremden Verwaltung sichtbar.')
+        self.assertIsNone(aktuelle_organisation())
+
+    def test_fehler_und_ausgabe_je_verwaltung(self):
+        from core.tenancy import je_organisation
+
+        def arbeit(organisation):
+            print(f'{organisation}: angefangen')
+            if organisation.pk == self.a.organisation.pk:
+                raise RuntimeError('Konto fehlt')
+            return organisation.pk
+
+        protokoll, ausgabe = StringIO(), StringIO()
+        from django.core.management.base import OutputWrapper
+        ergebnisse, fehler = je_organisation(arbeit, parallel=2, ausgabe=OutputWrapper(ausgabe),
+                                             protokoll=OutputWrapper(protokoll))
+
+        self.assertEqual(ergebnisse, [self.b.organisation.pk])
+        self.assertEqual([(o.pk, str(e)) for o, e in fehler],
+                         [(self.a.organisation.pk, 'Konto fehlt')])
+        self.assertIsInstance(fehler[0][1], RuntimeError)
+        self.assertIn('Verwaltung A AG: angefangen', protokoll.getvalue())
+        self.assertIn('Verwaltung B AG: angefangen', protokoll.getvalue())
+        self.assertIn('FEHLER Verwaltung A AG: Konto fehlt', ausgabe.getvalue())
+
+    def test_gestorbenes_kind_reisst_die_anderen_nicht_mit(self):
+        """Stirbt das Kind von A, bricht der Pool für alle offenen Läufe —
+        B läuft einzeln nach, als Fehler bleibt nur A."""
+        import os
+        import time
+        from concurrent.futures.process import BrokenProcessPool
+        from core.tenancy import je_organisation
+
+        def arbeit(organisation):
+            if organisation.pk == self.a.organisation.pk:
+                os._exit(1)
+            time.sleep(0.5)       # B ist noch offen, wenn A stirbt
+            return organisation.pk
+
+        ergebnisse, fehler = je_organisation(arbeit, parallel=2)
+
+        self.assertEqual(ergebnisse, [self.b.organisation.pk])
+        self.assertEqual([o.pk for o, _ in fehler], [self.a.organisation.pk])
+        self.assertIsInstance(fehler[0][1], BrokenProcessPool)
+
+    def test_befehl_mit_parallel(self):
+        ausgabe = self.laufen_lassen('monatslauf', jahr=2026, monat=8, parallel=2)
+        self.assertIn('Verwaltung A AG: Sollstellung 08/2026', ausgabe)
+        self.assertIn('Verwaltung B AG: Sollstellung 08/2026', ausgabe)
@@ -0,0 +1,163 @@
+"""Zwischenspeicher (`core.services.zwischenspeicher`): getrennt je
+Verwaltung, verworfen über Tags, gezählt je Bereich."""
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from ._isolation import MandantenFixture
+
+
+class ZwischenspeicherTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.a = MandantenFixture('A', '8000', 'Zürich')
+        cls.b = MandantenFixture('B', '3000', 'Bern')
+
+    def setUp(self):
+        from core.services import zwischenspeicher
+        cache.clear()
+        zwischenspeicher.zaehler_zuruecksetzen()
+        self.aufrufe = []
+
+    def _zaehlend(self, wert):
+        def berechnen():
+            self.aufrufe.append(wert)
+            return wert
+        return berechnen
+
+    def test_eintraege_sind_je_verwaltung_getrennt(self):
+        from core.services.zwischenspeicher import holen
+        from core.tenancy import OrganisationsFehler, ohne_organisation, organisation_kontext
+        with organisation_kontext(self.a.organisation):
+            self.assertEqual(holen(('kennzahl', 1), self._zaehlend('A')), 'A')
+        with organisation_kontext(self.b.organisation):
+            self.assertEqual(holen(('kennzahl', 1), self._zaehlend('B')), 'B')
+        with organisation_kontext(self.a.organisation):
+            self.assertEqual(holen(('kennzahl', 1), self._zaehlend('A2')), 'A')
+        self.assertEqual(self.aufrufe, ['A', 'B'])
+        with ohne_organisation(), self.assertRaises(OrganisationsFehler):
+            holen(('kennzahl', 1), self._zaehlend('x'))
+
+    def test_dekorator_schluessel_aus_argumenten_und_none_wird_gemerkt(self):
+        from core.services.zwischenspeicher import zwischenspeichern
+        from core.tenancy import organisation_kontext
+
+        @zwischenspeichern('liegenschaft:{liegenschaft.pk}')
+        def kennzahl(liegenschaft, stichtag=None):
+            self.aufrufe.append((liegenschaft.pk, stichtag))
+            return None
+
+        with organisation_kontext(self.a.organisation):
+            lg = self.a.liegenschaft
+            self.assertIsNone(kennzahl(lg))
+            kennzahl(lg, stichtag=None)
+            kennzahl(lg, date(2026, 1, 1))
+            kennzahl(lg, stichtag=date(2026, 1, 1))
+            kennzahl.__wrapped__(lg)
+        self.assertEqual(self.aufrufe, [(lg.pk, None), (lg.pk, date(2026, 1, 1)), (lg.pk, None)])
+
+    def test_signal_verwirft_eigenen_und_bezogene_tags(self):
+        from core.services.zwischenspeicher import holen
+        from core.tenancy import organisation_kontext
+        from portfolio.models import Einheit
+
+        def lesen():
+            return {
+                'lg': holen(('lg',), self._zaehlend('lg'), tags=[f'liegenschaft:{self.a.liegenschaft.pk}']),
+                'vertrag': holen(('v',), self._zaehlend('v'), tags=[f'vertrag:{self.a.vertrag.pk}']),
+                'alle': holen(('alle',), self._zaehlend('alle'), tags=['einheit:*']),
+            }
+
+        with organisation_kontext(self.a.organisation):
+            lesen()
+            lesen()
+            self.assertEqual(self.aufrufe, ['lg', 'v', 'alle'])
+            # Eine neue Einheit verwirft ihre Liegenschaft und «alle Einheiten»,
+            # nicht den Vertrag.
+            Einheit.objects.create(liegenschaft=self.a.liegenschaft, bezeichnung='Neu',
+                                   typ='wohnung', nettomiete_aktuell=Decimal('900'))
+            lesen()
+            self.assertEqual(self.aufrufe, ['lg', 'v', 'alle', 'lg', 'alle'])
+        # Eine Änderung in B lässt A unberührt.
+        with organisation_kontext(self.b.organisation):
+            self.b.liegenschaft.save()
+            self.b.einheit.save()
+        with organisation_kontext(self.a.organisation):
+            lesen()
+        self.assertEqual(len(self.aufrufe), 5)
+
+    def test_stern_verwirft_alle_einzelnen(self):
+        from core.services.zwischenspeicher import holen, vergessen
+        from core.tenancy import organisation_kontext
+
+        with organisation_kontext(self.a.organisation):
+            holen(('v1',), self._zaehlend('v1'), tags=['vertrag:1'])
+            holen(('v2',), self._zaehlend('v2'), tags=['vertrag:2'])
+            vergessen('vertrag:1')
+            holen(('v1',), self._zaehlend('v1'), tags=['vertrag:1'])
+            holen(('v2',), self._zaehlend('v2'), tags=['vertrag:2'])
+            self.assertEqual(self.aufrufe, ['v1', 'v2', 'v1'])
+            vergessen('vertrag:*')
+            holen(('v1',), self._zaehlend('v1'), tags=['vertrag:1'])
+            holen(('v2',), self._zaehlend('v2'), tags=['vertrag:2'])
+        self.assertEqual(self.aufrufe, ['v1', 'v2', 'v1', 'v1', 'v2'])
+
+    def test_aenderung_waehrend_des_rechnens_gilt_nicht_als_aktuell(self):
+        from core.services.zwischenspeicher import holen, vergessen
+        from core.tenancy import organisation_kontext
+
+        def berechnen():
+            self.aufrufe.append('alt')
+            vergessen('vertrag:*')
+            return 'alt'
+
+        with organisation_kontext(self.a.organisation):
+            holen(('v',), berechnen, tags=['vertrag:*'])
+            self.assertEqual(holen(('v',), self._zaehlend('neu'), tags=['vertrag:*']), 'neu')
+
+    def test_zaehler_und_befehl(self):
+        from core.services.zwischenspeicher import holen, statistik
+        from core.tenancy import organisation_kontext
+
+        with organisation_kontext(self.a.organisation):
+            for _ in range(3):
+                holen(('zaehlbereich', 1), self._zaehlend(1))
+        self.assertEqual(statistik()['zaehlbereich'],
+                         {'treffer': 2, 'fehlgriffe': 1, 'quote': 0.667})
+        raus = StringIO()
+        call_command('zwischenspeicher', stdout=raus)
+        self.assertIn('zaehlbereich', raus.getvalue())
+
+        call_command('zwischenspeicher', vergessen=['zaehlbereich'], stdout=StringIO())
+        with organisation_kontext(self.a.organisation):
+            holen(('zaehlbereich', 1), self._zaehlend(1), tags=['zaehlbereich'])
+            holen(('zaehlbereich', 1), self._zaehlend(1), tags=['zaehlbereich'])
+        self.assertEqual(statistik()['zaehlbereich']['fehlgriffe'], 2)
+
+    def test_datenbank_cache_zaehlt_erst_nach_dem_commit(self):
+        """Der Datenbank-Cache schreibt in die offene Transaktion: Vor dem
+        Commit sähe den Stand niemand, und jeder Schreiber hielte die Zeile
+        von `mieter:*` gesperrt. Gezählt wird dort nur nach dem Commit."""
+        from django.db import connection
+        from django.test import override_settings
+        from django.test.utils import CaptureQueriesContext
+        from core.services.zwischenspeicher import holen
+        from core.tenancy import organisation_kontext
+
+        db_cache = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                'LOCATION': 'swissimmo_cache'}}
+        with override_settings(CACHES=db_cache), organisation_kontext(self.a.organisation):
+            call_command('createcachetable', verbosity=0)
+            holen(('m',), self._zaehlend('alt'), tags=['mieter:*'])
+            with self.captureOnCommitCallbacks() as nach_dem_commit, \
+                    CaptureQueriesContext(connection) as abfragen:
+                self.a.mieter.save()
+            self.assertEqual([a['sql'] for a in abfragen.captured_queries
+                              if 'swissimmo_cache' in a['sql']], [])
+            for rueckruf in nach_dem_commit:
+                rueckruf()
+            self.assertEqual(holen(('m',), self._zaehlend('neu'), tags=['mieter:*']), 'neu')
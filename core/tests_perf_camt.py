@@ -0,0 +1,87 @@
+"""Messung: camt.053 lesen — DOM gegen `core.services.camt.CamtLeser`.
+
+Kein Korrektheits-Test — die Regeln prüft `test_bankabgleich.CamtLeserTests`.
+Hier wird ein synthetischer Jahresauszug mit CAMT_ANZAHL Buchungen (Standard
+50'000, jede zehnte eine Sammelbuchung mit drei Zahlungen) erzeugt und
+zweimal gelesen: so wie der Import es bis dahin tat (`ET.fromstring`, zwei
+Mal: Bewegungen und Kopf) und mit dem Streaming-Leser. Gemeldet werden Dauer
+und Speicherspitze (tracemalloc).
+
+    PERF=1 python manage.py test core.tests_perf_camt -v0
+"""
+import io
+import os
+import time
+import tracemalloc
+from unittest import skipUnless
+
+from django.test import SimpleTestCase
+
+
+def _camt_synthetisch(anzahl):
+    """Ein camt.053 mit `anzahl` Buchungen als Bytes."""
+    teile = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.04"><BkToCstmrStmt><Stmt>'
+             '<Acct><Id><IBAN>CH9300762011623852957</IBAN></Id></Acct>'
+             '<FrToDt><FrDtTm>2024-01-01T00:00:00</FrDtTm><ToDtTm>2024-12-31T00:00:00</ToDtTm></FrToDt>'
+             '<Bal><Tp><CdOrPrtry><Cd>OPBD</Cd></CdOrPrtry></Tp><Amt Ccy="CHF">0.00</Amt>'
+             '<CdtDbtInd>CRDT</CdtDbtInd></Bal>']
+    for i in range(anzahl):
+        tag = f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}'
+        if i % 10 == 0:
+            tx = ''.join(f'<TxDtls><Amt Ccy="CHF">100.00</Amt><Refs><AcctSvcrRef>S{i}-{j}</AcctSvcrRef></Refs>'
+                         f'<RmtInf><Strd><CdtrRefInf><Ref>{i:020d}{j:07d}</Ref></CdtrRefInf></Strd></RmtInf>'
+                         '</TxDtls>' for j in range(3))
+            betrag = '300.00'
+        else:
+            tx = (f'<TxDtls><Refs><AcctSvcrRef>E{i}</AcctSvcrRef></Refs>'
+                  f'<RltdPties><Dbtr><Nm>Mieter {i}</Nm></Dbtr></RltdPties>'
+                  f'<RmtInf><Ustrd>Miete {tag}</Ustrd></RmtInf></TxDtls>')
+            betrag = f'{1000 + i % 900}.00'
+        teile.append(f'<Ntry><Amt Ccy="CHF">{betrag}</Amt><CdtDbtInd>CRDT</CdtDbtInd>'
+                     f'<BookgDt><Dt>{tag}</Dt></BookgDt><ValDt><Dt>{tag}</Dt></ValDt>'
+                     f'<NtryDtls>{tx}</NtryDtls></Ntry>')
+    teile.append('<Bal><Tp><CdOrPrtry><Cd>CLBD</Cd></CdOrPrtry></Tp><Amt Ccy="CHF">1.00</Amt>'
+                 '<CdtDbtInd>CRDT</CdtDbtInd></Bal></Stmt></BkToCstmrStmt></Document>')
+    return ''.join(teile).encode()
+
+
+def _messen(arbeit):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    ergebnis = arbeit()
+    dauer = time.perf_counter() - t0
+    _, spitze = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ergebnis, dauer, spitze
+
+
+@skipUnless(os.environ.get("PERF"), "Messwerkzeug — mit PERF=1 starten")
+class CamtLesen(SimpleTestCase):
+
+    def test_dom_gegen_streaming(self):
+        import xml.etree.ElementTree as ET
+        from core.services.camt import CamtLeser, buchung_eintraege
+
+        anzahl = int(os.environ.get('CAMT_ANZAHL', '50000'))
+        roh = _camt_synthetisch(anzahl)
+
+        def dom():
+            # Wie der Import bis dahin: ein Baum für die Bewegungen, ein
+            # zweiter für den Kopf.
+            eintraege = [e for n in ET.fromstring(roh).iter() if n.tag.endswith('}Ntry')
+                         for e in buchung_eintraege(n)]
+            ET.fromstring(roh)
+            return eintraege
+
+        def streaming():
+            # Nur zählen, nicht sammeln: gemessen wird der Leser, nicht die Liste.
+            leser = CamtLeser(io.BytesIO(roh))
+            return sum(1 for _ in leser)
+
+        alt, t_alt, m_alt = _messen(dom)
+        n_neu, t_neu, m_neu = _messen(streaming)
+        self.assertEqual(len(alt), n_neu)
+        print(f"\ncamt.053 · {anzahl} Buchungen · {len(roh) / 1e6:.1f} MB · {n_neu} Bewegungen")
+        print(f"  DOM (2×)    {t_alt:6.2f} s   Spitze {m_alt / 1e6:7.1f} MB")
+        print(f"  Streaming   {t_neu:6.2f} s   Spitze {m_neu / 1e6:7.1f} MB")
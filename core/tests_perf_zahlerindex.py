@@ -0,0 +1,44 @@
+"""Messung: Zahler-Index — Zeit je Abfrage `kandidaten(name, betrag, datum)`.
+
+Kein Korrektheits-Test — die Regeln prüft `test_bankabgleich.ZahlerIndexTests`.
+Ein synthetischer Index mit ZI_ANZAHL Verträgen (Standard 10'000, je mit
+Mieter und Mitmieter) ohne Datenbank; gemessen werden Auftraggeber mit
+Treffer und ohne.
+
+    PERF=1 python manage.py test core.tests_perf_zahlerindex -v0
+"""
+import os
+import time
+from datetime import date
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.test import SimpleTestCase
+
+
+@skipUnless(os.environ.get("PERF"), "Messwerkzeug — mit PERF=1 starten")
+class ZahlerIndexAbfrage(SimpleTestCase):
+
+    def test_kandidaten(self):
+        from core.services import zahlerindex
+
+        anzahl = int(os.environ.get('ZI_ANZAHL', '10000'))
+        idx = zahlerindex.ZahlerIndex()
+        t0 = time.perf_counter()
+        for i in range(anzahl):
+            namen = (zahlerindex._person_namen(f'Vorname{i % 300}', f'Nachname{i}')
+                     + zahlerindex._freier_name(f'Partner{i} Nachname{i}'))
+            idx.vertrag_aufnehmen(i, beginn=date(2020, 1, 1), ende=None,
+                                  erwartet=Decimal(1000 + i % 900), mieter=f'Nachname{i}',
+                                  namen=namen, mieter_ids=[i])
+        t_aufbau = time.perf_counter() - t0
+
+        abfragen = [(f'Herr Vorname{i % 300} Nachname{i} Zürich', Decimal(1000 + i % 900))
+                    for i in range(0, anzahl, 7)]
+        abfragen += [(f'Fremde Firma {i} AG', Decimal('123.00')) for i in range(len(abfragen))]
+        t0 = time.perf_counter()
+        for name, betrag in abfragen:
+            idx.kandidaten(name, betrag, date(2024, 3, 5))
+        dauer = time.perf_counter() - t0
+        print(f"\nZahler-Index · {anzahl} Verträge · Aufbau {t_aufbau:.2f} s")
+        print(f"  {len(abfragen)} Abfragen · {dauer / len(abfragen) * 1e6:.1f} µs je Abfrage")
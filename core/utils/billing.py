@@ -8,43 +8,47 @@ from portfolio.models import Liegenschaft, Einheit
 from rentals.models import Mietvertrag
 from finance.models import AbrechnungsPeriode, KreditorenRechnung, Zahlungseingang
 
+#: Standard-Heizgradtage der Schweiz je Monat, in Prozent des Jahres.
+HGT_VERTEILUNG = {1: 21, 2: 18, 3: 15, 4: 10, 5: 5, 6: 0, 7: 0, 8: 0, 9: 3, 10: 8, 11: 10, 12: 10}
+
+
 def get_heizgradtage_fuer_zeitraum(start_datum, ende_datum):
     """
     Berechnet die Summe der Heizgradtage (HGT) für eine bestimmte Zeitspanne.
     Standard HGT in der Schweiz pro Monat in %:
     Jan:21, Feb:18, Mär:15, Apr:10, Mai:5, Jun:0, Jul:0, Aug:0, Sep:3, Okt:8, Nov:10, Dez:10
+
+    Monatsweise: Ein angebrochener Monat zählt mit seinem Tagesanteil (Tage im
+    Zeitraum / Tage im Monat). Das ist dieselbe Summe wie die frühere Schleife
+    Tag für Tag, aber zwölf Schritte im Jahr statt 365 — und die Verteilung
+    ruft das je Vertrag auf.
     """
-    hgt_verteilung = {1: 21, 2: 18, 3: 15, 4: 10, 5: 5, 6: 0, 7: 0, 8: 0, 9: 3, 10: 8, 11: 10, 12: 10}
     total_prozent = Decimal('0')
-
-    curr = start_datum
-    while curr <= ende_datum:
-        _, tage_im_monat = calendar.monthrange(curr.year, curr.month)
-        # Anteiliger Prozentsatz für diesen einen Tag
-        tages_prozent = Decimal(hgt_verteilung[curr.month]) / Decimal(tage_im_monat)
-        total_prozent += tages_prozent
-        curr += datetime.timedelta(days=1)
+    if ende_datum < start_datum:
+        return total_prozent
+    jahr, monat = start_datum.year, start_datum.month
+    while (jahr, monat) <= (ende_datum.year, ende_datum.month):
+        _, tage_im_monat = calendar.monthrange(jahr, monat)
+        von = max(start_datum, datetime.date(jahr, monat, 1))
+        bis = min(ende_datum, datetime.date(jahr, monat, tage_im_monat))
+        total_prozent += Decimal(HGT_VERTEILUNG[monat] * ((bis - von).days + 1)) / Decimal(tage_im_monat)
+        jahr, monat = (jahr + 1, 1) if monat == 12 else (jahr, monat + 1)
 
     return total_prozent / Decimal('100')
 
 
 def _heiz_verbrauch_pro_einheit(liegenschaft, start_p, ende_p):
     """Verbrauch (Zählerdifferenz) pro Einheit für Heizungs-/Wärmezähler im Zeitraum.
-    Gibt {einheit_id: verbrauch} zurück; leer, wenn keine verwertbaren Zählerstände existieren."""
-    from portfolio.models import Zaehler, ZaehlerStand
-    result = {}
-    heiz_typen = ('heiz', 'wärme', 'waerme', 'wmz', 'energie', 'wärmemenge')
-    for z in Zaehler.objects.filter(einheit__liegenschaft=liegenschaft):
-        typ = (z.typ or '').lower()
-        if not any(t in typ for t in heiz_typen):
-            continue
-        staende = list(ZaehlerStand.objects.filter(
-            zaehler=z, datum__gte=start_p, datum__lte=ende_p).order_by('datum'))
-        if len(staende) >= 2:
-            verbrauch = (staende[-1].wert or Decimal('0')) - (staende[0].wert or Decimal('0'))
-            if verbrauch > 0:
-                result[z.einheit_id] = result.get(z.einheit_id, Decimal('0')) + verbrauch
-    return result
+    Gibt {einheit_id: verbrauch} zurück; leer, wenn keine verwertbaren Zählerstände existieren.
+
+    Die Stände aller Wärmezähler kommen in einer Abfrage
+    (`core.services.verbrauch`); allgemeine Zähler der Liegenschaft zählen
+    hier nicht, sie gehören keiner Einheit."""
+    from core.services.verbrauch import verbrauch_je_einheit
+    return {einheit_id: je_art['waerme']
+            for einheit_id, je_art in verbrauch_je_einheit(liegenschaft, start_p, ende_p,
+                                                           arten=('waerme',)).items()
+            if einheit_id is not None}
 
 
 
@@ -301,20 +305,33 @@ def berechne_abrechnung(periode_id):
     # Anteil — der Pool wird voll auf die tatsächlichen Bewohner verteilt (so geht
     # die Abrechnung auf). Ist niemand da (total_person_tage 0), fällt der Pool auf
     # die Flächenverteilung zurück, damit die Kosten nicht verschwinden.
+    #
+    # Alle Verträge der Liegenschaft in EINER Abfrage, je Einheit gruppiert,
+    # mit ihrer Überschneidung mit der Periode. Vorher fragte die Verteilung je
+    # Einheit zweimal nach ihren Verträgen und je Vertrag nach dem Mieter — bei
+    # 200 Einheiten über 600 Abfragen für eine Abrechnung.
+    #
+    # Alle Verträge, die die Objekt-Einheit während der Periode BEWOHNT haben —
+    # aktiv, gekündigt ODER archiviert (die Zeitüberschneidung filtert die
+    # Gültigkeit). Nur Entwürfe (nie ein echtes Mietverhältnis) fallen raus.
+    # (Früher `aktiv=True` — das schloss mitten in der Periode ausgezogene
+    # gekündigte Mieter fälschlich aus, ihr Anteil fiel dann auf Leerstand.)
+    belegungen = {}
     total_person_tage = Decimal('0')
-    if pool_nk_personen > 0:
-        for _e in einheiten:
-            _vtr = _e.vertraege.exclude(status='entwurf').filter(beginn__lte=ende_p).filter(
-                Q(ende__isnull=True) | Q(ende__gte=start_p)).distinct()
-            for _v in _vtr:
-                _vs = max(_v.beginn, start_p)
-                _ve = min(_v.ende, ende_p) if _v.ende else ende_p
-                _tage = (_ve - _vs).days + 1
-                if _tage > 0:
-                    total_person_tage += Decimal(max(1, _v.anzahl_personen or 1)) * _tage
-        if total_person_tage <= 0:
-            pool_nk_m2 += pool_nk_personen
-            pool_nk_personen = Decimal('0.00')
+    for _v in (Mietvertrag.objects.filter(einheit__liegenschaft=liegenschaft)
+               .exclude(status='entwurf').filter(beginn__lte=ende_p)
+               .filter(Q(ende__isnull=True) | Q(ende__gte=start_p))
+               .select_related('mieter').order_by('pk')):
+        _vs = max(_v.beginn, start_p)
+        _ve = min(_v.ende, ende_p) if _v.ende else ende_p
+        _tage = (_ve - _vs).days + 1
+        if _tage <= 0:
+            continue
+        belegungen.setdefault(_v.einheit_id, []).append((_v, _vs, _ve, _tage))
+        total_person_tage += Decimal(max(1, _v.anzahl_personen or 1)) * _tage
+    if pool_nk_personen > 0 and total_person_tage <= 0:
+        pool_nk_m2 += pool_nk_personen
+        pool_nk_personen = Decimal('0.00')
 
     total_kosten_gesamt = pool_heizkosten + pool_nk_m2 + pool_nk_einheit + pool_nk_personen
 
@@ -330,6 +347,8 @@ def berechne_abrechnung(periode_id):
     # ---------------------------------------------------------
     abrechnungen = []
     kontroll_summe = Decimal('0.00')
+    hgt_je_zeitraum = {(start_p, ende_p): periode_hgt}
+    _tage_jahr = Decimal(366 if calendar.isleap(start_p.year) else 365)
 
     for einheit in einheiten:
         # Anteil der Einheit am Haus
@@ -346,29 +365,20 @@ def berechne_abrechnung(periode_id):
             anteil_hk_einheit = pool_heizkosten * (e_m3 / total_m3)
         anteil_nk_einheit = (pool_nk_m2 * (e_m2 / total_m2)) + (pool_nk_einheit * (Decimal('1') / Decimal(total_einheiten)))
 
-        # Mieter in dieser Periode finden
-        # Alle Verträge, die die Objekt-Einheit während der Periode BEWOHNT haben —
-        # aktiv, gekündigt ODER archiviert (die Zeitüberschneidung unten filtert die
-        # Gültigkeit). Nur Entwürfe (nie ein echtes Mietverhältnis) fallen raus.
-        # (Früher `aktiv=True` — das schloss mitten in der Periode ausgezogene
-        # gekündigte Mieter fälschlich aus, ihr Anteil fiel dann auf Leerstand.)
-        vertraege = einheit.vertraege.exclude(status='entwurf').filter(beginn__lte=ende_p).filter(Q(ende__isnull=True) | Q(ende__gte=start_p))
-
+        # Mieter in dieser Periode (oben je Einheit gesammelt)
         tage_vermietet_total = 0
         hgt_vermietet_total = Decimal('0.00')
 
-        for vertrag in vertraege.distinct():
-            v_start = max(vertrag.beginn, start_p)
-            v_ende = min(vertrag.ende, ende_p) if vertrag.ende else ende_p
-
-            tage_bewohnt = (v_ende - v_start).days + 1
-            if tage_bewohnt <= 0: continue
-
+        for vertrag, v_start, v_ende, tage_bewohnt in belegungen.get(einheit.id, ()):
             # Gewichtungen ermitteln
             tage_vermietet_total += tage_bewohnt
             zeit_faktor_nk = Decimal(tage_bewohnt) / tage_periode
 
-            overlap_hgt = get_heizgradtage_fuer_zeitraum(v_start, v_ende)
+            # Viele Verträge laufen über die ganze Periode — gleicher Zeitraum,
+            # gleiche Heizgradtage.
+            if (v_start, v_ende) not in hgt_je_zeitraum:
+                hgt_je_zeitraum[(v_start, v_ende)] = get_heizgradtage_fuer_zeitraum(v_start, v_ende)
+            overlap_hgt = hgt_je_zeitraum[(v_start, v_ende)]
             hgt_vermietet_total += overlap_hgt
             zeit_faktor_hk = overlap_hgt / periode_hgt
 
@@ -388,11 +398,9 @@ def berechne_abrechnung(periode_id):
             nk_typ = getattr(vertrag, 'nk_abrechnungsart', 'akonto')
 
             if nk_typ == 'akonto':
-                import calendar as _cal
                 nk_monat = vertrag.nebenkosten or Decimal('0.00')
                 # Tage des Kalenderjahres (Schaltjahr = 366) statt fix 365 — sonst wird
                 # das bezahlte Akonto in Schaltjahren um ~0.27 % zu hoch angesetzt.
-                _tage_jahr = Decimal(366 if _cal.isleap(start_p.year) else 365)
                 bezahltes_akonto = (nk_monat * 12 / _tage_jahr) * Decimal(tage_bewohnt)
                 saldo = mieter_total_kosten - bezahltes_akonto # Positiv = Nachzahlung
 
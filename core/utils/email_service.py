@@ -1,39 +1,45 @@
 import logging
-import threading
 import os
-from django.core.mail import EmailMessage
-from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
 
-# Helper to send mail via Hoststar
-def send_via_hoststar(to_email, subject, html_content, attachment_name=None, attachment_content=None, cc_list=None):
+# Alle Mails gehen über den Postausgang (`core.services.postausgang`): erst
+# eingereiht, dann über eine gemeinsame Verbindung zugestellt und bei
+# Fehlern wiederholt. Die Funktionen hier bauen nur noch den Inhalt.
+def send_via_hoststar(to_email, subject, html_content, attachment_name=None, attachment_content=None,
+                      cc_list=None, schluessel=None):
+    """Reiht eine Mail ein und stellt sie gleich zu. True, solange sie nicht
+    endgültig gescheitert ist — ein vorübergehender Fehler wird später
+    wiederholt (`postausgang_senden`)."""
+    from core.models import Postausgang
+    from core.services.postausgang import einreihen
     try:
-        from_email = settings.DEFAULT_FROM_EMAIL
-        reply_addr = os.environ.get('EMAIL_REPLY_USER', 'reply@immoswiss.app')
-
-        email = EmailMessage(
-            subject=subject,
-            body=html_content,
-            from_email=from_email,
-            to=[to_email],
-            cc=cc_list or [],
-            reply_to=[reply_addr]
-        )
-        email.content_subtype = "html"
-
+        anhaenge = []
         if attachment_name and attachment_content:
             mime_type = 'application/pdf' if attachment_name.endswith('.pdf') else 'image/jpeg'
-            email.attach(attachment_name, attachment_content, mime_type)
-
-        email.send(fail_silently=False)
-        print(f"✅ Mail sent to {to_email}")
-        return True
-    except Exception as e:
-        print(f"❌ Mail Error: {e}")
+            anhaenge.append((attachment_name, attachment_content, mime_type))
+        nachricht = einreihen(to_email, subject, html_content, anhaenge=anhaenge,
+                              cc=cc_list or (), schluessel=schluessel, sofort=True)
+        return nachricht is not None and nachricht.status != Postausgang.AUFGEGEBEN
+    except Exception:
+        logger.exception("Mail an %s liess sich nicht einreihen", to_email)
         return False
 
+
+def _im_hintergrund(to_email, subject, html_content, attachment_name=None, attachment_content=None):
+    """Einreihen und nach dem Commit zustellen, ohne dass der Request wartet
+    (vorher: ein eigener Thread mit eigener Verbindung je Mail)."""
+    from core.services.postausgang import anstossen, einreihen
+    try:
+        anhaenge = [(attachment_name, attachment_content, 'application/pdf'
+                     if attachment_name.endswith('.pdf') else 'image/jpeg')] \
+            if attachment_name and attachment_content else []
+        einreihen(to_email, subject, html_content, anhaenge=anhaenge)
+        anstossen()
+    except Exception:
+        logger.exception("Mail an %s liess sich nicht einreihen", to_email)
+
 # ---------------------------------------------------------
 # PUBLIC FUNCTIONS (Imported by views/admin)
 # ---------------------------------------------------------
@@ -55,7 +61,7 @@ def send_ticket_receipt(ticket):
     <p>Freundliche Grüsse<br>ImmoSwiss Verwaltung</p>
     </body></html>
     """
-    threading.Thread(target=send_via_hoststar, args=(ticket.email_melder, subject, html_msg)).start()
+    _im_hintergrund(ticket.email_melder, subject, html_msg)
 
 
 def send_handyman_notification(auftrag):
@@ -106,7 +112,7 @@ def send_handyman_notification(auftrag):
             except:
                 logger.debug("Fehler bewusst übergangen", exc_info=True)
 
-        threading.Thread(target=send_via_hoststar, args=(hw.email, subject, html_hw, att_name, att_content)).start()
+        _im_hintergrund(hw.email, subject, html_hw, att_name, att_content)
 
     # 2. MAIL TO TENANT
     if ticket.email_melder:
@@ -121,7 +127,7 @@ def send_handyman_notification(auftrag):
         <p>Die Firma meldet sich für einen Termin.</p>
         </body></html>
         """
-        threading.Thread(target=send_via_hoststar, args=(ticket.email_melder, sub_m, html_m)).start()
+        _im_hintergrund(ticket.email_melder, sub_m, html_m)
 
 def send_neue_meldung_intern(ticket, to_emails):
     """Benachrichtigt die Verwaltung über eine neu eingegangene Schadenmeldung
@@ -230,26 +236,24 @@ def send_mieter_portal_zugang(to_email, anrede_name, username, passwort, login_u
     return send_via_hoststar(to_email, betreff, html)
 
 
-def send_report_mail(to_email, betreff, html_inhalt, anhaenge=None):
-    """Sendet eine HTML-Mail mit mehreren PDF-Anhängen. anhaenge = Liste von
-    (dateiname, bytes). Gibt True/False zurück."""
+def send_report_mail(to_email, betreff, html_inhalt, anhaenge=None, schluessel=None):
+    """Reiht eine HTML-Mail mit mehreren PDF-Anhängen in den Postausgang ein.
+    anhaenge = Liste von (dateiname, bytes). Zugestellt wird gesammelt
+    (`postausgang.abarbeiten`) — der Aufrufer arbeitet danach ab. Mit
+    `schluessel` reiht ein zweiter Lauf denselben Report nicht nochmals ein.
+    Gibt True zurück, wenn die Mail neu eingereiht wurde, None, wenn sie
+    unter `schluessel` schon im Postausgang lag, sonst False."""
     if not to_email:
         return False
+    from core.services.postausgang import einreihen
     try:
-        from_email = settings.DEFAULT_FROM_EMAIL
-        reply_addr = os.environ.get('EMAIL_REPLY_USER', 'reply@immoswiss.app')
-        email = EmailMessage(subject=betreff, body=html_inhalt, from_email=from_email,
-                             to=[to_email], reply_to=[reply_addr])
-        email.content_subtype = "html"
-        for name, inhalt in (anhaenge or []):
-            if inhalt:
-                mime = 'application/pdf' if name.lower().endswith('.pdf') else 'application/octet-stream'
-                email.attach(name, inhalt, mime)
-        email.send(fail_silently=False)
-        print(f"✅ Report-Mail an {to_email} ({len(anhaenge or [])} Anhang/Anhänge)")
-        return True
-    except Exception as e:
-        print(f"❌ Report-Mail Fehler: {e}")
+        nachricht = einreihen(to_email, betreff, html_inhalt, anhaenge=anhaenge or (),
+                              schluessel=schluessel)
+        if nachricht is None:
+            return False
+        return True if nachricht.neu else None
+    except Exception:
+        logger.exception("Report-Mail an %s liess sich nicht einreihen", to_email)
         return False
 
 
@@ -286,13 +290,23 @@ def send_eigentuemer_portal_zugang(to_email, anrede_name, username, passwort, lo
     return send_via_hoststar(to_email, betreff, html)
 
 
-def send_payment_reminder(vertrag, monat_datum, offener_betrag):
+def send_payment_reminder(vertrag, monat_datum, offener_betrag, stufe=None):
     """
-    Versendet eine E-Mail-Mahnung an den Mieter.
+    Reiht eine E-Mail-Mahnung an den Mieter in den Postausgang ein.
+
+    Zugestellt wird gesammelt (`postausgang.anstossen()` nach dem Mahnlauf).
+    Je Vertrag, Monat und Stufe höchstens einmal: Läuft der Mahnlauf zweimal
+    am selben Tag, geht die Erinnerung nicht doppelt hinaus — dann False.
     """
+    from core.models import Postausgang
+    from core.services.postausgang import einreihen
+
     mieter = vertrag.mieter
     if not mieter or not mieter.email:
         return False
+    schluessel = f"zahlungserinnerung:{vertrag.pk}:{monat_datum:%Y-%m-%d}:{stufe or ''}"
+    if Postausgang.objects.filter(schluessel=schluessel).exists():
+        return False
 
     monat_str = monat_datum.strftime('%B %Y')
     subject = f"Zahlungserinnerung: Miete {monat_str} - {vertrag.einheit.bezeichnung}"
@@ -309,7 +323,11 @@ def send_payment_reminder(vertrag, monat_datum, offener_betrag):
         <p>Freundliche Grüsse,<br>Ihre Liegenschaftsverwaltung</p>
     </body></html>
     """
-    threading.Thread(target=send_via_hoststar, args=(mieter.email, subject, html_msg)).start()
+    nachricht = einreihen(mieter.email, subject, html_msg, schluessel=schluessel)
+    if nachricht is None or not nachricht.neu:
+        # Ein paralleler Lauf war mit demselben Schlüssel schneller; er hat
+        # auch schon ins Journal geschrieben.
+        return False
     journal_email(subject,
                   f"Zahlungserinnerung Miete {monat_str} · offen CHF {offener_betrag:,.2f}",
                   mieter=mieter, vertrag=vertrag, empfaenger=mieter.email)
@@ -1,7 +1,7 @@
 """Einfacher cache-basierter IP-Rate-Limiter (fixed window) für öffentliche
-Endpunkte (Bewerbungs-/Schadenformular). Nutzt den konfigurierten Django-Cache;
-mit dem Default-LocMemCache greift er pro Prozess — als Spam-/Missbrauchsbremse
-ausreichend, für harte Limits einen geteilten Cache (DB/Redis) konfigurieren."""
+Endpunkte (Bewerbungs-/Schadenformular). Nutzt den konfigurierten Django-Cache
+(`CACHES`, Standard die Datenbank und damit über die Worker geteilt); mit
+`CACHE_ART=lokal` greift er pro Prozess."""
 from django.core.cache import cache
 
 
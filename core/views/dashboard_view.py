@@ -1,12 +1,15 @@
-# Nach E1b enthält diese Datei nur noch zwei Dinge: den manuellen
-# Marktdaten-Import und `_berechne_aufgaben`, das von core/views/fw.py
-# gebraucht wird. Die Vue-Ansicht `spa_master_view` und ihre beiden
-# ausschliesslich von ihr genutzten Hilfen sind entfallen; die Importe
-# hier sind entsprechend auf das noch Gebrauchte zurückgeschnitten.
+# Nach E1b enthält diese Datei nur noch, was am Admin hängt — den manuellen
+# Marktdaten-Import und die Kinder der Admin-Seitenleiste — und
+# `_berechne_aufgaben`, das von core/views/fw.py gebraucht wird. Die
+# Vue-Ansicht `spa_master_view` und ihre beiden ausschliesslich von ihr
+# genutzten Hilfen sind entfallen; die Importe hier sind entsprechend auf das
+# noch Gebrauchte zurückgeschnitten.
 from portfolio.models import Einheit, Geraet
 from rentals.models import Mietvertrag
 from finance.models import DebitorenRechnung
 
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
 from django.shortcuts import redirect
 from core.auth import rolle_erforderlich, ROLLE_VERWALTER, ROLLE_SACHBEARBEITER
 from django.contrib import messages
@@ -34,6 +37,22 @@ def update_market_data_view(request):
     return redirect('fw_dashboard')
 
 
+@staff_member_required
+def admin_baum_kinder(request, art, pk):
+    """Die Kinder eines Knotens der Admin-Seitenleiste, als JSON — der Baum
+    lädt sie beim ersten Aufklappen nach (`core.services.admin_baum`)."""
+    from core.services.admin_baum import kinder
+
+    # Ohne Verwaltung gäbe es keinen Baum; die Seitenleiste zeigt dann auch
+    # keine Wurzeln, nach denen hier gefragt werden könnte.
+    if aktuelle_organisation() is None:
+        raise Http404
+    try:
+        return JsonResponse({'kinder': kinder(art, pk)})
+    except LookupError:
+        raise Http404
+
+
 # ====================================================================
 # HILFSFUNKTIONEN (Damit wir den Code nicht doppelt schreiben müssen)
 # ====================================================================
@@ -24,6 +24,7 @@ from django.contrib import messages
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
 from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.decorators.http import require_POST
 
 from core.auth import rolle_erforderlich, SCHREIB_ROLLEN, TEAM_ROLLEN
@@ -145,12 +146,76 @@ def fw_laeufe(request):
         }
         (erledigt if lauf.status == Lauf.ABGESCHLOSSEN else offen).append(zeile)
     offen.sort(key=lambda z: z['lauf'].faellig_am)
+    from faelle.lauf_models import Laufauftrag
     return render(request, 'fw/laeufe.html', {
         **_global_filter(request), 'nav': 'arbeit',
         'heute': heute, 'offen': offen, 'erledigt': erledigt[:20],
+        'auftraege': list(Laufauftrag.objects.select_related('erstellt_von')[:15]),
     })
 
 
+@rolle_erforderlich(*TEAM_ROLLEN)
+def fw_laufauftrag(request, pk):
+    """Ein Laufauftrag: Fortschritt, Ergebnis, Abbruch, Datei.
+
+    Die Seite fragt `?format=json` alle zwei Sekunden ab, solange der Auftrag
+    nicht beendet ist, und lädt sich danach einmal neu — dann stehen Ergebnis
+    und Datei da. Der Arbeitsprozess ist dabei nur für die kurze Abfrage
+    belegt, nicht für den ganzen Lauf.
+    """
+    from django.http import JsonResponse
+    from faelle.lauf_models import Laufauftrag
+
+    auftrag = get_object_or_404(Laufauftrag.objects.select_related('lauf__laufart', 'erstellt_von'), pk=pk)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'status': auftrag.status, 'status_text': auftrag.get_status_display(),
+            'beendet': auftrag.ist_beendet, 'prozent': auftrag.prozent,
+            'erledigt': auftrag.erledigt, 'gesamt': auftrag.gesamt, 'schritt': auftrag.schritt,
+        })
+    # Nur eigene Adressen als Rücksprung — sonst wäre die Seite ein offener
+    # Weiterleiter für jeden, der einen Link darauf verschickt. Von Hand
+    # geprüft rutscht `/\boese.example` durch: Browser lesen den Rückstrich
+    # als Schrägstrich. Django kennt diese Fälle.
+    zurueck = request.GET.get('zurueck') or ''
+    if not url_has_allowed_host_and_scheme(zurueck, {request.get_host()},
+                                           require_https=request.is_secure()):
+        zurueck = '/neu/laeufe/'
+    return render(request, 'fw/laufauftrag.html', {
+        **_global_filter(request), 'nav': 'arbeit', 'auftrag': auftrag, 'zurueck': zurueck,
+    })
+
+
+@require_POST
+@rolle_erforderlich(*SCHREIB_ROLLEN)
+def fw_laufauftrag_abbrechen(request, pk):
+    """Abbrechen: ein wartender Auftrag sofort, ein laufender beim nächsten Schritt."""
+    from faelle.lauf_models import Laufauftrag
+    from faelle.laufauftraege import abbrechen
+
+    auftrag = get_object_or_404(Laufauftrag, pk=pk)
+    if abbrechen(auftrag):
+        messages.success(request, f'{auftrag.bezeichnung}: Abbruch angefordert.')
+    else:
+        messages.info(request, f'{auftrag.bezeichnung} ist bereits beendet.')
+    return redirect(f'/neu/auftraege/{auftrag.pk}/')
+
+
+@rolle_erforderlich(*TEAM_ROLLEN)
+def fw_laufauftrag_datei(request, pk):
+    """Die Ergebnisdatei — über die Verwaltung des Auftrags geprüft, nicht
+    über einen erratbaren Pfad unter /media/."""
+    import os
+    from django.http import FileResponse, Http404
+    from faelle.lauf_models import Laufauftrag
+
+    auftrag = get_object_or_404(Laufauftrag, pk=pk)
+    if not auftrag.datei:
+        raise Http404('Dieser Auftrag hat keine Datei.')
+    return FileResponse(auftrag.datei.open('rb'), as_attachment=True,
+                        filename=os.path.basename(auftrag.datei.name))
+
+
 @rolle_erforderlich(*TEAM_ROLLEN)
 def fw_zulauf(request):
     """Der ganze Posteingang mit Vorschlägen.
@@ -150,6 +150,28 @@ def fw_bankabgleich(request):
         if not z.zahler and z.vertrag_id and z.vertrag.mieter_id:
             z.zahler, z.zahler_geraten = z.vertrag.mieter.display_name, False
         z.ref = ((bew.referenz if bew else '') or '').strip()
+    # Vorschlag für ungeklärte Zahlungen: der beste Vertrag aus dem
+    # Zahler-Index und dessen älteste offene Rechnung, in der Auswahl
+    # vorgewählt. Nur ein Vorschlag — zugeordnet wird erst per Klick.
+    erste_offene = {}
+    for row in rows:
+        erste_offene.setdefault(row['r'].vertrag_id, row)
+    zahler_index = None
+    for z in geparkt:
+        z.vorschlag = None
+        if z.vertrag_id or not z.zahler:
+            continue
+        if zahler_index is None:
+            from core.services import zahlerindex
+            zahler_index = zahlerindex.index()
+        for k in zahler_index.kandidaten(z.zahler, z.betrag, z.datum_eingang):
+            if k['score'] < zahlerindex.VORSCHLAG_AB:
+                break
+            row = erste_offene.get(k['vertrag_id'])
+            if row is not None:
+                z.vorschlag = {'rechnung_id': row['r'].id, 'mieter': row['mieter'],
+                               'titel': row['r'].titel, 'prozent': int(k['score'] * 100)}
+                break
     # 1190 (Aktiv, ungeklärt) und 2030 (Passiv, Mieterguthaben) sind fachlich
     # verschieden und werden nicht zu einer Summe vermischt.
     geparkt_unklar = sum((z.betrag for z in geparkt if z.konto and z.konto.nummer == '1190'),
@@ -311,111 +333,23 @@ def fw_bankabgleich_verbuchen(request):
     return _r(ziel)
 
 
-def _camt_localname(tag):
-    """Entfernt den XML-Namespace ({...}Ntry -> Ntry)."""
-    return tag.split('}')[-1] if '}' in tag else tag
-
-
-def _camt_find(el, *pfad):
-    """Namespace-agnostisches Suchen entlang eines Pfads von Localnames."""
-    cur = el
-    for name in pfad:
-        gefunden = None
-        for kind in list(cur):
-            if _camt_localname(kind.tag) == name:
-                gefunden = kind
-                break
-        if gefunden is None:
-            return None
-        cur = gefunden
-    return cur
-
-
-def _camt_tx_details(el, richtung='CRDT'):
-    """Liest Referenz / Mitteilung / Bank-Tx-Ref / Gegenpartei aus einem
-    camt-Teilbaum (<Ntry> oder einzelne <TxDtls>).
-
-    Die Gegenpartei ist bei einer Gutschrift der Auftraggeber (<Dbtr>), bei einer
-    Belastung der Zahlungsempfaenger (<Cdtr>) — sonst bleibt der Lieferantenname
-    im Bank-Eingang leer."""
-    referenz = info = acct_ref = dbtr_name = ''
-    gegen_tag = 'Dbtr' if richtung == 'CRDT' else 'Cdtr'
-    in_dbtr = False
-    for sub in el.iter():
-        ln = _camt_localname(sub.tag)
-        if ln == 'CdtrRefInf':
-            ref_el = _camt_find(sub, 'Ref')
-            if ref_el is not None and ref_el.text:
-                referenz = ref_el.text.strip().replace(' ', '')
-        elif ln == 'Ustrd' and not info and sub.text:
-            info = sub.text.strip()
-        elif ln in ('AcctSvcrRef', 'TxId', 'EndToEndId') and not acct_ref and sub.text:
-            # 'NOTPROVIDED' ist bei Swiss-QR-Gutschriften der Standardwert und
-            # KEINE eindeutige Transaktionsreferenz.
-            _cand = sub.text.strip()
-            if _cand.upper() != 'NOTPROVIDED':
-                acct_ref = _cand
-        elif ln == gegen_tag:
-            in_dbtr = True
-        elif ln == 'Nm' and in_dbtr and not dbtr_name and sub.text:
-            dbtr_name = sub.text.strip(); in_dbtr = False
-    return {'referenz': referenz, 'info': info,
-            'acct_ref': acct_ref, 'dbtr_name': dbtr_name}
-
-
 def _camt_kopf(xml_bytes):
     """Liest Kopfdaten des Auszugs: IBAN, Periode und Schlusssaldo.
 
     Ohne den Schlusssaldo gibt es keinen Abstimmungsnachweis — man kann Zahlungen
     zuordnen, aber nie belegen, dass das Buchhaltungskonto mit dem realen
-    Bankkonto übereinstimmt (Praxis-Audit).
+    Bankkonto übereinstimmt (Praxis-Audit). Der Import selbst nimmt
+    `core.services.camt.lese_camt`, das Kopf und Bewegungen in EINEM Durchgang
+    liest.
     """
-    import xml.etree.ElementTree as ET
+    from core.services.camt import CamtLeser
+    leser = CamtLeser(xml_bytes)
     try:
-        root = ET.fromstring(xml_bytes)
+        for _ in leser:
+            pass
     except Exception:
         return {}
-    kopf = {'iban': '', 'von': None, 'bis': None,
-            'eroeffnung': None, 'schluss': None}
-    # IBAN des Auszugskontos
-    for el in root.iter():
-        if _camt_localname(el.tag) == 'IBAN' and el.text:
-            kopf['iban'] = el.text.strip().replace(' ', '')
-            break
-    # Periode <FrToDt><FrDtTm>/<ToDtTm>
-    for el in root.iter():
-        ln = _camt_localname(el.tag)
-        if ln in ('FrDtTm', 'ToDtTm') and el.text:
-            try:
-                d = date.fromisoformat(el.text.strip()[:10])
-            except ValueError:
-                continue
-            kopf['von' if ln == 'FrDtTm' else 'bis'] = d
-    # Salden: <Bal> mit <Cd> OPBD (Eröffnung) bzw. CLBD (Schluss)
-    for bal in root.iter():
-        if _camt_localname(bal.tag) != 'Bal':
-            continue
-        code = ''
-        for sub in bal.iter():
-            if _camt_localname(sub.tag) == 'Cd' and sub.text:
-                code = sub.text.strip().upper()
-                break
-        amt = _camt_find(bal, 'Amt')
-        if amt is None or not (amt.text or '').strip():
-            continue
-        try:
-            wert = Decimal(amt.text.strip())
-        except Exception:
-            continue
-        # Ein Habensaldo auf dem Bankkonto (CRDT) ist Guthaben → positiv.
-        vz = _camt_find(bal, 'CdtDbtInd')
-        if vz is not None and (vz.text or '').strip() == 'DBIT':
-            wert = -wert
-        if code in ('OPBD', 'PRCD'):
-            kopf['eroeffnung'] = wert
-        elif code in ('CLBD', 'CLAV'):
-            kopf['schluss'] = wert
-    return kopf
+    return leser.kopf
 
 
 def _camt_parse(xml_bytes, nur_gutschriften=True):
@@ -423,238 +357,22 @@ def _camt_parse(xml_bytes, nur_gutschriften=True):
 
     `nur_gutschriften=False` liefert AUCH Belastungen (negatives Vorzeichen).
     Ohne Belastungen — Lieferantenzahlungen, Gebühren, Zinsen, Daueraufträge —
-    ist das Bankkonto strukturell nicht abstimmbar (Praxis-Audit).
+    ist das Bankkonto strukturell nicht abstimmbar (Praxis-Audit). Gelesen
+    wird mit `core.services.camt.CamtLeser`.
     """
-    import xml.etree.ElementTree as ET
-    root = ET.fromstring(xml_bytes)
-    eintraege = []
-    # Alle <Ntry>-Elemente unabhängig von der Verschachtelungstiefe
-    for ntry in root.iter():
-        if _camt_localname(ntry.tag) != 'Ntry':
-            continue
-        cdtdbt = _camt_find(ntry, 'CdtDbtInd')
-        richtung = (cdtdbt.text or '').strip() if cdtdbt is not None else ''
-        if richtung not in ('CRDT', 'DBIT'):
-            continue
-        if nur_gutschriften and richtung != 'CRDT':
-            continue
-        vorzeichen = Decimal('1') if richtung == 'CRDT' else Decimal('-1')
-        amt_el = _camt_find(ntry, 'Amt')
-        if amt_el is None or not (amt_el.text or '').strip():
-            continue
-        try:
-            betrag = Decimal((amt_el.text or '0').strip())
-        except Exception:
-            continue
-        # Buchungsdatum (Element mit Text ist in ET „falsy", daher explizit is-None prüfen)
-        datum = None
-        dt_el = _camt_find(ntry, 'BookgDt', 'Dt')
-        if dt_el is None:
-            dt_el = _camt_find(ntry, 'ValDt', 'Dt')
-        if dt_el is not None and dt_el.text:
-            try:
-                datum = date.fromisoformat(dt_el.text.strip()[:10])
-            except Exception:
-                datum = None
-        # Valutadatum separat — es ist das buchhalterisch massgebende Datum und
-        # wich bisher stillschweigend dem Erfassungstag (Praxis-Audit).
-        valuta = None
-        v_el = _camt_find(ntry, 'ValDt', 'Dt')
-        if v_el is not None and v_el.text:
-            try:
-                valuta = date.fromisoformat(v_el.text.strip()[:10])
-            except Exception:
-                valuta = None
-        # Sammelbuchung: enthält der Eintrag mehrere <TxDtls>, ist jede davon eine
-        # eigene Zahlung mit eigener QRR. Ohne diese Aufteilung würde der GESAMT-
-        # betrag der zuletzt gefundenen Referenz zugeordnet und alle übrigen Mieter
-        # blieben unbezahlt (Audit, kritisch) — Schweizer Banken fassen QR-Eingänge
-        # eines Tages regelmässig so zusammen.
-        txdtls = [t for t in ntry.iter() if _camt_localname(t.tag) == 'TxDtls']
-        if len(txdtls) > 1:
-            summe_tx = Decimal('0.00')
-            teil_eintraege = []
-            for tx in txdtls:
-                tx_amt = _camt_find(tx, 'Amt')
-                try:
-                    tx_betrag = Decimal((tx_amt.text or '0').strip()) if tx_amt is not None else None
-                except Exception:
-                    tx_betrag = None
-                if tx_betrag is None or tx_betrag <= 0:
-                    teil_eintraege = []      # unvollständig → als Ganzes behandeln
-                    break
-                teil_eintraege.append((tx, tx_betrag))
-                summe_tx += tx_betrag
-            # Nur aufteilen, wenn die Einzelbeträge den Eintrag exakt ergeben —
-            # sonst ginge Geld verloren oder würde doppelt verbucht.
-            if teil_eintraege and summe_tx == betrag:
-                for tx, tx_betrag in teil_eintraege:
-                    eintraege.append({
-                        'betrag': tx_betrag * vorzeichen, 'datum': datum, 'valuta': valuta,
-                        **_camt_tx_details(tx, richtung),
-                    })
-                continue
-
-        # Referenz + Info + Bank-Tx-Ref (Duplikatschutz) + Auftraggebername (Fuzzy)
-        referenz = ''
-        info = ''
-        acct_ref = ''
-        dbtr_name = ''
-        # Bei einer BELASTUNG ist die Gegenpartei der Zahlungsempfänger (<Cdtr>),
-        # nicht der Auftraggeber — sonst bleibt der Lieferantenname im Bank-Eingang
-        # leer und die Zeile ist für den Buchhalter nicht zuordenbar (Praxis-Audit).
-        gegen_tag = 'Dbtr' if richtung == 'CRDT' else 'Cdtr'
-        in_dbtr = False
-        for sub in ntry.iter():
-            ln = _camt_localname(sub.tag)
-            if ln == 'CdtrRefInf':
-                ref_el = _camt_find(sub, 'Ref')
-                if ref_el is not None and ref_el.text:
-                    referenz = ref_el.text.strip().replace(' ', '')
-            elif ln == 'Ustrd' and not info and sub.text:
-                info = sub.text.strip()
-            elif ln in ('AcctSvcrRef', 'TxId', 'EndToEndId') and not acct_ref and sub.text:
-                # 'NOTPROVIDED' ist bei Swiss-QR-Gutschriften der Standard-EndToEndId
-                # und KEINE eindeutige Transaktionsreferenz — sonst würden mehrere
-                # verschiedene Zahlungen fälschlich als Duplikat verworfen (Datenverlust).
-                _cand = sub.text.strip()
-                if _cand.upper() != 'NOTPROVIDED':
-                    acct_ref = _cand
-            elif ln == gegen_tag:
-                in_dbtr = True
-            elif ln == 'Nm' and in_dbtr and not dbtr_name and sub.text:
-                dbtr_name = sub.text.strip(); in_dbtr = False
-        eintraege.append({'betrag': betrag * vorzeichen, 'referenz': referenz,
-                          'datum': datum, 'valuta': valuta,
-                          'info': info, 'acct_ref': acct_ref, 'dbtr_name': dbtr_name})
-    return eintraege
+    from core.services.camt import CamtLeser
+    return list(CamtLeser(xml_bytes, nur_gutschriften=nur_gutschriften))
 
 
 def _bank_csv_parse(raw):
     """Parst einen Bank-Kontoauszug als CSV (PostFinance/Raiffeisen/ZKB/UBS-Exporte).
 
-    Header-basiert und tolerant: Trennzeichen (; , Tab) wird erkannt, Spalten
-    werden über Schlüsselwörter gefunden (Datum, Betrag/Gutschrift, Referenz,
-    Text/Mitteilung, Auftraggeber). Nur Gutschriften (positive Beträge bzw.
-    Gutschrift-Spalte) werden übernommen. Rückgabe: gleiche Struktur wie
-    _camt_parse → derselbe Zuordnungs-/Verbuchungspfad."""
-    import csv as _csv
-    import io as _io
-    import re as _re
-
-    text = None
-    for enc in ('utf-8-sig', 'cp1252', 'latin-1'):
-        try:
-            text = raw.decode(enc)
-            break
-        except (UnicodeDecodeError, AttributeError):
-            continue
-    if text is None:
-        raise ValueError("Datei-Codierung nicht erkannt")
-
-    # Trennzeichen aus den ersten nicht-leeren Zeilen bestimmen
-    probe = [z for z in text.splitlines() if z.strip()][:10]
-    if not probe:
-        return []
-    zaehl = {d: sum(z.count(d) for z in probe) for d in (';', ',', '\t')}
-    delim = max(zaehl, key=zaehl.get)
-    zeilen = list(_csv.reader(_io.StringIO(text), delimiter=delim))
-
-    KEY = {
-        'datum': ('datum', 'date', 'buchungsdatum', 'valuta', 'booking'),
-        'betrag': ('betrag', 'amount', 'umsatz'),
-        'gut': ('gutschrift', 'credit', 'haben', 'eingang'),
-        'last': ('lastschrift', 'belastung', 'debit', 'soll', 'ausgang'),
-        'ref': ('referenz', 'reference', 'qrr', 'esr', 'referenznummer'),
-        'text': ('mitteilung', 'buchungstext', 'beschreibung', 'verwendungszweck',
-                 'text', 'details', 'avisierung', 'zahlungszweck'),
-        # Ohne Treffer hier bleibt der Auftraggeber leer und die Zeile im
-        # Bankabgleich sagt nur «von der Bank nicht geliefert» — darum breit fassen.
-        'name': ('auftraggeber', 'absender', 'zahlungspflichtiger', 'einzahler',
-                 'name', 'gegenpartei', 'debitor', 'begünstigter', 'beguenstigter',
-                 'partner', 'kontoinhaber', 'zahler', 'counterparty', 'payer'),
-    }
-
-    def _spalte(kopf, schluessel):
-        for i, z in enumerate(kopf):
-            zl = (z or '').strip().lower()
-            if any(k in zl for k in KEY[schluessel]):
-                return i
-        return None
-
-    # Header-Zeile suchen (erste Zeile mit Datum- UND Betrag/Gutschrift-Spalte)
-    kopf_idx = None
-    sp = {}
-    for i, z in enumerate(zeilen[:15]):
-        if _spalte(z, 'datum') is not None and (
-                _spalte(z, 'betrag') is not None or _spalte(z, 'gut') is not None):
-            kopf_idx = i
-            sp = {k: _spalte(z, k) for k in KEY}
-            break
-    if kopf_idx is None:
-        raise ValueError("Keine Kopfzeile mit Datum- und Betrag-/Gutschrift-Spalte gefunden. "
-                         "Erwartet werden Spalten wie «Datum», «Betrag» oder «Gutschrift», "
-                         "optional «Referenz», «Mitteilung», «Auftraggeber».")
-
-    def _dec(s):
-        s = (s or '').strip().replace("'", '').replace(' ', '').replace(' ', '')
-        s = s.replace('CHF', '').replace('chf', '')
-        if not s:
-            return None
-        if ',' in s and '.' not in s:
-            s = s.replace(',', '.')
-        else:
-            s = s.replace(',', '')
-        try:
-            return Decimal(s)
-        except Exception:
-            return None
-
-    def _datum(s):
-        from datetime import datetime as _dt
-        s = (s or '').strip()[:10]
-        for fmt in ('%d.%m.%Y', '%Y-%m-%d', '%d/%m/%Y', '%d.%m.%y'):
-            try:
-                return _dt.strptime(s, fmt).date()
-            except ValueError:
-                continue
-        return None
-
-    eintraege = []
-    for z in zeilen[kopf_idx + 1:]:
-        if not any((c or '').strip() for c in z):
-            continue
-
-        def wert(k):
-            i = sp.get(k)
-            return z[i] if i is not None and i < len(z) else ''
-
-        # Gutschrift bestimmen: eigene Spalte hat Vorrang, sonst positiver Betrag
-        betrag = _dec(wert('gut')) if sp.get('gut') is not None else None
-        if betrag is None:
-            b = _dec(wert('betrag'))
-            if b is None or b <= 0:
-                continue   # Belastung/Leerzeile → kein Zahlungseingang
-            if sp.get('last') is not None and _dec(wert('last')):
-                continue   # Zeile ist als Belastung markiert
-            betrag = b
-        if betrag is None or betrag <= 0:
-            continue
-
-        info = (wert('text') or '').strip()
-        referenz = (wert('ref') or '').strip().replace(' ', '')
-        if not referenz:
-            # QRR (27-stellig) auch aus dem Buchungstext fischen
-            m27 = _re.search(r'\b(\d[\d ]{25,40}\d)\b', info)
-            if m27:
-                kandidat = m27.group(1).replace(' ', '')
-                if len(kandidat) == 27:
-                    referenz = kandidat
-        eintraege.append({
-            'betrag': betrag, 'referenz': referenz, 'datum': _datum(wert('datum')),
-            'info': info, 'acct_ref': '', 'dbtr_name': (wert('name') or '').strip(),
-        })
-    return eintraege
+    Nur Gutschriften; Rückgabe: gleiche Struktur wie _camt_parse → derselbe
+    Zuordnungs-/Verbuchungspfad. Der Parser steht in
+    `core.services.bankimport.lese_csv`, damit der Befehl `bank_import` ihn
+    ohne Umweg über die Ansicht nimmt."""
+    from core.services.bankimport import lese_csv
+    return lese_csv(raw)
 
 
 @rolle_erforderlich(*SCHREIB_ROLLEN)
@@ -662,12 +380,14 @@ def fw_camt_import(request):
     """Importiert einen Bank-Kontoauszug — camt.053 (ISO 20022) ODER CSV-Export
     der Bank. Gutschriften werden per QRR-Referenz den offenen Debitoren-
     rechnungen zugeordnet und als Zahlungseingang (Bank an Debitoren) verbucht;
-    Unzuordenbares wird auf dem Durchlaufkonto 1190 geparkt."""
+    Unzuordenbares wird auf dem Durchlaufkonto 1190 geparkt.
+
+    Zuordnen und Verbuchen macht `core.services.bankimport` — dieselben
+    Schritte wie der Befehl `bank_import`; hier bleiben Upload und Meldungen."""
     from django.shortcuts import redirect
     from django.contrib import messages
-    from finance.models import Buchungskonto, Buchung
-    from core.utils.qr_code import qrr_referenz
     from core.auth import log_aktion
+    from core.services import bankimport
 
     if request.method != 'POST':
         return redirect('fw_bankabgleich')
@@ -677,341 +397,35 @@ def fw_camt_import(request):
         messages.error(request, "Keine Datei ausgewählt.")
         return redirect('fw_bankabgleich')
 
-    roh = datei.read()
-    # Format erkennen: XML (camt.053) beginnt mit '<' — alles andere als Bank-CSV parsen.
-    kopf_bytes = roh.lstrip(b'\xef\xbb\xbf \t\r\n')
-    ist_xml = kopf_bytes.startswith(b'<')
+    quelle = bankimport.erkenne_format(datei)
     try:
-        if ist_xml:
-            # nur_gutschriften=False: Belastungen (Lieferantenzahlungen, Gebühren,
-            # Zinsen, Daueraufträge) gehören dazu, sonst ist die Bank nicht
-            # abstimmbar (Praxis-Audit).
-            eintraege = _camt_parse(roh, nur_gutschriften=False)
-            auszug_kopf = _camt_kopf(roh)
-        else:
-            eintraege = _bank_csv_parse(roh)
-            auszug_kopf = {}
+        eintraege, auszug_kopf = bankimport.lese_datei(datei, quelle)
     except Exception as e:
         messages.error(request, f"Datei konnte nicht gelesen werden "
-                                f"({'kein gültiges camt.053' if ist_xml else 'CSV-Format nicht erkannt'}): {e}")
+                                f"({'kein gültiges camt.053' if quelle == 'camt.053' else 'CSV-Format nicht erkannt'}): {e}")
         return redirect('fw_bankabgleich')
 
-    quelle = 'camt.053' if ist_xml else 'Bank-CSV'
     if not eintraege:
         messages.warning(request, "Keine Bewegungen im Kontoauszug gefunden.")
         return redirect('fw_bankabgleich')
 
-    # Zielkonto der Bank: wählbar, damit mehrere Bankkonten buchbar sind.
-    # Vorher war «1020» im ganzen Import hart verdrahtet (Praxis-Audit).
-    bank_nr = (request.POST.get('bank_konto') or '1020').strip()
-    konto_bank_obj = Buchungskonto.objects.filter(nummer=bank_nr).first()
-    if konto_bank_obj is None:
-        bank_nr, konto_bank_obj = '1020', _park_konto('1020')
-
-    # Kontoauszug mit Schlusssaldo festhalten — die Grundlage des Abstimmungsnachweises.
-    from finance.models import Kontoauszug, Bankbewegung
-    auszug = Kontoauszug.objects.create(
-        konto=konto_bank_obj, iban=(auszug_kopf.get('iban') or '')[:34],
-        von=auszug_kopf.get('von'), bis=auszug_kopf.get('bis'),
-        eroeffnungssaldo=auszug_kopf.get('eroeffnung'),
-        schlusssaldo=auszug_kopf.get('schluss'),
-        dateiname=datei.name[:255], quelle=quelle, importiert_von=request.user)
-
-    # Referenz-Index aller offenen/teilbezahlten Rechnungen aufbauen
-    offene = list(DebitorenRechnung.objects.filter(status__in=['offen', 'teilbezahlt'])
-                  .select_related('vertrag__mieter', 'vertrag__einheit__liegenschaft'))
-    ref_index = {}
-    for r in offene:
-        schluessel = set()
-        if r.qr_referenz:
-            schluessel.add(r.qr_referenz.replace(' ', ''))
-        if r.vertrag_id:
-            raw, _ = qrr_referenz(r.vertrag_id, r.id)
-            schluessel.add(raw)
-        for s in schluessel:
-            ref_index.setdefault(s, r)
-
-    verbucht = 0
-    zugeordnet_summe = Decimal('0.00')
-    fuzzy = 0
-    gelernt_treffer = 0     # über einen früher von Hand zugeordneten Absender
-    geklaert = 0            # auf Durchlaufkonto 1190 geparkt (Mieter unbekannt)
-    guthaben = 0            # Überzahlung auf 2030 (Mieter bekannt)
-    duplikate = 0
-    gesperrt = 0            # von der Periodensperre abgewiesen
-    belastungen = 0         # Ausgänge — landen im Bank-Eingang zur Zuordnung
-    bewegungen_neu = []     # persistierte Auszugszeilen
-    komposit_lauf = {}      # Laufnummern für referenzlose Zahlungen
-    heute = timezone.localdate()
-
-    # Das Bankkonto steckt in bank_nr/konto_bank_obj — kein hart verdrahtetes 1020 mehr.
-    konto_clearing, _ = Buchungskonto.objects.get_or_create(
-        nummer="1190", defaults={'bezeichnung': 'Durchlaufkonto (ungeklärte Zahlungen)', 'typ': 'bilanz'})
-    # W6: Überzahlung eines BEKANNTEN Mieters ist kein ungeklärter Posten, sondern
-    # eine echte Verbindlichkeit → 2030 «Guthaben Mieter» statt Durchlaufkonto 1190.
-    konto_guthaben = _park_konto("2030")
-
-    # Fuzzy-Index: offener Betrag → Rechnungen (für referenzlose Gutschriften)
-    def _norm(s):
-        return ''.join(ch for ch in (s or '').lower() if ch.isalnum())
-
-    def _name_tokens(s):
-        """Wortweise normalisierte Tokens eines Namens (Reihenfolge erhalten)."""
-        return [t for t in (_norm(w) for w in re.split(r'\s+', s or '')) if t]
-
-    def _nachname_passt(nachname, dbtr):
-        """Nachname passt zum Auftraggeber, wenn er als zusammenhängende
-        Tokenfolge im Auftraggebernamen vorkommt.
-
-        Nicht als reine Teilzeichenkette (`_norm(nachname) in _norm(dbtr)`) —
-        ein kurzer Nachname («Ott») steckte sonst in einem fremden Namen
-        («Scott») und die Zahlung würde dem falschen Mieter automatisch
-        gutgeschrieben. Die Tokenfolge-Prüfung trägt mehrteilige Nachnamen
-        («Von Gunten») weiterhin, verlangt aber Wortgrenzen."""
-        ziel = _name_tokens(nachname)
-        hay = _name_tokens(dbtr)
-        if not ziel or not hay:
-            return False
-        n = len(ziel)
-        return any(hay[i:i + n] == ziel for i in range(len(hay) - n + 1))
-
-    def _verbuche(rechnung, betrag, e, via):
-        vertrag = rechnung.vertrag
-        with transaction.atomic():
-            zahlung = Zahlungseingang.objects.create(
-                vertrag=vertrag, betrag=betrag, datum_eingang=e['datum'] or heute,
-                buchungs_monat=(rechnung.faellig_am or rechnung.datum or heute).replace(day=1),
-                bemerkung=f"{quelle}-Import ({via}) {rechnung.titel}",
-                bank_referenz=e.get('acct_ref', ''),
-                liegenschaft=vertrag.einheit.liegenschaft if vertrag and vertrag.einheit_id else None,
-                debitoren_rechnung=rechnung, erstellt_von=request.user, status='verbucht',
-            )
-            rechnung.status = 'bezahlt' if rechnung.offener_betrag <= 0 else 'teilbezahlt'
-            rechnung.save()
-            from finance.booking import buche
-            buche(bank_nr, "1100", betrag, f"{quelle} {vertrag.mieter} - {rechnung.titel}",
-                  datum=e['datum'] or heute,
-                  liegenschaft=vertrag.einheit.liegenschaft if vertrag and vertrag.einheit_id else None,
-                  zahlung=zahlung, user=request.user)
-        # Auszugszeile als erledigt markieren und mit der Zahlung verknüpfen —
-        # so ist im Bank-Eingang sichtbar, was noch offen ist.
-        _bew = Bankbewegung.objects.filter(bank_referenz=e.get('acct_ref', ''),
-                                           status='offen').first()
-        if _bew is not None:
-            _bew.status = 'verbucht'
-            _bew.zahlung = zahlung
-            _bew.liegenschaft = zahlung.liegenschaft
-            _bew.save(update_fields=['status', 'zahlung', 'liegenschaft'])
-        if rechnung.status == 'bezahlt':
-            for k in [k for k, v in ref_index.items() if v is rechnung]:
-                ref_index.pop(k, None)
-
-    def _eintrag_verarbeiten(e):
-        """Verarbeitet EINEN Kontoauszugs-Eintrag. Läuft in der Schleife unten in
-        einem try/except für die Periodensperre — sonst reisst eine gesperrte
-        Periode den ganzen Import mit HTTP 500 ab: die bis dahin verbuchten Zeilen
-        blieben gespeichert, der Rest ginge kommentarlos verloren (Audit)."""
-        nonlocal verbucht, geklaert, guthaben, duplikate, fuzzy, zugeordnet_summe, belastungen
-        nonlocal gelernt_treffer
-
-        # 0) Duplikatschutz über Bank-Transaktionsreferenz. Fehlt eine eindeutige
-        #    Referenz (kein AcctSvcrRef/TxId, EndToEndId=NOTPROVIDED), wird ein
-        #    zusammengesetzter Schlüssel aus Datum|Betrag|Auftraggeber|QRR gebildet —
-        #    so wird der erneute Import derselben Datei nicht doppelt verbucht, ohne
-        #    verschiedene ref-lose Zahlungen fälschlich zu verschmelzen.
-        aref = e.get('acct_ref', '')
-        if not aref:
-            _dat = (e.get('datum') or heute)
-            aref = f"camt:{_dat:%Y-%m-%d}|{e.get('betrag','')}|{_norm(e.get('dbtr_name',''))}|{e.get('referenz','')}"
-            # Laufnummer je Schlüssel: zwei ECHTE Zahlungen am selben Tag über
-            # denselben Betrag (z.B. zwei Mieter mit gleicher Miete, beide ohne
-            # Auftraggebername) ergaben sonst denselben Schlüssel — die zweite
-            # wurde als «Duplikat» verworfen und das Geld verschwand (Audit).
-            # Beim erneuten Import derselben Datei entstehen dieselben Nummern,
-            # die Idempotenz bleibt also erhalten.
-            # Auf Feldlänge kürzen (bank_referenz = 140 Zeichen), bevor die
-            # Laufnummer angehängt wird — ein langer Auftraggebername hätte den
-            # Import sonst mit einem DataError abgebrochen. Die Kürzung ist
-            # deterministisch, der Wiederholungs-Import erzeugt denselben Wert.
-            aref = aref[:130]
-            komposit_lauf[aref] = komposit_lauf.get(aref, 0) + 1
-            if komposit_lauf[aref] > 1:
-                aref = f"{aref}#{komposit_lauf[aref]}"
-        aref = aref[:140]
-        e['acct_ref'] = aref
-        # Stornierte Zahlungen NICHT als Duplikat werten — sonst liesse sich eine
-        # rückgängig gemachte Import-Datei nie wieder importieren (jede Zeile fiele
-        # als «Duplikat» durch). Nur aktive (verbuchte) Zahlungen/Bewegungen zählen.
-        if (Zahlungseingang.objects.filter(bank_referenz=aref).exclude(status='storniert').exists()
-                or Bankbewegung.objects.filter(bank_referenz=aref).exists()):
-            duplikate += 1
-            return
-
-        betrag_e = e['betrag']
-
-        # Jede Zeile des Auszugs wird festgehalten — auch die, die sich nicht
-        # automatisch zuordnen lässt. Erst dadurch ist das Bankkonto abstimmbar
-        # und der Auszug im Programm nachvollziehbar (Praxis-Audit).
-        bew = Bankbewegung.objects.create(
-            auszug=auszug, konto=konto_bank_obj,
-            datum=e.get('datum') or heute, valuta=e.get('valuta'),
-            betrag=betrag_e,
-            text=(e.get('info') or '')[:255],
-            gegenpartei=(e.get('dbtr_name') or '')[:160],
-            referenz=(e.get('referenz') or '')[:40],
-            bank_referenz=aref, status='offen')
-        bewegungen_neu.append(bew)
-
-        def _bew_erledigt(zahlung_obj=None, notiz=''):
-            """Auszugszeile abhaken. Auch eine auf 1190 geparkte Gutschrift IST
-            gebucht — bliebe sie «offen», zeigte der Saldoabgleich eine Differenz,
-            die es gar nicht gibt."""
-            bew.status = 'verbucht'
-            if zahlung_obj is not None:
-                bew.zahlung = zahlung_obj
-                bew.liegenschaft = zahlung_obj.liegenschaft
-            if notiz:
-                bew.bemerkung = notiz[:255]
-            bew.save(update_fields=['status', 'zahlung', 'liegenschaft', 'bemerkung'])
-
-        # Belastungen wandern in den Bank-Eingang zur Zuordnung. Automatisch
-        # buchen wäre geraten — das Gegenkonto (Lieferant, Gebühr, Zins, Miete
-        # des Eigentümers) steht nicht im Auszug.
-        if betrag_e < 0:
-            belastungen += 1
-            return
-
-        rechnung = ref_index.get(e['referenz']) if e['referenz'] else None
-
-        # 1) Exakte QRR-Referenz
-        if rechnung and rechnung.vertrag_id and rechnung.offener_betrag > 0:
-            offen = rechnung.offener_betrag
-            betrag = min(max(betrag_e, Decimal('0.01')), offen)
-            _verbuche(rechnung, betrag, e, 'Referenz')
-            verbucht += 1; zugeordnet_summe += betrag
-            # Überzahlung: den vollen Bankeingang abbilden — der Überschuss wird als
-            # Mieterguthaben auf 2030 gebucht. Ohne das läge auf 1020 weniger als auf
-            # dem realen Kontoauszug → Bankabgleich geht nie auf und die Überzahlung
-            # verschwindet. 2030 statt 1190 (Audit W6): der Mieter ist bekannt, das
-            # ist eine echte Verbindlichkeit und kein ungeklärter Durchlaufposten.
-            ueberschuss = betrag_e - offen
-            if ueberschuss > 0:
-                with transaction.atomic():
-                    z_ueber = Zahlungseingang.objects.create(
-                        vertrag=rechnung.vertrag, betrag=ueberschuss,
-                        datum_eingang=e['datum'] or heute,
-                        buchungs_monat=(e['datum'] or heute).replace(day=1),
-                        bemerkung=f"{quelle} Überzahlung {rechnung.titel} (Guthaben Mieter)"[:255],
-                        bank_referenz=f"{aref}:ueber"[:140], konto=konto_guthaben,
-                        liegenschaft=rechnung.vertrag.einheit.liegenschaft if rechnung.vertrag.einheit_id else None,
-                        erstellt_von=request.user, status='verbucht')
-                    from finance.booking import buche
-                    buche(bank_nr, "2030", ueberschuss,
-                          f"{quelle} Überzahlung {rechnung.vertrag.mieter} - {rechnung.titel}",
-                          datum=e['datum'] or heute,
-                          liegenschaft=rechnung.vertrag.einheit.liegenschaft if rechnung.vertrag.einheit_id else None,
-                          zahlung=z_ueber, user=request.user)
-                guthaben += 1; zugeordnet_summe += ueberschuss
-            return
-
-        # 2) Fuzzy: exakter Betrag + Name des Auftraggebers passt eindeutig
-        _dbtr_raw = e.get('dbtr_name', '')
-        if not _name_tokens(_dbtr_raw):
-            _dbtr_raw = e.get('info', '')
-        kandidaten = [r for r in offene if r.vertrag_id and r.offener_betrag == betrag_e
-                      and r.vertrag.mieter
-                      and _nachname_passt(r.vertrag.mieter.nachname, _dbtr_raw)]
-        if len(kandidaten) == 1:
-            r = kandidaten[0]
-            _verbuche(r, betrag_e, e, 'Name+Betrag')
-            verbucht += 1; fuzzy += 1; zugeordnet_summe += betrag_e
-            return
-
-        # 2b) Gelernter Absender: Wurde dieser Zahler schon einmal von Hand
-        # zugeordnet, gilt die Entscheidung weiter. Konservativ — nur wenn der
-        # Vertrag GENAU EINE offene Rechnung hat und der Betrag hineinpasst.
-        # Bei mehreren offenen Rechnungen wäre die Wahl geraten, und geratene
-        # Zahlungszuordnungen sind teurer als eine Minute Handarbeit.
-        from core.services import zahler as _zahler
-        absender, _rest_txt, _ = _zahler.aus_bewegung(e.get('dbtr_name'), e.get('info'))
-        gelernter_vertrag = _zahler.finde_vertrag(absender) if absender else None
-        if gelernter_vertrag is not None:
-            kand = [r for r in offene if r.vertrag_id == gelernter_vertrag.id
-                    and r.offener_betrag > 0]
-            if len(kand) == 1 and betrag_e <= kand[0].offener_betrag:
-                _verbuche(kand[0], betrag_e, e, f'gelernter Absender {absender}')
-                _zahler.zaehle_treffer(absender)
-                verbucht += 1; gelernt_treffer += 1; zugeordnet_summe += betrag_e
-                return
-
-        # 3) Nicht zuordenbar → parken (nichts geht verloren).
-        # Trägt die Zahlung eine QRR, deren Rechnung bereits bezahlt ist, ist der
-        # Zahler bekannt: das ist eine Doppelzahlung des Mieters und gehört als
-        # Guthaben auf 2030, nicht als «ungeklärt» auf 1190 — dort wäre sie
-        # optisch ein Fremdeingang und der Mieter bekäme sein Geld nie zurück.
-        bekannte = ref_index.get(e['referenz']) if e['referenz'] else None
-        if bekannte is None and e['referenz']:
-            bekannte = (DebitorenRechnung.objects
-                        .filter(qr_referenz=e['referenz'], vertrag__isnull=False)
-                        .select_related('vertrag__einheit__liegenschaft').first())
-        with transaction.atomic():
-            from finance.booking import buche
-            if bekannte is not None and bekannte.vertrag_id:
-                v_b = bekannte.vertrag
-                lg_b = v_b.einheit.liegenschaft if v_b.einheit_id else None
-                zahlung = Zahlungseingang.objects.create(
-                    vertrag=v_b, betrag=betrag_e, datum_eingang=e['datum'] or heute,
-                    buchungs_monat=(e['datum'] or heute).replace(day=1),
-                    bemerkung=f"{quelle} Doppelzahlung {bekannte.titel} (Guthaben Mieter)"[:255],
-                    bank_referenz=aref, konto=konto_guthaben, liegenschaft=lg_b,
-                    erstellt_von=request.user, status='verbucht')
-                buche(bank_nr, "2030", betrag_e,
-                      f"{quelle} Doppelzahlung {v_b.mieter} - {bekannte.titel}",
-                      datum=e['datum'] or heute, liegenschaft=lg_b,
-                      zahlung=zahlung, user=request.user)
-                _bew_erledigt(zahlung, f"Doppelzahlung → 2030 ({bekannte.titel})")
-                guthaben += 1
-                return
-            zahlung = Zahlungseingang.objects.create(
-                betrag=betrag_e, datum_eingang=e['datum'] or heute,
-                buchungs_monat=(e['datum'] or heute).replace(day=1),
-                bemerkung=f"{quelle} UNGEKLÄRT: {e.get('dbtr_name','') or e.get('info','') or e.get('referenz','')}"[:255],
-                bank_referenz=aref, konto=konto_clearing,
-                erstellt_von=request.user, status='verbucht')
-            buche(bank_nr, "1190", betrag_e,
-                  f"{quelle} ungeklärt: {e.get('dbtr_name','') or e.get('referenz','')}",
-                  datum=e['datum'] or heute, zahlung=zahlung, user=request.user)
-        _bew_erledigt(zahlung, "ungeklärt → Durchlaufkonto 1190")
-        geklaert += 1
-
-    for e in eintraege:
-        try:
-            _eintrag_verarbeiten(e)
-        except PermissionError:
-            gesperrt += 1
-            # Die Bankbewegung wird in Autocommit angelegt, BEVOR die Buchung läuft;
-            # scheitert die Buchung an der Periodensperre, rollt nur das atomic der
-            # Buchung/Zahlung zurück — die Bewegung bliebe als Waise stehen. Beim
-            # Re-Import (nach Entsperren) gälte die Auszugszeile dann als Duplikat und
-            # die Zahlung würde NIE gebucht (QS-Befund). Deshalb die noch nicht mit
-            # einer Zahlung verknüpfte Bewegung dieser Zeile entfernen, damit der
-            # Re-Import sie neu anlegt und bucht.
-            _aref = e.get('acct_ref')
-            if _aref:
-                Bankbewegung.objects.filter(bank_referenz=_aref, zahlung__isnull=True,
-                                            status='offen').delete()
+    plan = bankimport.planen(eintraege)
+    erg = bankimport.ausfuehren(plan, auszug_kopf, bank_nr=request.POST.get('bank_konto') or '1020',
+                                quelle=quelle, dateiname=datei.name, user=request.user)
+    verbucht, geklaert, guthaben = erg['verbucht'], erg['geklaert'], erg['guthaben']
+    duplikate, belastungen = erg['duplikate'], erg['belastungen']
 
     log_aktion(request, f"{quelle}-Import", datei.name,
-               f"{verbucht} verbucht (davon {fuzzy} fuzzy, {gelernt_treffer} gelernter "
-               f"Absender), CHF {zugeordnet_summe}, "
+               f"{verbucht} verbucht (davon {erg['fuzzy']} fuzzy, {erg['gelernt']} gelernter "
+               f"Absender), CHF {erg['zugeordnet_summe']}, "
                f"{geklaert} auf 1190, {guthaben} Guthaben auf 2030, {duplikate} Duplikate, "
-               f"{gesperrt} Periodensperre")
+               f"{erg['gesperrt']} Periodensperre")
     if verbucht or geklaert or guthaben or belastungen:
-        teile = [f"{verbucht} Zahlung(en) zugeordnet (CHF {zugeordnet_summe})"]
-        if fuzzy:
-            teile.append(f"davon {fuzzy} über Name/Betrag")
-        if gelernt_treffer:
-            teile.append(f"{gelernt_treffer} über einen früher zugeordneten Absender")
+        teile = [f"{verbucht} Zahlung(en) zugeordnet (CHF {erg['zugeordnet_summe']})"]
+        if erg['fuzzy']:
+            teile.append(f"davon {erg['fuzzy']} über Name/Betrag")
+        if erg['gelernt']:
+            teile.append(f"{erg['gelernt']} über einen früher zugeordneten Absender")
         if guthaben:
             teile.append(f"{guthaben} Überzahlung(en) als Mieterguthaben (2030)")
         if geklaert:
@@ -1027,26 +441,21 @@ def fw_camt_import(request):
                                f"Bank-Eingang zur Zuordnung. Das Gegenkonto (Lieferant, "
                                f"Gebühr, Zins) steht nicht im Auszug und wird bewusst nicht geraten.")
     # Saldoabgleich: der Nachweis, dass Buchhaltung und Bankkonto übereinstimmen.
-    if auszug.schlusssaldo is not None:
-        from django.db.models import Sum as _SumB
-        _bq = Buchung.objects.filter(ist_storno=False, storniert_am__isnull=True)
-        if auszug.bis:
-            _bq = _bq.filter(datum__lte=auszug.bis)
-        _s = _bq.filter(soll_konto=konto_bank_obj).aggregate(t=_SumB('betrag'))['t'] or Decimal('0.00')
-        _h = _bq.filter(haben_konto=konto_bank_obj).aggregate(t=_SumB('betrag'))['t'] or Decimal('0.00')
-        buch_saldo = (_s - _h).quantize(Decimal('0.01'))
-        diff = (auszug.schlusssaldo - buch_saldo).quantize(Decimal('0.01'))
+    abgleich = bankimport.saldoabgleich(erg['auszug'])
+    if abgleich is not None:
+        buch_saldo, diff = abgleich
+        bank_nr = erg['bank_nr']
         if diff == 0:
             messages.success(request, f"✅ Saldoabgleich {bank_nr}: Buchhaltung und Auszug "
                                       f"stimmen überein (CHF {buch_saldo}).")
         else:
             messages.warning(request, f"⚠️ Saldoabgleich {bank_nr}: Auszug CHF "
-                                      f"{auszug.schlusssaldo}, Buchhaltung CHF {buch_saldo} — "
+                                      f"{erg['auszug'].schlusssaldo}, Buchhaltung CHF {buch_saldo} — "
                                       f"Differenz CHF {diff}. Offene Bewegungen im Bank-Eingang "
                                       f"zuordnen, dann stimmt es.")
-    if gesperrt:
+    if erg['gesperrt']:
         # Nie stillschweigend überspringen — der Import gälte sonst als vollständig.
-        messages.error(request, f"⚠️ {gesperrt} Zahlung(en) konnten nicht verbucht werden: "
+        messages.error(request, f"⚠️ {erg['gesperrt']} Zahlung(en) konnten nicht verbucht werden: "
                                 f"die Buchungsperiode ist gesperrt. Periode öffnen und die "
                                 f"Datei erneut importieren — bereits verbuchte Zahlungen "
                                 f"werden dabei als Duplikat übersprungen.")
@@ -41,12 +41,14 @@ def _erfolg_bilanz(aktive_lg, jahr):
     auseinanderdriften — und ein Abschluss, der je nach Ausgabeweg anders
     aussieht, ist wertlos.
     """
-    from finance.models import Buchung, Buchungskonto
-    qs = Buchung.objects.all()
+    from finance.models import Buchungskonto, Saldenbuch
+    # Aus dem Saldenbuch statt aus dem Journal: je Konto, Liegenschaft und
+    # Monat eine vorgerechnete Zeile. Die Seite summierte vorher bei jedem
+    # Aufruf sechsmal über alle Buchungen (`Saldenbuch` in finance.models).
+    zeilen = Saldenbuch.objects.all()
     if aktive_lg:
-        qs = qs.filter(liegenschaft=aktive_lg)
-    if jahr != 'alle':
-        qs = qs.filter(datum__gte=date(jahr, 1, 1), datum__lte=date(jahr, 12, 31))
+        zeilen = zeilen.filter(liegenschaft=aktive_lg)
+    periode = zeilen if jahr == 'alle' else zeilen.filter(jahr=jahr)
 
     # --- ZWEI SICHTEN (korrekte Rechnungslegung) ---
     # Erfolgsrechnung = NUR die Periode (Ertrags-/Aufwandskonten werden jährlich
@@ -55,35 +57,29 @@ def _erfolg_bilanz(aktive_lg, jahr):
     #   ohne Kumulation wäre die Jahresbilanz falsch). Das kumulierte Jahres-/
     #   Vortragsergebnis fliesst ins Eigenkapital, damit die Bilanz aufgeht.
     konten = Buchungskonto.objects.all()
-    bilanz_qs = Buchung.objects.all()
-    if aktive_lg:
-        bilanz_qs = bilanz_qs.filter(liegenschaft=aktive_lg)
-    if jahr != 'alle':
-        bilanz_qs = bilanz_qs.filter(datum__lte=date(jahr, 12, 31))
+    bilanz = zeilen if jahr == 'alle' else zeilen.filter(jahr__lte=jahr)
 
     # Abschlussbuchungen aus der ERFOLGSRECHNUNG ausklammern — sie saldieren die
     # Erfolgskonten per 31.12. gegen 2970. Ohne diesen Ausschluss zeigte die
     # Erfolgsrechnung nach dem Jahresabschluss überall null, obwohl das Jahr
     # gelaufen ist (Audit). Die Bilanz braucht sie dagegen, weil erst sie das
-    # Ergebnis auf 2970 stellt — bilanz_qs bleibt deshalb unangetastet.
-    from core.services.jahresabschluss import abschluss_buchungen_q
-    qs_periode_inkl = qs                       # Periode MIT Abschlussbuchungen (offener Erfolg)
-    qs = qs.exclude(abschluss_buchungen_q())   # Periode OHNE Abschluss (Erfolgsrechnung/P&L)
+    # Ergebnis auf 2970 stellt — `bilanz` bleibt deshalb unangetastet.
+    # `abschluss` ist `abschluss_buchungen_q()`, beim Buchen festgehalten.
+    periode_inkl = periode                          # Periode MIT Abschlussbuchungen (offener Erfolg)
+    periode = periode.filter(abschluss=False)       # Periode OHNE Abschluss (Erfolgsrechnung/P&L)
 
-    # Salden in VIER Abfragen statt zwei je Konto. Die Buchhaltungsseite lief
+    # Salden gruppiert in EINER Abfrage je Sicht. Die Buchhaltungsseite lief
     # über den Kontenplan und fragte je Konto Soll und Haben einzeln ab —
     # gemessen 90 Abfragen für einen Seitenaufbau, und dieselbe Rechnung steckt
-    # im PDF-Abzug. Gruppiert liefert die Datenbank dasselbe in einem Durchgang.
-    def _salden(basis_qs):
-        soll = {kid: betrag for kid, betrag in
-                basis_qs.values_list('soll_konto').annotate(t=Sum('betrag'))}
-        haben = {kid: betrag for kid, betrag in
-                 basis_qs.values_list('haben_konto').annotate(t=Sum('betrag'))}
-        return soll, haben
-
-    p_soll, p_haben = _salden(qs)                        # Periode (Erfolgsrechnung, ohne Abschluss)
-    k_soll, k_haben = _salden(bilanz_qs)                 # kumulativ bis Jahresende (Bilanz)
-    pi_soll, pi_haben = _salden(qs_periode_inkl)         # Periode MIT Abschluss (offener Erfolg)
+    # im PDF-Abzug.
+    def _salden(auswahl):
+        summen = Saldenbuch.summen(auswahl)
+        return ({kid: s for kid, (s, _) in summen.items()},
+                {kid: h for kid, (_, h) in summen.items()})
+
+    p_soll, p_haben = _salden(periode)                   # Periode (Erfolgsrechnung, ohne Abschluss)
+    k_soll, k_haben = _salden(bilanz)                    # kumulativ bis Jahresende (Bilanz)
+    pi_soll, pi_haben = _salden(periode_inkl)            # Periode MIT Abschluss (offener Erfolg)
     _0 = Decimal('0.00')
 
     ertraege, aufwaende = [], []
@@ -22,7 +22,7 @@ from core.auth import rolle_erforderlich, TEAM_ROLLEN
 from core.views.fw.arbeit import ANSICHTEN
 from finance.models import DebitorenRechnung
 
-from ._basis import _global_filter, _pendenz_ziel
+from ._basis import _global_filter
 
 # Elf Importe sind mit der alten Startseite weggefallen (Einheit, Liegenschaft,
 # Mietvertrag, defaultdict, date, STATUS_PILL, _pendenz_ziel, _num, die beiden
@@ -48,9 +48,9 @@ def fw_dashboard(request):
     abweicht». Wer die alten Auswertungen sucht, findet sie unter
     /neu/berichte/ — sie waren dort schon immer.
     """
-    from faelle.arbeitsvorrat import arbeitsvorrat, was_reisst
-    from faelle.lage import lage
+    from faelle.arbeitsvorrat import arbeitsvorrat
     from faelle.models import Fall
+    from faelle.startseite import stand
 
     basis = _global_filter(request)
     aktive_lg = basis['aktive_lg']
@@ -60,18 +60,26 @@ def fw_dashboard(request):
     if ansicht not in dict(ANSICHTEN):
         ansicht = 'heute'
 
+    # DER STAND DES TAGES. «Was reisst», die Inbox und die Lage sind die
+    # schweren Teile; sie kommen aus `faelle.startseite` — vom taeglichen Lauf
+    # vorgerechnet, von den Signalen teilweise verworfen, fuer alle im Team
+    # derselbe. Was billig ist und sich laufend bewegt (Zulauf, Termine,
+    # Freigaben, Vertretung, die Zaehler an den Reitern), rechnet diese View
+    # weiterhin selbst und legt es darueber.
+    teile = stand(heute, aktive_lg)
+
     # Die gemeinsamen Abschnitte kommen aus dem Sammler — Zulauf, Termine,
     # Freigaben, Liegezeit, Vertretung unter den `av_*`-Namen, die der
     # eingebundene Baustein erwartet. Sie hier ein zweites Mal
     # zusammenzusuchen, war der erste Entwurf; damit haette `arbeitsvorrat()`
     # ausser Tests keinen Aufrufer mehr gehabt — genau die Waise, die in
     # dieser Phase schon dreimal aufgetaucht ist.
-    av = arbeitsvorrat(request, aktive_lg)
+    av = arbeitsvorrat(request, aktive_lg, reisst=teile['reisst'])
 
     # EIN Durchgang fuer alle Fenster. `was_reisst(365)` ist die Obermenge;
     # «Diese Woche» und «Heute» sind daraus gefiltert, statt die Sammelarbeit
     # ueber alle vier Quellen zwei- oder dreimal zu leisten.
-    alle = was_reisst(heute, grenze=365, aktive_lg=aktive_lg)
+    alle = teile['reisst']
     woche = [e for e in alle if e['tage'] <= 7]
     heute_faellig = [e for e in woche if e['tage'] <= 0]
 
@@ -112,10 +120,7 @@ def fw_dashboard(request):
     # Listen»), was bleibt, sind vor allem die **undatierten** Aufgaben. Genau
     # die haben sonst keinen Ort: Der Arbeitsvorrat nimmt nur, was eine Frist
     # traegt.
-    from core.services.inbox import sammle_inbox
-    inbox, inbox_mehr, _typen = sammle_inbox(
-        aktive_lg=aktive_lg, lg_query=basis['lg_query'],
-        pendenz_ziel=_pendenz_ziel)
+    inbox, inbox_mehr = teile['inbox']
 
     return render(request, 'fw/dashboard.html', {
         **basis, 'nav': 'dashboard',
@@ -132,7 +137,7 @@ def fw_dashboard(request):
         **av,
         'inbox': inbox,
         'inbox_mehr': inbox_mehr,
-        **lage(heute, aktive_lg),
+        **teile['lage'],
     })
 
 
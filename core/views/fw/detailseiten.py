@@ -643,6 +643,13 @@ def fw_objekt_detail(request, pk):
 
     geraete = Geraet.objects.filter(einheit=e).order_by('kategorie')
     zaehler = Zaehler.objects.filter(einheit=e).order_by('typ')
+    # Verbrauch der letzten zwölf Monate je Zähler — eine Abfrage für alle.
+    from datetime import timedelta
+    from core.services.verbrauch import verbrauch_je_zaehler
+    _bis = timezone.localdate()
+    _verbrauch = verbrauch_je_zaehler(zaehler, _bis - timedelta(days=365), _bis)
+    for z in zaehler:
+        z.verbrauch_12m = _verbrauch.get(z.pk)
     fotos = list(e.fotos.all())
 
     # Sollmietzins-Komponenten (datierte Netto-/NK-Historie). Die aktuell gültige
@@ -342,43 +342,22 @@ def fw_suche(request):
     personen, liegenschaften, objekte, vertraege = [], [], [], []
 
     if q:
-        # Telefon-Suche: Nummern werden in vielen Formaten erfasst («079 123 45 67»,
-        # «+41791234567») — Query UND Feldwerte auf reine Ziffern normalisieren,
-        # damit der Anrufer vom Display direkt gefunden wird.
-        personen_q = (Q(vorname__icontains=q) | Q(nachname__icontains=q)
-                      | Q(firmen_name__icontains=q) | Q(email__icontains=q)
-                      | Q(ort__icontains=q)
-                      | Q(mobile__icontains=q) | Q(telefon_privat__icontains=q)
-                      | Q(telefon_geschaeft__icontains=q))
-        personen = list(Mieter.objects.filter(personen_q)
-                        .order_by('nachname', 'firmen_name')[:20])
-        ziffern = ''.join(ch for ch in q if ch.isdigit())
-        if len(ziffern) >= 5 and len(personen) < 20:
-            # Format-agnostischer Nachfilter über die Telefon-Felder.
-            vorhandene = {p.id for p in personen}
-            for p in Mieter.objects.exclude(id__in=vorhandene).exclude(
-                    mobile='', telefon_privat='', telefon_geschaeft='')[:500]:
-                nummern = ''.join(ch for ch in f"{p.mobile}|{p.telefon_privat}|{p.telefon_geschaeft}" if ch.isdigit())
-                if ziffern in nummern:
-                    personen.append(p)
-                    if len(personen) >= 20:
-                        break
+        # Personen, Objekte und Verträge über den Suchindex — nach Ähnlichkeit
+        # sortiert, mit Tippfehlern und formatfremden Telefonnummern
+        # («0791234567» findet «079 123 45 67»); siehe `core.services.suche`.
+        from core.services import suche
+        treffer = suche.suchen(q, arten=('mieter', 'einheit', 'vertrag'))
+        personen = suche.in_reihenfolge(Mieter.objects.all(), treffer['mieter'])
+        objekte = suche.in_reihenfolge(Einheit.objects.select_related('liegenschaft'),
+                                       treffer['einheit'])
+        vertraege = suche.in_reihenfolge(
+            Mietvertrag.objects.select_related('mieter', 'einheit__liegenschaft'),
+            treffer['vertrag'])
 
         liegenschaften = list(Liegenschaft.objects.filter(
             Q(strasse__icontains=q) | Q(ort__icontains=q) | Q(plz__icontains=q) | Q(egid__icontains=q)
         ).order_by('strasse')[:20])
 
-        objekte = list(Einheit.objects.select_related('liegenschaft').filter(
-            Q(bezeichnung__icontains=q) | Q(etage__icontains=q)
-            | Q(liegenschaft__strasse__icontains=q) | Q(liegenschaft__ort__icontains=q)
-        ).order_by('liegenschaft__strasse', 'bezeichnung')[:20])
-
-        vertraege = list(Mietvertrag.objects.select_related('mieter', 'einheit__liegenschaft').filter(
-            Q(mieter__vorname__icontains=q) | Q(mieter__nachname__icontains=q)
-            | Q(mieter__firmen_name__icontains=q) | Q(einheit__bezeichnung__icontains=q)
-            | Q(einheit__liegenschaft__strasse__icontains=q)
-        ).order_by('-beginn')[:20])
-
     total = len(personen) + len(liegenschaften) + len(objekte) + len(vertraege)
     return render(request, 'fw/suche.html', {
         **basis, 'nav': '', 'q': q, 'total': total,
@@ -62,8 +62,7 @@ def fw_debitoren(request):
 
     qs = (DebitorenRechnung.objects
           .select_related('vertrag__mieter', 'vertrag__einheit__liegenschaft__eigentuemer',
-                          'liegenschaft__eigentuemer', 'einheit__liegenschaft')
-          .prefetch_related('zahlungseingaenge'))
+                          'liegenschaft__eigentuemer', 'einheit__liegenschaft'))
     if aktive_lg:
         qs = qs.filter(Q(liegenschaft=aktive_lg) | Q(vertrag__einheit__liegenschaft=aktive_lg))
 
@@ -73,10 +72,9 @@ def fw_debitoren(request):
         qs = qs.filter(status=status_filter)
     q = (request.GET.get('q') or '').strip()
     if q:
-        qs = qs.filter(Q(titel__icontains=q)
-                       | Q(vertrag__mieter__vorname__icontains=q)
-                       | Q(vertrag__mieter__nachname__icontains=q)
-                       | Q(vertrag__mieter__firmen_name__icontains=q))
+        # Titel und Mietername stehen im Suchdokument der Rechnung.
+        from core.services import suche
+        qs = suche.filtern(qs, 'rechnung', q)
 
     # --- KPI-Summen als DB-Aggregate ---------------------------------------
     # Vorher lief hier eine Python-Schleife über ALLE Rechnungen (inkl. der
@@ -85,28 +83,18 @@ def fw_debitoren(request):
     # Objekte und ~500 ms für eine Seite, die 50 Zeilen zeigt — und es wächst
     # linear mit jedem Monat Sollstellung. Die Summen rechnet jetzt die
     # Datenbank, materialisiert wird nur die angezeigte Seite (Profiling).
-    from django.db.models import OuterRef, Subquery, Count, Value, DecimalField
-    from django.db.models.functions import Coalesce, Greatest
-    _GELD = DecimalField(max_digits=12, decimal_places=2)
-    _NULL = Value(Decimal('0.00'), output_field=_GELD)
-    _OFFEN_STATUS = ('offen', 'teilbezahlt')
-
-    # Verbuchte Zahlungen je Rechnung als SUBQUERY, nicht als JOIN: ein Join auf
-    # die Zahlungen vervielfacht die Rechnungszeilen (eine Zeile je Zahlung) und
-    # würde damit Sum('betrag') für Rechnungen mit Teilzahlungen verfälschen.
-    _bezahlt = Subquery(
-        Zahlungseingang.objects
-        .filter(debitoren_rechnung=OuterRef('pk'), status='verbucht')
-        .values('debitoren_rechnung').annotate(s=Sum('betrag')).values('s')[:1],
-        output_field=_GELD)
-    # Spiegelt DebitorenRechnung.offener_betrag: max(0, betrag − verbucht).
-    _offen_expr = Greatest(F('betrag') - Coalesce(_bezahlt, _NULL), _NULL, output_field=_GELD)
+    from django.db.models import Count
+    from django.db.models.functions import Coalesce
+    _OFFEN_STATUS = qs.OFFEN_STATUS
+    # Offener Betrag je Rechnung aus `mit_offen()` (Unterabfrage über die
+    # verbuchten Zahlungen, nicht Join — siehe DebitorenRechnungQuerySet).
+    qs = qs.mit_offen()
     _faellig_expr = Coalesce('faellig_am', 'datum')   # datum hat Default → nie NULL
 
     total_betrag = (qs.exclude(status='storniert')
                     .aggregate(s=Sum('betrag'))['s'] or Decimal('0.00'))
     offene_qs = qs.filter(status__in=_OFFEN_STATUS)
-    _agg = offene_qs.annotate(_o=_offen_expr).aggregate(s=Sum('_o'), n=Count('id'))
+    _agg = offene_qs.aggregate(s=Sum('offen'), n=Count('id'))
     total_offen = _agg['s'] or Decimal('0.00')
     anzahl_offen = _agg['n'] or 0
     # _mahnstufe() liefert für JEDE überfällige offene Rechnung einen Treffer
@@ -115,40 +103,27 @@ def fw_debitoren(request):
     anzahl_ueberfaellig = (offene_qs.annotate(_f=_faellig_expr)
                            .filter(_f__lt=heute).count())
 
-    # --- Sortierung + Pagination in SQL ------------------------------------
+    # --- Sortierung + Blättern in SQL ---------------------------------------
     # Reihenfolge wie bisher: offene Posten zuerst (älteste Fälligkeit oben),
-    # erledigte danach (neuste oben). Zwei Querysets, weil eine einzelne
-    # ORDER BY-Klausel die Richtung nicht pro Gruppe umdrehen kann.
-    offene_sortiert = offene_qs.annotate(_f=_faellig_expr, _o=_offen_expr).order_by('_f', 'id')
-    andere_sortiert = (qs.exclude(status__in=_OFFEN_STATUS)
-                       .annotate(_f=_faellig_expr, _o=_offen_expr).order_by('-_f', '-id'))
-
-    from django.core.paginator import Paginator, Page
-    try:
-        seite = max(1, int(request.GET.get('seite') or 1))
-    except ValueError:
-        seite = 1
-    n_offen_rows = offene_sortiert.count()
-    rows_gesamt = n_offen_rows + andere_sortiert.count()
-    # Paginator über eine Platzhalter-Sequenz: das Template nutzt von `page` nur
-    # die Pager-Metadaten (Nummer, Seitenzahl, vor/zurück), nie object_list.
-    paginator = Paginator(range(rows_gesamt), 50)
-    page = paginator.get_page(seite)
-    _start = (page.number - 1) * paginator.per_page
-    _ende = _start + paginator.per_page
-    seiten_objekte = []
-    if _start < n_offen_rows:                       # Teil der Seite liegt in den offenen
-        seiten_objekte += list(offene_sortiert[_start:min(_ende, n_offen_rows)])
-    if _ende > n_offen_rows:                        # …und/oder in den erledigten
-        seiten_objekte += list(andere_sortiert[max(0, _start - n_offen_rows):_ende - n_offen_rows])
+    # erledigte danach (neuste oben). Zwei Abschnitte, weil eine einzelne
+    # ORDER BY-Klausel die Richtung nicht pro Gruppe umdrehen kann. Geblättert
+    # wird über den Schlüssel (Fälligkeit, id) statt über OFFSET, und gezählt
+    # nur beim frischen Aufruf — siehe `core.blaettern`.
+    from core.blaettern import blaettern
+    page = blaettern(request.GET, [
+        (offene_qs.annotate(_f=_faellig_expr), ('_f', 'id')),
+        (qs.exclude(status__in=_OFFEN_STATUS).annotate(_f=_faellig_expr), ('-_f', '-id')),
+    ])
+    rows_gesamt = page.paginator.count
+    seiten_objekte = page.object_list
 
     rows = []
     for r in seiten_objekte:
         lg = r.liegenschaft or (r.vertrag.einheit.liegenschaft if r.vertrag_id and r.vertrag.einheit_id else None)
         einheit = r.einheit or (r.vertrag.einheit if r.vertrag_id else None)
-        # `_o` kommt aus der Annotation (siehe oben) — identisch zu
+        # `offen` kommt aus `mit_offen()` (siehe oben) — identisch zu
         # r.offener_betrag, aber ohne die Zahlungen nachzuladen.
-        offen = r._o if r.status in _OFFEN_STATUS else Decimal('0.00')
+        offen = r.offen if r.status in _OFFEN_STATUS else Decimal('0.00')
         faellig = r.faellig_am or r.datum
         mahn = _mahnstufe(faellig, heute, r.status, _eigentuemer_von_rechnung(r))
         label, pill_cls = STATUS_PILL.get(r.status, (r.status, 'bg-slate-100 text-slate-500'))
@@ -166,10 +141,9 @@ def fw_debitoren(request):
         })
     # (Sortierung und Seitenauswahl sind oben bereits in SQL erledigt.)
     # Das Template iteriert `page` (nicht `rows`) — ein Page-Objekt ist über
-    # seine object_list iterierbar. Der Paginator oben kennt nur die Platzhalter-
-    # Sequenz für die Metadaten (Seitenzahl, vor/zurück); die tatsächlichen
-    # Zeilen werden hier eingesetzt, damit beides zusammenpasst.
-    page = Page(rows, page.number, paginator)
+    # seine object_list iterierbar; die aufbereiteten Zeilen ersetzen die
+    # Rechnungen, Seitenzahl und Schlüssel bleiben.
+    page.object_list = rows
 
     aktive_vertraege = (Mietvertrag.objects.filter(status='aktiv')
                         .select_related('mieter', 'einheit__liegenschaft').order_by('einheit__liegenschaft__strasse'))
@@ -710,13 +684,15 @@ def fw_berichte(request):
     heute = timezone.localdate()
 
     # --- Forderungen (Debitoren) ---
-    deb = DebitorenRechnung.objects.filter(status__in=['offen', 'teilbezahlt'])
+    # Zwei Summen über die offenen Posten — in der Datenbank, ohne eine
+    # einzige Rechnung zu laden.
+    from django.db.models.functions import Coalesce
+    deb = DebitorenRechnung.objects.offene_posten()
     if aktive_lg:
         deb = deb.filter(Q(liegenschaft=aktive_lg) | Q(vertrag__einheit__liegenschaft=aktive_lg))
-    deb = [r for r in deb.select_related('vertrag').prefetch_related('zahlungseingaenge') if r.offener_betrag > 0]
-    deb_offen = sum((r.offener_betrag for r in deb), Decimal('0.00'))
-    deb_ueberf = sum((r.offener_betrag for r in deb
-                      if (r.faellig_am or r.datum) and (r.faellig_am or r.datum) < heute), Decimal('0.00'))
+    deb_offen = deb.aggregate(s=Sum('offen'))['s'] or Decimal('0.00')
+    deb_ueberf = (deb.annotate(_f=Coalesce('faellig_am', 'datum')).filter(_f__lt=heute)
+                  .aggregate(s=Sum('offen'))['s'] or Decimal('0.00'))
 
     # --- Verbindlichkeiten (Kreditoren) ---
     kred = KreditorenRechnung.objects.exclude(status='storniert')
@@ -1109,6 +1085,11 @@ def fw_objekte(request):
                           ('leer', f'Leerstand ({kopf["leer"]})')],
     })
 
+#: Zeilen je Seite in Vertrags- und Personenliste. Mehr als bei den
+#: Debitoren: Die Personenliste filtert live im Browser, und das greift nur
+#: auf der geladenen Seite.
+LISTE_GROESSE = 100
+
 # Design-System-Chip-Variante je Status (fw-chip fw-<variant>)
 VERTRAG_CHIP = {'aktiv': 'good', 'gekuendigt': 'crit',
                 'entwurf': 'mut', 'archiviert': 'mut', 'beendet': 'mut'}
@@ -1123,9 +1104,7 @@ def fw_vertraege(request):
     basis = _global_filter(request)
     aktive_lg = basis['aktive_lg']
 
-    qs = (Mietvertrag.objects
-          .select_related('mieter', 'einheit__liegenschaft')
-          .order_by('-beginn'))
+    qs = Mietvertrag.objects.select_related('mieter', 'einheit__liegenschaft')
     if aktive_lg:
         qs = qs.filter(einheit__liegenschaft=aktive_lg)
 
@@ -1151,13 +1130,16 @@ def fw_vertraege(request):
         qs = qs.filter(status=status_filter).exclude(ende__lt=heute)
     q = (request.GET.get('q') or '').strip()
     if q:
-        qs = qs.filter(Q(mieter__vorname__icontains=q) | Q(mieter__nachname__icontains=q)
-                       | Q(mieter__firmen_name__icontains=q)
-                       | Q(einheit__bezeichnung__icontains=q)
-                       | Q(einheit__liegenschaft__strasse__icontains=q))
-
+        from core.services import suche
+        qs = suche.filtern(qs, 'vertrag', q)
+
+    # Geblättert über (beginn, id) — siehe `core.blaettern`. Die Zahl der
+    # aktiven Verträge zählt die Datenbank über den ganzen Filter, nicht die
+    # Zeilen der Seite; die Regel ist die von `anzeige_status`.
+    from core.blaettern import blaettern
+    page = blaettern(request.GET, [(qs, ('-beginn', '-id'))], groesse=LISTE_GROESSE)
     rows = []
-    for v in qs:
+    for v in page.object_list:
         anzeige = v.anzeige_status
         label, pill_cls = VERTRAG_PILL.get(
             anzeige, (anzeige, 'bg-slate-100 text-slate-500'))
@@ -1174,7 +1156,8 @@ def fw_vertraege(request):
         'status_filter': status_filter, 'q': q,
         'status_chips': [('', 'Alle')] + [(k, VERTRAG_PILL[k][0])
                                           for k in VERTRAG_FILTER],
-        'aktiv_count': sum(1 for r in rows if r['v'].anzeige_status == 'aktiv'),
+        'aktiv_count': qs.filter(status='aktiv').exclude(ende__lt=heute).count(),
+        'page': page,
     })
 
 
@@ -1183,7 +1166,7 @@ def fw_personen(request):
     basis = _global_filter(request)
     aktive_lg = basis['aktive_lg']
 
-    qs = Mieter.objects.all().order_by('nachname', 'firmen_name')
+    qs = Mieter.objects.all()
     if aktive_lg:
         # Haupt- ODER Mitmieter eines Vertrags in dieser Liegenschaft
         qs = qs.filter(Q(vertraege__einheit__liegenschaft=aktive_lg)
@@ -1194,12 +1177,15 @@ def fw_personen(request):
         qs = qs.filter(typ=typ_filter)
     q = (request.GET.get('q') or '').strip()
     if q:
-        qs = qs.filter(Q(vorname__icontains=q) | Q(nachname__icontains=q)
-                       | Q(firmen_name__icontains=q) | Q(email__icontains=q) | Q(ort__icontains=q)
-                       | Q(mobile__icontains=q) | Q(telefon_privat__icontains=q)
-                       | Q(telefon_geschaeft__icontains=q))
+        from core.services import suche
+        qs = suche.filtern(qs, 'mieter', q)
 
+    from core.blaettern import blaettern
+    page = blaettern(request.GET, [(qs, ('nachname', 'firmen_name', 'id'))], groesse=LISTE_GROESSE)
+    ids = [m.id for m in page.object_list]
+    # Nur die aktiven Verträge der Personen auf dieser Seite, nicht alle.
     aktive_vertraege = (Mietvertrag.objects.filter(status='aktiv')
+                        .filter(Q(mieter_id__in=ids) | Q(mitmieter_id__in=ids))
                         .select_related('einheit__liegenschaft'))
     vertrag_je_mieter = {}
     for v in aktive_vertraege:
@@ -1209,7 +1195,7 @@ def fw_personen(request):
             vertrag_je_mieter.setdefault(v.mitmieter_id, []).append(v)
 
     rows = []
-    for m in qs:
+    for m in page.object_list:
         aktive = vertrag_je_mieter.get(m.id, [])
         rows.append({
             'm': m,
@@ -1223,5 +1209,8 @@ def fw_personen(request):
         **basis, 'nav': 'personen', 'rows': rows,
         'typ_filter': typ_filter, 'q': q,
         'typ_chips': [('', 'Alle'), ('person', 'Privatpersonen'), ('firma', 'Firmen'), ('verein', 'Vereine')],
-        'mit_vertrag_count': sum(1 for r in rows if r['aktive']),
+        'mit_vertrag_count': (qs.filter(Q(vertraege__status='aktiv')
+                                        | Q(vertraege_als_mitmieter__status='aktiv'))
+                              .values('pk').distinct().count()),
+        'page': page,
     })
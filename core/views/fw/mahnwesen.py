@@ -47,11 +47,14 @@ def fw_mahnwesen(request):
     basis = _global_filter(request)
     aktive_lg = basis['aktive_lg']
 
-    qs = (DebitorenRechnung.objects
-          .filter(status__in=['offen', 'teilbezahlt'])
+    # Nur überfällige offene Posten laden: Rest und Fälligkeit filtert die
+    # Datenbank (`offene_posten()`), die Mahnstufe hängt am Eigentümer und
+    # bleibt in Python.
+    from django.db.models.functions import Coalesce
+    qs = (DebitorenRechnung.objects.offene_posten()
+          .annotate(_f=Coalesce('faellig_am', 'datum')).filter(_f__lt=heute)
           .select_related('vertrag__mieter', 'vertrag__einheit__liegenschaft__eigentuemer',
-                          'liegenschaft__eigentuemer')
-          .prefetch_related('zahlungseingaenge'))
+                          'liegenschaft__eigentuemer'))
     if aktive_lg:
         qs = qs.filter(Q(liegenschaft=aktive_lg) | Q(vertrag__einheit__liegenschaft=aktive_lg))
 
@@ -133,12 +136,10 @@ def fw_debitoren_aging(request):
     # `offener_betrag` summiert die verbuchten Zahlungseingänge. Ohne Prefetch
     # ist das EINE Abfrage je offener Rechnung — gemessen 88 Posten → 93
     # Abfragen, 176 → 181. Ausgerechnet diese Seite öffnet man dann, wenn viel
-    # offen ist. Der Prefetch-Zweig in `offener_betrag` greift nur, wenn die
-    # Zahlungen hier auch vorgeladen werden; die übrigen Debitoren-Listen tun
-    # das seit dem N+1-Hotfix, diese Seite war nicht nachgezogen worden.
-    qs = (DebitorenRechnung.objects.filter(status__in=['offen', 'teilbezahlt'])
-          .select_related('vertrag__mieter', 'vertrag__einheit__liegenschaft', 'liegenschaft')
-          .prefetch_related('zahlungseingaenge'))
+    # offen ist. `offene_posten()` rechnet den Rest in derselben Abfrage und
+    # lässt die bezahlten gleich weg; `offener_betrag` liest die Annotation.
+    qs = (DebitorenRechnung.objects.offene_posten()
+          .select_related('vertrag__mieter', 'vertrag__einheit__liegenschaft', 'liegenschaft'))
     if aktive_lg:
         qs = qs.filter(Q(liegenschaft=aktive_lg) | Q(vertrag__einheit__liegenschaft=aktive_lg))
 
@@ -324,32 +325,37 @@ def fw_mahnung_erfassen(request):
 def fw_mahnlauf(request):
     """Sammel-Mahnlauf über ALLE fälligen offenen Debitoren (statt einzeln).
     Erzeugt Mahnungen je Stufe (idempotent), stellt Mahngebühr + optional
-    Verzugszins und verschickt Zahlungserinnerungen per E-Mail."""
+    Verzugszins und verschickt Zahlungserinnerungen per E-Mail.
+
+    Die Vorschau rechnet weiter im Request (sie schreibt nichts); der Lauf
+    selbst wird als Laufauftrag eingereiht und im Hintergrund ausgeführt."""
     from django.shortcuts import redirect
     from django.contrib import messages
-    from core.auth import log_aktion
+    from urllib.parse import urlencode
     from core.services.automation import run_mahnlauf
+    from faelle.laufauftraege import einreihen
     if request.method != 'POST':
         return redirect('fw_mahnwesen')
     basis = _global_filter(request)
     mit_zins = request.POST.get('mit_zins') == 'on'
     send_email = request.POST.get('kein_versand') != 'on'
-    res = run_mahnlauf(aktive_lg=basis['aktive_lg'], send_email=send_email,
-                       mit_zins=mit_zins, user=request.user)
-    log_aktion(request, "Mahnlauf ausgeführt", "Sammellauf",
-               f"{res['gemahnt']} gemahnt, {res['emails']} E-Mails, Gebühren CHF {res['gebuehren']}, Zins CHF {res['zins']}")
-    if res['gemahnt']:
-        teile = [f"{res['gemahnt']} Mahnung(en) erstellt"]
-        if send_email:
-            teile.append(f"{res['emails']} E-Mail(s) versandt")
-        if res['gebuehren'] > 0:
-            teile.append(f"Gebühren CHF {res['gebuehren']}")
-        if res['zins'] > 0:
-            teile.append(f"Verzugszins CHF {res['zins']}")
-        messages.success(request, "✅ Mahnlauf: " + ", ".join(teile) + ".")
-    else:
-        messages.success(request, "Mahnlauf: keine neuen Mahnungen fällig — alles aktuell.")
-    ziel = '/neu/mahnwesen/'
-    if lg := request.POST.get('lg'):
-        ziel += f'?lg={lg}'
-    return redirect(ziel)
+    # `_global_filter` liest nur GET — der Lauf folgt dem Formularfeld `lg`,
+    # damit Vorschau und Lauf dieselben Forderungen sehen.
+    if (request.POST.get('lg') or '').isdigit():
+        from portfolio.models import Liegenschaft
+        basis['aktive_lg'] = Liegenschaft.objects.filter(id=request.POST['lg']).first()
+    if request.POST.get('probelauf') == 'on':
+        # Vorschau: nur planen, nichts schreiben, nichts versenden.
+        res = run_mahnlauf(aktive_lg=basis['aktive_lg'], send_email=send_email,
+                           mit_zins=mit_zins, probelauf=True)
+        return render(request, 'fw/mahnlauf_vorschau.html', {
+            **basis, 'nav': 'mahnwesen', 'res': res, 'mit_zins': mit_zins, 'send_email': send_email,
+            'n_email': sum(1 for s in res['plan'] if s['per_email'])})
+    lg = basis['aktive_lg']
+    auftrag = einreihen('mahnlauf', benutzer=request.user,
+                        periode=None if lg else timezone.localdate().strftime('%Y-%m'),
+                        liegenschaft=lg.pk if lg else None,
+                        send_email=send_email, mit_zins=mit_zins)
+    messages.info(request, "Mahnlauf eingereiht — er läuft im Hintergrund.")
+    ziel = '/neu/mahnwesen/' + (f'?lg={lg.pk}' if lg else '')
+    return redirect(f'/neu/auftraege/{auftrag.pk}/?' + urlencode({'zurueck': ziel}))
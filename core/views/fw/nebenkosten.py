@@ -68,9 +68,32 @@ def fw_nebenkosten(request):
         'n_offen': n_offen, 'n_zu': n_zu, 'total_kosten_offen': total_kosten_offen,
         'anzahl': len(rows),
         'liegenschaften': Liegenschaft.objects.order_by('strasse'),
+        'lauf_jahr': timezone.localdate().year - 1,
     })
 
 
+@rolle_erforderlich(*SCHREIB_ROLLEN)
+def fw_nebenkostenlauf(request):
+    """Alle Abrechnungen eines Jahres als Laufauftrag (siehe
+    `core.services.nebenkostenlauf`): rechnen, je Mieter ablegen, Manifest."""
+    from urllib.parse import urlencode
+    from django.contrib import messages
+    from django.shortcuts import redirect
+    from faelle.laufauftraege import einreihen
+
+    if request.method != 'POST':
+        return redirect('/neu/nebenkosten/')
+    try:
+        jahr = int(request.POST.get('jahr') or timezone.localdate().year - 1)
+    except ValueError:
+        messages.error(request, "Ungültiges Jahr.")
+        return redirect('/neu/nebenkosten/')
+    auftrag = einreihen('nebenkostenlauf', benutzer=request.user, periode=str(jahr),
+                        jahr=jahr, neu=request.POST.get('neu') == 'on')
+    messages.info(request, f"Nebenkostenlauf {jahr} eingereiht — er läuft im Hintergrund.")
+    return redirect(f'/neu/auftraege/{auftrag.pk}/?' + urlencode({'zurueck': '/neu/nebenkosten/'}))
+
+
 @rolle_erforderlich(*TEAM_ROLLEN)
 def fw_nebenkosten_detail(request, pk):
     """Zeigt die Abrechnung — nutzt die EINE kanonische Engine (core.utils.billing),
@@ -238,7 +261,8 @@ def fw_nebenkosten_versand(request, pk):
     from finance.models import AbrechnungsPeriode
     from crm.models import Organisation
     from core.utils.billing import hole_abrechnung
-    from core.services.nk_abrechnung import generate_nk_pdf_einzeln, generate_nk_pdf_sammel
+    from core.services.nk_abrechnung import (generate_nk_pdf_einzeln, generate_nk_pdf_sammel,
+                                             mieter_kontexte)
     from core.services.ablage import ablegen
     from core.auth import log_aktion
 
@@ -252,44 +276,15 @@ def fw_nebenkosten_versand(request, pk):
         messages.error(request, result['error'])
         return redirect(f'/neu/nebenkosten/{p.id}/')
 
-    vw = p.organisation      # die Verwaltung DIESER Abrechnungsperiode
-    lg = p.liegenschaft
-    periode_str = f"{p.bezeichnung} ({p.start_datum:%d.%m.%Y}–{p.ende_datum:%d.%m.%Y})"
-    positionen = result.get('belege_details', [])
-    total_kosten = result.get('total_kosten', Decimal('0.00'))
-
     kontexte = []
     abgelegt = 0
-    for a in result.get('abrechnungen', []):
-        vid = a.get('vertrag_id')
-        if not vid or a.get('typ') == 'leerstand':
-            continue
-        v = Mietvertrag.objects.filter(id=vid).select_related('mieter', 'mitmieter', 'einheit__liegenschaft').first()
-        if not v:
-            continue
-        m = v.mieter
-        namen = m.display_name
-        zweit = (v.mitmieter.display_name if v.mitmieter_id else (v.mitmieter_name or '')).strip()
-        if zweit:
-            namen += f" & {zweit}"
-        adresse = [namen]
-        if m.strasse:
-            adresse.append(m.strasse)
-        if m.plz or m.ort:
-            adresse.append(f"{m.plz or ''} {m.ort or ''}".strip())
-        k = {
-            'verwaltung': vw, 'periode': periode_str,
-            'objekt': f"{lg.strasse}, {lg.plz} {lg.ort} · {v.einheit.bezeichnung}" if lg and v.einheit_id else (v.einheit.bezeichnung if v.einheit_id else ''),
-            'adresse': adresse, 'positionen': positionen, 'total_kosten': total_kosten,
-            'kosten_anteil': a.get('kosten_anteil', 0), 'akonto': a.get('akonto', 0),
-            'saldo': a.get('saldo', 0), 'nachzahlung': a.get('nachzahlung', False),
-        }
+    for v, k in mieter_kontexte(p, result):
         kontexte.append(k)
         # Einzel-PDF in die Akte des Mieters (erscheint im Portal)
         try:
             einzel = generate_nk_pdf_einzeln(k)
             if ablegen(einzel, f"Nebenkostenabrechnung {p.bezeichnung}", kategorie='korrespondenz',
-                       vertrag=v, mieter=m, dedup=True):
+                       vertrag=v, mieter=v.mieter, dedup=True):
                 abgelegt += 1
         except Exception:
             logger.debug("Fehler bewusst übergangen", exc_info=True)
@@ -116,12 +116,14 @@ def fw_sollstellung(request):
 
 @rolle_erforderlich(ROLLE_VERWALTER)
 def fw_sollstellung_run(request):
-    """Führt den Mietenlauf für den gewählten Monat aus (idempotent, Pro-Rata,
-    Debitoren 1100 an Ertrag 3000 / NK-Akonto 3020) — wie die Finanz-API."""
+    """Reiht den Mietenlauf für den gewählten Monat als Laufauftrag ein
+    (idempotent, Pro-Rata, Debitoren 1100 an Ertrag 3000 / NK-Akonto 3020)
+    und leitet auf dessen Fortschritt um. Gerechnet wird im Hintergrund
+    (`faelle.laufauftraege`), nicht mehr im Request."""
+    from urllib.parse import urlencode
     from django.shortcuts import redirect
     from django.contrib import messages
-    from finance.models import Buchungskonto, Buchung
-    from core.auth import log_aktion
+    from faelle.laufauftraege import einreihen
 
     if request.method != 'POST':
         return redirect('fw_sollstellung')
@@ -144,23 +146,71 @@ def fw_sollstellung_run(request):
     # Rechnung, obwohl der Dialog die gefilterte Anzahl nannte (Praxis-Audit).
     # `lg` kommt beim POST aus dem Formular-Feld (_global_filter liest nur GET).
     lauf_lg = Liegenschaft.objects.filter(id=request.POST.get('lg') or None).first()
-    from core.services.automation import run_sollstellung
-    try:
-        erstellt = run_sollstellung(jahr, monat, user=request.user, liegenschaft=lauf_lg)
-    except RuntimeError as e:
-        messages.error(request, f"{e}")
-        return redirect(f'/neu/sollstellung/?jahr={jahr}&monat={monat}')
-
-    log_aktion(request, "Sollstellung ausgeführt", titel,
-               f"{erstellt} Rechnungen erstellt"
-               + (f" · nur {lauf_lg.strasse}" if lauf_lg else " · ganzes Portfolio"))
+    # Nur ein Lauf über den ganzen Bestand schliesst den geplanten Lauf der
+    # Periode ab — eine einzelne Liegenschaft ist nicht «die Sollstellung August».
+    auftrag = einreihen('sollstellung', benutzer=request.user,
+                        periode=None if lauf_lg else f'{jahr}-{monat:02d}',
+                        jahr=jahr, monat=monat, liegenschaft=lauf_lg.pk if lauf_lg else None)
     umfang = f" ({lauf_lg.strasse})" if lauf_lg else ""
-    if erstellt:
-        messages.success(request, f"✅ Sollstellung {titel}{umfang}: {erstellt} Rechnung(en) erstellt.")
-    else:
-        messages.success(request, f"Sollstellung {titel}{umfang}: alles bereits gestellt — "
-                                  f"nichts Neues erzeugt.")
+    messages.info(request, f"Sollstellung {titel}{umfang} eingereiht — sie läuft im Hintergrund.")
     ziel = f'/neu/sollstellung/?jahr={jahr}&monat={monat}'
     if lauf_lg:
         ziel += f'&lg={lauf_lg.id}'
-    return redirect(ziel)
+    return redirect(f'/neu/auftraege/{auftrag.pk}/?' + urlencode({'zurueck': ziel}))
+
+
+@rolle_erforderlich(*TEAM_ROLLEN)
+def fw_sollstellung_prognose(request):
+    """Prognose der Sollstellung über mehrere Monate, als JSON oder CSV.
+
+    ?von=JJJJ-MM (Standard: laufender Monat), ?monate=1–36 (Standard 12),
+    ?nach=vertrag|liegenschaft|eigentuemer (Standard liegenschaft),
+    ?format=csv für den Export. Folgt dem Liegenschaftsfilter (?lg=).
+    Liest nur — siehe `core.services.sollstellung_prognose`.
+    """
+    import csv
+    from django.http import HttpResponse, JsonResponse
+    from core.services.sollstellung_prognose import GRUPPEN, prognose, verdichten
+
+    basis = _global_filter(request)
+    heute = timezone.localdate()
+    try:
+        jahr, monat = (int(t) for t in (request.GET.get('von') or f'{heute.year}-{heute.month}').split('-'))
+        von = date(jahr, monat, 1)
+    except ValueError:
+        von = heute.replace(day=1)
+    if not 2000 <= von.year <= 2100:
+        von = heute.replace(day=1)
+    try:
+        monate = int(request.GET.get('monate') or 12)
+    except ValueError:
+        monate = 12
+    nach = request.GET.get('nach') or 'liegenschaft'
+    if nach not in GRUPPEN:
+        nach = 'liegenschaft'
+
+    ergebnis = prognose(von, monate, liegenschaft=basis['aktive_lg'])
+    zeilen = verdichten(ergebnis, nach)
+    spalten = [f'{m:02d}/{j}' for j, m in ergebnis['monate']]
+
+    if request.GET.get('format') == 'csv':
+        # utf-8 plus EIN BOM von Hand: Mit `charset=utf-8-sig` setzt jedes
+        # `write()` des csv-Writers ein eigenes BOM vor seine Zeile.
+        resp = HttpResponse(content_type='text/csv; charset=utf-8')
+        resp['Content-Disposition'] = (f'attachment; filename="Sollstellung_Prognose_'
+                                       f'{von:%Y-%m}_{len(spalten)}M.csv"')
+        resp.write('﻿')  # BOM für Excel
+        w = csv.writer(resp, delimiter=';')
+        w.writerow(['ID', nach.capitalize(), *spalten, 'Total'])
+        for z in zeilen:
+            w.writerow([z['id'] or '', z['bezeichnung'], *(f'{b:.2f}' for b in z['betraege']),
+                        f"{sum(z['betraege']):.2f}"])
+        w.writerow(['', 'Total', *(f'{b:.2f}' for b in ergebnis['total']),
+                    f"{sum(ergebnis['total']):.2f}"])
+        return resp
+
+    return JsonResponse({
+        'von': f'{von:%Y-%m}', 'monate': spalten, 'nach': nach,
+        'zeilen': [{**z, 'total': sum(z['betraege'])} for z in zeilen],
+        'total': ergebnis['total'], 'summe': sum(ergebnis['total']),
+    }, json_dumps_params={'ensure_ascii': False})
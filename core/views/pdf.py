@@ -104,6 +104,24 @@ def generate_vertragspaket_zip(request, vertrag_id):
     return resp
 
 
+@rolle_erforderlich(ROLLE_VERWALTER, ROLLE_SACHBEARBEITER, ROLLE_LESEZUGRIFF)
+def vertragspaket_einreihen(request, vertrag_id):
+    """Wie `generate_vertragspaket_zip`, aber als Laufauftrag: Die sechs PDFs
+    entstehen im Hintergrund, das ZIP liegt danach beim Auftrag zum
+    Herunterladen. Der Knopf im Vertrag nimmt diesen Weg; die direkte
+    Adresse bleibt für Lesezeichen."""
+    from urllib.parse import urlencode
+    from django.shortcuts import redirect
+    from faelle.laufauftraege import einreihen
+
+    vertrag = get_object_or_404(Mietvertrag, pk=vertrag_id)
+    if request.method != 'POST':
+        return redirect(f'/vertrag/{vertrag.pk}/dokumente-zip/')
+    auftrag = einreihen('vertragspaket', benutzer=request.user, vertrag=vertrag.pk)
+    return redirect(f'/neu/auftraege/{auftrag.pk}/?'
+                    + urlencode({'zurueck': f'/neu/vertraege/{vertrag.pk}/'}))
+
+
 @rolle_erforderlich(ROLLE_VERWALTER, ROLLE_SACHBEARBEITER, ROLLE_LESEZUGRIFF)
 def generate_dokument_view(request, vertrag_id, doc_type):
     """Erstellt eines der Fairwalter-Begleitdokumente (Allgemeine Bedingungen,
@@ -116,113 +116,12 @@ def portal_freigabe(request, pk):
 
 
 def _portfolio_daten(eigentuemer):
-    """Sammelt Rendite-Cockpit-Kennzahlen, Objektlisten und Dokumente."""
-    from portfolio.models import Dokument as PDokument
-    from finance.models import DebitorenRechnung
-    from django.utils import timezone
-    heute = timezone.localdate()
-    liegenschaften = []
-    total_soll = Decimal('0.00')
-    total_einheiten = 0
-    total_vermietet = 0
-    total_versicherungswert = Decimal('0.00')
-    total_ausstand = Decimal('0.00')
-    total_ueberfaellig = Decimal('0.00')
-
-    for lg in eigentuemer.liegenschaften.all().prefetch_related('einheiten'):
-        einheiten_rows = []
-        lg_soll = Decimal('0.00')
-        lg_einheiten = 0
-        lg_vermietet = 0
-
-        for e in lg.einheiten.all():
-            vertrag = (
-                Mietvertrag.objects
-                .filter(einheit=e, status='aktiv')
-                .select_related('mieter')
-                .order_by('-beginn')
-                .first()
-            )
-            brutto = vertrag.brutto_mietzins if vertrag else Decimal('0.00')
-            lg_soll += brutto
-            total_einheiten += 1
-            lg_einheiten += 1
-            if vertrag:
-                total_vermietet += 1
-                lg_vermietet += 1
-
-            einheiten_rows.append({
-                'bezeichnung': e.bezeichnung,
-                'typ': e.get_typ_display(),
-                'zimmer': e.zimmer,
-                'flaeche': e.flaeche_m2,
-                'mieter': str(vertrag.mieter) if vertrag else None,
-                'seit': vertrag.beginn if vertrag else None,
-                'brutto': brutto if vertrag else None,
-            })
-
-        total_soll += lg_soll
-        vw = lg.versicherungswert or Decimal('0.00')
-        total_versicherungswert += vw
-        lg_jahr = lg_soll * 12
-        lg_rendite = (float(lg_jahr) / float(vw) * 100) if vw else None
-        lg_leer = lg_einheiten - lg_vermietet
-
-        dok_qs = PDokument.objects.filter(liegenschaft=lg).order_by('-datum')[:20]
-        dokumente = [{'id': d.id, 'titel': d.titel, 'kategorie': d.kategorie, 'datum': d.datum}
-                     for d in dok_qs]
-
-        # Ist vs. Soll: offene Mietforderungen dieser Liegenschaft (Ausstände).
-        # Der Eigentümer sieht so, ob die Soll-Mieten auch tatsächlich eingehen.
-        from django.db.models import Q as _Q
-        lg_ausstand = Decimal('0.00')
-        lg_ueberfaellig = Decimal('0.00')
-        offene_qs = (DebitorenRechnung.objects
-                     .filter(_Q(liegenschaft=lg) | _Q(vertrag__einheit__liegenschaft=lg),
-                             status__in=('offen', 'teilbezahlt'))
-                     .prefetch_related('zahlungseingaenge'))
-        for r in offene_qs:
-            offen = r.offener_betrag
-            lg_ausstand += offen
-            if (r.faellig_am or r.datum) < heute:
-                lg_ueberfaellig += offen
-        total_ausstand += lg_ausstand
-        total_ueberfaellig += lg_ueberfaellig
-
-        liegenschaften.append({
-            'id': lg.id,
-            'adresse': f"{lg.strasse}, {lg.plz} {lg.ort}",
-            'baujahr': lg.baujahr,
-            'einheiten': einheiten_rows,
-            'soll_monat': lg_soll,
-            'jahres_soll': lg_jahr,
-            'versicherungswert': vw if vw else None,
-            'rendite': lg_rendite,
-            'leer': lg_leer,
-            'leerquote': (lg_leer / lg_einheiten * 100) if lg_einheiten else 0,
-            'dokumente': dokumente,
-            'ausstand': lg_ausstand,
-            'ueberfaellig': lg_ueberfaellig,
-        })
+    """Sammelt Rendite-Cockpit-Kennzahlen, Objektlisten und Dokumente.
 
-    total_leer = total_einheiten - total_vermietet
-    jahres_soll = total_soll * 12
-    bruttorendite = (float(jahres_soll) / float(total_versicherungswert) * 100) if total_versicherungswert else None
-    leerquote = (total_leer / total_einheiten * 100) if total_einheiten else 0
-
-    return {
-        'liegenschaften': liegenschaften,
-        'total_soll': total_soll,
-        'jahres_soll': jahres_soll,
-        'total_einheiten': total_einheiten,
-        'total_vermietet': total_vermietet,
-        'total_leer': total_leer,
-        'total_versicherungswert': total_versicherungswert if total_versicherungswert else None,
-        'bruttorendite': bruttorendite,
-        'leerquote': leerquote,
-        'total_ausstand': total_ausstand,
-        'total_ueberfaellig': total_ueberfaellig,
-    }
+    Gerechnet und zwischengespeichert in `core.services.eigentuemer_portfolio`
+    — dieselben Zahlen brauchen der Portfolio-Report und der Report-Versand."""
+    from core.services.eigentuemer_portfolio import portfolio_daten
+    return portfolio_daten(eigentuemer)
 
 
 @login_required
@@ -377,7 +276,7 @@ def _mieter_offene(mieter):
     alle_vertrag_ids = list(Mietvertrag.objects.filter(_ist_mieter_q(mieter)).values_list('id', flat=True))
     offene_qs = (DebitorenRechnung.objects
                  .filter(vertrag_id__in=alle_vertrag_ids, status__in=['offen', 'teilbezahlt'])
-                 .select_related('vertrag').order_by('faellig_am'))
+                 .mit_offen().select_related('vertrag').order_by('faellig_am'))
     heute = timezone.localdate()
     offene = []
     total_offen = Decimal('0.00')
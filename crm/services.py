@@ -1,21 +1,18 @@
 # crm/services.py
-from django.db.models import Q
 from .models import Mieter
 
 def search_mieter(query):
     """
-    Sucht Mieter anhand von Vorname, Nachname, Email oder Firmenname.
+    Sucht Mieter anhand von Name, Firmenname, E-Mail, Ort oder Telefon
+    (über den Suchindex, siehe core.services.suche).
     Gibt ein Django QuerySet zurück.
     """
+    from core.services import suche
+
     if not query:
         return Mieter.objects.all()
 
-    return Mieter.objects.filter(
-        Q(vorname__icontains=query) |
-        Q(nachname__icontains=query) |
-        Q(email__icontains=query) |
-        Q(firma__icontains=query)
-    ).distinct()
+    return suche.filtern(Mieter.objects.all(), 'mieter', query)
 
 def onboard_new_mieter(mieter_obj):
     """
@@ -203,11 +203,15 @@ QUELLEN = (
 )
 
 
-def was_reisst(heute=None, grenze=VORSCHAU_TAGE, aktive_lg=None):
+def was_reisst(heute=None, grenze=VORSCHAU_TAGE, aktive_lg=None, ausfaelle=None):
     """Überfälliges und bald Fälliges, über alle Quellen gemischt.
 
     Rückgabe: nach Fälligkeit sortierte Liste. Jede Zeile trägt `art`, damit
     die Oberfläche das passende Ziel verlinken kann, ohne zu raten.
+
+    `ausfaelle`: eine Liste, an die der Name jeder Quelle angehängt wird, die
+    nicht geladen werden konnte. Wer das Ergebnis aufbewahrt, muss das
+    wissen — die Liste ist dann unvollständig.
     """
     heute = heute or timezone.localdate()
     bis = heute + timedelta(days=grenze)
@@ -222,6 +226,8 @@ def was_reisst(heute=None, grenze=VORSCHAU_TAGE, aktive_lg=None):
             # diesem Haus verboten (Befund P6); hier wäre er zusätzlich
             # heimtückisch, weil eine leere Liste wie ein ruhiger Tag aussieht.
             log.exception('Arbeitsvorrat: Quelle «%s» konnte nicht geladen werden', name)
+            if ausfaelle is not None:
+                ausfaelle.append(name)
     eintraege.sort(key=lambda e: e['datum'])
     return eintraege
 
@@ -457,10 +463,18 @@ def liegezeit(zeilen):
     return round(sum(alter) / len(alter), 1) if alter else None
 
 
-def arbeitsvorrat(request, aktive_lg=None):
-    """Alles, was die Heute-Ansicht braucht — in einem Aufruf."""
+def arbeitsvorrat(request, aktive_lg=None, reisst=None):
+    """Alles, was die Heute-Ansicht braucht — in einem Aufruf.
+
+    `reisst` nimmt eine schon gesammelte «Was reisst»-Liste mit mindestens
+    `VORSCHAU_TAGE` Vorschau; die Startseite reicht ihren Stand herein
+    (`faelle.startseite`), statt die vier Quellen ein zweites Mal abzufragen.
+    """
     heute = timezone.localdate()
-    reisst = was_reisst(heute, aktive_lg=aktive_lg)
+    if reisst is None:
+        reisst = was_reisst(heute, aktive_lg=aktive_lg)
+    else:
+        reisst = [e for e in reisst if e['tage'] <= VORSCHAU_TAGE]
     eingaenge, eingaenge_gesamt = posteingang()
     termin_zeilen = termine(heute)
     freigaben = wartet_auf_freigabe()
@@ -48,11 +48,6 @@ SCHWELLE_LEERSTAND = Decimal('3')
 #: und kein Zufall. Zwei wären Rauschen.
 TREND_MONATE = 3
 
-#: So viele Verträge werden auf einen Senkungsanspruch geprüft. Die Grenze ist
-#: da, weil die Prüfung je Vertrag rechnet (Referenzzins gegen die wirksame
-#: Basis) und nicht in einer Abfrage zu haben ist.
-SENKUNG_STICHPROBE = 400
-
 
 def _monatsgrenzen(stichtag):
     """(erster Tag des Monats, erster Tag des Vormonats, letzter Tag Vormonat)."""
@@ -213,20 +208,16 @@ def mandate(stichtag=None):
 
 
 def _senkungsansprueche():
-    """Verträge, deren Referenzzins unter die wirksame Basis gefallen ist.
+    """Anzahl Verträge, deren Referenzzins unter die wirksame Basis gefallen ist.
 
-    `Mietvertrag.mietzinspotenzial` rechnet je Vertrag und ist nicht in eine
-    Abfrage zu bringen: Es liest die Organisation (Zinsstand) und die jüngste
-    wirksame Anpassung. Ohne `select_related` und `prefetch_related` sind das
-    zwei zusätzliche Abfragen **je Vertrag** — bei der Stichprobe von 400 also
-    achthundert, bei jedem Aufruf der Startseite.
+    Bis hierher rechnete die Lage `Mietvertrag.mietzinspotenzial` je Vertrag
+    und prüfte darum nur eine Stichprobe von 400 — wer mehr Verträge hatte,
+    sah eine zu kleine Zahl. Jetzt zählt EINE Abfrage das Merkmal, das
+    `core.services.senkungsanspruch` für den ganzen Bestand nachführt.
     """
     from rentals.models import Mietvertrag
 
-    vertraege = (Mietvertrag.objects.filter(status='aktiv')
-                 .select_related('organisation')
-                 .prefetch_related('anpassungen')[:SENKUNG_STICHPROBE])
-    return [v for v in vertraege if v.mietzinspotenzial == 'decrease']
+    return Mietvertrag.objects.filter(status='aktiv', senkungsanspruch=True).count()
 
 
 def abweichungen(stichtag=None, aktive_lg=None):
@@ -276,8 +267,8 @@ def abweichungen(stichtag=None, aktive_lg=None):
         if senkung:
             befunde.append({
                 'stufe': 'warn',
-                'titel': f'Senkungsanspruch bei {len(senkung)} Mietverhältnis'
-                         f'{"sen" if len(senkung) != 1 else ""}',
+                'titel': f'Senkungsanspruch bei {senkung} Mietverhältnis'
+                         f'{"sen" if senkung != 1 else ""}',
                 'text': ('Der Referenzzinssatz ist seit der Festsetzung gesunken. '
                          'Geltend gemacht hat ihn bisher niemand — die Ansprüche '
                          'bestehen aber.'),
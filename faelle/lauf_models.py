@@ -25,13 +25,19 @@ WAS DIESE ETAPPE NICHT TUT
 Sie rechnet nichts. Die bestehenden Views bleiben unverändert und machen die
 Arbeit weiter. Hier entsteht nur die Buchführung darüber — additiv, wie der
 ganze Rest von Phase 4a.
+
+Ausgeführt wird seither über `Laufauftrag` (unten): Sollstellung und Mahnlauf
+laufen nicht mehr im Request, sondern im Worker, und melden ihren Fortschritt
+in den Auftrag und von dort in den `Lauf` der Periode.
 """
 from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
-from core.organisation_kette import OrganisationAusKette, organisation_aus_kontext
+from core.organisation_kette import (OrganisationAusKette, organisation_aus_kontext,
+                                     organisation_bestimmen)
 from core.tenancy import AlleOrganisationenManager, TenantManager, TenantQuerySet
+from core.utils import get_smart_upload_path
 
 
 class Laufart(models.Model):
@@ -267,3 +273,93 @@ class Blockade(OrganisationAusKette):
             self.behoben_am = timezone.now()
             self.save(update_fields=['behoben_am'])
         return self
+
+
+class Laufauftrag(models.Model):
+    """Ein Lauf, der im Hintergrund ausgeführt wird — eingereiht, dann abgearbeitet.
+
+    Sollstellung und Mahnlauf rechneten im Request: Ein Klick hielt den
+    einzigen Arbeitsprozess der Website minutenlang fest, und brach der
+    Browser oder der Proxy ab, wusste niemand, wie weit der Lauf gekommen
+    war. Jetzt reiht der Knopf einen Auftrag ein und zeigt dessen Fortschritt;
+    gerechnet wird im Worker (`laufauftraege_abarbeiten`, siehe
+    `faelle.laufauftraege`).
+
+    Ein Auftrag meldet `erledigt`/`gesamt` und einen Schritt in Klartext,
+    endet mit einem `ergebnis` (dieselben Zahlen, die vorher die Meldung im
+    Browser trug) und gegebenenfalls einer `datei` zum Herunterladen. Gehört
+    er zu einem geplanten `Lauf` — Sollstellung für den ganzen Bestand im
+    Monat des Laufs —, wird dieser mitgeführt: gestartet, und am Ende mit den
+    Kennzahlen abgeschlossen.
+    """
+    organisation = models.ForeignKey('crm.Organisation', on_delete=models.CASCADE,
+                                     editable=False, related_name='laufauftraege',
+                                     verbose_name='Organisation')
+
+    def save(self, *args, **kwargs):
+        if self.organisation_id is None:
+            self.organisation_id = organisation_bestimmen().pk
+        super().save(*args, **kwargs)
+
+    WARTEND, LAEUFT, FERTIG, FEHLER, ABGEBROCHEN = (
+        'wartend', 'laeuft', 'fertig', 'fehler', 'abgebrochen')
+    STATUS = [
+        (WARTEND, 'Wartet'),
+        (LAEUFT, 'Läuft'),
+        (FERTIG, 'Fertig'),
+        (FEHLER, 'Fehlgeschlagen'),
+        (ABGEBROCHEN, 'Abgebrochen'),
+    ]
+    BEENDET = (FERTIG, FEHLER, ABGEBROCHEN)
+
+    art = models.CharField('Art', max_length=40)
+    parameter = models.JSONField('Parameter', default=dict, blank=True)
+    lauf = models.ForeignKey(Lauf, on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='auftraege')
+    status = models.CharField('Status', max_length=12, choices=STATUS, default=WARTEND)
+
+    erledigt = models.PositiveIntegerField('Erledigt', default=0)
+    gesamt = models.PositiveIntegerField('Gesamt', null=True, blank=True)
+    schritt = models.CharField('Schritt', max_length=200, blank=True)
+    #: Zuletzt gemeldet. Ein laufender Auftrag, der sich lange nicht meldet,
+    #: gehört einem abgestürzten Worker und blockiert sonst seine Verwaltung.
+    herzschlag = models.DateTimeField('Letztes Lebenszeichen', null=True, blank=True)
+    abbruch_angefordert = models.BooleanField('Abbruch angefordert', default=False)
+
+    ergebnis = models.JSONField('Ergebnis', default=dict, blank=True)
+    fehler = models.TextField('Fehler', blank=True)
+    datei = models.FileField('Ergebnisdatei', upload_to=get_smart_upload_path, blank=True)
+
+    erstellt_von = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+                                     null=True, blank=True, related_name='+')
+    erstellt_am = models.DateTimeField('Eingereiht', auto_now_add=True)
+    gestartet_am = models.DateTimeField('Gestartet', null=True, blank=True)
+    beendet_am = models.DateTimeField('Beendet', null=True, blank=True)
+
+    objects = TenantManager()
+    alle_organisationen = AlleOrganisationenManager()
+
+    class Meta:
+        verbose_name = 'Laufauftrag'
+        verbose_name_plural = 'Laufaufträge'
+        ordering = ('-erstellt_am',)
+        indexes = [models.Index(fields=('status', 'erstellt_am'), name='laufauftrag_status')]
+
+    def __str__(self):
+        return f'{self.bezeichnung} ({self.get_status_display()})'
+
+    @property
+    def bezeichnung(self):
+        from faelle.laufauftraege import ARTEN
+        art = ARTEN.get(self.art)
+        return art.bezeichnung if art else self.art
+
+    @property
+    def ist_beendet(self):
+        return self.status in self.BEENDET
+
+    @property
+    def prozent(self):
+        if not self.gesamt:
+            return 100 if self.status == self.FERTIG else 0
+        return min(100, round(100 * self.erledigt / self.gesamt))
@@ -0,0 +1,457 @@
+"""Laufaufträge: lange Läufe im Hintergrund statt im Request.
+
+Der Knopf «Sollstellung starten» rechnete bis hierhin im Request. Auf einem
+Host mit einem einzigen Arbeitsprozess stand damit die ganze Website, bis der
+Lauf fertig war — bei einigen tausend Verträgen Minuten. Brach der Browser
+vorher ab, lief der Lauf weiter oder auch nicht, und niemand sah es.
+
+Jetzt:
+
+  · `einreihen(art, **parameter)` legt einen `Laufauftrag` an. Die Ansicht
+    leitet auf dessen Seite um, die den Fortschritt abfragt.
+  · `abarbeiten()` führt wartende Aufträge aus — im Worker
+    (`manage.py laufauftraege_abarbeiten --dauerhaft`), oder, wo keiner
+    läuft, in einem Thread nach dem Commit (`LAUFAUFTRAEGE_IM_PROZESS`).
+    Je Verwaltung laufen höchstens `LAUFAUFTRAEGE_JE_ORGANISATION` Aufträge
+    gleichzeitig; die übrigen warten, statt sich gegenseitig auf den
+    Zeilensperren der Sollstellung zu stauen.
+  · Ein Auftrag meldet sich über `melden()`. Dort wird auch der Abbruch
+    geprüft: `abbrechen()` setzt nur eine Marke, und der Auftrag hält an der
+    nächsten Meldung an — zwischen zwei Schritten, nie mitten in einer
+    Buchung.
+
+Eine Auftragsart ist eine Funktion `(auftrag, **parameter) → ergebnis`, mit
+`@auftragsart` angemeldet. Das Ergebnis ist ein dict mit JSON-tauglichen
+Werten; eine Datei legt die Funktion mit `ablegen()` ab.
+
+Der Worker läuft ohne Mandantenkontext und setzt je Auftrag den seiner
+Verwaltung — die Auftragsart sieht dieselben Daten wie vorher der Request.
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+#: So lange darf ein laufender Auftrag schweigen, bevor er als verwaist gilt.
+VERWAIST_NACH = timedelta(minutes=30)
+
+
+class Abgebrochen(Exception):
+    """Der Auftrag wurde abgebrochen; `melden()` hält ihn damit an.
+
+    Wer vor dem Anhalten schon etwas geschrieben hat, gibt es als `ergebnis`
+    mit — es steht dann beim abgebrochenen Auftrag."""
+
+    def __init__(self, ergebnis=None):
+        super().__init__()
+        self.ergebnis = ergebnis or {}
+
+
+@dataclass(frozen=True)
+class Auftragsart:
+    art: str
+    bezeichnung: str
+    ausfuehren: object
+    #: `Laufart.schluessel` des geplanten Laufs, den der Auftrag mitführt.
+    laufart: str = ''
+    #: So lange darf der Auftrag schweigen. Länger als `VERWAIST_NACH` nur
+    #: für Arten, die in EINER Transaktion rechnen und sich dazwischen nicht
+    #: melden können — sonst beendete `_verwaiste_beenden` sie mitten im Lauf.
+    verwaist_nach: timedelta = VERWAIST_NACH
+
+
+ARTEN = {}
+
+
+def auftragsart(art, bezeichnung, laufart='', verwaist_nach=VERWAIST_NACH):
+    """Meldet eine Funktion als Auftragsart an."""
+    def anmelden(funktion):
+        ARTEN[art] = Auftragsart(art, bezeichnung, funktion, laufart, verwaist_nach)
+        return funktion
+    return anmelden
+
+
+# ---------------------------------------------------------------------------
+# Einreihen, Melden, Abbrechen
+# ---------------------------------------------------------------------------
+
+def einreihen(art, *, benutzer=None, periode=None, **parameter):
+    """Einen Auftrag in der aktuellen Verwaltung einreihen.
+
+    `periode` verbindet ihn mit dem geplanten `Lauf` seiner Laufart (falls es
+    ihn gibt). `parameter` müssen JSON-tauglich sein — IDs statt Objekte.
+    """
+    from faelle.lauf_models import Lauf, Laufauftrag
+
+    if art not in ARTEN:
+        raise ValueError(f'Unbekannte Auftragsart «{art}».')
+    lauf = None
+    if periode and ARTEN[art].laufart:
+        lauf = Lauf.objects.filter(laufart__schluessel=ARTEN[art].laufart,
+                                   periode=periode).first()
+    auftrag = Laufauftrag.objects.create(
+        art=art, parameter=parameter, lauf=lauf,
+        erstellt_von=benutzer if getattr(benutzer, 'is_authenticated', False) else None)
+    if getattr(settings, 'LAUFAUFTRAEGE_IM_PROZESS', False):
+        anstossen()
+    return auftrag
+
+
+def melden(auftrag, erledigt=None, gesamt=None, schritt=None):
+    """Fortschritt festhalten — und anhalten, wenn abgebrochen wurde.
+
+    Schreibt mit `update()` und nur die genannten Felder: Die Seite des
+    Auftrags liest mit, und ein `save()` des ganzen Objekts überschriebe
+    die Abbruchmarke, die die Ansicht inzwischen gesetzt hat.
+    """
+    from faelle.lauf_models import Laufauftrag
+
+    felder = {'herzschlag': timezone.now()}
+    if erledigt is not None:
+        felder['erledigt'] = auftrag.erledigt = erledigt
+    if gesamt is not None:
+        felder['gesamt'] = auftrag.gesamt = gesamt
+    if schritt is not None:
+        felder['schritt'] = auftrag.schritt = schritt[:200]
+    zeilen = Laufauftrag.alle_organisationen.filter(pk=auftrag.pk)
+    zeilen.update(**felder)
+    if zeilen.filter(abbruch_angefordert=True).exists():
+        raise Abgebrochen
+
+
+def abbrechen(auftrag):
+    """Einen wartenden Auftrag sofort beenden, einen laufenden anhalten lassen.
+
+    Gibt True zurück, wenn es noch etwas abzubrechen gab.
+    """
+    from faelle.lauf_models import Laufauftrag
+
+    zeilen = Laufauftrag.alle_organisationen.filter(pk=auftrag.pk)
+    if zeilen.filter(status=Laufauftrag.WARTEND).update(
+            status=Laufauftrag.ABGEBROCHEN, beendet_am=timezone.now(),
+            schritt='Vor dem Start abgebrochen'):
+        return True
+    return bool(zeilen.filter(status=Laufauftrag.LAEUFT).update(abbruch_angefordert=True))
+
+
+def ablegen(auftrag, name, inhalt):
+    """Die Ergebnisdatei eines Auftrags speichern (ZIP, PDF, CSV)."""
+    from django.core.files.base import ContentFile
+
+    auftrag.datei.save(name, ContentFile(inhalt), save=False)
+    type(auftrag).alle_organisationen.filter(pk=auftrag.pk).update(datei=auftrag.datei.name)
+
+
+# ---------------------------------------------------------------------------
+# Abarbeiten
+# ---------------------------------------------------------------------------
+
+def _verwaiste_beenden():
+    """Laufende Aufträge ohne Lebenszeichen: Ihr Worker ist abgestürzt.
+
+    Die Frist gilt je Auftragsart (`Auftragsart.verwaist_nach`)."""
+    from faelle.lauf_models import Laufauftrag
+
+    jetzt = timezone.now()
+
+    def still(frist):
+        grenze = jetzt - frist
+        return Q(herzschlag__lt=grenze) | Q(herzschlag__isnull=True, gestartet_am__lt=grenze)
+
+    laenger = {a.art: a.verwaist_nach for a in ARTEN.values() if a.verwaist_nach != VERWAIST_NACH}
+    verwaist = still(VERWAIST_NACH) & ~Q(art__in=laenger)
+    for art, frist in laenger.items():
+        verwaist |= Q(art=art) & still(frist)
+    return Laufauftrag.alle_organisationen.filter(
+        verwaist, status=Laufauftrag.LAEUFT,
+    ).update(status=Laufauftrag.FEHLER, beendet_am=timezone.now(),
+             fehler='Der Worker hat sich nicht mehr gemeldet — vermutlich abgestürzt. '
+                    'Bitte den Lauf neu starten; was fertig gebucht war, bleibt bestehen.')
+
+
+def _naechster(organisation=None):
+    """Den ältesten wartenden Auftrag beanspruchen, dessen Verwaltung noch
+    Platz hat. None, wenn keiner ansteht.
+
+    Die Grenze je Verwaltung wird gelesen und dann beansprucht, nicht in
+    einem Zug. Zwei Worker können sie darum im selben Augenblick beide
+    überschreiten, um je einen Auftrag — für eine Schutzgrenze gegen
+    Stau genügt das, und die Sollstellung selbst sperrt ihre Verträge ohnehin.
+    """
+    from faelle.lauf_models import Laufauftrag
+
+    grenze = getattr(settings, 'LAUFAUFTRAEGE_JE_ORGANISATION', 1)
+    # `alle_organisationen`: Der Worker arbeitet für jede Verwaltung und
+    # setzt deren Kontext erst, wenn er einen Auftrag ausführt.
+    laufend = dict(Laufauftrag.alle_organisationen.filter(status=Laufauftrag.LAEUFT)
+                   .order_by().values('organisation').annotate(n=Count('pk'))
+                   .values_list('organisation', 'n'))
+    voll = [org for org, n in laufend.items() if n >= grenze]
+    wartend = (Laufauftrag.alle_organisationen.filter(status=Laufauftrag.WARTEND)
+               .exclude(organisation__in=voll).order_by('erstellt_am', 'pk'))
+    if organisation is not None:
+        wartend = wartend.filter(organisation=organisation)
+    for pk in wartend.values_list('pk', flat=True)[:20]:
+        jetzt = timezone.now()
+        if Laufauftrag.alle_organisationen.filter(pk=pk, status=Laufauftrag.WARTEND).update(
+                status=Laufauftrag.LAEUFT, gestartet_am=jetzt, herzschlag=jetzt):
+            return Laufauftrag.alle_organisationen.select_related('lauf', 'organisation').get(pk=pk)
+    return None
+
+
+def _json(wert):
+    """Ergebniswerte JSON-tauglich machen (Beträge als Zeichenkette)."""
+    if isinstance(wert, dict):
+        return {k: _json(v) for k, v in wert.items()}
+    if isinstance(wert, (list, tuple)):
+        return [_json(v) for v in wert]
+    if isinstance(wert, Decimal):
+        return str(wert)
+    return wert
+
+
+def ausfuehren(auftrag):
+    """Einen beanspruchten Auftrag im Kontext seiner Verwaltung ausführen."""
+    from core.tenancy import organisation_kontext
+    from faelle.lauf_models import Laufauftrag
+
+    # Nur ein Auftrag, der noch läuft, bekommt seinen Abschluss: Hat ihn
+    # `_verwaiste_beenden` inzwischen als FEHLER beendet, ist sein Platz in
+    # der Verwaltung schon weitergegeben — ein FERTIG darüber verdeckte das.
+    zeilen = Laufauftrag.alle_organisationen.filter(pk=auftrag.pk, status=Laufauftrag.LAEUFT)
+    with organisation_kontext(auftrag.organisation):
+        try:
+            art = ARTEN[auftrag.art]
+            if auftrag.lauf is not None:
+                auftrag.lauf.starten()
+            ergebnis = _json(art.ausfuehren(auftrag, **auftrag.parameter) or {})
+        except Abgebrochen as abbruch:
+            zeilen.update(status=Laufauftrag.ABGEBROCHEN, beendet_am=timezone.now(),
+                          schritt='Abgebrochen', ergebnis=_json(abbruch.ergebnis))
+            return Laufauftrag.ABGEBROCHEN
+        except Exception as fehler:                          # noqa: BLE001
+            # Der Stacktrace gehört ins Log, nicht an den Auftrag: `fehler`
+            # steht auf der Auftragsseite für jeden im Team, und ein Trace
+            # zeigt Pfade, SQL und Werte aus fremden Zeilen.
+            logger.exception('Laufauftrag %s (%s) fehlgeschlagen', auftrag.pk, auftrag.art)
+            zeilen.update(status=Laufauftrag.FEHLER, beendet_am=timezone.now(),
+                          fehler=f'{type(fehler).__name__}: {fehler}'[:10000])
+            return Laufauftrag.FEHLER
+        if not zeilen.update(status=Laufauftrag.FERTIG, beendet_am=timezone.now(),
+                             ergebnis=ergebnis, erledigt=auftrag.gesamt or auftrag.erledigt,
+                             schritt='Fertig'):
+            logger.warning('Laufauftrag %s (%s) beendet, war aber schon als verwaist markiert',
+                           auftrag.pk, auftrag.art)
+        lauf = auftrag.lauf
+        if lauf is not None:
+            try:
+                if lauf.status != lauf.LAEUFT:
+                    raise ValueError('schon abgeschlossen oder übersprungen')
+                lauf.abschliessen(benutzer=auftrag.erstellt_von, **ergebnis)
+            except ValueError:
+                # Offene Blockade, oder der Lauf war schon abgeschlossen (ein
+                # zweiter Lauf im selben Monat): Er bleibt, wie er ist, und
+                # trägt nur die neuen Kennzahlen.
+                lauf.kennzahlen = {**(lauf.kennzahlen or {}), **ergebnis}
+                lauf.save(update_fields=['kennzahlen'])
+    return Laufauftrag.FERTIG
+
+
+def abarbeiten(organisation=None, hoechstens=None):
+    """Wartende Aufträge nacheinander ausführen. Gibt die Zahl zurück."""
+    _verwaiste_beenden()
+    n = 0
+    while hoechstens is None or n < hoechstens:
+        auftrag = _naechster(organisation)
+        if auftrag is None:
+            break
+        ausfuehren(auftrag)
+        n += 1
+    return n
+
+
+def anstossen():
+    """Nach dem Commit in einem Thread abarbeiten — für Installationen ohne
+    eigenen Worker. Der Request wartet nicht darauf."""
+    def _im_hintergrund():
+        from django.db import connections
+        try:
+            abarbeiten()
+        except Exception:                                    # noqa: BLE001
+            logger.exception('Laufaufträge: Hintergrundlauf abgebrochen')
+        finally:
+            connections.close_all()
+
+    transaction.on_commit(lambda: threading.Thread(target=_im_hintergrund,
+                                                   name='laufauftraege').start())
+
+
+# ---------------------------------------------------------------------------
+# Auftragsarten
+# ---------------------------------------------------------------------------
+
+@auftragsart('sollstellung', 'Sollstellung', laufart='sollstellung',
+             verwaist_nach=timedelta(hours=4))
+def _sollstellung(auftrag, jahr, monat, liegenschaft=None):
+    """Der Mietenlauf eines Monats (`run_sollstellung`), über den Stapelweg
+    wie im Scheduler (`bulk=True`).
+
+    Er schreibt in EINER Transaktion; abbrechen lässt er sich darum nur vor
+    dem Start, danach läuft er durch oder gar nicht. Melden kann er sich
+    dazwischen nicht — deshalb die längere Frist, bevor er als verwaist gilt."""
+    from core.auth import log_aktion
+    from core.services.automation import run_sollstellung
+    from portfolio.models import Liegenschaft
+
+    lg = Liegenschaft.objects.filter(pk=liegenschaft).first() if liegenschaft else None
+    titel = f"Miete & NK {monat:02d}/{jahr}"
+    melden(auftrag, schritt=f'{titel}: Rechnungen werden gestellt'
+                            + (f' ({lg.strasse})' if lg else ''))
+    erstellt = run_sollstellung(jahr, monat, user=auftrag.erstellt_von, liegenschaft=lg,
+                                bulk=True)
+    log_aktion(None, "Sollstellung ausgeführt", titel,
+               f"{erstellt} Rechnungen erstellt"
+               + (f" · nur {lg.strasse}" if lg else " · ganzes Portfolio"),
+               user=auftrag.erstellt_von)
+    return {'rechnungen': erstellt}
+
+
+@auftragsart('mahnlauf', 'Mahnlauf', laufart='mahnlauf')
+def _mahnlauf(auftrag, liegenschaft=None, send_email=True, mit_zins=False):
+    """Der Sammel-Mahnlauf: planen, dann Schritt für Schritt schreiben.
+
+    Jeder Schritt ist eine eigene Transaktion — ein Abbruch hält zwischen
+    zwei Mahnungen an; was geschrieben ist, bleibt, und ein neuer Lauf
+    macht dort weiter (der Mahnlauf ist je Stufe idempotent)."""
+    from core.auth import log_aktion
+    from core.services.automation import mahnlauf_ausfuehren, mahnlauf_planen
+    from portfolio.models import Liegenschaft
+
+    lg = Liegenschaft.objects.filter(pk=liegenschaft).first() if liegenschaft else None
+    melden(auftrag, schritt='Fällige Forderungen werden geprüft')
+    plan = mahnlauf_planen(aktive_lg=lg, send_email=send_email, mit_zins=mit_zins)
+    melden(auftrag, erledigt=0, gesamt=len(plan['schritte']), schritt='Mahnungen werden geschrieben')
+    angehalten = []
+
+    def weiter(i):
+        try:
+            melden(auftrag, erledigt=i)
+            return True
+        except Abgebrochen:
+            angehalten.append(i)
+            return False
+
+    res = mahnlauf_ausfuehren(plan, user=auftrag.erstellt_von, fortschritt=weiter)
+    log_aktion(None, "Mahnlauf ausgeführt", "Sammellauf",
+               f"{res['gemahnt']} gemahnt, {res['emails']} E-Mails, "
+               f"Gebühren CHF {res['gebuehren']}, Zins CHF {res['zins']}"
+               f"{f', {n} schon gemahnt' if (n := res['uebersprungen']) else ''}",
+               user=auftrag.erstellt_von)
+    ergebnis = {'gemahnt': res['gemahnt'], 'emails': res['emails'],
+                'gebuehren': res['gebuehren'], 'zins': res['zins'],
+                'uebersprungen': res['uebersprungen']}
+    if angehalten:
+        raise Abgebrochen(ergebnis)
+    return ergebnis
+
+
+@auftragsart('mahnbelege', 'Mahnbelege ablegen')
+def _mahnbelege(auftrag, belege):
+    """Die Belege eines Mahnlaufs rendern und in die Vertrags-Akten legen.
+
+    Der Mahnlauf reiht sie ein (`mahnlauf_zustellen`), statt sie selbst zu
+    rendern. Ein Beleg, der nicht entsteht, wird gezählt und übergangen —
+    die Mahnung ist gebucht, und der PDF-Knopf am Vertrag legt ihn nach."""
+    from datetime import date
+    from core.services.ablage import ablage_mahnung
+    from rentals.models import Mietvertrag
+
+    vertraege = Mietvertrag.objects.in_bulk({b['vertrag'] for b in belege})
+    melden(auftrag, erledigt=0, gesamt=len(belege), schritt='Mahnbelege werden abgelegt')
+    ergebnis = {'abgelegt': 0, 'fehler': 0}
+    for i, b in enumerate(belege, 1):
+        dok = None
+        vertrag = vertraege.get(b['vertrag'])
+        if vertrag is not None:
+            try:
+                dok = ablage_mahnung(vertrag, stufe=b['stufe'], datum=date.fromisoformat(b['datum']),
+                                     betrag=b['betrag'])
+            except Exception:                                # noqa: BLE001
+                logger.warning('Mahnbeleg für Vertrag %s nicht abgelegt', b['vertrag'],
+                               exc_info=True)
+        ergebnis['abgelegt' if dok else 'fehler'] += 1
+        try:
+            melden(auftrag, erledigt=i)
+        except Abgebrochen:
+            raise Abgebrochen(ergebnis) from None
+    return ergebnis
+
+
+@auftragsart('vertragspaket', 'Vertragsdokumente (ZIP)')
+def _vertragspaket(auftrag, vertrag):
+    """Mietvertrag und Beilagen erzeugen, in die Akte legen und als ZIP ablegen."""
+    import io
+    import zipfile
+
+    from django.utils.text import slugify
+    from core.views.pdf import erzeuge_und_ablege_vertragspaket
+    from rentals.models import Mietvertrag
+
+    v = Mietvertrag.objects.select_related('mieter').get(pk=vertrag)
+    melden(auftrag, schritt=f'Dokumente für {v.mieter} werden erzeugt')
+    dateien = erzeuge_und_ablege_vertragspaket(v)
+    if not dateien:
+        raise RuntimeError('Keine Dokumente erzeugt.')
+    puffer = io.BytesIO()
+    with zipfile.ZipFile(puffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, pdf in dateien:
+            zf.writestr(name, pdf)
+    ablegen(auftrag, f"Vertragsdokumente_{slugify(v.mieter.nachname)}.zip", puffer.getvalue())
+    return {'dokumente': len(dateien)}
+
+
+@auftragsart('nebenkostenlauf', 'Nebenkostenlauf', laufart='nebenkosten')
+def _nebenkostenlauf(auftrag, jahr, neu=False):
+    """Alle NK-Abrechnungen eines Jahres (`core.services.nebenkostenlauf`).
+
+    Angehalten wird zwischen zwei Stapeln; das Manifest steht dann auf dem
+    letzten, und ein neuer Auftrag macht dort weiter. Die Datei des Auftrags
+    ist das Manifest."""
+    import json
+    from core.auth import log_aktion
+    from core.services.nebenkostenlauf import manifest_lesen, nebenkostenlauf
+
+    melden(auftrag, schritt=f'Abrechnungen {jahr} werden gerechnet')
+    angehalten = []
+
+    def weiter(erledigt, gesamt):
+        try:
+            melden(auftrag, erledigt=erledigt, gesamt=gesamt,
+                   schritt=f'{erledigt} von {gesamt} Abrechnungen abgelegt')
+            return True
+        except Abgebrochen:
+            angehalten.append(erledigt)
+            return False
+
+    res = nebenkostenlauf(jahr, prozesse=getattr(settings, 'NEBENKOSTENLAUF_PROZESSE', 1),
+                          neu=neu, fortschritt=weiter)
+    manifest = manifest_lesen(auftrag.organisation, jahr)
+    if manifest:
+        ablegen(auftrag, f'Nebenkostenlauf_{jahr}_Manifest.json',
+                json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8'))
+    log_aktion(None, "Nebenkostenlauf", str(jahr),
+               f"{res['abgelegt']} abgelegt, {res['uebersprungen']} schon vorhanden, "
+               f"{res['fehler']} Periode(n) mit Fehler, {res['je_sekunde']}/s",
+               user=auftrag.erstellt_von)
+    ergebnis = {k: res[k] for k in ('abgelegt', 'uebersprungen', 'fehler', 'je_sekunde')}
+    if angehalten:
+        raise Abgebrochen(ergebnis)
+    return ergebnis
@@ -0,0 +1,40 @@
+"""Führt eingereihte Laufaufträge aus (`faelle.Laufauftrag`).
+
+    python manage.py laufauftraege_abarbeiten
+    python manage.py laufauftraege_abarbeiten --organisation 3
+    python manage.py laufauftraege_abarbeiten --dauerhaft      # Always-on Task
+
+Ohne `--dauerhaft` wird abgearbeitet, was ansteht, und beendet. Mit
+`--dauerhaft` schaut der Befehl alle `--pause` Sekunden erneut nach — das ist
+der Worker, der Sollstellung, Mahnlauf und Vertragspakete aus der Oberfläche
+übernimmt. Mehrere Worker nebeneinander sind unschädlich: Jeder Auftrag wird
+vor dem Start beansprucht, und die Grenze je Verwaltung gilt für alle.
+
+Der Befehl läuft über alle Verwaltungen; den Kontext setzt er je Auftrag.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Führt eingereihte Laufaufträge aus (Sollstellung, Mahnlauf, Vertragspakete)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organisation', type=int, default=None,
+                            help='Nur diese Verwaltung (ID). Ohne Angabe: alle.')
+        parser.add_argument('--dauerhaft', action='store_true',
+                            help='Nicht beenden, sondern immer wieder nachschauen.')
+        parser.add_argument('--pause', type=int, default=5,
+                            help='Sekunden zwischen zwei Durchgängen mit --dauerhaft.')
+
+    def handle(self, *args, **opts):
+        from faelle.laufauftraege import abarbeiten
+
+        while True:
+            n = abarbeiten(organisation=opts['organisation'])
+            if n or not opts['dauerhaft']:
+                self.stdout.write(f"{n} Laufauftrag/-aufträge ausgeführt.")
+            if not opts['dauerhaft']:
+                return
+            time.sleep(opts['pause'])
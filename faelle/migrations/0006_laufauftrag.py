@@ -0,0 +1,47 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:54
+
+import core.utils
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0040_organisation_zweifaktor_pflicht'),
+        ('faelle', '0005_abwesenheit_termin'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Laufauftrag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('art', models.CharField(max_length=40, verbose_name='Art')),
+                ('parameter', models.JSONField(blank=True, default=dict, verbose_name='Parameter')),
+                ('status', models.CharField(choices=[('wartend', 'Wartet'), ('laeuft', 'Läuft'), ('fertig', 'Fertig'), ('fehler', 'Fehlgeschlagen'), ('abgebrochen', 'Abgebrochen')], default='wartend', max_length=12, verbose_name='Status')),
+                ('erledigt', models.PositiveIntegerField(default=0, verbose_name='Erledigt')),
+                ('gesamt', models.PositiveIntegerField(blank=True, null=True, verbose_name='Gesamt')),
+                ('schritt', models.CharField(blank=True, max_length=200, verbose_name='Schritt')),
+                ('herzschlag', models.DateTimeField(blank=True, null=True, verbose_name='Letztes Lebenszeichen')),
+                ('abbruch_angefordert', models.BooleanField(default=False, verbose_name='Abbruch angefordert')),
+                ('ergebnis', models.JSONField(blank=True, default=dict, verbose_name='Ergebnis')),
+                ('fehler', models.TextField(blank=True, verbose_name='Fehler')),
+                ('datei', models.FileField(blank=True, upload_to=core.utils.get_smart_upload_path, verbose_name='Ergebnisdatei')),
+                ('erstellt_am', models.DateTimeField(auto_now_add=True, verbose_name='Eingereiht')),
+                ('gestartet_am', models.DateTimeField(blank=True, null=True, verbose_name='Gestartet')),
+                ('beendet_am', models.DateTimeField(blank=True, null=True, verbose_name='Beendet')),
+                ('erstellt_von', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('lauf', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='auftraege', to='faelle.lauf')),
+                ('organisation', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='laufauftraege', to='crm.organisation', verbose_name='Organisation')),
+            ],
+            options={
+                'verbose_name': 'Laufauftrag',
+                'verbose_name_plural': 'Laufaufträge',
+                'ordering': ('-erstellt_am',),
+                'indexes': [models.Index(fields=['status', 'erstellt_am'], name='laufauftrag_status')],
+            },
+        ),
+    ]
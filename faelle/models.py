@@ -408,7 +408,7 @@ from faelle.zulauf_models import (  # noqa: E402,F401
     Eingang, Zuordnungsregel,
 )
 from faelle.lauf_models import (  # noqa: E402,F401
-    Blockade, Lauf, Laufart,
+    Blockade, Lauf, Laufart, Laufauftrag,
 )
 from faelle.termin_models import (  # noqa: E402,F401
     Abwesenheit, Termin,
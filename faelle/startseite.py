@@ -0,0 +1,139 @@
+"""Der Stand der Startseite — einmal gerechnet, von allen gelesen.
+
+WARUM ES DIESE DATEI GIBT
+
+`fw_dashboard` rechnete bei jedem Aufruf alles neu: «Was reisst» über ein
+Jahr und vier Quellen, die Inbox (jede offene Rechnung mit ihren Zahlungen)
+und die Lage (Eingangsquote, Leerstandsverlauf, Senkungsprüfung). Zehn
+Personen, die den ganzen Tag die Startseite neu laden, rechnen damit zehnmal
+dasselbe — es war die schwerste wiederkehrende Last der Anwendung.
+
+Jetzt liegen diese drei TEILE als Stand im Zwischenspeicher
+(`core.services.zwischenspeicher`), je Verwaltung, Tag und
+Liegenschaftsfilter:
+
+  · Der tägliche Lauf rechnet sie frühmorgens vor (`vorberechnen`) — für den
+    ganzen Bestand und für jede Liegenschaft. Der erste Aufruf des Tages
+    wartet also nicht.
+  · Ändert sich tagsüber eine Quelle, verwerfen die Signale nur die Teile,
+    die daran hängen (`TEILE`): Eine neue Pendenz rechnet «Was reisst» neu,
+    nicht die Lage. Der nächste Aufruf rechnet nach, die übrigen lesen.
+  · Was billig ist und sich laufend bewegt — Posteingang, Termine,
+    Freigaben, Vertretung, die Fallzähler an den Reitern — rechnet die View
+    weiterhin bei jedem Aufruf und legt es über den Stand.
+
+Der Tag steht im Schlüssel: Um Mitternacht gilt automatisch ein neuer
+Stand, auch wenn kein Lauf kommt. Ein Stand lebt darum bis zum Tagesende
+(`_bis_tagesende`) — eine kürzere Frist liesse den Stand des Morgenlaufs
+verfallen, bevor das Team die Seite öffnet. Was kein Signal auslöst
+(`QuerySet.update()`, `bulk_create`), verwirft der Schreibende selbst; so
+halten es Sollstellung und Bankimport.
+
+Ein UNVOLLSTÄNDIGER Teil wird nie gespeichert: Fällt in «Was reisst» eine
+Quelle aus, zeigt dieser eine Aufruf, was da ist, und der nächste rechnet
+neu. Gespeichert sähe das ganze Team bis zum Abend einen ruhigen Tag, wo
+überfällige Läufe oder Pendenzen stehen.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+#: Teil → Tags, an denen er hängt. `'startseite'` tragen alle — damit
+#: verwirft `vorberechnen` den Stand des Tages, ohne die Teile zu kennen.
+#:
+#: Ein Stern fängt auch die Bezüge: Jede Pendenz, jede Einheit, jeder Schaden
+#: an einer Liegenschaft zählt `liegenschaft:*` weiter. Ein Teil mit diesem
+#: Tag würde bei fast jeder Änderung neu gerechnet; er fehlt deshalb. Eine
+#: gespeicherte Liegenschaft zählt über ihren Eigentümer `eigentuemer:*`
+#: weiter, und das reicht für die Mandatsliste.
+#:
+#: «Was reisst» zeigt an Pendenzen und Fällen Mietername und -adresse, und
+#: der Stand lebt bis Mitternacht: Ein umbenannter Mieter oder ein
+#: geänderter Vertrag verwirft ihn darum (`mieter:*`, `vertrag:*`).
+TEILE = {
+    'reisst': ('startseite', 'pendenz:*', 'wartungsfrist:*', 'lauf:*', 'fall:*',
+               'mieter:*', 'vertrag:*'),
+    'inbox': ('startseite', 'rechnung:*', 'zahlung:*', 'mahnung:*', 'kreditor:*',
+              'pendenz:*', 'vertrag:*', 'kuendigung:*', 'schaden:*', 'auftrag:*',
+              'eigentuemer:*'),
+    'lage': ('startseite', 'rechnung:*', 'zahlung:*', 'einheit:*', 'vertrag:*',
+             'mietzins:*', 'fall:*', 'eigentuemer:*', 'organisation:*'),
+}
+
+#: So weit schaut «Was reisst» auf der Startseite voraus — die Obermenge der
+#: Reiter «Heute», «Diese Woche» und «Alle».
+VORSCHAU_ALLE = 365
+
+
+def _lg_query(aktive_lg):
+    # Dieselbe Form wie `_global_filter` — die Inbox baut ihre Links daraus.
+    return f"?lg={aktive_lg.id}" if aktive_lg else ""
+
+
+def _bis_tagesende(heute):
+    """Sekunden bis Mitternacht nach `heute` — mindestens eine Minute."""
+    ende = timezone.make_aware(datetime.combine(heute + timedelta(days=1), time.min))
+    return max(60, int((ende - timezone.now()).total_seconds()))
+
+
+def _reisst(heute, aktive_lg):
+    from core.services.zwischenspeicher import Unvollstaendig
+    from faelle.arbeitsvorrat import was_reisst
+
+    ausfaelle = []
+    # `objekt` trägt das Modell hinter der Zeile. Keine Vorlage liest es, und
+    # im Zwischenspeicher zöge es jede vorgeladene Beziehung mit.
+    eintraege = [{k: v for k, v in e.items() if k != 'objekt'}
+                 for e in was_reisst(heute, grenze=VORSCHAU_ALLE, aktive_lg=aktive_lg,
+                                     ausfaelle=ausfaelle)]
+    if ausfaelle:
+        raise Unvollstaendig(eintraege)
+    return eintraege
+
+
+def _inbox(heute, aktive_lg):
+    from core.services.inbox import sammle_inbox
+    from core.views.fw._basis import _pendenz_ziel
+    inbox, inbox_mehr, _typen = sammle_inbox(
+        aktive_lg=aktive_lg, lg_query=_lg_query(aktive_lg), pendenz_ziel=_pendenz_ziel)
+    return inbox, inbox_mehr
+
+
+def _lage(heute, aktive_lg):
+    from faelle.lage import lage
+    return lage(heute, aktive_lg)
+
+
+_RECHNEN = {'reisst': _reisst, 'inbox': _inbox, 'lage': _lage}
+
+
+def teil(name, heute=None, aktive_lg=None):
+    """Ein Teil der Startseite für `heute` — aus dem Stand oder frisch gerechnet."""
+    from core.services.zwischenspeicher import holen
+
+    heute = heute or timezone.localdate()
+    return holen(('startseite', name, heute, aktive_lg.pk if aktive_lg else None),
+                 lambda: _RECHNEN[name](heute, aktive_lg),
+                 tags=TEILE[name], gueltigkeit=_bis_tagesende(heute))
+
+
+def stand(heute=None, aktive_lg=None):
+    """Alle Teile: {'reisst': [...], 'inbox': (eintraege, mehr), 'lage': {...}}."""
+    heute = heute or timezone.localdate()
+    return {name: teil(name, heute, aktive_lg) for name in TEILE}
+
+
+def vorberechnen(heute=None):
+    """Den Stand des Tages für die Verwaltung des Kontexts neu rechnen — für
+    den ganzen Bestand und je Liegenschaft. Rückgabe: Anzahl Stände."""
+    from core.services.zwischenspeicher import vergessen
+    from portfolio.models import Liegenschaft
+
+    heute = heute or timezone.localdate()
+    # Verwerfen statt überschreiben: Auch ein Stand, den jemand um drei Uhr
+    # nachts gelesen hat, soll die Marktdaten dieses Laufs schon kennen.
+    vergessen('startseite')
+    filter_ = [None, *Liegenschaft.objects.order_by('pk')]
+    for aktive_lg in filter_:
+        stand(heute, aktive_lg)
+    return len(filter_)
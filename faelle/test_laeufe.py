@@ -272,3 +272,146 @@ class MandantentrennungTests(_Basis):
                 fremde = modell.alle_organisationen.exclude(
                     organisation__in=[self.a.organisation, self.b.organisation])
                 self.assertEqual(fremde.count(), 0)
+
+
+# ---------------------------------------------------------------------------
+# Laufaufträge: lange Läufe im Hintergrund
+# ---------------------------------------------------------------------------
+
+from faelle import laufauftraege                                      # noqa: E402
+from faelle.lauf_models import Laufauftrag                            # noqa: E402
+
+
+@laufauftraege.auftragsart('test-schritte', 'Testschritte')
+def _schritte(auftrag, n=3, abbrechen_nach=None):
+    """Zählt bis `n`; `abbrechen_nach` spielt den Knopf «Abbrechen» mitten im Lauf."""
+    for erledigt in range(n):
+        if erledigt == abbrechen_nach:
+            laufauftraege.abbrechen(auftrag)
+        laufauftraege.melden(auftrag, erledigt=erledigt, gesamt=n, schritt=f'Schritt {erledigt + 1}')
+    return {'schritte': n}
+
+
+@laufauftraege.auftragsart('test-verschollen', 'Testlauf ohne Lebenszeichen')
+def _verschollen(auftrag):
+    """Schweigt, bis ein zweiter Worker ihn als verwaist beendet — und läuft dann doch zu Ende."""
+    Laufauftrag.alle_organisationen.filter(pk=auftrag.pk).update(
+        herzschlag=timezone.now() - laufauftraege.VERWAIST_NACH - timedelta(minutes=1))
+    laufauftraege._verwaiste_beenden()
+    return {'fertig': True}
+
+
+class LaufauftragTests(_Basis):
+    def _einreihen(self, fixture, art='test-schritte', **parameter):
+        with mandant(fixture.organisation):
+            return laufauftraege.einreihen(art, benutzer=fixture.benutzer, **parameter)
+
+    def test_sollstellung_im_auftrag_schliesst_ihren_lauf_ab(self):
+        with mandant(self.a.organisation):
+            lauf = _lauf(self.a.organisation, self.a.laufart, periode='2026-08')
+        auftrag = self._einreihen(self.a, 'sollstellung', periode='2026-08', jahr=2026, monat=8)
+        self.assertEqual(auftrag.lauf, lauf)
+
+        self.assertEqual(laufauftraege.abarbeiten(), 1)
+        auftrag.refresh_from_db()
+        lauf.refresh_from_db()
+        self.assertEqual(auftrag.status, Laufauftrag.FERTIG, auftrag.fehler)
+        self.assertEqual(auftrag.ergebnis, {'rechnungen': 1})
+        self.assertEqual(lauf.status, Lauf.ABGESCHLOSSEN)
+        self.assertEqual(lauf.kennzahlen, {'rechnungen': 1})
+
+    def test_blockierter_lauf_bleibt_offen_und_traegt_die_kennzahlen(self):
+        """Der Fixture-Lauf 2099-01 hat eine offene Blockade. Der Auftrag
+        rechnet trotzdem — abgeschlossen wird der Lauf erst von Hand."""
+        auftrag = self._einreihen(self.a, 'sollstellung', periode='2099-01', jahr=2099, monat=1)
+        laufauftraege.abarbeiten()
+        auftrag.refresh_from_db()
+        self.a.lauf.refresh_from_db()
+        self.assertEqual(auftrag.status, Laufauftrag.FERTIG)
+        self.assertEqual(self.a.lauf.status, Lauf.LAEUFT)
+        self.assertEqual(self.a.lauf.kennzahlen['rechnungen'], 1)
+
+    def test_je_verwaltung_laeuft_nur_ein_auftrag(self):
+        erster = self._einreihen(self.a)
+        self._einreihen(self.a)
+        von_b = self._einreihen(self.b)
+        Laufauftrag.alle_organisationen.filter(pk=erster.pk).update(
+            status=Laufauftrag.LAEUFT, herzschlag=timezone.now())
+
+        naechster = laufauftraege._naechster()
+        self.assertEqual(naechster.pk, von_b.pk)
+        self.assertIsNone(laufauftraege._naechster())
+
+    def test_wartender_auftrag_wird_sofort_abgebrochen(self):
+        auftrag = self._einreihen(self.a)
+        self.assertTrue(laufauftraege.abbrechen(auftrag))
+        self.assertEqual(laufauftraege.abarbeiten(), 0)
+        auftrag.refresh_from_db()
+        self.assertEqual(auftrag.status, Laufauftrag.ABGEBROCHEN)
+        self.assertFalse(laufauftraege.abbrechen(auftrag))
+
+    def test_laufender_auftrag_haelt_beim_naechsten_schritt_an(self):
+        auftrag = self._einreihen(self.a, n=5, abbrechen_nach=2)
+        laufauftraege.abarbeiten()
+        auftrag.refresh_from_db()
+        self.assertEqual(auftrag.status, Laufauftrag.ABGEBROCHEN)
+        self.assertEqual(auftrag.erledigt, 2)
+
+    def test_fehler_steht_beim_auftrag(self):
+        auftrag = self._einreihen(self.a, 'vertragspaket', vertrag=self.b.vertrag.pk)
+        laufauftraege.abarbeiten()
+        auftrag.refresh_from_db()
+        # Der Vertrag von B ist im Kontext von A nicht zu finden.
+        self.assertEqual(auftrag.status, Laufauftrag.FEHLER)
+        self.assertIn('DoesNotExist', auftrag.fehler)
+        self.assertNotIn('Traceback', auftrag.fehler)
+
+    def test_verwaister_auftrag_wird_beendet(self):
+        auftrag = self._einreihen(self.a)
+        Laufauftrag.alle_organisationen.filter(pk=auftrag.pk).update(
+            status=Laufauftrag.LAEUFT,
+            herzschlag=timezone.now() - laufauftraege.VERWAIST_NACH - timedelta(minutes=1))
+        self.assertEqual(laufauftraege._verwaiste_beenden(), 1)
+        auftrag.refresh_from_db()
+        self.assertEqual(auftrag.status, Laufauftrag.FEHLER)
+
+    def test_sollstellung_schweigt_laenger_bevor_sie_verwaist(self):
+        """Die Sollstellung rechnet in EINER Transaktion und kann sich nicht
+        melden — nach 30 Minuten läuft sie noch, erst nach Stunden nicht mehr."""
+        auftrag = self._einreihen(self.a, 'sollstellung', jahr=2026, monat=8)
+        zeilen = Laufauftrag.alle_organisationen.filter(pk=auftrag.pk)
+        zeilen.update(status=Laufauftrag.LAEUFT,
+                      herzschlag=timezone.now() - laufauftraege.VERWAIST_NACH - timedelta(minutes=1))
+        self.assertEqual(laufauftraege._verwaiste_beenden(), 0)
+        zeilen.update(herzschlag=timezone.now() - timedelta(hours=5))
+        self.assertEqual(laufauftraege._verwaiste_beenden(), 1)
+
+    def test_verwaist_beendeter_auftrag_wird_nicht_fertig_ueberschrieben(self):
+        auftrag = self._einreihen(self.a, 'test-verschollen')
+        laufauftraege.abarbeiten()
+        auftrag.refresh_from_db()
+        self.assertEqual(auftrag.status, Laufauftrag.FEHLER)
+        self.assertEqual(auftrag.ergebnis, {})
+
+    def test_knopf_reiht_ein_und_leitet_auf_den_auftrag(self):
+        from django.test import Client
+        c = Client()
+        c.force_login(self.a.benutzer)
+        antwort = c.post('/neu/sollstellung/starten/', {'jahr': 2026, 'monat': 9})
+        auftrag = Laufauftrag.alle_organisationen.get()
+        self.assertEqual(auftrag.organisation, self.a.organisation)
+        self.assertTrue(antwort['Location'].startswith(f'/neu/auftraege/{auftrag.pk}/'))
+
+        stand = c.get(f'/neu/auftraege/{auftrag.pk}/?format=json').json()
+        self.assertEqual(stand['status'], Laufauftrag.WARTEND)
+        self.assertFalse(stand['beendet'])
+        # Fremder Rücksprung wird nicht übernommen.
+        for fremder in ('//boese.example', '/\\boese.example', 'https://boese.example/'):
+            seite = c.get(f'/neu/auftraege/{auftrag.pk}/', {'zurueck': fremder})
+            self.assertNotContains(seite, 'boese.example')
+        seite = c.get(f'/neu/auftraege/{auftrag.pk}/', {'zurueck': '/neu/sollstellung/'})
+        self.assertContains(seite, '/neu/sollstellung/')
+
+        fremd = Client()
+        fremd.force_login(self.b.benutzer)
+        self.assertEqual(fremd.get(f'/neu/auftraege/{auftrag.pk}/').status_code, 404)
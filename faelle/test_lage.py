@@ -322,8 +322,8 @@ class AbfragezahlTests(TestCase):
     def test_senkungsansprueche_ohne_abfrage_je_vertrag(self):
         from faelle.lage import _senkungsansprueche
         with mandant(self.a.organisation):
-            # Eine für die Verträge, eine für das Vorabladen der Anpassungen.
-            with self.assertNumQueries(2):
+            # Eine Zählung über das Merkmal — gleich wie viele Verträge.
+            with self.assertNumQueries(1):
                 _senkungsansprueche()
 
     def test_die_ganze_lage_bleibt_zweistellig(self):
@@ -399,6 +399,116 @@ class StartseiteTests(TestCase):
         self.assertEqual(antwort['Location'], '/neu/?ansicht=wartet')
 
 
+class StandDerStartseiteTests(TestCase):
+    """Die schweren Teile der Startseite kommen aus dem Stand des Tages
+    (`faelle.startseite`) — und nur der betroffene Teil wird neu gerechnet."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.a = MandantenFixture('A', '8000', 'Zürich')
+
+    def setUp(self):
+        from unittest import mock
+
+        from faelle import startseite
+        self.gerechnet = []
+
+        def zaehlend(name, echt):
+            def rechnen(heute, aktive_lg):
+                self.gerechnet.append((name, aktive_lg.pk if aktive_lg else None))
+                return echt(heute, aktive_lg)
+            return rechnen
+
+        ersatz = {name: zaehlend(name, f) for name, f in startseite._RECHNEN.items()}
+        patcher = mock.patch.dict(startseite._RECHNEN, ersatz)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _seite(self):
+        c = Client()
+        c.force_login(self.a.benutzer)
+        with mandant(self.a.organisation):
+            return c.get('/neu/')
+
+    def test_zweiter_aufruf_rechnet_nichts_schweres(self):
+        self._seite()
+        self.assertEqual(sorted(n for n, _ in self.gerechnet), ['inbox', 'lage', 'reisst'])
+        self.gerechnet.clear()
+        self.assertEqual(self._seite().status_code, 200)
+        self.assertEqual(self.gerechnet, [])
+
+    def test_neue_pendenz_rechnet_nur_was_daran_haengt(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from core.models import Pendenz
+
+        self._seite()
+        self.gerechnet.clear()
+        with mandant(self.a.organisation):
+            Pendenz.objects.create(titel='Heizung prüfen lassen', liegenschaft=self.a.liegenschaft,
+                                   faellig_am=timezone.localdate() - timedelta(days=1))
+        antwort = self._seite()
+        self.assertContains(antwort, 'Heizung prüfen lassen')
+        self.assertEqual(sorted(n for n, _ in self.gerechnet), ['inbox', 'reisst'])
+
+    def test_umbenannter_mieter_verwirft_was_reisst(self):
+        """«Was reisst» trägt Mieternamen; bis Mitternacht darf dort nicht
+        der alte stehen."""
+        from django.utils import timezone
+
+        from faelle.startseite import teil
+
+        with mandant(self.a.organisation):
+            teil('reisst', timezone.localdate())
+            teil('reisst', timezone.localdate())
+            self.a.mieter.nachname = 'Neuname'
+            self.a.mieter.save()
+            teil('reisst', timezone.localdate())
+        self.assertEqual([n for n, _ in self.gerechnet], ['reisst', 'reisst'])
+
+    def test_ausgefallene_quelle_wird_nicht_gespeichert(self):
+        """Eine Lücke darf einen Aufruf treffen, nicht das Team bis zum Abend."""
+        from unittest.mock import patch
+
+        from django.utils import timezone
+
+        from faelle import arbeitsvorrat
+        from faelle.startseite import teil
+
+        def kaputt(heute, bis):
+            raise RuntimeError('kaputt')
+
+        tabelle = ((arbeitsvorrat.QUELLEN[0][0], kaputt, False), *arbeitsvorrat.QUELLEN[1:])
+        with mandant(self.a.organisation):
+            with patch('faelle.arbeitsvorrat.QUELLEN', tabelle), \
+                    self.assertLogs('faelle.arbeitsvorrat', level='ERROR'):
+                teil('reisst', timezone.localdate())
+            teil('reisst', timezone.localdate())
+            teil('reisst', timezone.localdate())
+        self.assertEqual([n for n, _ in self.gerechnet], ['reisst', 'reisst'])
+
+    def test_taeglicher_lauf_rechnet_den_tag_je_liegenschaft_vor(self):
+        from io import StringIO
+
+        from django.core.management import call_command
+        from django.utils import timezone
+
+        from faelle.startseite import stand
+
+        raus = StringIO()
+        call_command('taeglicher_lauf', organisation=self.a.organisation.pk,
+                     digest_weekday=-1, stdout=raus, stderr=StringIO())
+        self.assertIn('Startseite vorgerechnet (2 Stand/Stände)', raus.getvalue())
+        self.assertEqual(set(self.gerechnet), {
+            (n, lg) for n in ('inbox', 'lage', 'reisst') for lg in (None, self.a.liegenschaft.pk)})
+        self.gerechnet.clear()
+        with mandant(self.a.organisation):
+            stand(timezone.localdate(), self.a.liegenschaft)
+        self.assertEqual(self.gerechnet, [])
+
+
 class TrennungTests(TestCase):
     @classmethod
     def setUpTestData(cls):
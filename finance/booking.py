@@ -7,7 +7,11 @@ Ziele:
   es angelegt statt die Buchung stillschweigend zu verschlucken (kein
   ``except Buchungskonto.DoesNotExist: pass`` mehr → keine Drift zwischen
   Haupt- und Nebenbuch).
+- Konten werden innerhalb einer Anfrage oder eines Laufs nur einmal gesucht
+  (``kontenplan_zwischenspeicher``).
 """
+from contextlib import contextmanager
+from contextvars import ContextVar
 from decimal import Decimal
 
 from django.utils import timezone
@@ -79,44 +83,123 @@ def _organisation(organisation=None):
     return organisation_bestimmen(organisation)
 
 
+#: Aufgelöste Konten des laufenden Zwischenspeichers, Schlüssel
+#: `(organisation_id, nummer)`. `None` heisst „kein Zwischenspeicher offen" —
+#: dann sucht `konto()` jedes Mal, wie bisher.
+_kontenplan: ContextVar = ContextVar('swissimmo_kontenplan', default=None)
+
+
+@contextmanager
+def kontenplan_zwischenspeicher():
+    """Merkt sich aufgelöste Konten für die Dauer eines Blocks.
+
+    `buche()` löst Soll- und Habenkonto über `konto()` auf, und `konto()` fragte
+    dafür jedes Mal die Datenbank. Ein Lauf mit 10'000 Buchungen stellte so
+    20'000 Mal dieselbe Handvoll Fragen. Innerhalb dieses Blocks wird jede
+    Kontonummer je Verwaltung genau einmal gesucht.
+
+    WARUM EINE CONTEXTVAR: aus demselben Grund wie beim Mandantenkontext
+    (`core.tenancy`). Der Speicher lebt genau so lange wie die Anfrage oder der
+    Lauf, der ihn öffnet — die `OrganisationMiddleware` je Anfrage,
+    `je_organisation` je Verwaltung —, und kein Worker-Thread nimmt ihn in die
+    nächste Anfrage mit. Der Schlüssel trägt die Organisation; ein Konto einer
+    fremden Verwaltung kann darüber nicht herauskommen.
+
+    Verschachtelt ist der Block ein Leerlauf: Der innere benutzt den Speicher
+    des äusseren. Geleert wird bei jedem Speichern oder Löschen eines
+    Buchungskontos (Signal in `finance.models`). Nicht abgedeckt: ein Konto,
+    das `konto()` in einer Transaktion nachlegt, die danach zurückrollt — es
+    bliebe bis zum Ende des Blocks gemerkt. Deshalb nur um Anfragen und Läufe
+    legen, nie um etwas Langlebigeres.
+    """
+    if _kontenplan.get() is not None:
+        yield
+        return
+    token = _kontenplan.set({})
+    try:
+        yield
+    finally:
+        _kontenplan.reset(token)
+
+
+def kontenplan_vergessen(organisation_id):
+    """Wirft die gemerkten Konten EINER Verwaltung aus dem laufenden Speicher.
+
+    Die ganze Verwaltung und nicht nur die eine Nummer: Wird ein Konto
+    umnummeriert, stünde es sonst unter der alten Nummer weiter im Speicher.
+    """
+    gemerkt = _kontenplan.get()
+    if gemerkt:
+        for schluessel in [k for k in gemerkt if k[0] == organisation_id]:
+            del gemerkt[schluessel]
+
+
 def ensure_kontenplan(organisation=None):
-    """Legt fehlende Standardkonten idempotent an. Gibt die Anzahl neu erstellter zurück."""
+    """Legt fehlende Standardkonten idempotent an. Gibt die Anzahl neu erstellter zurück.
+
+    Eine Abfrage für den vorhandenen Kontenplan statt eines `get_or_create`
+    je Standardkonto; angelegt wird nur, was fehlt. Ist ein Zwischenspeicher
+    offen, ist der Kontenplan danach vollständig darin.
+    """
     from finance.models import Buchungskonto
     organisation = _organisation(organisation)
+    vorhanden = {k.nummer: k for k in Buchungskonto.objects.filter(organisation=organisation)}
     created = 0
     for nummer, bez, typ, hnk, vs in STANDARD_KONTEN:
-        _, c = Buchungskonto.objects.get_or_create(
+        if nummer in vorhanden:
+            continue
+        vorhanden[nummer], c = Buchungskonto.objects.get_or_create(
             nummer=nummer, organisation=organisation,
             defaults={'bezeichnung': bez, 'typ': typ, 'is_hnk_relevant': hnk,
                       'standard_verteilschluessel': vs})
         if c:
             created += 1
+    gemerkt = _kontenplan.get()
+    if gemerkt is not None:
+        for nummer, k in vorhanden.items():
+            gemerkt[(organisation.pk, nummer)] = k
     return created
 
 
 def konto(nummer, organisation=None):
     """Holt ein Buchungskonto; legt ein bekanntes Standardkonto bei Bedarf nach.
-    Wirft ValueError bei einer völlig unbekannten Kontonummer (statt stillem Skip)."""
+    Wirft ValueError bei einer völlig unbekannten Kontonummer (statt stillem Skip).
+
+    Innerhalb von `kontenplan_zwischenspeicher()` wird jede Nummer je
+    Verwaltung nur einmal gesucht."""
     from finance.models import Buchungskonto
     organisation = _organisation(organisation)
     nummer = str(nummer)
+    gemerkt = _kontenplan.get()
+    schluessel = (organisation.pk, nummer)
+    if gemerkt is not None and schluessel in gemerkt:
+        return gemerkt[schluessel]
     obj = Buchungskonto.objects.filter(nummer=nummer, organisation=organisation).first()
-    if obj:
-        return obj
-    if nummer in _STANDARD_MAP:
+    if obj is None and nummer in _STANDARD_MAP:
         _, bez, typ, hnk, vs = _STANDARD_MAP[nummer]
-        return Buchungskonto.objects.create(nummer=nummer, organisation=organisation,
-                                            bezeichnung=bez, typ=typ,
-                                            is_hnk_relevant=hnk, standard_verteilschluessel=vs)
-    raise ValueError(f"Unbekanntes Buchungskonto '{nummer}' — nicht im Standard-Kontenplan. "
-                     "Bitte im Kontenplan anlegen.")
+        obj = Buchungskonto.objects.create(nummer=nummer, organisation=organisation,
+                                           bezeichnung=bez, typ=typ,
+                                           is_hnk_relevant=hnk, standard_verteilschluessel=vs)
+    if obj is None:
+        raise ValueError(f"Unbekanntes Buchungskonto '{nummer}' — nicht im Standard-Kontenplan. "
+                         "Bitte im Kontenplan anlegen.")
+    # Erst NACH dem Anlegen merken: `create` löst das Signal aus, das die
+    # Einträge dieser Verwaltung verwirft.
+    gemerkt = _kontenplan.get()
+    if gemerkt is not None:
+        gemerkt[schluessel] = obj
+    return obj
 
 
-def buche(soll, haben, betrag, beleg_text, *, datum=None, liegenschaft=None, user=None,
-          debitor=None, kreditor=None, zahlung=None, storno=False):
-    """Erzeugt eine doppelte Buchung (Soll/Haben). soll/haben sind Kontonummern (str)
-    oder Buchungskonto-Instanzen. Beträge = 0/None werden übersprungen (gibt None).
-    Legt fehlende Standardkonten an — verschluckt nichts."""
+def buchung_vorbereiten(soll, haben, betrag, beleg_text, *, datum=None, liegenschaft=None, user=None,
+                       debitor=None, kreditor=None, zahlung=None, storno=False):
+    """Die Buchung, die `buche()` mit denselben Argumenten schriebe — UNGESPEICHERT.
+
+    Gibt None zurück, wo `buche()` nichts bucht (Betrag 0/None). Gedacht für
+    `buche_stapel()`: Wer viele Buchungen auf einmal schreibt, baut sie hier,
+    damit Rundung, Textkürzung und Kontoauflösung genau dieselben bleiben wie
+    im Einzelweg.
+    """
     from finance.models import Buchung, Buchungskonto
     if betrag is None:
         return None
@@ -125,7 +208,7 @@ def buche(soll, haben, betrag, beleg_text, *, datum=None, liegenschaft=None, use
         return None
     sk = soll if isinstance(soll, Buchungskonto) else konto(soll)
     hk = haben if isinstance(haben, Buchungskonto) else konto(haben)
-    return Buchung.objects.create(
+    return Buchung(
         datum=datum or timezone.localdate(),
         beleg_text=str(beleg_text)[:255],
         soll_konto=sk, haben_konto=hk, betrag=betrag,
@@ -134,6 +217,64 @@ def buche(soll, haben, betrag, beleg_text, *, datum=None, liegenschaft=None, use
         ist_storno=storno)
 
 
+def buche(soll, haben, betrag, beleg_text, *, datum=None, liegenschaft=None, user=None,
+          debitor=None, kreditor=None, zahlung=None, storno=False):
+    """Erzeugt eine doppelte Buchung (Soll/Haben). soll/haben sind Kontonummern (str)
+    oder Buchungskonto-Instanzen. Beträge = 0/None werden übersprungen (gibt None).
+    Legt fehlende Standardkonten an — verschluckt nichts."""
+    b = buchung_vorbereiten(soll, haben, betrag, beleg_text, datum=datum, liegenschaft=liegenschaft,
+                            user=user, debitor=debitor, kreditor=kreditor, zahlung=zahlung,
+                            storno=storno)
+    if b is None:
+        return None
+    b.save(force_insert=True)
+    return b
+
+
+def buche_stapel(buchungen):
+    """Schreibt vorbereitete Buchungen (`buchung_vorbereiten`) mit einem `bulk_create`.
+
+    Das Journal ist danach dasselbe, als wäre jede einzeln mit `buche()`
+    geschrieben worden: Belegnummern lückenlos in Listenreihenfolge, je
+    Verwaltung ein Block, Periodensperre und Betragsprüfung wie in `save()`.
+    Beides muss hier ausdrücklich stehen, weil `bulk_create` an `save()` und
+    am `pre_save`-Signal vorbeigeht.
+
+    Die Nummern kommen als zusammenhängender Block aus dem Zähler der
+    Verwaltung (`Belegnummernkreis.reservieren`). Verlangt eine umschliessende
+    Transaktion — ohne sie wäre ein Stapel, der halb geschrieben abbricht, ein
+    Journal mit Lücke. Das Saldenbuch trägt den Stapel in einem Zug ein, je
+    berührter Saldenzeile eine Anweisung. Gibt die Liste der gespeicherten
+    Buchungen zurück (None-Einträge werden übergangen).
+    """
+    from django.db import transaction
+    from finance.models import (Belegnummernkreis, Buchung, Saldenbuch, pruefe_dezimalfelder,
+                                pruefe_periodensperre)
+
+    buchungen = [b for b in buchungen if b is not None]
+    if not buchungen:
+        return []
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError("buche_stapel() braucht eine umschliessende transaction.atomic().")
+
+    je_organisation = {}
+    for b in buchungen:
+        if b.organisation_id is None:
+            b.organisation_id = b.organisation_aus_kette()
+        pruefe_dezimalfelder(b)
+        je_organisation.setdefault(b.organisation_id, []).append(b)
+
+    for organisation_id, teil in je_organisation.items():
+        # Die Sperre gilt bis zu einem Stichtag — das früheste Datum des
+        # Blocks entscheidet für alle.
+        pruefe_periodensperre(organisation_id, min(b.datum for b in teil))
+        for b, nr in zip(teil, Belegnummernkreis.reservieren(organisation_id, len(teil))):
+            b.beleg_nr = nr
+    Buchung.objects.bulk_create(buchungen)
+    Saldenbuch.verbuchen(buchungen)
+    return buchungen
+
+
 def storniere_buchung(buchung, *, user=None, datum=None):
     """Revisionssichere Gegenbuchung (Soll↔Haben getauscht). Die Originalbuchung
     bleibt unverändert erhalten (append-only), wird aber als storniert markiert.
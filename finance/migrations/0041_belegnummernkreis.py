@@ -0,0 +1,45 @@
+"""Belegnummernzähler je Verwaltung — ersetzt die Vergabe über `Max(beleg_nr) + 1`.
+
+Der Zähler wird für jede bestehende Verwaltung auf ihre höchste Belegnummer
+gesetzt. Ohne diesen Schritt legte die erste Buchung nach dem Update den
+Zähler zwar ebenfalls aus dem Journal an (`Belegnummernkreis.reservieren`),
+aber erst unter Last und im Schreibpfad — hier geschieht es einmal, ruhig.
+"""
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def befuellen(apps, schema_editor):
+    Organisation = apps.get_model('crm', 'Organisation')
+    Buchung = apps.get_model('finance', 'Buchung')
+    Belegnummernkreis = apps.get_model('finance', 'Belegnummernkreis')
+    stand = dict(Buchung.objects.values('organisation_id')
+                 .annotate(m=models.Max('beleg_nr')).values_list('organisation_id', 'm'))
+    Belegnummernkreis.objects.bulk_create([
+        Belegnummernkreis(organisation_id=org_id, letzte_nr=stand.get(org_id) or 0)
+        for org_id in Organisation.objects.values_list('pk', flat=True)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0040_organisation_zweifaktor_pflicht'),
+        ('finance', '0040_organisation_rest_pflicht'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Belegnummernkreis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('letzte_nr', models.PositiveIntegerField(default=0, verbose_name='Zuletzt vergebene Beleg-Nr')),
+                ('organisation', models.OneToOneField(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='belegnummernkreis', to='crm.organisation', verbose_name='Organisation')),
+            ],
+            options={
+                'verbose_name': 'Belegnummernkreis',
+                'verbose_name_plural': 'Belegnummernkreise',
+                'db_table': 'finance_belegnummernkreis',
+            },
+        ),
+        migrations.RunPython(befuellen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+"""Saldenbuch: Soll/Haben je Konto, Liegenschaft und Monat, vorgerechnet.
+
+Der Bestand wird einmal aus dem Journal aufgebaut; danach trägt sich jede
+Buchung selbst ein (`Buchung.save()`, `buche_stapel`). Dieselbe Rechnung wie
+`Saldenbuch.aus_journal`, hier auf den historischen Modellen.
+"""
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def befuellen(apps, schema_editor):
+    from core.services.jahresabschluss import abschluss_merkmal
+    Buchung = apps.get_model('finance', 'Buchung')
+    Saldenbuch = apps.get_model('finance', 'Saldenbuch')
+    _0 = Decimal('0.00')
+    summen = {}
+    buchungen = Buchung.objects.values_list('organisation_id', 'soll_konto_id', 'haben_konto_id',
+                                            'liegenschaft_id', 'datum', 'betrag', 'beleg_text')
+    for org_id, soll_id, haben_id, lg_id, datum, betrag, text in buchungen.iterator(chunk_size=2000):
+        rest = (lg_id, datum.year, datum.month, *abschluss_merkmal(text))
+        for schluessel, s, h in (((org_id, soll_id, *rest), betrag, _0),
+                                 ((org_id, haben_id, *rest), _0, betrag)):
+            alt_s, alt_h = summen.get(schluessel, (_0, _0))
+            summen[schluessel] = (alt_s + s, alt_h + h)
+    Saldenbuch.objects.bulk_create([
+        Saldenbuch(organisation_id=org_id, konto_id=konto_id, liegenschaft_id=lg_id, jahr=jahr,
+                   monat=monat, abschluss=abschluss, abschluss_jahr=abschluss_jahr,
+                   soll=s, haben=h)
+        for (org_id, konto_id, lg_id, jahr, monat, abschluss, abschluss_jahr), (s, h)
+        in summen.items()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0040_organisation_zweifaktor_pflicht'),
+        ('finance', '0041_belegnummernkreis'),
+        ('portfolio', '0039_liegenschaftsbudget'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Saldenbuch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jahr', models.PositiveSmallIntegerField()),
+                ('monat', models.PositiveSmallIntegerField()),
+                ('abschluss', models.BooleanField(default=False, verbose_name='Abschlussbuchungen')),
+                ('abschluss_jahr', models.PositiveSmallIntegerField(default=0, verbose_name='Abschluss für Jahr')),
+                ('soll', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('haben', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('konto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldenbuch', to='finance.buchungskonto')),
+                ('liegenschaft', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='portfolio.liegenschaft')),
+                ('organisation', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='crm.organisation', verbose_name='Organisation')),
+            ],
+            options={
+                'verbose_name': 'Saldenbuch-Zeile',
+                'verbose_name_plural': 'Saldenbuch',
+                'db_table': 'finance_saldenbuch',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('liegenschaft__isnull', False)), fields=('organisation', 'konto', 'liegenschaft', 'jahr', 'monat', 'abschluss', 'abschluss_jahr'), name='uniq_saldenbuch_liegenschaft'), models.UniqueConstraint(condition=models.Q(('liegenschaft__isnull', True)), fields=('organisation', 'konto', 'jahr', 'monat', 'abschluss', 'abschluss_jahr'), name='uniq_saldenbuch_ohne_liegenschaft')],
+            },
+        ),
+        migrations.RunPython(befuellen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.9 on 2026-10-18 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0040_organisation_zweifaktor_pflicht'),
+        ('finance', '0042_saldenbuch'),
+        ('portfolio', '0039_liegenschaftsbudget'),
+        ('rentals', '0037_dokument_organisation_pflicht'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='debitorenrechnung',
+            index=models.Index(condition=models.Q(('status__in', ['offen', 'teilbezahlt'])), fields=['faellig_am', 'datum'], name='idx_debrech_offen_faellig'),
+        ),
+    ]
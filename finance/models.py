@@ -7,7 +7,7 @@ from decimal import Decimal, InvalidOperation
 from django.conf import settings
 from django.db import models
 
-from core.tenancy import AlleOrganisationenManager, TenantManager
+from core.tenancy import AlleOrganisationenManager, TenantManager, TenantQuerySet
 from core.organisation_kette import OrganisationAusKette, organisation_bestimmen
 from django.utils import timezone
 from django.db.models import Sum
@@ -170,6 +170,28 @@ class LieferantProfil(models.Model):
     def __str__(self): return f"{self.name_anzeige} → {self.standard_konto or '—'}"
 
 
+def pruefe_periodensperre(organisation_id, datum):
+    """Wirft `PermissionError`, wenn `datum` in der gesperrten Periode liegt.
+
+    Die Sperre der EIGENEN Verwaltung, nicht `Organisation.objects.first()`.
+    Mit zwei Mandanten haette sonst der Abschluss von A die Buchungen von B
+    blockiert — oder, schlimmer, B haette in eine abgeschlossene Periode
+    buchen koennen, weil A noch offen war.
+
+    Eigene Funktion, weil neben `Buchung.save()` auch der Stapelweg
+    (`finance.booking.buche_stapel`) sie braucht: `bulk_create` geht an
+    `save()` vorbei, die Sperre darf es nicht.
+    """
+    from crm.models import Organisation
+    vw = Organisation.objects.filter(pk=organisation_id).first()
+    sperre = vw.buchung_gesperrt_bis if vw else None
+    if sperre and datum and datum <= sperre:
+        raise PermissionError(
+            f"Periode gesperrt: Buchungen bis {sperre:%d.%m.%Y} sind abgeschlossen "
+            f"(Datum {datum:%d.%m.%Y}). Bitte spätere Periode wählen."
+        )
+
+
 # 🔥 NEU: Die doppelte Buchhaltung (Soll & Haben) mit Revisionssicherheit
 class Buchung(OrganisationAusKette):
     ORGANISATION_PFAD = 'soll_konto'
@@ -208,8 +230,6 @@ class Buchung(OrganisationAusKette):
         return f"{self.datum}: {self.soll_konto.nummer} an {self.haben_konto.nummer} | CHF {self.betrag}"
 
     def save(self, *args, **kwargs):
-        from django.db import IntegrityError, transaction
-
         # Die Organisation MUSS vor allem Weiteren feststehen: Periodensperre
         # und Belegnummer haengen beide an ihr, und beide laufen, BEVOR
         # `OrganisationAusKette.save()` sie sonst ableiten wuerde.
@@ -218,64 +238,76 @@ class Buchung(OrganisationAusKette):
 
         # Periodensperre: neue Buchungen in einer abgeschlossenen Periode blockieren.
         if self._state.adding:
-            from crm.models import Organisation
-            # Die Sperre der EIGENEN Verwaltung, nicht `Organisation.objects.first()`.
-            # Mit zwei Mandanten haette bisher der Abschluss von A die Buchungen
-            # von B blockiert — oder, schlimmer, B haette in eine abgeschlossene
-            # Periode buchen koennen, weil A noch offen war.
-            vw = Organisation.objects.filter(pk=self.organisation_id).first()
-            sperre = vw.buchung_gesperrt_bis if vw else None
-            if sperre and self.datum and self.datum <= sperre:
-                raise PermissionError(
-                    f"Periode gesperrt: Buchungen bis {sperre:%d.%m.%Y} sind abgeschlossen "
-                    f"(Datum {self.datum:%d.%m.%Y}). Bitte spätere Periode wählen."
-                )
+            pruefe_periodensperre(self.organisation_id, self.datum)
             # Fortlaufende, EINDEUTIGE Belegnummer vergeben (lückenlos, OR 957a/958f).
-            # beleg_nr ist eindeutig; bei Parallel-Buchungen (Postgres) kollidiert
-            # Max+1 → IntegrityError. Deshalb Retry: Nummer neu berechnen und den
-            # Insert im Savepoint wiederholen (funktioniert auch verschachtelt in
-            # einer äusseren transaction.atomic()).
             #
             # JE ORGANISATION, seit Etappe 5 — und das ist keine Formalie:
             #
             # Die Constraint allein genügt hier nicht, darauf weist der Skill
-            # `phase-2-migration` ausdrücklich hin. Zählte `Max` weiter global,
+            # `phase-2-migration` ausdrücklich hin. Zählte die Vergabe global,
             # bekäme die zweite Verwaltung als erste Buchung die Nummer 1051,
             # weil die erste tausend Buchungen hat. Aus dieser Lücke liesse sich
             # die Buchungsmenge eines fremden Mandanten ablesen — und eine
             # Belegnummernfolge, die bei 1051 beginnt, ist nach OR 957a/958f
             # ohnehin keine lückenlose mehr. Jede Verwaltung zählt bei 1.
+            #
+            # Die Nummer kommt aus dem Zähler der Verwaltung
+            # (`Belegnummernkreis`), nicht mehr aus `Max(beleg_nr) + 1`. Das
+            # Aggregat lief über das ganze Journal der Verwaltung — jede
+            # Buchung wurde mit der Grösse des Journals teurer —, und zwei
+            # gleichzeitige Schreiber zogen dieselbe Nummer und mussten es bis
+            # zu achtmal erneut versuchen. Der Zähler sperrt seine Zeile bis
+            # zum Ende der Transaktion: Der zweite wartet, statt zu kollidieren.
+            #
+            # Zähler und Insert in EINER Transaktion: Scheitert der Insert,
+            # fällt die Reservierung mit zurück, und es bleibt keine Lücke.
+            #
+            # Das Saldenbuch trägt sich in derselben Transaktion ein.
+            from django.db import IntegrityError, transaction
             if self.beleg_nr is None:
-                last_exc = None
-                for _ in range(8):
-                    # `alle_organisationen`, weil die Mandantengrenze hier
-                    # eine Zeile tiefer AUSDRUECKLICH steht
-                    # (`organisation_id=self.organisation_id`). Der Kontext
-                    # zusaetzlich zu verlangen wuerde nichts sicherer machen,
-                    # aber jedes Speichern ausserhalb einer Anfrage abbrechen —
-                    # Sollstellungslauf, Import, Migration, Test.
-                    letzte = (Buchung.alle_organisationen
-                              .filter(organisation_id=self.organisation_id)
-                              .aggregate(m=models.Max('beleg_nr'))['m'] or 0)
-                    self.beleg_nr = letzte + 1
+                for versuch in range(2):
                     try:
                         with transaction.atomic():
+                            self.beleg_nr = Belegnummernkreis.reservieren(self.organisation_id)[0]
                             super().save(*args, **kwargs)
+                            Saldenbuch.verbuchen([self])
                         return
-                    except IntegrityError as exc:
-                        last_exc = exc
-                        continue
-                if last_exc:
-                    raise last_exc
-                return
-        super().save(*args, **kwargs)
+                    except IntegrityError:
+                        # Der Zähler stand hinter dem Journal (Datenbankumzug,
+                        # Altbestand, Handeingriff). Einmal angleichen und neu
+                        # ziehen; scheitert es dann noch, ist es kein Zählerproblem.
+                        self.beleg_nr = None
+                        if versuch:
+                            raise
+                        Belegnummernkreis.angleichen(self.organisation_id)
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                Saldenbuch.verbuchen([self])
+            return
+        # Eine gespeicherte Buchung ändert sich normalerweise nur im Storno-
+        # Vermerk. Berührt ein Speichern doch Betrag, Konto, Datum,
+        # Liegenschaft oder Text, wird der alte Stand aus- und der neue
+        # eingetragen.
+        felder = kwargs.get('update_fields')
+        if felder is not None and not set(felder) & set(Saldenbuch.BUCHUNGSFELDER):
+            return super().save(*args, **kwargs)
+        from django.db import transaction
+        with transaction.atomic():
+            alt = Buchung.alle_organisationen.filter(pk=self.pk).first()
+            super().save(*args, **kwargs)
+            if alt is not None:
+                Saldenbuch.verbuchen([alt], -1)
+            Saldenbuch.verbuchen([self])
 
     def delete(self, *args, **kwargs):
         """Revisionssicherheit: Buchungen sind append-only. Statt Löschen wird
         storniert (Gegenbuchung). Hard-Delete nur mit explizitem force=True
         (z.B. Testdaten-Cleanup / Storno-Paar-Bereinigung)."""
         if kwargs.pop('force', False):
-            return super().delete(*args, **kwargs)
+            from django.db import transaction
+            with transaction.atomic():
+                Saldenbuch.verbuchen([self], -1)
+                return super().delete(*args, **kwargs)
         raise PermissionError(
             "Buchungen dürfen nicht gelöscht werden (Revisionssicherheit). "
             "Bitte stornieren statt löschen."
@@ -295,7 +327,339 @@ class Buchung(OrganisationAusKette):
         ]
 
 
+class Belegnummernkreis(models.Model):
+    """Der Belegnummernzähler einer Verwaltung (OR 957a/958f).
+
+    Eine Zeile je Organisation; `letzte_nr` ist die zuletzt vergebene Nummer.
+    Vergeben wird nur über `reservieren()`, das die Zeile bis zum Ende der
+    Transaktion sperrt. Zwei Dinge folgen daraus:
+
+      · Gleichzeitige Schreiber warten aufeinander, statt dieselbe Nummer zu
+        ziehen und es erneut zu versuchen.
+      · Rollt die Transaktion zurück, rollt der Zähler mit — eine reservierte,
+        aber nie geschriebene Nummer hinterlässt keine Lücke.
+
+    Stapelwege (Sollstellung, Bankimport, Jahresabschluss) ziehen mit
+    `reservieren(org, n)` einen zusammenhängenden Block in einer Anweisung.
+    """
+    organisation = models.OneToOneField('crm.Organisation', on_delete=models.CASCADE,
+                                        editable=False, related_name='belegnummernkreis',
+                                        verbose_name='Organisation')
+    letzte_nr = models.PositiveIntegerField("Zuletzt vergebene Beleg-Nr", default=0)
+
+    objects = TenantManager()
+    alle_organisationen = AlleOrganisationenManager()
+
+    class Meta:
+        verbose_name = "Belegnummernkreis"
+        verbose_name_plural = "Belegnummernkreise"
+        db_table = 'finance_belegnummernkreis'
+
+    def __str__(self):
+        return f"{self.organisation_id}: {self.letzte_nr}"
+
+    # `alle_organisationen` in beiden Methoden: Die Mandantengrenze steht
+    # ausdrücklich als `organisation_id` im Filter, wie bei der Vergabe in
+    # `Buchung.save()`. Den Kontext zusätzlich zu verlangen brächte nichts und
+    # bräche jedes Buchen ausserhalb einer Anfrage ab.
+
+    @classmethod
+    def reservieren(cls, organisation_id, anzahl=1):
+        """Reserviert die nächsten `anzahl` Nummern und gibt sie als `range` zurück.
+
+        Erst das UPDATE, dann das Lesen: Das UPDATE nimmt die Zeilensperre
+        (auf SQLite die Schreibsperre) sofort, bevor irgendetwas gelesen wird —
+        ein „lesen, dann schreiben" liesse zwei Transaktionen denselben Stand
+        sehen. Verlangt eine umschliessende Transaktion; ohne sie wäre die
+        Nummer vergeben, bevor die Buchung steht.
+        """
+        from django.db import IntegrityError, transaction
+        from django.db.models import F
+        if anzahl < 1:
+            raise ValueError("Es muss mindestens eine Belegnummer reserviert werden.")
+        if not transaction.get_connection().in_atomic_block:
+            raise RuntimeError("Belegnummernkreis.reservieren() braucht eine transaction.atomic().")
+        zeilen = cls.alle_organisationen.filter(organisation_id=organisation_id)
+        if not zeilen.update(letzte_nr=F('letzte_nr') + anzahl):
+            # Erste Buchung dieser Verwaltung seit Einführung des Zählers:
+            # vom bestehenden Journal aus anlegen. Legt ein paralleler
+            # Schreiber die Zeile gleichzeitig an, gewinnt einer, und der
+            # andere zählt auf dessen Zeile weiter.
+            try:
+                with transaction.atomic():
+                    cls.alle_organisationen.create(organisation_id=organisation_id,
+                                                   letzte_nr=cls._journal_stand(organisation_id))
+            except IntegrityError:
+                pass
+            zeilen.update(letzte_nr=F('letzte_nr') + anzahl)
+        letzte = zeilen.values_list('letzte_nr', flat=True).get()
+        return range(letzte - anzahl + 1, letzte + 1)
+
+    @classmethod
+    def angleichen(cls, organisation_id=None):
+        """Setzt Zähler auf die höchste Belegnummer im Journal. Gibt die Anzahl
+        korrigierter Zähler zurück.
+
+        Nötig, wo das Journal am Zähler vorbei gewachsen ist — nach `loaddata`
+        beim Datenbankumzug oder nach einem Handeingriff. Ein Zähler VOR dem
+        Journal wird nie zurückgesetzt: Das gäbe vergebene Nummern ein zweites
+        Mal aus.
+        """
+        from crm.models import Organisation
+        ids = [organisation_id] if organisation_id is not None else list(
+            Organisation.objects.values_list('pk', flat=True))
+        korrigiert = 0
+        for org_id in ids:
+            stand = cls._journal_stand(org_id)
+            kreis, neu = cls.alle_organisationen.get_or_create(organisation_id=org_id,
+                                                               defaults={'letzte_nr': stand})
+            if not neu and kreis.letzte_nr < stand:
+                kreis.letzte_nr = stand
+                kreis.save(update_fields=['letzte_nr'])
+                korrigiert += 1
+        return korrigiert
+
+    @staticmethod
+    def _journal_stand(organisation_id):
+        return (Buchung.alle_organisationen.filter(organisation_id=organisation_id)
+                .aggregate(m=models.Max('beleg_nr'))['m'] or 0)
+
+
+class Saldenbuch(models.Model):
+    """Verdichtete Kontensalden: Soll und Haben je Konto, Liegenschaft und Monat.
+
+    Die Auswertungen über das Hauptbuch (Jahresabschluss, Erfolgsrechnung und
+    Bilanz) summierten bei jedem Aufruf das ganze Journal. Hier steht dieselbe
+    Summe vorgerechnet; eine Jahresauswertung liest höchstens zwölf Zeilen je
+    Konto und Liegenschaft.
+
+    NACHGEFÜHRT, NICHT NACHGERECHNET. Jede Buchung trägt sich beim Speichern
+    ein (`Buchung.save()`, `finance.booking.buche_stapel`), in DERSELBEN
+    Transaktion — rollt die Buchung zurück, rollt ihr Saldo mit. Ein Storno
+    ist eine Gegenbuchung und trägt sich wie jede andere ein.
+
+    `abschluss` und `abschluss_jahr` halten fest, ob die Buchungen der Zeile
+    Abschlussbuchungen sind (`core.services.jahresabschluss.abschluss_merkmal`).
+    Die Auswertungen klammern sie aus, wie sie es im Journal über
+    `abschluss_buchungen_q()` tun.
+
+    Wer am Journal vorbei schreibt (`QuerySet.update()`/`delete()`, `loaddata`,
+    Roh-SQL), muss danach `manage.py saldenbuch` laufen lassen; `--pruefen`
+    zeigt, ob Saldenbuch und Journal auseinanderliegen.
+    """
+    organisation = models.ForeignKey('crm.Organisation', on_delete=models.CASCADE,
+                                     editable=False, related_name='+', verbose_name='Organisation')
+    konto = models.ForeignKey(Buchungskonto, on_delete=models.CASCADE, related_name='saldenbuch')
+    # CASCADE ist richtig, obwohl die Buchung beim Löschen einer Liegenschaft
+    # nur SET_NULL erfährt: Ein pre_delete-Signal hängt die Zeilen vorher auf
+    # «ohne Liegenschaft» um (`liegenschaft_aufloesen`).
+    liegenschaft = models.ForeignKey('portfolio.Liegenschaft', on_delete=models.CASCADE,
+                                     null=True, blank=True, related_name='+')
+    jahr = models.PositiveSmallIntegerField()
+    monat = models.PositiveSmallIntegerField()
+    abschluss = models.BooleanField("Abschlussbuchungen", default=False)
+    abschluss_jahr = models.PositiveSmallIntegerField("Abschluss für Jahr", default=0)
+    soll = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    haben = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    objects = TenantManager()
+    alle_organisationen = AlleOrganisationenManager()
+
+    #: Felder der Buchung, die bestimmen, wo und wie viel sie im Saldenbuch zählt.
+    BUCHUNGSFELDER = ('organisation', 'organisation_id', 'soll_konto', 'soll_konto_id',
+                      'haben_konto', 'haben_konto_id', 'liegenschaft', 'liegenschaft_id',
+                      'datum', 'betrag', 'beleg_text')
+
+    class Meta:
+        verbose_name = "Saldenbuch-Zeile"
+        verbose_name_plural = "Saldenbuch"
+        db_table = 'finance_saldenbuch'
+        # Zwei Constraints statt einer: NULL ist in einer UniqueConstraint von
+        # jedem anderen NULL verschieden, die Zeilen «ohne Liegenschaft» wären
+        # sonst nicht eindeutig.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['organisation', 'konto', 'liegenschaft', 'jahr', 'monat',
+                        'abschluss', 'abschluss_jahr'],
+                condition=models.Q(liegenschaft__isnull=False),
+                name='uniq_saldenbuch_liegenschaft'),
+            models.UniqueConstraint(
+                fields=['organisation', 'konto', 'jahr', 'monat', 'abschluss', 'abschluss_jahr'],
+                condition=models.Q(liegenschaft__isnull=True),
+                name='uniq_saldenbuch_ohne_liegenschaft'),
+        ]
+
+    def __str__(self):
+        return f"{self.konto_id} {self.monat:02d}/{self.jahr}: S {self.soll} / H {self.haben}"
+
+    # `alle_organisationen` durchgehend: Die Organisation steht in jedem
+    # Schlüssel ausdrücklich, wie beim `Belegnummernkreis`. Gebucht wird auch
+    # ausserhalb einer Anfrage (Migration, Befehle).
+
+    @staticmethod
+    def _bewegungen(buchung, vorzeichen):
+        """Die zwei Saldenbuch-Schlüssel einer Buchung mit ihrem Soll/Haben-Beitrag."""
+        from core.services.jahresabschluss import abschluss_merkmal
+        datum = Buchung._meta.get_field('datum').to_python(buchung.datum)
+        betrag = Decimal(str(buchung.betrag)).quantize(Decimal('0.01')) * vorzeichen
+        abschluss, abschluss_jahr = abschluss_merkmal(buchung.beleg_text)
+        rest = (buchung.liegenschaft_id, datum.year, datum.month, abschluss, abschluss_jahr)
+        return [((buchung.organisation_id, buchung.soll_konto_id, *rest), betrag, Decimal('0.00')),
+                ((buchung.organisation_id, buchung.haben_konto_id, *rest), Decimal('0.00'), betrag)]
+
+    @classmethod
+    def verbuchen(cls, buchungen, vorzeichen=1):
+        """Trägt Buchungen ein (`vorzeichen=-1`: trägt sie wieder aus).
+
+        Die Bewegungen werden zuerst je Schlüssel zusammengezählt; ein Stapel
+        von tausend Mietbuchungen trifft so nur die paar Zeilen, die er
+        wirklich berührt. Je Zeile erst das UPDATE, wie beim
+        `Belegnummernkreis`: Es sperrt die Zeile, bevor gelesen wird.
+        """
+        from django.db import transaction
+        if not transaction.get_connection().in_atomic_block:
+            raise RuntimeError("Saldenbuch.verbuchen() braucht eine transaction.atomic().")
+        summen = {}
+        for b in buchungen:
+            for schluessel, soll, haben in cls._bewegungen(b, vorzeichen):
+                s, h = summen.get(schluessel, (Decimal('0.00'), Decimal('0.00')))
+                summen[schluessel] = (s + soll, h + haben)
+        for schluessel, (soll, haben) in summen.items():
+            cls._fortschreiben(schluessel, soll, haben)
+
+    @classmethod
+    def _fortschreiben(cls, schluessel, soll, haben):
+        from django.db import IntegrityError, transaction
+        from django.db.models import F
+        org_id, konto_id, lg_id, jahr, monat, abschluss, abschluss_jahr = schluessel
+        zeile = cls.alle_organisationen.filter(
+            organisation_id=org_id, konto_id=konto_id, liegenschaft_id=lg_id, jahr=jahr,
+            monat=monat, abschluss=abschluss, abschluss_jahr=abschluss_jahr)
+        if zeile.update(soll=F('soll') + soll, haben=F('haben') + haben):
+            return
+        try:
+            with transaction.atomic():
+                cls.alle_organisationen.create(
+                    organisation_id=org_id, konto_id=konto_id, liegenschaft_id=lg_id, jahr=jahr,
+                    monat=monat, abschluss=abschluss, abschluss_jahr=abschluss_jahr,
+                    soll=soll, haben=haben)
+        except IntegrityError:
+            # Ein paralleler Schreiber hat die Zeile eben angelegt.
+            zeile.update(soll=F('soll') + soll, haben=F('haben') + haben)
+
+    @classmethod
+    def liegenschaft_aufloesen(cls, liegenschaft_id):
+        """Hängt die Zeilen einer Liegenschaft auf «ohne Liegenschaft» um.
+
+        Wird eine Liegenschaft gelöscht, verlieren ihre Buchungen den Bezug
+        (SET_NULL) und zählen fortan ohne Liegenschaft. Das Saldenbuch muss
+        ihnen folgen, sonst fehlten sie in der portfolioweiten Auswertung.
+        """
+        zeilen = cls.alle_organisationen.filter(liegenschaft_id=liegenschaft_id)
+        for z in zeilen:
+            cls._fortschreiben((z.organisation_id, z.konto_id, None, z.jahr, z.monat,
+                                z.abschluss, z.abschluss_jahr), z.soll, z.haben)
+        zeilen.delete()
+
+    @staticmethod
+    def summen(zeilen):
+        """`{konto_id: (soll, haben)}` über eine Auswahl von Saldenbuch-Zeilen."""
+        from django.db.models import Sum
+        return {kid: (soll or Decimal('0.00'), haben or Decimal('0.00'))
+                for kid, soll, haben in zeilen.values('konto').annotate(
+                    s=Sum('soll'), h=Sum('haben')).values_list('konto', 's', 'h')}
+
+    @classmethod
+    def aus_journal(cls, organisation_id):
+        """Soll-Stand des Saldenbuchs einer Verwaltung, frisch aus dem Journal.
+
+        `{schluessel: (soll, haben)}` mit denselben Schlüsseln wie `verbuchen`.
+        Grundlage für Neuaufbau und Prüfung (`manage.py saldenbuch`).
+        """
+        summen = {}
+        buchungen = (Buchung.alle_organisationen.filter(organisation_id=organisation_id)
+                     .only('organisation_id', 'soll_konto_id', 'haben_konto_id', 'liegenschaft_id',
+                           'datum', 'betrag', 'beleg_text'))
+        for b in buchungen.iterator(chunk_size=2000):
+            for schluessel, soll, haben in cls._bewegungen(b, 1):
+                s, h = summen.get(schluessel, (Decimal('0.00'), Decimal('0.00')))
+                summen[schluessel] = (s + soll, h + haben)
+        return summen
+
+    @classmethod
+    def neu_aufbauen(cls, organisation_id):
+        """Ersetzt das Saldenbuch einer Verwaltung durch den Stand aus dem Journal.
+        Gibt die Anzahl geschriebener Zeilen zurück."""
+        from django.db import transaction
+        zeilen = [cls(organisation_id=org_id, konto_id=konto_id, liegenschaft_id=lg_id,
+                      jahr=jahr, monat=monat, abschluss=abschluss, abschluss_jahr=abschluss_jahr,
+                      soll=soll, haben=haben)
+                  for (org_id, konto_id, lg_id, jahr, monat, abschluss, abschluss_jahr), (soll, haben)
+                  in cls.aus_journal(organisation_id).items()]
+        with transaction.atomic():
+            cls.alle_organisationen.filter(organisation_id=organisation_id).delete()
+            cls.alle_organisationen.bulk_create(zeilen, batch_size=1000)
+        return len(zeilen)
+
+    @classmethod
+    def abweichungen(cls, organisation_id):
+        """Schlüssel, bei denen Saldenbuch und Journal nicht übereinstimmen.
+
+        Liste von `(schluessel, saldenbuch, journal)`, je `(soll, haben)`.
+        Zeilen, die auf null stehen, zählen wie fehlende Zeilen.
+        """
+        _0 = (Decimal('0.00'), Decimal('0.00'))
+        soll_stand = cls.aus_journal(organisation_id)
+        ist_stand = {
+            (z.organisation_id, z.konto_id, z.liegenschaft_id, z.jahr, z.monat,
+             z.abschluss, z.abschluss_jahr): (z.soll, z.haben)
+            for z in cls.alle_organisationen.filter(organisation_id=organisation_id)}
+        return [(k, ist_stand.get(k, _0), soll_stand.get(k, _0))
+                for k in sorted(set(soll_stand) | set(ist_stand), key=str)
+                if ist_stand.get(k, _0) != soll_stand.get(k, _0)]
+
+
 # 🔥 NEU: Debitorenrechnungen (inkl. OP-Verwaltung)
+class DebitorenRechnungQuerySet(TenantQuerySet):
+    """Offene Posten in SQL statt Zeile für Zeile in Python.
+
+    `offener_betrag` rechnet je Rechnung — aus vorgeladenen Zahlungseingängen
+    oder mit einer eigenen Abfrage. Für Listen heisst das: ALLE Rechnungen
+    laden, um danach in Python die offenen herauszusuchen; bei 20'000
+    Rechnungen ist das die ganze Seitenzeit. `mit_offen()` rechnet dasselbe als
+    Unterabfrage, damit Filtern (`offen__gt=0`), Sortieren und Blättern in der
+    Datenbank bleiben.
+    """
+
+    #: Status, in denen eine Rechnung als offener Posten zählt. Der Teilindex
+    #: `idx_debrech_offen_faellig` ist genau auf diese Status beschränkt.
+    OFFEN_STATUS = ('offen', 'teilbezahlt')
+
+    def mit_offen(self):
+        """Annotiert `bezahlt` (Summe der verbuchten Zahlungseingänge) und
+        `offen` (Betrag minus bezahlt, nie unter 0) — dieselbe Regel wie
+        `DebitorenRechnung.offener_betrag`, das die Annotation dann liest."""
+        from django.db.models import DecimalField, F, OuterRef, Subquery, Value
+        from django.db.models.functions import Coalesce, Greatest
+
+        geld = DecimalField(max_digits=12, decimal_places=2)
+        null = Value(Decimal('0.00'), output_field=geld)
+        # `alle_organisationen`: Die Unterabfrage hängt an `OuterRef('pk')`,
+        # also an einer Rechnung, die der äussere Ausdruck schon ausgewählt
+        # hat. Die Grenze steht dort; `objects` würde sie nur wiederholen und
+        # in Systemläufen ohne Kontext werfen.
+        summe = (Zahlungseingang.alle_organisationen
+                 .filter(debitoren_rechnung=OuterRef('pk'), status='verbucht')
+                 .order_by().values('debitoren_rechnung')
+                 .annotate(summe=Sum('betrag')).values('summe')[:1])
+        return (self.annotate(bezahlt=Coalesce(Subquery(summe, output_field=geld), null))
+                .annotate(offen=Greatest(F('betrag') - F('bezahlt'), null, output_field=geld)))
+
+    def offene_posten(self):
+        """Rechnungen mit Status offen/teilbezahlt und einem Rest über 0."""
+        return self.mit_offen().filter(status__in=self.OFFEN_STATUS, offen__gt=0)
+
+
 class DebitorenRechnung(OrganisationAusKette):
     ORGANISATION_PFAD = ('vertrag', 'einheit', 'liegenschaft', 'konto_haben')
     STATUS_CHOICES = [
@@ -340,6 +704,11 @@ class DebitorenRechnung(OrganisationAusKette):
     qr_referenz = models.CharField("QRR-Referenz (27-stellig)", max_length=27, blank=True, default='', db_index=True)  # 🔥 NEU (camt.053-Abgleich)
     pdf_dokument = models.FileField(upload_to='debitoren_rechnungen/', blank=True, null=True)
 
+    # Wie in `OrganisationAusKette`, nur mit `mit_offen()`/`offene_posten()`;
+    # `objects` zuerst, damit der filternde Manager der Default bleibt.
+    objects = TenantManager.from_queryset(DebitorenRechnungQuerySet)()
+    alle_organisationen = AlleOrganisationenManager.from_queryset(DebitorenRechnungQuerySet)()
+
     class Meta:
         verbose_name = "Debitorenrechnung (Weiterverrechnung)"
         verbose_name_plural = "Debitorenrechnungen"
@@ -347,6 +716,11 @@ class DebitorenRechnung(OrganisationAusKette):
         indexes = [
             models.Index(fields=['status', 'faellig_am'], name='idx_debrech_status_faellig'),
             models.Index(fields=['vertrag', 'status'], name='idx_debrech_vertrag_status'),
+            # Teilindex nur über die offenen Posten: Mahnwesen, Aging und
+            # Inbox fragen fast immer «offen/teilbezahlt, nach Fälligkeit» —
+            # und das ist ein kleiner Bruchteil aller Rechnungen.
+            models.Index(fields=['faellig_am', 'datum'], name='idx_debrech_offen_faellig',
+                         condition=models.Q(status__in=['offen', 'teilbezahlt'])),
         ]
 
     def __str__(self):
@@ -379,6 +753,10 @@ class DebitorenRechnung(OrganisationAusKette):
         # sonst löst jede Zeile einer Liste eine eigene SUM-Abfrage aus (N+1 →
         # Timeout auf grossen Portfolios). .filter() umgeht den Prefetch-Cache,
         # daher hier in Python filtern, wenn die Daten bereits geladen sind.
+        # Kam die Rechnung aus `mit_offen()`, steht der Betrag schon da —
+        # Stand beim Laden, wie beim Prefetch.
+        if 'offen' in self.__dict__:
+            return self.offen
         cache = getattr(self, '_prefetched_objects_cache', None) or {}
         if 'zahlungseingaenge' in cache:
             zahlungen = sum((z.betrag or Decimal('0.00'))
@@ -1157,3 +1535,162 @@ def _dezimalfeld_guard(sender, instance, **kwargs):
 
 
 _pre_save.connect(_dezimalfeld_guard, dispatch_uid='finance.dezimalfeld_guard')
+
+
+# ---------------------------------------------------------------------------
+# Kontenplan-Zwischenspeicher (`finance.booking.kontenplan_zwischenspeicher`)
+# leeren, sobald sich ein Buchungskonto ändert. Über das Signal und nicht in
+# `Buchungskonto.save()`, weil auch das Löschen (Admin, Kontenplan-Pflege)
+# einen gemerkten Eintrag ungültig macht.
+from django.db.models.signals import post_delete as _post_delete, post_save as _post_save
+
+
+def _kontenplan_vergessen(sender, instance, **kwargs):
+    from finance.booking import kontenplan_vergessen
+    kontenplan_vergessen(instance.organisation_id)
+
+
+_post_save.connect(_kontenplan_vergessen, sender=Buchungskonto, dispatch_uid='finance.kontenplan_vergessen')
+_post_delete.connect(_kontenplan_vergessen, sender=Buchungskonto,
+                     dispatch_uid='finance.kontenplan_vergessen_loeschen')
+
+
+# ---------------------------------------------------------------------------
+# Saldenbuch: Vor dem Löschen einer Liegenschaft ihre Zeilen auf «ohne
+# Liegenschaft» umhängen — die Buchungen selbst behalten ihren Betrag und
+# verlieren nur den Bezug (SET_NULL). Siehe `Saldenbuch.liegenschaft_aufloesen`.
+from django.db.models.signals import pre_delete as _pre_delete
+
+
+def _saldenbuch_liegenschaft(sender, instance, **kwargs):
+    Saldenbuch.liegenschaft_aufloesen(instance.pk)
+
+
+_pre_delete.connect(_saldenbuch_liegenschaft, sender='portfolio.Liegenschaft',
+                    dispatch_uid='finance.saldenbuch_liegenschaft')
+
+
+# ---------------------------------------------------------------------------
+# Zahler-Index (`core.services.zahlerindex`) nachziehen: Er kennt die Namen
+# aller Vertragsparteien und die gelernten Absender. Ein neuer WG-Mieter kommt
+# über `weitere_mieter` dazu, ohne dass der Vertrag gespeichert wird — darum
+# auch `m2m_changed`.
+from django.db.models.signals import m2m_changed as _m2m_changed
+
+
+def _zahlerindex_vertrag(sender, instance, **kwargs):
+    from core.services.zahlerindex import vertrag_geaendert
+    vertrag_geaendert(instance.organisation_id, instance.pk)
+
+
+def _zahlerindex_mieter(sender, instance, **kwargs):
+    from core.services.zahlerindex import mieter_geaendert
+    mieter_geaendert(instance.organisation_id, instance.pk)
+
+
+def _zahlerindex_gelernt(sender, instance, signal, **kwargs):
+    from core.services.zahlerindex import gelernt_geaendert
+    gelernt_geaendert(instance.organisation_id, instance.pk, instance.name_norm,
+                      None if signal is _post_delete else instance.vertrag_id)
+
+
+def _zahlerindex_wg(sender, instance, action, reverse, pk_set, **kwargs):
+    from core.services.zahlerindex import mieter_geaendert, vertrag_geaendert
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        vertrag_geaendert(instance.organisation_id, instance.pk)
+    elif pk_set:
+        for vertrag_id in pk_set:
+            vertrag_geaendert(instance.organisation_id, vertrag_id)
+    else:
+        mieter_geaendert(instance.organisation_id, instance.pk)
+
+
+for _quelle, _empfaenger in (('rentals.Mietvertrag', _zahlerindex_vertrag),
+                             ('crm.Mieter', _zahlerindex_mieter),
+                             ('finance.ZahlerZuordnung', _zahlerindex_gelernt)):
+    _post_save.connect(_empfaenger, sender=_quelle, dispatch_uid=f'finance.zahlerindex_{_quelle}')
+    _post_delete.connect(_empfaenger, sender=_quelle,
+                         dispatch_uid=f'finance.zahlerindex_{_quelle}_loeschen')
+_m2m_changed.connect(_zahlerindex_wg, sender='rentals.Mietvertrag_weitere_mieter',
+                     dispatch_uid='finance.zahlerindex_wg')
+
+
+# Suchindex (`core.services.suche`) nachziehen: je Person, Vertrag, Objekt und
+# Debitorenrechnung ein Dokument, in dem auch die Namen der Nachbarn stehen —
+# darum die Liegenschaft (Strasse, Ort) und die WG-Mieter dazu.
+def _suche_gespeichert(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    from core.services.suche import gespeichert
+    if not raw:
+        gespeichert(instance, created, update_fields)
+
+
+def _suche_geloescht(sender, instance, **kwargs):
+    from core.services.suche import geloescht
+    geloescht(instance)
+
+
+def _suche_wg(sender, instance, action, reverse, pk_set, **kwargs):
+    from core.services.suche import aktualisieren
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        aktualisieren('vertrag', pk=instance.pk)
+    elif pk_set:
+        aktualisieren('vertrag', pk__in=pk_set)
+
+
+for _quelle in ('crm.Mieter', 'rentals.Mietvertrag', 'portfolio.Einheit',
+                'portfolio.Liegenschaft', 'finance.DebitorenRechnung'):
+    _post_save.connect(_suche_gespeichert, sender=_quelle, dispatch_uid=f'finance.suche_{_quelle}')
+    _post_delete.connect(_suche_geloescht, sender=_quelle,
+                         dispatch_uid=f'finance.suche_{_quelle}_loeschen')
+_m2m_changed.connect(_suche_wg, sender='rentals.Mietvertrag_weitere_mieter',
+                     dispatch_uid='finance.suche_wg')
+
+
+# ---------------------------------------------------------------------------
+# Zwischenspeicher (`core.services.zwischenspeicher`): Jede gespeicherte oder
+# gelöschte Zeile einer Quelle in `TAG_ARTEN` verwirft ihren Tag und die ihrer
+# direkten Bezüge. `raw` (Fixtures) löst nichts aus — dort gibt es noch nichts
+# zu verwerfen, und die Zeile trägt womöglich noch keine Organisation.
+def _zwischenspeicher_vergessen(sender, instance, raw=False, **kwargs):
+    from core.services.zwischenspeicher import tags_fuer, vergessen
+    if not raw and instance.organisation_id:
+        vergessen(*tags_fuer(instance), organisation_id=instance.organisation_id)
+
+
+def _zwischenspeicher_wg(sender, instance, action, reverse, pk_set, **kwargs):
+    from core.services.zwischenspeicher import vergessen
+    if action not in ('post_add', 'post_remove', 'post_clear') or not instance.organisation_id:
+        return
+    if not reverse:
+        vergessen(f'vertrag:{instance.pk}', organisation_id=instance.organisation_id)
+    else:
+        vergessen(*(f'vertrag:{pk}' for pk in pk_set or ()), f'mieter:{instance.pk}',
+                  organisation_id=instance.organisation_id)
+
+
+def _zwischenspeicher_organisation(sender, instance, raw=False, **kwargs):
+    # Die Organisation trägt Zinsstand und LIK, aber keine `organisation_id` —
+    # sie IST die Organisation. Deshalb ein eigener Empfänger.
+    from core.services.zwischenspeicher import vergessen
+    if not raw:
+        vergessen(f'organisation:{instance.pk}', organisation_id=instance.pk)
+
+
+def _zwischenspeicher_verbinden():
+    from core.services.zwischenspeicher import TAG_ARTEN
+    for quelle in TAG_ARTEN:
+        _post_save.connect(_zwischenspeicher_vergessen, sender=quelle,
+                           dispatch_uid=f'finance.zwischenspeicher_{quelle}')
+        _post_delete.connect(_zwischenspeicher_vergessen, sender=quelle,
+                             dispatch_uid=f'finance.zwischenspeicher_{quelle}_loeschen')
+    _m2m_changed.connect(_zwischenspeicher_wg, sender='rentals.Mietvertrag_weitere_mieter',
+                         dispatch_uid='finance.zwischenspeicher_wg')
+    _post_save.connect(_zwischenspeicher_organisation, sender='crm.Organisation',
+                       dispatch_uid='finance.zwischenspeicher_organisation')
+
+
+_zwischenspeicher_verbinden()
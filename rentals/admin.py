@@ -86,7 +86,7 @@ class DokumentVertragInline(NurLesenTabularInline):
 @admin.register(Mietvertrag)
 class MietvertragAdmin(NurLesenModelAdmin):
     list_display = ('vertrag_profil', 'finanzen_info', 'laufzeit_info', 'docuseal_badge', 'schnell_aktionen')
-    list_filter = ('sign_status', 'aktiv', 'nk_abrechnungsart')
+    list_filter = ('sign_status', 'aktiv', 'senkungsanspruch', 'nk_abrechnungsart')
     list_filter_submit = True
     search_fields = ('mieter__vorname', 'mieter__nachname', 'einheit__bezeichnung')
     inlines = [DokumentVertragInline]
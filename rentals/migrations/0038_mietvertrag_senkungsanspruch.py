@@ -0,0 +1,17 @@
+"""Senkungsanspruch als Merkmal am Vertrag — Schritt 1: die Spalte."""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0037_dokument_organisation_pflicht'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mietvertrag',
+            name='senkungsanspruch',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Senkungsanspruch (Art. 270a OR)'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+"""Senkungsanspruch als Merkmal am Vertrag — Schritt 2: den Bestand versorgen.
+
+Dieselbe Regel wie `core.services.senkungsanspruch`, hier mit den historischen
+Modellen: aktiver Vertrag, wirksame Basis (jüngste Anpassung bis heute, sonst
+Vertragsbasis) über dem Referenzzinssatz seiner Verwaltung. Ohne diesen
+Schritt zeigte die Lage bis zum ersten täglichen Lauf keinen Anspruch.
+"""
+from datetime import date
+
+from django.db import migrations
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def befuellen(apps, schema_editor):
+    Organisation = apps.get_model('crm', 'Organisation')
+    Mietvertrag = apps.get_model('rentals', 'Mietvertrag')
+    MietzinsAnpassung = apps.get_model('rentals', 'MietzinsAnpassung')
+
+    juengste = (MietzinsAnpassung.objects
+                .filter(vertrag=OuterRef('pk'), wirksam_ab__lte=date.today())
+                .order_by('-wirksam_ab', '-pk')
+                .values('neuer_referenzzinssatz')[:1])
+    for organisation_id, zins in Organisation.objects.values_list('pk', 'aktueller_referenzzinssatz'):
+        if zins is None:
+            continue
+        anspruch = (Mietvertrag.objects.filter(organisation_id=organisation_id, status='aktiv')
+                    .annotate(wirksamer_zins=Coalesce(Subquery(juengste), F('basis_referenzzinssatz')))
+                    .filter(wirksamer_zins__gt=zins))
+        Mietvertrag.objects.filter(pk__in=anspruch.values('pk')).update(senkungsanspruch=True)
+
+
+def zurueck(apps, schema_editor):
+    """Nichts zu tun — Schritt 1 entfernt die Spalte beim Rueckwaertslauf."""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0038_mietvertrag_senkungsanspruch'),
+    ]
+
+    operations = [
+        migrations.RunPython(befuellen, zurueck),
+    ]
@@ -1,4 +1,7 @@
+import itertools
 import logging
+import threading
+from collections import OrderedDict
 # rentals/models.py
 from django.db import models
 from core.organisation_kette import OrganisationAusKette
@@ -8,6 +11,39 @@ from core.utils import get_current_ref_zins, get_current_lik, get_smart_upload_p
 
 logger = logging.getLogger(__name__)
 
+#: Änderungsstand der Mietzins-Quellen je ('vertrag', id) bzw. ('einheit', id).
+#: Die Signale am Ende des Moduls ziehen ihn hoch; eine gemerkte
+#: Zeitachse (`Mietvertrag.mietzins_zeitachse`) mit älterem Stand wird neu
+#: gerechnet. Nur im Prozess — genau wie die Zeitachse selbst, die am Objekt
+#: hängt und mit ihm verschwindet. Der Zwischenspeicher zählt mit dem
+#: Datenbank-Cache erst nach dem Commit; eine Zeitachse, die in derselben
+#: Transaktion nach einer Mietzinsänderung gelesen wird, sähe dort ihre
+#: eigene Änderung nicht.
+#:
+#: Höchstens `_ZEITACHSE_HOECHSTENS` Stände; der älteste fällt heraus. Der
+#: Zähler steigt nur, darum genügt für alle herausgefallenen ein gemeinsamer
+#: Boden — sein Wert ist mindestens so neu wie jeder von ihnen, und eine
+#: danach gemerkte Zeitachse sieht ihn als Stand. Herausfallen heisst also
+#: höchstens: einmal zu viel neu rechnen, nie: eine alte Zeitachse behalten.
+_ZEITACHSE_STAND = OrderedDict()
+_ZEITACHSE_HOECHSTENS = 10000
+_zeitachse_boden = 0
+_zeitachse_zaehler = itertools.count(1)
+_zeitachse_sperre = threading.Lock()
+
+
+def _zeitachse_stand(art, pk):
+    return _ZEITACHSE_STAND.get((art, pk), _zeitachse_boden)
+
+
+def _zeitachse_weiterzaehlen(art, pk):
+    global _zeitachse_boden
+    with _zeitachse_sperre:
+        _ZEITACHSE_STAND[(art, pk)] = next(_zeitachse_zaehler)
+        _ZEITACHSE_STAND.move_to_end((art, pk))
+        while len(_ZEITACHSE_STAND) > _ZEITACHSE_HOECHSTENS:
+            _zeitachse_boden = _ZEITACHSE_STAND.popitem(last=False)[1]
+
 
 class Mietvertrag(OrganisationAusKette):
     ORGANISATION_PFAD = 'einheit'
@@ -138,6 +174,12 @@ class Mietvertrag(OrganisationAusKette):
     mietzinsreserve_betrag = models.DecimalField("Reserve Betrag (CHF)", max_digits=8, decimal_places=2, null=True, blank=True)
     mietzinsreserve_prozent = models.DecimalField("Reserve Prozent (%)", max_digits=5, decimal_places=2, null=True, blank=True)
     weitere_vorbehalte = models.TextField("Weitere Vorbehalte", blank=True, default='')
+    # Abgeleitet, nicht erfasst: Liegt der Referenzzins der Verwaltung unter der
+    # wirksamen Basis, kann der Mieter eine Herabsetzung verlangen (Art. 270a OR).
+    # Nachgeführt von `core.services.senkungsanspruch` — damit Listen über den
+    # ganzen Bestand zählen können, ohne je Vertrag zu rechnen.
+    senkungsanspruch = models.BooleanField("Senkungsanspruch (Art. 270a OR)", default=False,
+                                           editable=False)
 
     pdf_datei = models.FileField(upload_to='roh_vertraege/', blank=True, null=True)
 
@@ -271,16 +313,105 @@ class Mietvertrag(OrganisationAusKette):
         - Fest/Index: die jüngste am Stichtag WIRKSAME amtliche Mietzinsanpassung
           (Referenzzins-/Index-/Teuerungsanpassung, Art. 269d) ab `wirksam_ab` —
           so folgt die Sollstellung automatisch der angekündigten Anpassung, ohne
-          den Basiswert zu mutieren. Ohne Anpassung/Stufe = Basis-Nettomietzins."""
+          den Basiswert zu mutieren. Ohne Anpassung/Stufe = Basis-Nettomietzins.
+
+        Aufgelöst über die Mietzins-Zeitachse (`mietzins_zeitachse`); die Regeln
+        stehen in `_netto_am`."""
+        return self._zeitachse_am(fuer_datum)[0]
+
+    def effektive_nebenkosten(self, fuer_datum=None):
+        """Nebenkosten (Akonto/Pauschal), die an einem Datum gelten — verrechnungs-
+        wirksam. Datierte Komponenten haben Vorrang; sonst der flache Vertragswert."""
+        return self._zeitachse_am(fuer_datum)[1]
+
+    # --- Mietzins-Zeitachse -------------------------------------------------
+    #
+    # Mieterspiegel, Sollstellung, Vorschau, Rendite und die Senkungsprüfung
+    # fragen den Mietzins je Vertrag und je Monat ab, und jede Abfrage lief
+    # über alle Komponenten, Sollmietzins-Zeilen, Staffelstufen und
+    # Anpassungen. Der Mietzins ändert sich aber nur an deren Stichtagen: Die
+    # Zeitachse rechnet ihn EINMAL je Stichtag und löst jedes Datum danach mit
+    # einer Binärsuche auf.
+    #
+    # Gemerkt wird am Vertragsobjekt, wie ein prefetch. Neu gerechnet wird,
+    # sobald sich eine Quelle geändert hat: die eigenen Felder (auch ungespeichert)
+    # oder — über die Signale am Ende dieses Moduls — eine Komponente, Stufe,
+    # Anpassung oder eine Sollmietzins-Zeile des Objekts. Was an den Signalen
+    # vorbei schreibt (`QuerySet.update()`), sieht ein bereits geladener Vertrag
+    # erst nach dem Neuladen; das galt für einen vorab geladenen prefetch schon
+    # immer.
+
+    #: Die Mietzins-Quellen, die die Regeln lesen. `sollmietzinse` hängt an
+    #: der Einheit, die übrigen am Vertrag.
+    ZEITACHSE_QUELLEN = ('mietzins_komponenten', 'staffelstufen', 'anpassungen', 'sollmietzinse')
+
+    def _bestand(self, name):
+        """Die Zeilen einer Mietzins-Quelle (`ZEITACHSE_QUELLEN`) für die Regeln.
+
+        Mit `Prefetch(name, to_attr=f'{name}_liste')` vorgeladen gilt die
+        Liste, sonst `.all()` (mit oder ohne prefetch). Die Liste kostet beim
+        Laden weniger als die Hälfte und beim Lesen keinen Manager je Aufruf —
+        das zählt erst bei tausenden Verträgen, etwa in der Sollstellungs-Prognose."""
+        halter = self.einheit if name == 'sollmietzinse' else self
+        liste = halter.__dict__.get(f'{name}_liste')
+        return liste if liste is not None else getattr(halter, name).all()
+
+    def mietzins_am(self, fuer_datum=None):
+        """`(netto, nk, verrechnet_netto, verrechnet_nk)` am Stichtag in EINEM
+        Nachschlagen — dasselbe wie die vier einzelnen Methoden, für Läufe,
+        die alle vier brauchen (Sollstellung, Prognose)."""
+        return self._zeitachse_am(fuer_datum)
+
+    def mietzins_zeitachse(self):
+        """Die Wechselpunkte des Mietzinses, aufsteigend: Liste von
+        `(gueltig_ab, netto, nk, verrechnet_netto, verrechnet_nk)`.
+
+        Der erste Punkt trägt `date.min` und gilt vor jedem datierten Eintrag.
+        An jedem Datum gilt der letzte Punkt mit `gueltig_ab <= Datum`."""
+        return self._zeitachse()[1]
+
+    def _zeitachse(self):
         from datetime import date as _d
+        stand = (_zeitachse_stand('vertrag', self.pk),
+                 _zeitachse_stand('einheit', self.einheit_id),
+                 self.pk, self.einheit_id, self.beginn, self.mietzins_modell,
+                 self.netto_mietzins, self.nebenkosten)
+        gemerkt = self.__dict__.get('_zeitachse_gemerkt')
+        if gemerkt is not None and gemerkt[0] == stand:
+            return gemerkt[1], gemerkt[2]
+        stichtage = set()
+        if self.pk:
+            stichtage |= {k.gueltig_ab for k in self._bestand('mietzins_komponenten') if k.gueltig_ab}
+            stichtage |= {s.ab_datum for s in self._bestand('staffelstufen') if s.ab_datum}
+            stichtage |= {a.wirksam_ab for a in self._bestand('anpassungen') if a.wirksam_ab}
+            if self.einheit_id:
+                stichtage |= {z.gueltig_ab for z in self._bestand('sollmietzinse')
+                              if z.quelle_anpassung_id is None and z.gueltig_ab}
+        daten = [_d.min, *sorted(stichtage)]
+        punkte = [(tag, self._netto_am(tag), self._nk_am(tag),
+                   self._verrechnet_netto_am(tag), self._verrechnet_nk_am(tag)) for tag in daten]
+        self._zeitachse_gemerkt = (stand, daten, punkte)
+        return daten, punkte
+
+    def _zeitachse_am(self, fuer_datum):
+        """Der Zeitachsen-Punkt, der an `fuer_datum` (Standard: heute) gilt."""
+        import bisect
+        from datetime import date as _d, datetime as _dt
         stichtag = fuer_datum or _d.today()
+        if isinstance(stichtag, _dt):
+            stichtag = stichtag.date()
+        daten, punkte = self._zeitachse()
+        return punkte[bisect.bisect_right(daten, stichtag) - 1][1:]
+
+    def _netto_am(self, stichtag):
+        """Die Regeln hinter `effektiver_netto_mietzins`, ohne Zeitachse."""
         basis = self.netto_mietzins or Decimal('0.00')
         if not self.pk:
             return basis
         # Datierte Komponenten am Verhältnis haben Vorrang (Gratismonate/gestaffelter
         # Start): die jüngste Komponente mit gueltig_ab <= Stichtag gilt.
         # Python-Filter über .all() statt .filter() → nutzt prefetch_related (kein N+1).
-        komps = [k for k in self.mietzins_komponenten.all()
+        komps = [k for k in self._bestand('mietzins_komponenten')
                  if k.gueltig_ab and k.gueltig_ab <= stichtag]
         komp = max(komps, key=lambda k: (k.gueltig_ab, k.id or 0)) if komps else None
         if komp:
@@ -291,22 +422,19 @@ class Mietvertrag(OrganisationAusKette):
         if soll:
             return soll.netto_mietzins or Decimal('0.00')
         if self.mietzins_modell == 'staffel':
-            stufen = [s for s in self.staffelstufen.all()
+            stufen = [s for s in self._bestand('staffelstufen')
                       if s.ab_datum and s.ab_datum <= stichtag]
             stufe = max(stufen, key=lambda s: (s.ab_datum, s.id or 0)) if stufen else None
             return stufe.netto_mietzins if stufe else basis
-        anps = [a for a in self.anpassungen.all()
+        anps = [a for a in self._bestand('anpassungen')
                 if a.wirksam_ab and a.wirksam_ab <= stichtag]
         anp = max(anps, key=lambda a: (a.wirksam_ab, a.id or 0)) if anps else None
         return anp.neuer_netto_mietzins if anp else basis
 
-    def effektive_nebenkosten(self, fuer_datum=None):
-        """Nebenkosten (Akonto/Pauschal), die an einem Datum gelten — verrechnungs-
-        wirksam. Datierte Komponenten haben Vorrang; sonst der flache Vertragswert."""
-        from datetime import date as _d
-        stichtag = fuer_datum or _d.today()
+    def _nk_am(self, stichtag):
+        """Die Regeln hinter `effektive_nebenkosten`, ohne Zeitachse."""
         if self.pk:
-            komps = [k for k in self.mietzins_komponenten.all()
+            komps = [k for k in self._bestand('mietzins_komponenten')
                      if k.gueltig_ab and k.gueltig_ab <= stichtag]
             komp = max(komps, key=lambda k: (k.gueltig_ab, k.id or 0)) if komps else None
             if komp:
@@ -316,6 +444,26 @@ class Mietvertrag(OrganisationAusKette):
                 return soll.nebenkosten or Decimal('0.00')
         return self.nebenkosten or Decimal('0.00')
 
+    def _verrechnet_netto_am(self, stichtag):
+        """Die Regeln hinter `verrechneter_netto_mietzins`, ohne Zeitachse."""
+        komp = self._aktive_komponente(stichtag)
+        if komp:
+            return komp.verrechnet_netto
+        soll = self._sollmietzins_zeile(stichtag)
+        if soll:
+            return soll.verrechnet_netto
+        return self._netto_am(stichtag)
+
+    def _verrechnet_nk_am(self, stichtag):
+        """Die Regeln hinter `verrechnete_nebenkosten`, ohne Zeitachse."""
+        komp = self._aktive_komponente(stichtag)
+        if komp:
+            return komp.verrechnet_nk
+        soll = self._sollmietzins_zeile(stichtag)
+        if soll:
+            return soll.verrechnet_nk
+        return self._nk_am(stichtag)
+
     def _sollmietzins_zeile(self, fuer_datum=None):
         """Die zum Stichtag geltende, MANUELL erfasste Sollmietzins-Zeile des
         Objekts (Gratismonat-Zeitplan). Nur wirksam, wenn für DIESES Verhältnis
@@ -328,7 +476,7 @@ class Mietvertrag(OrganisationAusKette):
             return None
         stichtag = fuer_datum or _d.today()
         # Python-Filter über .all() statt .filter() → nutzt prefetch (einheit__sollmietzinse).
-        zeilen = [z for z in self.einheit.sollmietzinse.all() if z.quelle_anpassung_id is None]
+        zeilen = [z for z in self._bestand('sollmietzinse') if z.quelle_anpassung_id is None]
         if not zeilen:
             return None
         # Zeitplan muss zu diesem Verhältnis gehören (eine Zeile ab Mietbeginn).
@@ -352,7 +500,7 @@ class Mietvertrag(OrganisationAusKette):
         if not self.pk:
             return None
         stichtag = fuer_datum or _d.today()
-        komps = [k for k in self.mietzins_komponenten.all()
+        komps = [k for k in self._bestand('mietzins_komponenten')
                  if k.gueltig_ab and k.gueltig_ab <= stichtag]
         return max(komps, key=lambda k: (k.gueltig_ab, k.id or 0)) if komps else None
 
@@ -362,24 +510,12 @@ class Mietvertrag(OrganisationAusKette):
         (Rabatt == Referenz) ist das 0, während `effektiver_netto_mietzins` den
         vollen Referenzwert für Mieterspiegel/Bilanz behält (Option B: brutto
         buchen, Rabatt als Ertragsminderung)."""
-        komp = self._aktive_komponente(fuer_datum)
-        if komp:
-            return komp.verrechnet_netto
-        soll = self._sollmietzins_zeile(fuer_datum)
-        if soll:
-            return soll.verrechnet_netto
-        return self.effektiver_netto_mietzins(fuer_datum)
+        return self._zeitachse_am(fuer_datum)[2]
 
     def verrechnete_nebenkosten(self, fuer_datum=None):
         """Nebenkosten, die an einem Datum tatsächlich verrechnet werden =
         Referenz-NK − Rabatt-NK. Ohne Komponente = effektive Nebenkosten."""
-        komp = self._aktive_komponente(fuer_datum)
-        if komp:
-            return komp.verrechnet_nk
-        soll = self._sollmietzins_zeile(fuer_datum)
-        if soll:
-            return soll.verrechnet_nk
-        return self.effektive_nebenkosten(fuer_datum)
+        return self._zeitachse_am(fuer_datum)[3]
 
     def rabatt_netto_am(self, fuer_datum=None):
         """Netto-Rabatt/-Erlass der am Datum geltenden Komponente (0 ohne)."""
@@ -942,3 +1078,81 @@ class AbnahmeMangel(OrganisationAusKette):
         if faktor is None:
             return Decimal(basis).quantize(Decimal('0.01'))
         return (Decimal(basis) * Decimal(str(faktor))).quantize(Decimal('0.01'))
+
+
+# ---------------------------------------------------------------------------
+# Mietzins-Zeitachse (`Mietvertrag.mietzins_zeitachse`) nach jeder Änderung
+# an einer ihrer Quellen verwerfen. Sollmietzins-Zeilen hängen am Objekt und
+# betreffen damit jeden Vertrag darauf.
+from django.db.models.signals import post_delete as _post_delete, post_save as _post_save
+
+
+def _zeitachse_vertrag(sender, instance, **kwargs):
+    _zeitachse_weiterzaehlen('vertrag', instance.vertrag_id)
+
+
+def _zeitachse_einheit(sender, instance, **kwargs):
+    _zeitachse_weiterzaehlen('einheit', instance.einheit_id)
+
+
+for _modell in (VertragMietzins, Staffelstufe, MietzinsAnpassung):
+    _post_save.connect(_zeitachse_vertrag, sender=_modell,
+                       dispatch_uid=f'rentals.zeitachse_{_modell.__name__}')
+    _post_delete.connect(_zeitachse_vertrag, sender=_modell,
+                         dispatch_uid=f'rentals.zeitachse_{_modell.__name__}_loeschen')
+_post_save.connect(_zeitachse_einheit, sender='portfolio.Sollmietzins',
+                   dispatch_uid='rentals.zeitachse_sollmietzins')
+_post_delete.connect(_zeitachse_einheit, sender='portfolio.Sollmietzins',
+                     dispatch_uid='rentals.zeitachse_sollmietzins_loeschen')
+
+
+# ---------------------------------------------------------------------------
+# Senkungsanspruch (`Mietvertrag.senkungsanspruch`) nachführen, wenn sich eine
+# seiner Grössen ändert: der Zinsstand der Verwaltung, der Vertrag selbst oder
+# eine seiner Anpassungen. Was ohne Signal geschieht, holt der tägliche Lauf
+# nach (`core.services.senkungsanspruch`).
+
+#: Nur diese Felder tragen zum Anspruch bei. Ein Speichern mit `update_fields`
+#: ohne eines davon — Signaturstatus, Kaution, Dokumente — rechnet nicht nach.
+_SENKUNG_VERTRAGSFELDER = {'status', 'aktiv', 'basis_referenzzinssatz'}
+
+
+def _senkung_organisation(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if created or raw:
+        return          # eine neue Verwaltung hat noch keine Verträge
+    if update_fields is not None and 'aktueller_referenzzinssatz' not in update_fields:
+        return
+    from core.services.senkungsanspruch import aktualisieren
+    aktualisieren(instance)
+
+
+def _senkung_nachfuehren(organisation_id, vertrag_id):
+    from crm.models import Organisation
+    from core.services.senkungsanspruch import aktualisieren
+    # Frisch geladen statt `instance.organisation`: Das füllte den Cache des
+    # Vertrags mit einer Verwaltung, die der Aufrufer danach nicht mehr sieht.
+    # Und beim Löschen einer Verwaltung laufen ihre Anpassungen per CASCADE
+    # mit — dann gibt es sie nicht mehr.
+    organisation = Organisation.objects.filter(pk=organisation_id).first()
+    if organisation is not None:
+        aktualisieren(organisation, vertrag_ids=[vertrag_id])
+
+
+def _senkung_vertrag(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not _SENKUNG_VERTRAGSFELDER & set(update_fields)):
+        return
+    _senkung_nachfuehren(instance.organisation_id, instance.pk)
+
+
+def _senkung_anpassung(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _senkung_nachfuehren(instance.organisation_id, instance.vertrag_id)
+
+
+_post_save.connect(_senkung_organisation, sender='crm.Organisation',
+                   dispatch_uid='rentals.senkung_organisation')
+_post_save.connect(_senkung_vertrag, sender=Mietvertrag, dispatch_uid='rentals.senkung_vertrag')
+_post_save.connect(_senkung_anpassung, sender=MietzinsAnpassung,
+                   dispatch_uid='rentals.senkung_anpassung')
+_post_delete.connect(_senkung_anpassung, sender=MietzinsAnpassung,
+                     dispatch_uid='rentals.senkung_anpassung_loeschen')
@@ -390,6 +390,73 @@ EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', '15'))
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = f'ImmoSwiss Verwaltung <{os.getenv("EMAIL_HOST_USER", "info@immoswiss.app")}>'
+# Postausgang (`core.services.postausgang`): höchstens so viele Mails je
+# Minute an denselben SMTP-Server. Hoststar drosselt Konten, die in kurzer
+# Zeit viel senden, und lehnt dann mit 4xx ab — lieber selbst langsamer, als
+# mitten im Mahnlauf ausgebremst zu werden. 0 = ungedrosselt (Tests).
+POSTAUSGANG_JE_MINUTE = 0 if TESTING else int(os.getenv('POSTAUSGANG_JE_MINUTE', '60'))
+# So viele Tage bleiben zugestellte und aufgegebene Nachrichten samt Anhängen
+# im Postausgang; danach löscht sie der tägliche Lauf (`postausgang.aufraeumen`).
+POSTAUSGANG_AUFBEWAHREN_TAGE = int(os.getenv('POSTAUSGANG_AUFBEWAHREN_TAGE', '90'))
+
+# Laufaufträge (`faelle.laufauftraege`): Sollstellung, Mahnlauf und
+# Vertragspakete laufen im Hintergrund. Mit eigenem Worker
+# (`laufauftraege_abarbeiten --dauerhaft`, Always-on Task) hier 0 setzen; ohne
+# arbeitet ein Thread im Webprozess sie nach dem Commit ab. In Tests nie —
+# dort führt der Test sie ausdrücklich aus.
+LAUFAUFTRAEGE_IM_PROZESS = not TESTING and os.getenv('LAUFAUFTRAEGE_IM_PROZESS', '1') == '1'
+# Höchstens so viele Aufträge je Verwaltung gleichzeitig; weitere warten.
+LAUFAUFTRAEGE_JE_ORGANISATION = int(os.getenv('LAUFAUFTRAEGE_JE_ORGANISATION', '1'))
+# Prozesse, die im Nebenkostenlauf-Auftrag die PDFs zeichnen. 1 heisst: im
+# Auftrag selbst. Mehr nur mit eigenem Worker — ein Webprozess mit Threads
+# sollte nicht forken.
+NEBENKOSTENLAUF_PROZESSE = int(os.getenv('NEBENKOSTENLAUF_PROZESSE', '1'))
+
+# ==========================================
+# 9a. ZWISCHENSPEICHER (CACHES)
+# ==========================================
+# Ohne Angabe gab Django jedem Worker einen eigenen LocMemCache: Der
+# Rate-Limiter zählte je Prozess, und was ein Worker verwarf (Portfolio,
+# Zahler-Index, `core.services.zwischenspeicher`), sah der andere erst nach
+# Ablauf. Standard ist darum der DATENBANK-Cache — geteilt über alle Prozesse,
+# ohne Redis:
+#
+#   CACHE_ART=db      (Standard) Tabelle `swissimmo_cache`; angelegt von der
+#                     Migration `core.0017_cachetabelle` (`createcachetable`)
+#   CACHE_ART=redis   CACHE_URL, z.B. redis://localhost:6379/1 (Paket `redis`)
+#   CACHE_ART=datei   Verzeichnis CACHE_VERZEICHNIS, sonst ./cache — nur für
+#                     die Entwicklung
+#   CACHE_ART=lokal   je Prozess (Tests, Entwicklung)
+#
+# WARUM NICHT MEHR DER DATEICACHE: Jedes `set`/`add` auf Djangos
+# FileBasedCache ruft `_cull()`, und das listet das ganze Verzeichnis. Mit
+# 15'000 Einträgen kostete ein einziges Weiterzählen eines Stands gemessen
+# 53 ms — und `zwischenspeicher.vergessen` zählt bei jedem Speichern eines
+# Modells aus `TAG_ARTEN` vier bis zehn Stände weiter, vor und nach dem
+# Commit. Ein Speichern kostete so Hunderte Millisekunden im Cache. Der
+# Datenbank-Cache fügt bei `add` atomar ein und zählt ohne Verzeichnisliste.
+#
+# Er schreibt aber über die Verbindung der App, in deren Transaktion. Die
+# Stände zählt der Zwischenspeicher mit ihm deshalb nur nach dem Commit
+# (`zwischenspeicher.vor_dem_commit_zaehlen`) — sonst sähe sie vor dem Commit
+# ohnehin niemand, und auf Postgres hielte jeder Schreiber einer Verwaltung
+# die Zeilen der geteilten Stände bis zum Commit gesperrt. Bei mehreren
+# Workern mit vielen gleichzeitigen Schreibern: CACHE_ART=redis.
+_CACHE_ART = os.getenv('CACHE_ART', 'lokal' if TESTING else 'db')
+if _CACHE_ART == 'redis':
+    _CACHE = {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+              'LOCATION': os.getenv('CACHE_URL', 'redis://127.0.0.1:6379/1')}
+elif _CACHE_ART == 'datei':
+    _CACHE = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+              'LOCATION': os.getenv('CACHE_VERZEICHNIS', str(BASE_DIR / 'cache')),
+              'OPTIONS': {'MAX_ENTRIES': 20000}}
+elif _CACHE_ART == 'lokal':
+    _CACHE = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+              'LOCATION': 'swissimmo'}
+else:
+    _CACHE = {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+              'LOCATION': 'swissimmo_cache', 'OPTIONS': {'MAX_ENTRIES': 50000}}
+CACHES = {'default': _CACHE}
 
 # Basis-URL für Links in E-Mails (Portal-Login etc.) — unabhängig vom Request-Host,
 # damit der Link auch aus Cron/Hintergrund-Jobs korrekt auf die Produktion zeigt.
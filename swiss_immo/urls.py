@@ -69,7 +69,7 @@ def healthz_view(request):
 from core.views.application import public_application_view, public_datenschutz_view
 
 # 2. Das neue Admin-Cockpit (Bereinigt um das alte Dashboard)
-from core.views.dashboard_view import update_market_data_view
+from core.views.dashboard_view import update_market_data_view, admin_baum_kinder
 
 # 2b. Eigentümer-Portal & Login-Weiche
 from core.views.zweifaktor import (zweifaktor_login, zweifaktor_bestaetigen,
@@ -94,7 +94,8 @@ from core.views.fw import (fw_arbeit, fw_fall_detail, fw_fallschritt_erledigen,
                            fw_regelwerk_protokoll, fw_regelanwendung_uebersteuern,
                            fw_kuendigung_pruefen,
                            fw_mandat_detail, fw_dienstleister_detail,
-                           fw_laeufe, fw_zulauf, fw_zulauf_uebernehmen,
+                           fw_laeufe, fw_laufauftrag, fw_laufauftrag_abbrechen, fw_laufauftrag_datei,
+                           fw_zulauf, fw_zulauf_uebernehmen,
                            fw_dashboard, fw_finanzen, fw_berichte, fw_betriebskostenspiegel, fw_betriebsrechnung_pdf, fw_leerstand_verlauf, fw_auswertung, fw_debitoren, fw_debitor_qr_pdf, fw_debitor_neu, fw_debitor_stornieren, fw_debitor_abschreiben, fw_liegenschaften, fw_mieterspiegel, fw_objekte,
                            fw_personen, fw_vertraege, fw_mieterwechsel, fw_vermarktung, fw_objekt_ausschreiben, fw_expose_pdf,
                            fw_liegenschaft_detail, fw_objekt_detail, fw_objekt_foto_upload, fw_objekt_foto_loeschen, fw_vertrag_detail,
@@ -115,12 +116,12 @@ from core.views.fw import (fw_arbeit, fw_fall_detail, fw_fallschritt_erledigen,
                            fw_kreditor_position_add, fw_kreditor_position_del,
                            fw_vertrag_mietzins_add, fw_vertrag_mietzins_del,
                            fw_kreditor_zahlung_zuruecksetzen, fw_kreditor_zahlung_stornieren,
-                           fw_dienstleister_neu, fw_dienstleister_bearbeiten, fw_dienstleister_loeschen, fw_dokument_neu, fw_dokument_loeschen, fw_nebenkosten_neu, fw_nebenkosten_loeschen,
+                           fw_dienstleister_neu, fw_dienstleister_bearbeiten, fw_dienstleister_loeschen, fw_dokument_neu, fw_dokument_loeschen, fw_nebenkosten_neu, fw_nebenkostenlauf, fw_nebenkosten_loeschen,
                            fw_buchung_neu, fw_buchung_stornieren, fw_kommunikation_senden, fw_serienbrief_pdf,
                            fw_schaeden, fw_schaden_kosten, fw_schaden_detail, fw_schaden_foto_upload, fw_schaden_foto_loeschen, fw_schaden_loeschen, fw_auftrag_kosten, fw_auftrag_pdf,
                            fw_schaden_auftrag, fw_schaden_status, fw_schaden_antwort, fw_schaden_neu,
                            fw_dienstleister, fw_buchhaltung, fw_kontoblatt, fw_kontenplan, fw_buchhaltung_export, fw_buchhaltung_pdf, fw_anlagen,
-                           fw_sollstellung, fw_sollstellung_run,
+                           fw_sollstellung, fw_sollstellung_run, fw_sollstellung_prognose,
                            fw_nebenkosten, fw_nebenkosten_detail, fw_nebenkosten_verbuchen, fw_nebenkosten_versand, fw_akonto_anpassen,
                            fw_mietzins, fw_mietzins_anpassung, fw_mietzins_massenanpassung, fw_anfangsmietzins, fw_dokumente, fw_kommunikation,
                            fw_vertrag_neu, fw_vertrag_neu_speichern, fw_vertrag_vorschau, fw_vertrag_bearbeiten,
@@ -155,7 +156,8 @@ from core.views.dossier import mieter_dossier, liegenschaft_dossier, vertrag_dos
 from core.views.contracts import mietzins_anpassung_view, generiere_amtliches_formular
 
 # 4. PDF (Mietvertrag + Begleitdokumente)
-from core.views.pdf import generate_pdf_view, generate_dokument_view, generate_vertragspaket_zip
+from core.views.pdf import (generate_pdf_view, generate_dokument_view, generate_vertragspaket_zip,
+                            vertragspaket_einreihen)
 
 # 5. DocuSeal
 from core.views.docuseal import send_via_docuseal, docuseal_webhook
@@ -372,8 +374,10 @@ urlpatterns = [
     path('neu/buchhaltung/buchung/<int:pk>/stornieren/', fw_buchung_stornieren, name='fw_buchung_stornieren'),
     path('neu/sollstellung/', fw_sollstellung, name='fw_sollstellung'),
     path('neu/sollstellung/starten/', fw_sollstellung_run, name='fw_sollstellung_run'),
+    path('neu/sollstellung/prognose/', fw_sollstellung_prognose, name='fw_sollstellung_prognose'),
     path('neu/nebenkosten/', fw_nebenkosten, name='fw_nebenkosten'),
     path('neu/nebenkosten/neu/', fw_nebenkosten_neu, name='fw_nebenkosten_neu'),
+    path('neu/nebenkosten/lauf/', fw_nebenkostenlauf, name='fw_nebenkostenlauf'),
     path('neu/nebenkosten/<int:pk>/loeschen/', fw_nebenkosten_loeschen, name='fw_nebenkosten_loeschen'),
     path('neu/nebenkosten/<int:pk>/', fw_nebenkosten_detail, name='fw_nebenkosten_detail'),
     path('neu/nebenkosten/<int:pk>/verbuchen/', fw_nebenkosten_verbuchen, name='fw_nebenkosten_verbuchen'),
@@ -405,6 +409,10 @@ urlpatterns = [
     path('neu/fallschritte/<int:pk>/erledigen/', fw_fallschritt_erledigen,
          name='fw_fallschritt_erledigen'),
     path('neu/laeufe/', fw_laeufe, name='fw_laeufe'),
+    path('neu/auftraege/<int:pk>/', fw_laufauftrag, name='fw_laufauftrag'),
+    path('neu/auftraege/<int:pk>/abbrechen/', fw_laufauftrag_abbrechen,
+         name='fw_laufauftrag_abbrechen'),
+    path('neu/auftraege/<int:pk>/datei/', fw_laufauftrag_datei, name='fw_laufauftrag_datei'),
     path('neu/zulauf/', fw_zulauf, name='fw_zulauf'),
     path('neu/zulauf/<int:pk>/uebernehmen/', fw_zulauf_uebernehmen,
          name='fw_zulauf_uebernehmen'),
@@ -529,6 +537,7 @@ urlpatterns = [
 
     # --- ADMIN-ZUGÄNGE & SYSTEM ---
     path('admin/update-marktdaten/', update_market_data_view, name='update_marktdaten'),
+    path('admin/baum/<str:art>/<int:pk>/', admin_baum_kinder, name='admin_baum_kinder'),
     path('admin/', admin.site.urls),
 
     # ==========================================
@@ -543,6 +552,8 @@ urlpatterns = [
     # --- PDF & E-MAIL ---
     path('vertrag/<int:vertrag_id>/pdf/', generate_pdf_view, name='generate_pdf'),
     path('vertrag/<int:vertrag_id>/dokumente-zip/', generate_vertragspaket_zip, name='generate_vertragspaket_zip'),
+    path('vertrag/<int:vertrag_id>/dokumente-zip/einreihen/', vertragspaket_einreihen,
+         name='vertragspaket_einreihen'),
     path('vertrag/<int:vertrag_id>/dokument/<slug:doc_type>/', generate_dokument_view, name='generate_dokument'),
     path('abrechnung/<int:periode_id>/pdf/', abrechnung_pdf_view, name='abrechnung_pdf'),
     path('abrechnung/<int:periode_id>/send-mail/', send_abrechnung_email_view, name='abrechnung_send_mail'),